@@ -5,8 +5,9 @@ from logging.config import fileConfig
 from alembic import context
 from dr_emu.models import Base
 from asyncpg import Connection
-from sqlalchemy import pool
+from sqlalchemy import pool, select, func
 from sqlalchemy.ext.asyncio import async_engine_from_config
+from dr_emu.lib import locks
 from dr_emu.settings import settings
 
 
@@ -53,6 +54,8 @@ def do_run_migrations(connection: Connection) -> None:
     context.configure(connection=connection, target_metadata=target_metadata)
 
     with context.begin_transaction():
+        # replicas starting at the same time migrate one after another, the others find the DB up to date
+        connection.execute(select(func.pg_advisory_xact_lock(locks.lock_key(locks.MIGRATION))))
         context.run_migrations()
 
 
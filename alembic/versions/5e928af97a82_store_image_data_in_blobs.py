@@ -0,0 +1,110 @@
+"""Store image data in content-addressed blobs
+
+Revision ID: 5e928af97a82
+Revises: 87401fef9807
+Create Date: 2026-10-19 09:12:41.203118
+
+"""
+import ast
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5e928af97a82"
+down_revision: Union[str, None] = "87401fef9807"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+image_table = sa.table(
+    "image",
+    sa.column("id", sa.Integer()),
+    sa.column("data", sqlalchemy_utils.types.scalar_list.ScalarListType(separator="|")),
+)
+blob_table = sa.table(
+    "blob",
+    sa.column("id", sa.Integer()),
+    sa.column("digest", sa.String()),
+    sa.column("size", sa.Integer()),
+    sa.column("contents", sa.LargeBinary()),
+)
+image_file_table = sa.table(
+    "image_file",
+    sa.column("image_id", sa.Integer()),
+    sa.column("blob_id", sa.Integer()),
+    sa.column("path", sa.String()),
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blob",
+        sa.Column("digest", sa.String(length=64), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("contents", sa.LargeBinary(), nullable=False),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("digest"),
+    )
+    op.create_table(
+        "image_file",
+        sa.Column("image_id", sa.Integer(), nullable=False),
+        sa.Column("blob_id", sa.Integer(), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.ForeignKeyConstraint(
+            ["blob_id"],
+            ["blob.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["image_id"],
+            ["image.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    # Move (path, contents) tuples serialized in image.data into the blob store
+    connection = op.get_bind()
+    blob_ids: dict[str, int] = {}
+    for image_id, image_data in connection.execute(sa.select(image_table.c.id, image_table.c.data)):
+        for file_description in image_data or []:
+            path, contents = ast.literal_eval(file_description)
+            contents = contents.encode()
+            digest = hashlib.sha256(contents).hexdigest()
+            if digest not in blob_ids:
+                blob_ids[digest] = connection.execute(
+                    sa.insert(blob_table)
+                    .values(digest=digest, size=len(contents), contents=contents)
+                    .returning(blob_table.c.id)
+                ).scalar_one()
+            connection.execute(
+                sa.insert(image_file_table).values(image_id=image_id, blob_id=blob_ids[digest], path=path)
+            )
+
+    op.drop_column("image", "data")
+
+
+def downgrade() -> None:
+    op.add_column("image", sa.Column("data", sqlalchemy_utils.types.scalar_list.ScalarListType(), nullable=True))
+
+    connection = op.get_bind()
+    image_data: dict[int, list[str]] = {}
+    for image_id, path, contents in connection.execute(
+        sa.select(image_file_table.c.image_id, image_file_table.c.path, blob_table.c.contents).join(
+            blob_table, blob_table.c.id == image_file_table.c.blob_id
+        )
+    ):
+        image_data.setdefault(image_id, []).append(str((path, contents.decode())))
+
+    connection.execute(sa.update(image_table).values(data=[]))
+    for image_id, data in image_data.items():
+        connection.execute(sa.update(image_table).where(image_table.c.id == image_id).values(data=data))
+    op.alter_column("image", "data", nullable=False)
+
+    op.drop_table("image_file")
+    op.drop_table("blob")
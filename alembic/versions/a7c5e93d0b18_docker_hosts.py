@@ -0,0 +1,46 @@
+"""Docker hosts
+
+Revision ID: a7c5e93d0b18
+Revises: f4a9d3b6c712
+Create Date: 2026-10-22 10:41:17.902615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c5e93d0b18"
+down_revision: Union[str, None] = "f4a9d3b6c712"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "docker_host",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("capacity", sa.Integer(), nullable=False),
+        sa.Column("enabled", sa.Boolean(), server_default=sa.true(), nullable=False),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+        sa.UniqueConstraint("url"),
+    )
+
+    op.add_column("infrastructure", sa.Column("docker_host_id", sa.Integer(), nullable=True))
+    op.create_index(op.f("ix_infrastructure_docker_host_id"), "infrastructure", ["docker_host_id"], unique=False)
+    op.create_foreign_key(
+        "infrastructure_docker_host_id_fkey", "infrastructure", "docker_host", ["docker_host_id"], ["id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("infrastructure_docker_host_id_fkey", "infrastructure", type_="foreignkey")
+    op.drop_index(op.f("ix_infrastructure_docker_host_id"), table_name="infrastructure")
+    op.drop_column("infrastructure", "docker_host_id")
+
+    op.drop_table("docker_host")
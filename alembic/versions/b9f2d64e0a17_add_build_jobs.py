@@ -0,0 +1,52 @@
+"""Add build jobs
+
+Revision ID: b9f2d64e0a17
+Revises: e8b4f1c07d25
+Create Date: 2026-10-19 22:05:43.512907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b9f2d64e0a17"
+down_revision: Union[str, None] = "e8b4f1c07d25"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "job",
+        sa.Column("run_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "status", sa.Enum("queued", "running", "succeeded", "failed", "cancelled", name="jobstatus"), nullable=False
+        ),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("cancel_requested", sa.Boolean(), nullable=False),
+        sa.Column("infrastructure_id", sa.Integer(), nullable=True),
+        sa.Column("worker", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["run_id"],
+            ["run.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_job_run_id"), "job", ["run_id"], unique=False)
+    op.create_index(op.f("ix_job_status"), "job", ["status"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_job_status"), table_name="job")
+    op.drop_index(op.f("ix_job_run_id"), table_name="job")
+    op.drop_table("job")
+    sa.Enum(name="jobstatus").drop(op.get_bind(), checkfirst=False)
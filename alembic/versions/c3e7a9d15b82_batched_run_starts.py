@@ -0,0 +1,45 @@
+"""Batched run starts
+
+Revision ID: c3e7a9d15b82
+Revises: b9f2d64e0a17
+Create Date: 2026-10-19 23:12:36.804519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3e7a9d15b82"
+down_revision: Union[str, None] = "b9f2d64e0a17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("job", sa.Column("count", sa.Integer(), server_default="1", nullable=False))
+    op.add_column("job", sa.Column("built", sa.Integer(), server_default="0", nullable=False))
+    op.execute("UPDATE job SET built = 1 WHERE status = 'succeeded'")
+
+    op.add_column("infrastructure", sa.Column("job_id", sa.Integer(), nullable=True))
+    op.execute("UPDATE infrastructure SET job_id = job.id FROM job WHERE job.infrastructure_id = infrastructure.id")
+    op.create_index(op.f("ix_infrastructure_job_id"), "infrastructure", ["job_id"], unique=False)
+    op.create_foreign_key(
+        "infrastructure_job_id_fkey", "infrastructure", "job", ["job_id"], ["id"], ondelete="SET NULL"
+    )
+    op.drop_column("job", "infrastructure_id")
+
+
+def downgrade() -> None:
+    op.add_column("job", sa.Column("infrastructure_id", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE job SET infrastructure_id = (SELECT max(infrastructure.id) FROM infrastructure "
+        "WHERE infrastructure.job_id = job.id)"
+    )
+    op.drop_constraint("infrastructure_job_id_fkey", "infrastructure", type_="foreignkey")
+    op.drop_index(op.f("ix_infrastructure_job_id"), table_name="infrastructure")
+    op.drop_column("infrastructure", "job_id")
+    op.drop_column("job", "built")
+    op.drop_column("job", "count")
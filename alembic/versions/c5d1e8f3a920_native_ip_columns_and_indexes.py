@@ -0,0 +1,80 @@
+"""Native IP columns and indexes
+
+Revision ID: c5d1e8f3a920
+Revises: a6e2b97c4d18
+Create Date: 2026-10-19 18:22:51.730164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5d1e8f3a920"
+down_revision: Union[str, None] = "a6e2b97c4d18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column, type)
+IP_COLUMNS = [
+    ("infrastructure", "supernet", postgresql.CIDR()),
+    ("network", "ipaddress", postgresql.CIDR()),
+    ("network", "router_gateway", postgresql.INET()),
+    ("interface", "ipaddress", postgresql.INET()),
+    ("interface", "original_ip", postgresql.INET()),
+]
+GIST_INDEXES = [
+    ("ix_infrastructure_supernet", "infrastructure", "supernet"),
+    ("ix_network_ipaddress", "network", "ipaddress"),
+    ("ix_interface_ipaddress", "interface", "ipaddress"),
+]
+FOREIGN_KEY_INDEXES = [
+    ("image_file", "blob_id"),
+    ("image_file", "image_id"),
+    ("images_services", "image_id"),
+    ("run", "template_id"),
+    ("instance", "run_id"),
+    ("infrastructure", "instance_id"),
+    ("appliance", "image_id"),
+    ("appliance", "infrastructure_id"),
+    ("network", "infrastructure_id"),
+    ("appliances_volumes", "volume_id"),
+    ("interface", "appliance_id"),
+    ("interface", "network_id"),
+    ("firewall_rule", "dst_net_id"),
+    ("firewall_rule", "router_id"),
+    ("firewall_rule", "src_net_id"),
+    ("node_file", "blob_id"),
+    ("node_file", "node_id"),
+    ("service_container", "image_id"),
+    ("service_container", "parent_node_id"),
+    ("depends_on", "dependant_service_id"),
+    ("depends_on", "dependency_service_id"),
+    ("services_volumes", "volume_id"),
+]
+
+
+def upgrade() -> None:
+    for table, column, column_type in IP_COLUMNS:
+        op.alter_column(
+            table, column, type_=column_type, existing_type=sa.String(), postgresql_using=f"{column}::{column_type}"
+        )
+    for name, table, column in GIST_INDEXES:
+        op.create_index(name, table, [column], postgresql_using="gist", postgresql_ops={column: "inet_ops"})
+    for table, column in FOREIGN_KEY_INDEXES:
+        op.create_index(op.f(f"ix_{table}_{column}"), table, [column])
+
+
+def downgrade() -> None:
+    for table, column in FOREIGN_KEY_INDEXES:
+        op.drop_index(op.f(f"ix_{table}_{column}"), table_name=table)
+    for name, table, _ in GIST_INDEXES:
+        op.drop_index(name, table_name=table)
+    for table, column, column_type in IP_COLUMNS:
+        # host() drops the /32 prefix length that text() would add to addresses
+        using = f"host({column})" if isinstance(column_type, postgresql.INET) else f"text({column})"
+        op.alter_column(table, column, type_=sa.String(), existing_type=column_type, postgresql_using=using)
@@ -0,0 +1,49 @@
+"""Warm pools
+
+Revision ID: d5a8c2e61f94
+Revises: c3e7a9d15b82
+Create Date: 2026-10-20 10:41:08.215337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d5a8c2e61f94"
+down_revision: Union[str, None] = "c3e7a9d15b82"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("template", sa.Column("warm_pool_size", sa.Integer(), server_default="0", nullable=False))
+
+    op.add_column("infrastructure", sa.Column("pool_template_id", sa.Integer(), nullable=True))
+    op.add_column("infrastructure", sa.Column("pooled_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f("ix_infrastructure_pool_template_id"), "infrastructure", ["pool_template_id"], unique=False)
+    op.create_foreign_key(
+        "infrastructure_pool_template_id_fkey", "infrastructure", "template", ["pool_template_id"], ["id"]
+    )
+
+    op.alter_column("job", "run_id", existing_type=sa.Integer(), nullable=True)
+    op.add_column("job", sa.Column("template_id", sa.Integer(), nullable=True))
+    op.create_index(op.f("ix_job_template_id"), "job", ["template_id"], unique=False)
+    op.create_foreign_key("job_template_id_fkey", "job", "template", ["template_id"], ["id"])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM job WHERE run_id IS NULL")
+    op.drop_constraint("job_template_id_fkey", "job", type_="foreignkey")
+    op.drop_index(op.f("ix_job_template_id"), table_name="job")
+    op.drop_column("job", "template_id")
+    op.alter_column("job", "run_id", existing_type=sa.Integer(), nullable=False)
+
+    op.drop_constraint("infrastructure_pool_template_id_fkey", "infrastructure", type_="foreignkey")
+    op.drop_index(op.f("ix_infrastructure_pool_template_id"), table_name="infrastructure")
+    op.drop_column("infrastructure", "pooled_at")
+    op.drop_column("infrastructure", "pool_template_id")
+
+    op.drop_column("template", "warm_pool_size")
@@ -0,0 +1,32 @@
+"""Deferred teardown
+
+Revision ID: e2f7b4c81a36
+Revises: d5a8c2e61f94
+Create Date: 2026-10-21 09:12:44.530871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2f7b4c81a36"
+down_revision: Union[str, None] = "d5a8c2e61f94"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("infrastructure", sa.Column("teardown_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("infrastructure", sa.Column("teardown_attempts", sa.Integer(), server_default="0", nullable=False))
+    op.add_column("infrastructure", sa.Column("teardown_error", sa.String(), nullable=True))
+    op.create_index(op.f("ix_infrastructure_teardown_at"), "infrastructure", ["teardown_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_infrastructure_teardown_at"), table_name="infrastructure")
+    op.drop_column("infrastructure", "teardown_error")
+    op.drop_column("infrastructure", "teardown_attempts")
+    op.drop_column("infrastructure", "teardown_at")
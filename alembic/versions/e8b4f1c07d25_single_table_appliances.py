@@ -0,0 +1,84 @@
+"""Single table appliances
+
+Revision ID: e8b4f1c07d25
+Revises: c5d1e8f3a920
+Create Date: 2026-10-19 20:41:07.318452
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e8b4f1c07d25"
+down_revision: Union[str, None] = "c5d1e8f3a920"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# subclass table: (polymorphic identities, {column: type})
+SUBCLASS_COLUMNS = {
+    "router": ("'router'", {"router_type": sa.String()}),
+    "node": (
+        "'node', 'attacker', 'dns'",
+        {"ipc_mode": sa.String(), "depends_on": sqlalchemy_utils.types.json.JSONType(), "group": sa.String()},
+    ),
+}
+# (table, column, subclass table)
+FOREIGN_KEYS = [
+    ("firewall_rule", "router_id", "router"),
+    ("service_container", "parent_node_id", "node"),
+    ("node_file", "node_id", "node"),
+]
+
+
+def _copy_columns(source: str, target: str, columns: list[str]) -> None:
+    for column in columns:
+        op.execute(
+            f'UPDATE {target} SET "{column}" = (SELECT "{column}" FROM {source} WHERE {source}.id = {target}.id) '
+            f"WHERE id IN (SELECT id FROM {source})"
+        )
+
+
+def upgrade() -> None:
+    for table, (_, columns) in SUBCLASS_COLUMNS.items():
+        for column, column_type in columns.items():
+            op.add_column("appliance", sa.Column(column, column_type, nullable=True))
+        _copy_columns(table, "appliance", list(columns))
+
+    for table, column, subclass_table in FOREIGN_KEYS:
+        op.drop_constraint(f"{table}_{column}_fkey", table, type_="foreignkey")
+        op.create_foreign_key(f"{table}_{column}_fkey", table, "appliance", [column], ["id"])
+
+    op.drop_table("router")
+    op.drop_table("node")
+
+
+def downgrade() -> None:
+    for table, (identities, columns) in SUBCLASS_COLUMNS.items():
+        op.create_table(
+            table,
+            sa.Column("id", sa.Integer(), nullable=False),
+            *[sa.Column(column, column_type, nullable=True) for column, column_type in columns.items()],
+            sa.ForeignKeyConstraint(
+                ["id"],
+                ["appliance.id"],
+            ),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.execute(f"INSERT INTO {table} (id) SELECT id FROM appliance WHERE type IN ({identities})")
+        _copy_columns("appliance", table, list(columns))
+
+    op.execute("UPDATE node SET depends_on = '{}' WHERE depends_on IS NULL")
+    op.alter_column("node", "depends_on", existing_type=sqlalchemy_utils.types.json.JSONType(), nullable=False)
+
+    for table, column, subclass_table in FOREIGN_KEYS:
+        op.drop_constraint(f"{table}_{column}_fkey", table, type_="foreignkey")
+        op.create_foreign_key(f"{table}_{column}_fkey", table, subclass_table, [column], ["id"])
+
+    for _, columns in SUBCLASS_COLUMNS.values():
+        for column in columns:
+            op.drop_column("appliance", column)
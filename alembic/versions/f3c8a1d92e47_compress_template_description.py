@@ -0,0 +1,88 @@
+"""Compress template description
+
+Revision ID: f3c8a1d92e47
+Revises: d7a40c9e1b53
+Create Date: 2026-10-19 15:04:37.512904
+
+"""
+import hashlib
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3c8a1d92e47"
+down_revision: Union[str, None] = "d7a40c9e1b53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+template_table = sa.table(
+    "template",
+    sa.column("id", sa.Integer()),
+    sa.column("description", sa.JSON()),
+    sa.column("compressed_description", sa.LargeBinary()),
+    sa.column("digest", sa.String()),
+    sa.column("size", sa.Integer()),
+)
+
+
+def upgrade() -> None:
+    op.add_column("template", sa.Column("compressed_description", sa.LargeBinary(), nullable=True))
+    op.add_column("template", sa.Column("digest", sa.String(length=64), nullable=True))
+    op.add_column("template", sa.Column("size", sa.Integer(), nullable=True))
+
+    # Templates are processed one by one, the descriptions can be large
+    connection = op.get_bind()
+    template_ids = connection.execute(sa.select(template_table.c.id)).scalars().all()
+    for template_id in template_ids:
+        description = connection.execute(
+            sa.select(template_table.c.description).where(template_table.c.id == template_id)
+        ).scalar_one()
+        contents = description.encode()
+        connection.execute(
+            sa.update(template_table)
+            .where(template_table.c.id == template_id)
+            .values(
+                compressed_description=zlib.compress(contents),
+                digest=hashlib.sha256(contents).hexdigest(),
+                size=len(contents),
+            )
+        )
+
+    with op.batch_alter_table("template") as batch_op:
+        batch_op.drop_column("description")
+        batch_op.alter_column("compressed_description", new_column_name="description", nullable=False)
+        batch_op.alter_column("digest", nullable=False)
+        batch_op.alter_column("size", nullable=False)
+
+
+def downgrade() -> None:
+    op.add_column("template", sa.Column("uncompressed_description", sa.JSON(), nullable=True))
+    uncompressed_table = sa.table(
+        "template",
+        sa.column("id", sa.Integer()),
+        sa.column("description", sa.LargeBinary()),
+        sa.column("uncompressed_description", sa.JSON()),
+    )
+
+    connection = op.get_bind()
+    template_ids = connection.execute(sa.select(uncompressed_table.c.id)).scalars().all()
+    for template_id in template_ids:
+        description = connection.execute(
+            sa.select(uncompressed_table.c.description).where(uncompressed_table.c.id == template_id)
+        ).scalar_one()
+        connection.execute(
+            sa.update(uncompressed_table)
+            .where(uncompressed_table.c.id == template_id)
+            .values(uncompressed_description=zlib.decompress(description).decode())
+        )
+
+    with op.batch_alter_table("template") as batch_op:
+        batch_op.drop_column("size")
+        batch_op.drop_column("digest")
+        batch_op.drop_column("description")
+        batch_op.alter_column("uncompressed_description", new_column_name="description", nullable=False)
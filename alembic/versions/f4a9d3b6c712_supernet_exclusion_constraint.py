@@ -0,0 +1,41 @@
+"""Supernet exclusion constraint
+
+Revision ID: f4a9d3b6c712
+Revises: e2f7b4c81a36
+Create Date: 2026-10-21 14:27:05.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f4a9d3b6c712"
+down_revision: Union[str, None] = "e2f7b4c81a36"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the gist index of the constraint replaces the plain one
+    op.drop_index("ix_infrastructure_supernet", table_name="infrastructure")
+    op.create_exclude_constraint(
+        "infrastructure_supernet_excl",
+        "infrastructure",
+        ("supernet", "&&"),
+        using="gist",
+        ops={"supernet": "inet_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("infrastructure_supernet_excl", "infrastructure")
+    op.create_index(
+        "ix_infrastructure_supernet",
+        "infrastructure",
+        ["supernet"],
+        postgresql_using="gist",
+        postgresql_ops={"supernet": "inet_ops"},
+    )
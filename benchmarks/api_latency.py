@@ -0,0 +1,80 @@
+"""
+Measure latency of a cheap API endpoint while infrastructures are being started.
+
+Requires a running dr-emu with an existing Run. Run from the repository root, once with PARSER_WORKERS=0 set for the
+server (parsing in the API process) and once with the process pool enabled:
+    python -m benchmarks.api_latency --url http://127.0.0.1:8000 --run-id 1 --starts 4
+"""
+import asyncio
+import statistics
+import time
+from argparse import ArgumentParser
+
+import httpx
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> list[float]:
+    """
+    Repeatedly request the home endpoint until stopped.
+    :param client: API client
+    :param stop: event signalling the end of measurement
+    :param interval: pause between requests in seconds
+    :return: latencies in milliseconds
+    """
+    latencies: list[float] = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+    return latencies
+
+
+async def start_runs(client: httpx.AsyncClient, run_id: int, starts: int) -> None:
+    async with asyncio.TaskGroup() as tg:
+        for _ in range(starts):
+            tg.create_task(client.post(f"/runs/start/{run_id}/", timeout=None))
+
+
+def summary(name: str, latencies: list[float]) -> str:
+    if not latencies:
+        return f"{name:>6}: no samples"
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return (
+        f"{name:>6}: samples={len(latencies)} p50={quantiles[49]:.1f}ms p95={quantiles[94]:.1f}ms "
+        f"max={max(latencies):.1f}ms"
+    )
+
+
+async def main():
+    argument_parser = ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    argument_parser.add_argument("--run-id", type=int, required=True)
+    argument_parser.add_argument("--starts", type=int, default=4, help="number of concurrent run starts")
+    argument_parser.add_argument("--idle", type=float, default=5, help="seconds of baseline measurement")
+    argument_parser.add_argument("--interval", type=float, default=0.05)
+    arguments = argument_parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=arguments.url) as client:
+        stop = asyncio.Event()
+        idle_probe = asyncio.create_task(probe(client, stop, arguments.interval))
+        await asyncio.sleep(arguments.idle)
+        stop.set()
+        idle = await idle_probe
+
+        stop = asyncio.Event()
+        busy_probe = asyncio.create_task(probe(client, stop, arguments.interval))
+        start = time.perf_counter()
+        await start_runs(client, arguments.run_id, arguments.starts)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        busy = await busy_probe
+
+    print(summary("idle", idle))
+    print(summary("busy", busy))
+    print(f"{arguments.starts} run starts took {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,243 @@
+"""
+Seeded generator of synthetic serialized CYST configurations.
+
+The configuration is produced in the same (jsonpickle) format as `save_configuration`, so it can be stored as a
+template or passed to CYSTParser directly. Run from the repository root:
+    python -m benchmarks.generator --nodes 1000 --seed 42 > template.json
+"""
+import json
+import math
+import random
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import Any
+
+from netaddr import IPNetwork
+
+HOSTS_PER_NETWORK = 240  # /24 networks, the first addresses are left for gateways
+NETWORKS_PER_ROUTER = 8
+
+# service name and its versions in ascending order
+SERVICES: list[tuple[str, list[str]]] = [
+    ("ssh", ["5.1.4", "8.2.0", "9.0.1"]),
+    ("bash", ["5.0.0", "8.1.0"]),
+    ("mysql", ["5.7.40", "8.0.31"]),
+    ("postgres", ["13.0.0", "15.1.0"]),
+    ("wordpress", ["5.9.0", "6.1.1"]),
+    ("vsftpd", ["2.3.4", "3.0.3"]),
+    ("apache", ["2.4.49", "2.4.54"]),
+    ("samba", ["4.15.0", "4.17.2"]),
+]
+
+CONFIGURATION = "cyst.api.configuration"
+
+
+@dataclass
+class GeneratorConfig:
+    """
+    Size of the generated infrastructure.
+    """
+
+    nodes: int = 100
+    networks: int | None = None  # derived from number of nodes if not set
+    services_per_node: int = 2
+    exploits: int = 5
+    data_files: int = 1  # data files per passive service
+    data_size: int = 256  # bytes per data file
+    attackers: int = 1
+    seed: int = 0
+
+    @property
+    def network_count(self) -> int:
+        minimal = math.ceil((self.nodes + self.attackers) / HOSTS_PER_NETWORK)
+        return max(self.networks or 2, minimal, 2)
+
+
+def ip_address(address) -> dict[str, Any]:
+    return {"py/object": "netaddr.ip.IPAddress", "py/state": {"py/tuple": [int(address), 4]}}
+
+
+def ip_network(network: IPNetwork) -> dict[str, Any]:
+    return {
+        "py/object": "netaddr.ip.IPNetwork",
+        "py/state": {"py/tuple": [int(network.network), network.prefixlen, 4]},
+    }
+
+
+def interface(address, network: IPNetwork, item_id: str) -> dict[str, Any]:
+    return {
+        "py/object": f"{CONFIGURATION}.network.elements.InterfaceConfig",
+        "ip": ip_address(address),
+        "net": ip_network(network),
+        "index": -1,
+        "id": item_id,
+    }
+
+
+def firewall(rules: list[dict[str, Any]], item_id: str) -> dict[str, Any]:
+    return {
+        "py/object": f"{CONFIGURATION}.network.firewall.FirewallConfig",
+        "chains": [
+            {
+                "py/object": f"{CONFIGURATION}.network.firewall.FirewallChainConfig",
+                "rules": rules,
+                "id": f"{item_id}_chain",
+            }
+        ],
+        "id": item_id,
+    }
+
+
+def allow_rule(source: IPNetwork, destination: IPNetwork) -> dict[str, Any]:
+    return {
+        "py/object": "cyst.api.network.firewall.FirewallRule",
+        "src_net": ip_network(source),
+        "dst_net": ip_network(destination),
+        "service": "*",
+        "policy": {
+            "py/reduce": [{"py/type": "cyst.api.network.firewall.FirewallPolicy"}, {"py/tuple": [{"py/tuple": [0]}]}]
+        },
+    }
+
+
+def subnets(count: int) -> list[IPNetwork]:
+    """
+    Get distinct /24 networks, 192.168.0.0/16 is used first to keep small templates similar to the real ones.
+    """
+    if count <= 256:
+        return list(IPNetwork("192.168.0.0/16").subnet(24, count=count))
+    return list(IPNetwork("10.0.0.0/8").subnet(24, count=count))
+
+
+def generate(config: GeneratorConfig) -> list[dict[str, Any]]:
+    """
+    Generate serialized CYST configuration items.
+    :param config: size of the infrastructure
+    :return: configuration items in jsonpickle format
+    """
+    generator = random.Random(config.seed)
+    networks = subnets(config.network_count)
+    items: list[dict[str, Any]] = []
+
+    # every router connects a block of networks, the first one is the perimeter router
+    for router_index, start in enumerate(range(0, len(networks), NETWORKS_PER_ROUTER)):
+        router_networks = networks[start : start + NETWORKS_PER_ROUTER]
+        router_id = "perimeter_router" if router_index == 0 else f"router_{router_index}"
+        rules = [
+            allow_rule(source, destination)
+            for source in router_networks
+            for destination in router_networks
+            if source != destination
+        ]
+        items.append(
+            {
+                "py/object": f"{CONFIGURATION}.network.router.RouterConfig",
+                "interfaces": [
+                    interface(network[1], network, f"{router_id}_interface_{index}")
+                    for index, network in enumerate(router_networks)
+                ],
+                "traffic_processors": [firewall(rules, f"{router_id}_firewall")],
+                "routing_table": [],
+                "id": router_id,
+            }
+        )
+
+    # nodes are spread evenly over the networks
+    for node_index in range(config.nodes + config.attackers):
+        network = networks[node_index % len(networks)]
+        address = network[10 + node_index // len(networks)]
+        node_id = f"attacker_{node_index}" if node_index < config.attackers else f"node_{node_index}"
+        active_services = []
+        passive_services = []
+        if node_index < config.attackers:
+            active_services.append(
+                {
+                    "py/object": f"{CONFIGURATION}.host.service.ActiveServiceConfig",
+                    "type": "scripted_actor",
+                    "name": "scripted_attacker",
+                    "owner": "attacker",
+                    "id": f"{node_id}_actor",
+                }
+            )
+        else:
+            for service_index, (name, versions) in enumerate(
+                generator.sample(SERVICES, k=min(config.services_per_node, len(SERVICES)))
+            ):
+                passive_services.append(
+                    {
+                        "py/object": f"{CONFIGURATION}.host.service.PassiveServiceConfig",
+                        "name": name,
+                        "owner": name,
+                        "version": generator.choice(versions),
+                        "local": False,
+                        "private_data": [
+                            {
+                                "py/object": f"{CONFIGURATION}.logic.data.DataConfig",
+                                "id": f"/opt/{name}/data_{data_index}.txt",
+                                "description": generator.randbytes(config.data_size // 2).hex(),
+                                "owner": name,
+                            }
+                            for data_index in range(config.data_files)
+                        ],
+                        "id": f"{node_id}_service_{service_index}",
+                    }
+                )
+
+        items.append(
+            {
+                "py/object": f"{CONFIGURATION}.network.node.NodeConfig",
+                "active_services": active_services,
+                "passive_services": passive_services,
+                "traffic_processors": [],
+                "shell": "",
+                "interfaces": [interface(address, network, f"{node_id}_interface")],
+                "id": node_id,
+            }
+        )
+
+    for exploit_index in range(config.exploits):
+        name, versions = generator.choice(SERVICES)
+        items.append(
+            {
+                "py/object": f"{CONFIGURATION}.logic.exploit.ExploitConfig",
+                "services": [
+                    {
+                        "py/object": f"{CONFIGURATION}.logic.exploit.VulnerableServiceConfig",
+                        "service": name,
+                        "min_version": versions[0],
+                        "max_version": generator.choice(versions),
+                    }
+                ],
+                "id": f"exploit_{exploit_index}",
+            }
+        )
+
+    return items
+
+
+def generate_template(config: GeneratorConfig) -> str:
+    """
+    Generate serialized CYST configuration.
+    :param config: size of the infrastructure
+    :return: configuration in the same format as a stored template description
+    """
+    return json.dumps(generate(config), indent=1)
+
+
+def main():
+    argument_parser = ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--nodes", type=int, default=GeneratorConfig.nodes)
+    argument_parser.add_argument("--networks", type=int)
+    argument_parser.add_argument("--services-per-node", type=int, default=GeneratorConfig.services_per_node)
+    argument_parser.add_argument("--exploits", type=int, default=GeneratorConfig.exploits)
+    argument_parser.add_argument("--data-files", type=int, default=GeneratorConfig.data_files)
+    argument_parser.add_argument("--data-size", type=int, default=GeneratorConfig.data_size)
+    argument_parser.add_argument("--attackers", type=int, default=GeneratorConfig.attackers)
+    argument_parser.add_argument("--seed", type=int, default=GeneratorConfig.seed)
+    arguments = argument_parser.parse_args()
+
+    print(generate_template(GeneratorConfig(**vars(arguments))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare loading of serialized CYST configuration using CYST Environment and the native loader.
+
+Run from the repository root:
+    python -m benchmarks.loader --infrastructure cyst_infrastructure --replicas 1 10 100
+    python -m benchmarks.loader --template template.json
+"""
+import copy
+import gc
+import importlib
+import json
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Callable, Any
+
+from cyst.api.environment.environment import Environment
+
+from parser.lib.cyst_loader import load_configuration
+
+
+def serialize(module_name: str) -> str:
+    """
+    Serialize `all_config_items` of the infrastructure module the same way as the deployment script.
+    :param module_name: importable module with infrastructure description
+    :return: serialized CYST configuration
+    """
+    module = importlib.import_module(module_name)
+    environment = Environment.create()
+    environment.configure(*module.all_config_items)
+    return environment.configuration.general.save_configuration(indent=1)
+
+
+def replicate(description: str, replicas: int) -> str:
+    """
+    Create synthetic large template by copying all configuration items with unique ids.
+    :param description: serialized CYST configuration
+    :param replicas: number of copies
+    :return: serialized CYST configuration
+    """
+    items = json.loads(description)
+    replicated = []
+    for replica in range(replicas):
+        for item in copy.deepcopy(items):
+            if isinstance(item, dict) and "id" in item:
+                item["id"] = f"{item['id']}_{replica}"
+            replicated.append(item)
+
+    return json.dumps(replicated, indent=1)
+
+
+def environment_loader(description: str) -> Any:
+    return Environment.create().configuration.general.load_configuration(description)
+
+
+def measure(loader: Callable[[str], Any], description: str, repeat: int) -> tuple[float, float]:
+    """
+    Measure the best wall time and the peak of allocated memory of the loader.
+    :param loader: loader to measure
+    :param description: serialized CYST configuration
+    :param repeat: number of repetitions
+    :return: time in milliseconds, memory peak in MiB
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        loader(description)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    loader(description)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best * 1000, peak / 2**20
+
+
+def main():
+    argument_parser = ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--infrastructure", default="cyst_infrastructure", help="infrastructure module")
+    argument_parser.add_argument("--template", help="file with already serialized configuration")
+    argument_parser.add_argument("--replicas", type=int, nargs="+", default=[1, 10, 100])
+    argument_parser.add_argument("--repeat", type=int, default=5)
+    arguments = argument_parser.parse_args()
+
+    if arguments.template:
+        with open(arguments.template) as template_file:
+            description = template_file.read()
+    else:
+        description = serialize(arguments.infrastructure)
+    # warm up CYST plugin discovery, so it is not part of the first measured sample
+    environment_loader(description)
+
+    print(f"{'replicas':>8} {'size [KiB]':>10} {'loader':>12} {'time [ms]':>10} {'peak [MiB]':>10}")
+    for replicas in arguments.replicas:
+        template = replicate(description, replicas)
+        for name, loader in (("environment", environment_loader), ("native", load_configuration)):
+            elapsed, peak = measure(loader, template, arguments.repeat)
+            print(f"{replicas:>8} {len(template) / 1024:>10.1f} {name:>12} {elapsed:>10.2f} {peak:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
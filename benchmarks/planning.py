@@ -0,0 +1,197 @@
+"""
+Time and memory profile of the infrastructure planning stages on synthetic templates.
+
+Stages are measured separately: loading and parsing of the template, baking of the DB models (against an in-memory
+SQLite database), DNS configuration, and renaming and re-addressing of the infrastructure. Docker is not used.
+Results are stored as JSON, so they can be compared across commits. Run from the repository root:
+    python -m benchmarks.planning --nodes 10 100 1000 10000
+    python -m benchmarks.planning --nodes 10 100 --baseline benchmarks/results/<commit>.json
+"""
+import asyncio
+import gc
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+from unittest.mock import patch
+
+from netaddr import IPNetwork
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from benchmarks.generator import GeneratorConfig, generate_template
+from dr_emu.controllers.infrastructure import InfrastructureController
+from dr_emu.lib import util
+from dr_emu.models import Base, Infrastructure
+from parser.cyst_parser import CYSTParser
+
+RESULTS_DIRECTORY = Path(__file__).parent / "results"
+STAGES = ["load", "parse", "bake_models", "configure_dns", "change_ipaddresses", "change_names"]
+
+
+class Pipeline:
+    """
+    Planning stages of a single template, each stage uses the state produced by the previous ones.
+    """
+
+    def __init__(self, description: str, db_session):
+        self.description = description
+        self.db_session = db_session
+        self.parser: CYSTParser | None = None
+        self.baked: tuple | None = None
+        self.controller: InfrastructureController | None = None
+
+    async def load(self):
+        self.parser = CYSTParser(self.description)
+
+    async def parse(self):
+        await self.parser.parse()
+
+    async def bake_models(self):
+        self.baked = await self.parser.bake_models(self.db_session, "benchmark")
+
+    async def configure_dns(self):
+        await InfrastructureController.configure_dns(self.baked[2])
+
+    async def change_ipaddresses(self):
+        networks, routers, nodes, _, _ = self.baked
+        infrastructure = Infrastructure(
+            name="benchmark", supernet=IPNetwork("10.0.0.0/8"), networks=networks, routers=routers, nodes=nodes
+        )
+        available_networks = await util.generate_infrastructure_subnets(
+            IPNetwork("10.0.0.0/8"), list(self.parser.networks_ips), set()
+        )
+        # docker client is created by the controller, but it is not used during planning
+        with patch("dr_emu.controllers.infrastructure.docker.from_env"):
+            self.controller = await InfrastructureController.prepare_controller_for_infra_creation(
+                infrastructure=infrastructure, available_networks=available_networks
+            )
+
+    async def change_names(self):
+        await self.controller.change_names(container_names=set(), network_names=set(), volumes=self.baked[3])
+
+
+async def run_pipeline(description: str, measure: Callable[[str, Callable[[], Awaitable[Any]]], Awaitable[None]]):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as db_session:
+        pipeline = Pipeline(description, db_session)
+        for stage in STAGES:
+            await measure(stage, getattr(pipeline, stage))
+
+    await engine.dispose()
+
+
+async def profile(description: str) -> dict[str, dict[str, float]]:
+    """
+    Run the planning stages twice, once for the time and once for the memory measurement (tracemalloc slows down the
+    measured code, so the time would be skewed).
+    :param description: serialized CYST configuration
+    :return: seconds and peak of allocated memory in MiB for each stage
+    """
+    results: dict[str, dict[str, float]] = {stage: {} for stage in STAGES}
+
+    async def measure_time(stage: str, function: Callable[[], Awaitable[Any]]):
+        gc.collect()
+        start = time.perf_counter()
+        await function()
+        results[stage]["seconds"] = time.perf_counter() - start
+
+    async def measure_memory(stage: str, function: Callable[[], Awaitable[Any]]):
+        gc.collect()
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        await function()
+        _, peak = tracemalloc.get_traced_memory()
+        results[stage]["peak_mib"] = (peak - start) / 2**20
+
+    await run_pipeline(description, measure_time)
+    tracemalloc.start()
+    try:
+        await run_pipeline(description, measure_memory)
+    finally:
+        tracemalloc.stop()
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list[dict[str, Any]], baseline_path: Path) -> None:
+    baseline = {
+        (result["nodes"], result["stage"]): result for result in json.loads(baseline_path.read_text())["results"]
+    }
+    print(f"\nCompared to {baseline_path}:")
+    for result in results:
+        if (previous := baseline.get((result["nodes"], result["stage"]))) is None:
+            continue
+        changes = []
+        for metric in ("seconds", "peak_mib"):
+            if previous[metric]:
+                changes.append(f"{metric} {100 * (result[metric] / previous[metric] - 1):+.1f}%")
+        print(f"{result['nodes']:>8} {result['stage']:>20} {', '.join(changes)}")
+
+
+async def main():
+    argument_parser = ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--nodes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    argument_parser.add_argument("--services-per-node", type=int, default=GeneratorConfig.services_per_node)
+    argument_parser.add_argument("--exploits", type=int, default=GeneratorConfig.exploits)
+    argument_parser.add_argument("--data-files", type=int, default=GeneratorConfig.data_files)
+    argument_parser.add_argument("--seed", type=int, default=GeneratorConfig.seed)
+    argument_parser.add_argument("--output", type=Path, help="result file, benchmarks/results/<commit>.json by default")
+    argument_parser.add_argument("--baseline", type=Path, help="result file to compare with")
+    arguments = argument_parser.parse_args()
+
+    commit = git_commit()
+    results: list[dict[str, Any]] = []
+    print(f"{'nodes':>8} {'stage':>20} {'time [s]':>10} {'peak [MiB]':>10}")
+    for nodes in arguments.nodes:
+        description = generate_template(
+            GeneratorConfig(
+                nodes=nodes,
+                services_per_node=arguments.services_per_node,
+                exploits=arguments.exploits,
+                data_files=arguments.data_files,
+                seed=arguments.seed,
+            )
+        )
+        for stage, measurements in (await profile(description)).items():
+            results.append({"nodes": nodes, "stage": stage, **measurements})
+            print(f"{nodes:>8} {stage:>20} {measurements['seconds']:>10.3f} {measurements['peak_mib']:>10.2f}")
+
+    output = arguments.output or RESULTS_DIRECTORY / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                "commit": commit,
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "arguments": {key: str(value) for key, value in vars(arguments).items()},
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Results saved to {output}")
+
+    if arguments.baseline:
+        compare(results, arguments.baseline)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Compare resetting an infrastructure in place with replacing it by a new Run instance.
+
+Requires a running dr-emu (API and workers) with an existing Run whose template has no warm pool, otherwise the rebuild
+only claims a prebuilt infrastructure. A new instance of the Run is built (the rebuild), then it is reset repeatedly
+and finally torn down. Run from the repository root:
+    python -m benchmarks.reset --url http://127.0.0.1:8000 --run-id 1 --resets 5
+"""
+import asyncio
+import statistics
+import time
+from argparse import ArgumentParser
+
+import httpx
+
+from shared import endpoints
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+async def rebuild(client: httpx.AsyncClient, run_id: int, poll_interval: float) -> tuple[float, int]:
+    """
+    Start a new instance of the Run and wait until its Job finishes.
+    :param client: API client
+    :param run_id: ID of Run
+    :param poll_interval: seconds between checks of the Job
+    :return: build time in seconds and ID of the built infrastructure
+    """
+    infrastructures = await client.get(endpoints.Infrastructure.list, params={"run_id": run_id, "limit": 1000})
+    existing = {infrastructure["id"] for infrastructure in infrastructures.json()}
+
+    start = time.perf_counter()
+    response = await client.post(endpoints.Run.start.format(run_id))
+    response.raise_for_status()
+    job = response.json()
+    while job["status"] not in FINISHED:
+        await asyncio.sleep(poll_interval)
+        job = (await client.get(endpoints.Job.get.format(job["id"]))).json()
+    elapsed = time.perf_counter() - start
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"Build failed: {job['error']}")
+
+    infrastructures = await client.get(endpoints.Infrastructure.list, params={"run_id": run_id, "limit": 1000})
+    (infrastructure_id,) = {infrastructure["id"] for infrastructure in infrastructures.json()} - existing
+    return elapsed, infrastructure_id
+
+
+async def reset(client: httpx.AsyncClient, infrastructure_id: int) -> float:
+    start = time.perf_counter()
+    response = await client.post(endpoints.Infrastructure.reset.format(infrastructure_id))
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main():
+    argument_parser = ArgumentParser(description=__doc__)
+    argument_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    argument_parser.add_argument("--run-id", type=int, required=True)
+    argument_parser.add_argument("--resets", type=int, default=5)
+    argument_parser.add_argument("--poll-interval", type=float, default=0.5)
+    arguments = argument_parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=arguments.url, timeout=None) as client:
+        rebuild_time, infrastructure_id = await rebuild(client, arguments.run_id, arguments.poll_interval)
+        try:
+            reset_times = [await reset(client, infrastructure_id) for _ in range(arguments.resets)]
+        finally:
+            start = time.perf_counter()
+            await client.delete(endpoints.Infrastructure.delete.format(infrastructure_id))
+            teardown_time = time.perf_counter() - start
+
+    # replacing an infrastructure between episodes means tearing it down and building a new one
+    replace_time = teardown_time + rebuild_time
+    reset_time = statistics.median(reset_times)
+    print(f"replace: {replace_time:.1f}s (teardown {teardown_time:.1f}s, build {rebuild_time:.1f}s)")
+    print(
+        f"  reset: median={reset_time:.1f}s min={min(reset_times):.1f}s max={max(reset_times):.1f}s "
+        f"({arguments.resets} resets)"
+    )
+    print(f"speedup: {replace_time / reset_time:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
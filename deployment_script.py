@@ -36,14 +36,24 @@ def create_run(template_id: int) -> dict:
         return run.json()
 
 
-async def start_run(run_id: int):
+async def start_run(run_id: int, count: int = 1):
     async with httpx.AsyncClient() as client:
-        run_start = await client.post(f"http://127.0.0.1:8000/runs/start/{run_id}/", timeout=None)
-    if run_start.status_code != 200:
-        raise RuntimeError(f"message: {run_start.text}, code: {run_start.status_code}")
-    else:
-        print(f"Run {run_id} started successfully")
-        return run_id
+        run_start = await client.post(
+            f"http://127.0.0.1:8000/runs/start/{run_id}/", params={"count": count}, timeout=None
+        )
+        if run_start.status_code != 202:
+            raise RuntimeError(f"message: {run_start.text}, code: {run_start.status_code}")
+
+        # the run is built by a worker, wait for its job to finish
+        job = run_start.json()
+        while job["status"] in ("queued", "running"):
+            await asyncio.sleep(2)
+            job = (await client.get(f"http://127.0.0.1:8000/jobs/get/{job['id']}/")).json()
+
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"Run {run_id} failed to start: {job['status']}, {job['error']}")
+    print(f"Run {run_id} started successfully")
+    return run_id
 
 import requests
 
@@ -131,10 +141,8 @@ async def main(config_items=all_config_items, instances=1):
     template_id = create_template(config)["id"]
     run_id = create_run(template_id)["id"]
 
-    async with asyncio.TaskGroup() as tg:
-        for _ in range(instances):
-            tg.create_task(start_run(run_id))
-
+    # the instances are built together, sharing the template parse and image resolution
+    await start_run(run_id, instances)
 
     print("done")
     return run_id
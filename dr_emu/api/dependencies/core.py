@@ -1,7 +1,26 @@
 from typing import Annotated
 
 from dr_emu.database_config import get_db_session
-from fastapi import Depends
+from dr_emu.settings import settings
+from fastapi import Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+
+class Page:
+    """
+    Keyset pagination parameters of list endpoints, objects are ordered by their ID.
+    """
+
+    def __init__(
+        self,
+        limit: int = Query(
+            settings.page_size, ge=1, le=settings.max_page_size, description="Maximum number of objects in the response"
+        ),
+        after: int | None = Query(None, description="Return objects with greater ID (last ID of the previous page)"),
+    ):
+        self.limit = limit
+        self.after = after
+
+
 DBSession = Annotated[AsyncSession, Depends(get_db_session)]
+Pagination = Annotated[Page, Depends()]
@@ -0,0 +1,138 @@
+from fastapi import APIRouter, status, HTTPException, Request
+from sqlalchemy.exc import NoResultFound
+
+from shared import constants
+from dr_emu.api.dependencies.core import DBSession, Pagination
+from dr_emu.api.helpers import nonexistent_object_msg, page_response
+from dr_emu.controllers import docker_host as docker_host_controller
+from dr_emu.lib.exceptions import DockerHostStateError, DockerHostUnreachable
+from dr_emu.models import DockerHost
+from dr_emu.schemas.docker_host import DockerHostSchema, DockerHostOut, DockerHostUpdate, DockerHostDetail
+
+router = APIRouter(
+    prefix="/hosts",
+    tags=["docker hosts"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+def host_out(host: DockerHost) -> DockerHostOut:
+    return DockerHostOut(id=host.id, name=host.name, url=host.url, capacity=host.capacity, enabled=host.enabled)
+
+
+docker_host_create_description = """
+Register docker host new infrastructures can be placed on. Without any registered host, all infrastructures run on
+the docker daemon of dr-emu itself, register it too (e.g. `unix:///var/run/docker.sock`) to keep using it.
+
+Each new infrastructure is placed on the enabled host with the most free capacity, preferring hosts that already have
+the images of the template and avoiding hosts building many infrastructures. The daemon must be reachable and have the
+management network (unless it is ignored).
+"""
+
+
+@router.post(
+    "/create/",
+    status_code=status.HTTP_201_CREATED,
+    description=docker_host_create_description,
+    responses={
+        201: {"description": "Object successfully created"},
+        400: {"description": "Docker daemon is unreachable"},
+        409: {"description": "Docker host with the name or URL already exists"},
+    },
+    response_model=DockerHostOut,
+)
+async def create_host(host_schema: DockerHostSchema, session: DBSession):
+    """
+    responses:
+      201:
+        description: Docker host was registered
+    """
+    try:
+        host = await docker_host_controller.create_host(
+            host_schema.name, host_schema.url, host_schema.capacity, session
+        )
+    except DockerHostUnreachable as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    except DockerHostStateError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+    return host_out(host)
+
+
+@router.put("/update/{host_id}/", response_model=DockerHostOut)
+async def update_host(host_id: int, host_update: DockerHostUpdate, session: DBSession):
+    """
+    responses:
+      200:
+        description: Docker host was updated, its infrastructures are kept
+      404:
+        description: Docker host with specified id does not exist
+    """
+    try:
+        host = await docker_host_controller.update_host(host_id, session, host_update.capacity, host_update.enabled)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.DOCKER_HOST, host_id)
+        )
+
+    return host_out(host)
+
+
+@router.delete(
+    "/delete/{host_id}/",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={
+        204: {"description": "Object successfully deleted"},
+        409: {"description": "Docker host still has infrastructures"},
+    },
+)
+async def delete_host(host_id: int, session: DBSession):
+    """
+    responses:
+      204:
+        description: Docker host was unregistered
+      404:
+        description: Docker host with specified id does not exist
+    """
+    try:
+        await docker_host_controller.delete_host(host_id, session)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.DOCKER_HOST, host_id)
+        )
+    except DockerHostStateError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+
+@router.get("/", response_model=list[DockerHostOut])
+async def list_hosts(request: Request, session: DBSession, page: Pagination, enabled: bool | None = None):
+    """
+    responses:
+      200:
+        description: List docker hosts
+      304:
+        description: Listed docker hosts didn't change (If-None-Match)
+    """
+    hosts = await docker_host_controller.list_hosts(session, page.limit, page.after, enabled)
+
+    return page_response(request, [host_out(host) for host in hosts], page.limit)
+
+
+@router.get("/get/{host_id}/", response_model=DockerHostDetail)
+async def get_host(host_id: int, session: DBSession):
+    """
+    responses:
+      200:
+        description: Docker host with the number of its infrastructures
+      404:
+        description: Docker host with specified id does not exist
+    """
+    try:
+        host = await docker_host_controller.get_host(host_id, session)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.DOCKER_HOST, host_id)
+        )
+    load = (await docker_host_controller.get_load([host_id], session))[host_id]
+
+    return DockerHostDetail(**host_out(host).model_dump(), infrastructures=load.infrastructures, building=load.building)
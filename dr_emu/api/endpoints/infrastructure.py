@@ -1,12 +1,13 @@
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Request
 from sqlalchemy.exc import NoResultFound
 
-from dr_emu.models import Attacker, ServiceAttacker
 from shared import constants
-from dr_emu.api.dependencies.core import DBSession
-from dr_emu.api.helpers import nonexistent_object_msg
+from dr_emu.api.dependencies.core import DBSession, Pagination
+from dr_emu.api.helpers import nonexistent_object_msg, page_response
+from dr_emu.controllers import teardown, changes as changes_controller
 from dr_emu.controllers.infrastructure import InfrastructureController
-from dr_emu.schemas.infrastructure import InfrastructureInfo, NetworkSchema, ApplianceSchema, InfrastructureSchema
+from dr_emu.lib.exceptions import InfrastructureStateError, TemplateChangeError
+from dr_emu.schemas.infrastructure import InfrastructureInfo, InfrastructureSchema, InfrastructureApply, OperationOut
 
 router = APIRouter(
     prefix="/infrastructures",
@@ -24,63 +25,105 @@ router = APIRouter(
 )
 async def destroy_infra(infrastructure_id: int, session: DBSession):
     try:
-        infrastructure = await InfrastructureController.get_infra(infrastructure_id, session)
+        await InfrastructureController.get_infra(infrastructure_id, session)
     except NoResultFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=nonexistent_object_msg(constants.INFRASTRUCTURE, infrastructure_id),
         )
 
-    await InfrastructureController.stop_infra(infrastructure)
-    await InfrastructureController.delete_infra(infrastructure, session)
+    # the docker objects are removed in the background by a worker
+    await teardown.schedule_teardown([infrastructure_id], session)
 
 
 @router.get("/", response_model=list[InfrastructureSchema])
-async def list_infrastructures(session: DBSession):
-    infras = await InfrastructureController.list_infrastructures(session)
+async def list_infrastructures(
+    request: Request,
+    session: DBSession,
+    page: Pagination,
+    name: str | None = None,
+    run_id: int | None = None,
+):
+    infras = await InfrastructureController.list_infrastructures(session, page.limit, page.after, name, run_id)
     response = [InfrastructureSchema(id=infra.id, name=infra.name, run_id=infra.instance.run_id) for infra in infras]
-    return response
+    return page_response(request, response, page.limit)
 
 
 @router.get("/get/{infrastructure_id}/", response_model=InfrastructureInfo)
 async def get_infra(infrastructure_id: int, session: DBSession):
     try:
-        infrastructure = await InfrastructureController.get_infra_info(infrastructure_id, session)
-
-        networks_info = []
-
-        for network in infrastructure.networks:
-            appliances_info = []
-            for interface in network.interfaces:
-                appliances_info.append(
-                    ApplianceSchema(
-                        name=interface.appliance.name,
-                        ip=str(interface.ipaddress),
-                        original_ip=str(interface.original_ip),
-                    )
-                )
-            network_info = NetworkSchema(name=network.name, ip=str(network.ipaddress), appliances=appliances_info)
-            networks_info.append(network_info)
-
-        attackers = {}
-        for node in infrastructure.nodes:
-            if type(node) is Attacker:
-                for service in node.service_containers:
-                    if type(service) is ServiceAttacker:
-                        attackers[node.name] = service.environment["CRYTON_WORKER_NAME"]
-
-        infra_info = InfrastructureInfo(
-            id=infrastructure_id,
-            name=infrastructure.name,
-            run_id=infrastructure.instance.run_id,
-            networks=networks_info,
-            attackers=attackers
+        return await InfrastructureController.get_infra_snapshot(infrastructure_id, session)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=nonexistent_object_msg(constants.INFRASTRUCTURE, infrastructure_id),
         )
 
-        return infra_info
 
+infrastructure_reset_description = """
+Reset the infrastructure to its initial state in place, e.g. between agent episodes.
+
+Node and service containers and their volumes are recreated from their images and the nodes are configured again.
+Networks, routers, IP addresses, names and the infrastructure's records are kept, so the reset takes a fraction of
+stopping the Run and starting a new instance.
+"""
+
+
+@router.post(
+    "/reset/{infrastructure_id}/",
+    description=infrastructure_reset_description,
+    responses={204: {"description": "Infrastructure was reset"}, 409: {"description": "Infrastructure is not built"}},
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def reset_infra(infrastructure_id: int):
+    # the reset opens DB sessions only for loading and saving the infrastructure
+    try:
+        await InfrastructureController.reset_infra(infrastructure_id)
     except NoResultFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=nonexistent_object_msg(constants.INFRASTRUCTURE, infrastructure_id),
         )
+    except InfrastructureStateError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+
+infrastructure_apply_description = """
+Change the infrastructure to match a (changed) template without building it again, e.g. after adding a node, changing
+a firewall rule or a service version.
+
+The plan of the template is compared with the infrastructure and only the difference is applied. Removed nodes and
+networks are deleted, added ones are created, and changed nodes (image, services, data files, addresses) are replaced.
+Firewall rules, routes and DNS records are updated in the running routers and DNS node. Nodes are matched by their
+names in the template and networks by their template addresses. Routers can't be added or removed in place.
+
+The planned operations are returned, with `dry_run` nothing is changed.
+"""
+
+
+@router.post(
+    "/apply/{infrastructure_id}/",
+    description=infrastructure_apply_description,
+    response_model=list[OperationOut],
+    responses={
+        404: {"description": "Infrastructure or Template with specified ID not found"},
+        409: {"description": "Infrastructure is not built or the change can't be applied in place"},
+    },
+)
+async def apply_template(infrastructure_id: int, apply: InfrastructureApply):
+    # the changes open DB sessions only for loading and saving the infrastructure
+    try:
+        operations = await changes_controller.apply_template(infrastructure_id, apply.template_id, apply.dry_run)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{nonexistent_object_msg(constants.INFRASTRUCTURE, infrastructure_id)} "
+            f"or {nonexistent_object_msg(constants.TEMPLATE, apply.template_id)}",
+        )
+    except (InfrastructureStateError, TemplateChangeError) as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+    return [
+        OperationOut(action=operation.action, kind=operation.kind, name=operation.name, detail=operation.detail)
+        for operation in operations
+    ]
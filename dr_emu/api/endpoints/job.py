@@ -0,0 +1,74 @@
+from fastapi import APIRouter, HTTPException, status, Request
+from sqlalchemy.exc import NoResultFound
+
+from shared import constants
+from dr_emu.api.dependencies.core import DBSession, Pagination
+from dr_emu.api.helpers import nonexistent_object_msg, page_response
+from dr_emu.controllers import job as job_controller
+from dr_emu.lib.exceptions import JobStateError
+from dr_emu.models import JobStatus
+from dr_emu.schemas.job import JobOut
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    responses={
+        404: {"description": "Job with specified ID Not found"},
+    },
+)
+
+
+@router.get("/", response_model=list[JobOut])
+async def list_jobs(
+    request: Request,
+    session: DBSession,
+    page: Pagination,
+    status: JobStatus | None = None,
+    run_id: int | None = None,
+):
+    jobs = await job_controller.list_jobs(session, page.limit, page.after, status, run_id)
+    return page_response(request, [JobOut.model_validate(job) for job in jobs], page.limit)
+
+
+@router.get("/get/{job_id}/", response_model=JobOut)
+async def get_job(job_id: int, session: DBSession):
+    try:
+        return JobOut.model_validate(await job_controller.get_job(job_id, session))
+    except NoResultFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.JOB, job_id))
+
+
+@router.post(
+    "/cancel/{job_id}/",
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={
+        202: {"description": "Job was cancelled, running Job is stopped by its worker"},
+        409: {"description": "Job has already finished"},
+    },
+    response_model=JobOut,
+)
+async def cancel_job(job_id: int, session: DBSession):
+    try:
+        return JobOut.model_validate(await job_controller.cancel_job(job_id, session))
+    except NoResultFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.JOB, job_id))
+    except JobStateError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+
+@router.post(
+    "/retry/{job_id}/",
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={
+        202: {"description": "Job was queued again"},
+        409: {"description": "Job is neither failed nor cancelled"},
+    },
+    response_model=JobOut,
+)
+async def retry_job(job_id: int, session: DBSession):
+    try:
+        return JobOut.model_validate(await job_controller.retry_job(job_id, session))
+    except NoResultFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.JOB, job_id))
+    except JobStateError as error:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
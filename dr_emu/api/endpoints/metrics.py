@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+
+from dr_emu.database_config import sessionmanager
+from dr_emu.lib import metrics
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+)
+
+
+@router.get("/")
+async def list_metrics() -> dict[str, dict[str, float | int | str]]:
+    return {"db_pool": sessionmanager.pool_status(), **metrics.collect()}
@@ -1,14 +1,16 @@
-from docker.errors import ImageNotFound, APIError
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import NoResultFound
 
-from dr_emu.api.dependencies.core import DBSession
-from dr_emu.api.helpers import nonexistent_object_msg
+from dr_emu.api.dependencies.core import DBSession, Pagination
+from dr_emu.api.helpers import nonexistent_object_msg, page_response
 from dr_emu.controllers import run as run_controller
+from dr_emu.database_config import sessionmanager
+from dr_emu.lib import events
+from dr_emu.schemas.job import JobOut
 from dr_emu.schemas.run import Run, RunOut, RunInfo
-from dr_emu.settings import settings
 
-from shared import constants
+from shared import constants, endpoints
 
 router = APIRouter(
     prefix="/runs",
@@ -58,11 +60,15 @@ async def delete_run(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.RUN, run_id))
 
 
-# Make a data stream for checks that the run is still building
-
-
 run_start_description = """
-Start specified number of Run instances.
+Queue a build of `count` Run instances, the build is executed by a worker process.
+Progress of the build can be followed on the returned Job (see the `Location` header). The instances share one
+template parse, image resolution and address allocation, and are built in parallel. Instances that fail are reported
+in the Job's `error`, the ones that succeeded are kept and retrying the Job builds only the missing ones.
+
+## Warm pool
+If the Run's template has a warm pool, its idle infrastructures are claimed as instances right away and only the rest
+is built. The returned Job has them counted in `built` and is `succeeded` if the pool had all of them.
 
 ## Instance limit
 The maximum number of instances possible is 256 dues to IP address space given that the whole 
@@ -73,18 +79,48 @@ private ip range of the **10.0.0.0/8** is available.
 @router.post(
     "/start/{run_id}/",
     description=run_start_description,
-    )
-async def start_run(session: DBSession, run_id: int):
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={202: {"description": "Build of the Run instances was queued"}},
+    response_model=JobOut,
+)
+async def start_run(
+    run_id: int,
+    session: DBSession,
+    response: Response,
+    count: int = Query(1, ge=1, le=constants.MAX_RUN_INSTANCES, description="Number of instances to start"),
+):
     try:
-        await run_controller.start_run(
-            run_id, session
-        )
+        job = await run_controller.start_run(run_id, session, count)
     except NoResultFound:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.RUN, run_id)
-        )
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.RUN, run_id))
 
-    return {"message": f"Run instance started"}
+    response.headers["Location"] = endpoints.Job.get.format(job.id)
+    return JobOut.model_validate(job)
+
+
+@router.get(
+    "/events/{run_id}/",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}, "description": "Stream of build events"}},
+)
+async def stream_run_events(run_id: int):
+    """
+    Stream progress of the builds of the Run as Server-Sent Events. The event name is its status (started, finished,
+    failed, or the state of the Job), the data is a JSON object with the build phase and the name of the image,
+    network or appliance.
+    """
+    # the request session would be held for the whole stream
+    async with sessionmanager.session() as session:
+        try:
+            await run_controller.get_run(run_id, session)
+        except NoResultFound:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.RUN, run_id)
+            )
+
+    return StreamingResponse(
+        events.stream(run_id), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
 
 
 @router.post("/stop/{run_id}/")
@@ -94,26 +130,30 @@ async def stop_run(run_id: int, session: DBSession):
     except NoResultFound:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.RUN, run_id))
 
-    return {"message": f"All instances of Run {run_id} has been stopped"}
+    return {"message": f"All instances of Run {run_id} are being stopped"}
 
 
 @router.get("/", response_model=list[RunInfo])
-async def list_runs(session: DBSession):
-    runs = await run_controller.list_runs(session)
-    if runs:
-        result = []
-        for run in runs:
-            infrastructure_ids = [instance.infrastructure.id for instance in run.instances]
-            run_info = RunInfo(
-                id=run.id,
-                name=run.name,
-                template_id=run.template_id,
-                infrastructure_ids=infrastructure_ids,
-            )
-            result.append(run_info)
-        return result
-    else:
-        return []
+async def list_runs(
+    request: Request,
+    session: DBSession,
+    page: Pagination,
+    name: str | None = None,
+    template_id: int | None = None,
+):
+    runs = await run_controller.list_runs(session, page.limit, page.after, name, template_id)
+    result = []
+    for run in runs:
+        infrastructure_ids = [instance.infrastructure.id for instance in run.instances if instance.infrastructure]
+        run_info = RunInfo(
+            id=run.id,
+            name=run.name,
+            template_id=run.template_id,
+            infrastructure_ids=infrastructure_ids,
+        )
+        result.append(run_info)
+
+    return page_response(request, result, page.limit)
 
 
 @router.get("/get/{run_id}/", response_model=RunInfo)
@@ -1,11 +1,11 @@
-from fastapi import APIRouter, status, Response, HTTPException
+from fastapi import APIRouter, status, Response, HTTPException, Request
 from sqlalchemy.exc import NoResultFound
 
 from shared import constants
-from dr_emu.api.dependencies.core import DBSession
-from dr_emu.api.helpers import nonexistent_object_msg
-from dr_emu.controllers import template as template_controller
-from dr_emu.schemas.template import TemplateSchema, TemplateOut
+from dr_emu.api.dependencies.core import DBSession, Pagination
+from dr_emu.api.helpers import nonexistent_object_msg, page_response
+from dr_emu.controllers import template as template_controller, pool as pool_controller
+from dr_emu.schemas.template import TemplateSchema, TemplateOut, TemplateSummary, WarmPoolSize, WarmPoolOut
 
 router = APIRouter(
     prefix="/templates",
@@ -58,6 +58,8 @@ async def delete_template(template_id: int, session: DBSession, response: Respon
         description: Template with specified id does not exist
     """
     try:
+        # the warm pool is removed first, its infrastructures and Jobs reference the Template
+        await pool_controller.delete_pool(template_id, session)
         await template_controller.delete_template(template_id, session)
     except NoResultFound:
         raise HTTPException(
@@ -65,17 +67,92 @@ async def delete_template(template_id: int, session: DBSession, response: Respon
         )
 
 
-@router.get("/", response_model=list[TemplateOut])
-async def list_templates(session: DBSession):
+@router.get("/", response_model=list[TemplateSummary])
+async def list_templates(
+    request: Request,
+    session: DBSession,
+    page: Pagination,
+    name: str | None = None,
+):
     """
     responses:
       200:
-        description: List templates
+        description: List templates without their descriptions
+      304:
+        description: Listed templates didn't change (If-None-Match)
     """
-    templates = await template_controller.list_templates(session)
+    templates = await template_controller.list_templates(session, page.limit, page.after, name)
 
-    response = []
-    for template in templates:
-        response.append(TemplateOut(name=template.name, id=template.id, description=template.description))
+    response = [
+        TemplateSummary(id=template.id, name=template.name, digest=template.digest, size=template.size)
+        for template in templates
+    ]
 
-    return response
+    return page_response(request, response, page.limit)
+
+
+@router.get("/get/{template_id}/", response_model=TemplateOut)
+async def get_template(template_id: int, session: DBSession):
+    """
+    responses:
+      200:
+        description: Template including its description
+      404:
+        description: Template with specified id does not exist
+    """
+    try:
+        template = await template_controller.get_template(template_id, session)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.TEMPLATE, template_id)
+        )
+
+    return TemplateOut(id=template.id, name=template.name, description=template.description)
+
+
+warm_pool_description = """
+Set the number of idle infrastructures of the template kept built, so that starting a Run of the template claims them
+instead of waiting for a build.
+
+The workers refill the pool in the background (a few infrastructures at a time, only while the docker hosts have
+capacity) and tear down the surplus infrastructures when the size is lowered. Claims are counted in the
+`warm_pool_claims` metric.
+"""
+
+
+@router.put("/pool/{template_id}/", description=warm_pool_description, response_model=WarmPoolOut)
+async def set_warm_pool(template_id: int, pool: WarmPoolSize, session: DBSession):
+    """
+    responses:
+      200:
+        description: Size of the warm pool was set
+      404:
+        description: Template with specified id does not exist
+    """
+    try:
+        pool_status = await pool_controller.set_pool_size(template_id, pool.size, session)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.TEMPLATE, template_id)
+        )
+
+    return WarmPoolOut(size=pool_status.size, ready=pool_status.ready, building=pool_status.building)
+
+
+@router.get("/pool/{template_id}/", response_model=WarmPoolOut)
+async def get_warm_pool(template_id: int, session: DBSession):
+    """
+    responses:
+      200:
+        description: Size of the warm pool and its ready and building infrastructures
+      404:
+        description: Template with specified id does not exist
+    """
+    try:
+        pool_status = await pool_controller.get_pool_status(template_id, session)
+    except NoResultFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=nonexistent_object_msg(constants.TEMPLATE, template_id)
+        )
+
+    return WarmPoolOut(size=pool_status.size, ready=pool_status.ready, building=pool_status.building)
@@ -1,2 +1,34 @@
+import hashlib
+import json
+from typing import Sequence
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+
 def nonexistent_object_msg(model, model_id):
     return f"{model} with id {model_id} doesn't exist"
+
+
+def page_response(request: Request, items: Sequence[BaseModel], limit: int) -> Response:
+    """
+    Serialize a page of a list endpoint, supports conditional requests.
+    Link to the next page is sent in the `Link` header if the page is full. The `ETag` is a digest of the body, so
+    clients sending it back in `If-None-Match` get an empty 304 response if the page didn't change.
+    :param request: request of the list endpoint
+    :param items: objects of the page ordered by their ID
+    :param limit: requested page size
+    :return: JSON response or 304 response
+    """
+    content = json.dumps(jsonable_encoder(items), separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha256(content).hexdigest()}"'
+    headers = {"ETag": etag}
+    if len(items) == limit:
+        headers["Link"] = f'<{request.url.include_query_params(after=items[-1].id)}>; rel="next"'
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content, media_type="application/json", headers=headers)
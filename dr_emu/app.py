@@ -1,10 +1,13 @@
+import asyncio
+
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
+from dr_emu.lib import process_pool, events
 from dr_emu.middleware import middleware
 from dr_emu.settings import settings
 from dr_emu.database_config import sessionmanager
-from dr_emu.api.endpoints import run, infrastructure, template, image
+from dr_emu.api.endpoints import run, infrastructure, template, image, metrics, job, docker_host
 
 
 @asynccontextmanager
@@ -13,7 +16,12 @@ async def lifespan(app: FastAPI):
     Function that handles startup and shutdown events.
     To understand more, read https://fastapi.tiangolo.com/advanced/events/
     """
+    # build events of the workers are streamed by /runs/events/
+    forwarder = asyncio.create_task(events.forward_notifications(sessionmanager.listen))
     yield
+    forwarder.cancel()
+    await asyncio.gather(forwarder, return_exceptions=True)
+    process_pool.shutdown()
     if sessionmanager._engine is not None:
         # Close the DB connection
         await sessionmanager.close()
@@ -30,6 +38,9 @@ app.include_router(run.router)
 app.include_router(infrastructure.router)
 app.include_router(template.router)
 app.include_router(image.router)
+app.include_router(metrics.router)
+app.include_router(job.router)
+app.include_router(docker_host.router)
 
 
 @app.get("/")
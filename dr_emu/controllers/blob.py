@@ -0,0 +1,36 @@
+from sqlalchemy import select, delete, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dr_emu.lib.logger import logger
+from dr_emu.models import Blob, ImageFile, NodeFile
+
+
+async def get_blobs(digests: set[str], db_session: AsyncSession) -> dict[str, Blob]:
+    """
+    Get already stored blobs matching the digests, contents of the blobs are not loaded.
+    :param digests: SHA-256 digests of file contents
+    :param db_session: Async database session
+    :return: blobs indexed by their digest
+    """
+    if not digests:
+        return {}
+
+    logger.debug("Getting stored blobs", count=len(digests))
+    blobs = await db_session.scalars(select(Blob).where(Blob.digest.in_(digests)))
+
+    return {blob.digest: blob for blob in blobs}
+
+
+async def delete_unreferenced_blobs(db_session: AsyncSession) -> None:
+    """
+    Delete blobs that are no longer used by any image or node.
+    :param db_session: Async database session
+    :return:
+    """
+    logger.debug("Deleting unreferenced blobs")
+    await db_session.execute(
+        delete(Blob).where(
+            ~exists().where(ImageFile.blob_id == Blob.id),
+            ~exists().where(NodeFile.blob_id == Blob.id),
+        )
+    )
@@ -0,0 +1,519 @@
+"""
+Incremental application of template changes to a built infrastructure.
+
+The plan of the template (parsed, not baked) is compared with the models of the infrastructure. Routers and nodes are
+matched by their names in the template, networks by the template addresses of their interfaces. Only the difference
+is applied: removed and changed nodes are deleted, added networks and nodes (changed ones again) are created, and the
+firewall rules, routes and DNS records are updated in the running routers and DNS node.
+"""
+import asyncio
+import contextlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import docker
+from netaddr import IPNetwork, IPAddress
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from dr_emu.controllers import template as template_controller, blob as blob_controller, teardown
+from dr_emu.controllers.infrastructure import InfrastructureController, ImageResolver
+from dr_emu.database_config import sessionmanager
+from dr_emu.lib import events, process_pool, util, docker_hosts
+from dr_emu.lib.exceptions import InfrastructureStateError, TemplateChangeError
+from dr_emu.lib.logger import logger
+from dr_emu.models import (
+    Infrastructure,
+    Network,
+    Interface,
+    Router,
+    FirewallRule,
+    Node,
+    Dns,
+    ServiceContainer,
+    Image,
+    Volume,
+)
+from parser.cyst_parser import CYSTParser, parse_template
+from parser.lib import simple_models
+from shared import constants
+
+# actions of the operations
+CREATE = "create"
+REMOVE = "remove"
+REPLACE = "replace"
+UPDATE = "update"
+
+# kinds of the changed objects
+NETWORK = "network"
+ROUTER = "router"
+NODE = "node"
+DNS = "dns"
+
+
+@dataclass
+class Operation:
+    action: str
+    kind: str
+    name: str  # name of the object in the template, subnet of a network
+    detail: str | None = None
+
+
+@dataclass
+class Changes:
+    """
+    Difference between an infrastructure and the plan of a template, operations are listed in the order of applying.
+    """
+
+    operations: list[Operation] = field(default_factory=list)
+    networks: dict[IPNetwork, Network] = field(default_factory=dict)  # kept networks by their template subnets
+    removed_networks: list[Network] = field(default_factory=list)
+    added_networks: list[simple_models.Network] = field(default_factory=list)
+    connections: list[tuple[Router, simple_models.Network]] = field(default_factory=list)
+    disconnections: list[tuple[Router, Network]] = field(default_factory=list)
+    firewalls: dict[Router, list[simple_models.FirewallRule]] = field(default_factory=dict)
+    removed_nodes: list[Node] = field(default_factory=list)  # including the replaced ones
+    added_nodes: list[str] = field(default_factory=list)  # template names, including the replaced nodes
+    dns: bool = False
+
+
+def template_name(infrastructure_name: str, name: str) -> str:
+    """
+    Get the template name of a container, see `InfrastructureController.change_names`.
+    :param infrastructure_name: name of the infrastructure
+    :param name: name of the container
+    :return: name in the template
+    """
+    return name.removeprefix(f"{infrastructure_name}-").removesuffix("-dr-emu")
+
+
+def _match_network(network: Network, plan_networks: list[simple_models.Network]) -> simple_models.Network | None:
+    original_ips = [interface.original_ip for interface in network.interfaces if interface.original_ip is not None]
+    return next((plan for plan in plan_networks if any(ip in plan.subnet for ip in original_ips)), None)
+
+
+def _services_key(services) -> frozenset:
+    return frozenset(
+        (service.type, service.version, service.cves, frozenset(service.variable_override.items()))
+        for service in services
+    )
+
+
+def _image_key(image: Image) -> tuple:
+    # the same attributes as the equality of Image models, equal images are shared by the baked models
+    return image.pull, _services_key(image.services), frozenset((file.path, file.blob.digest) for file in image.files)
+
+
+def _plan_image_key(image: simple_models.Image) -> tuple:
+    files = frozenset((file.image_file_path, file.digest) for file in image.data)
+    return image.pull, _services_key(image.services), files
+
+
+def _node_state(node: Node) -> dict[str, Any]:
+    return {
+        "type": type(node).__name__,
+        "image": _image_key(node.image),
+        "files": frozenset((file.path, file.blob.digest) for file in node.files),
+        "services": Counter(_image_key(service.image) for service in node.service_containers),
+        "interfaces": [str(interface.original_ip) for interface in node.interfaces],
+    }
+
+
+def _plan_node_state(node: simple_models.Node) -> dict[str, Any]:
+    return {
+        "type": node.type.value.__name__,
+        "image": _plan_image_key(node.image),
+        "files": frozenset((file.image_file_path, file.digest) for file in node.data),
+        "services": Counter(_plan_image_key(container.image) for container in node.service_containers),
+        "interfaces": [str(interface.ip) for interface in node.interfaces],
+    }
+
+
+def plan_changes(infrastructure: Infrastructure, parser: CYSTParser) -> Changes:
+    """
+    Compare the infrastructure with the plan of a template, nothing is changed.
+    Networks, routers with their interfaces and firewall rules, and nodes with their images, files, services and
+    interfaces have to be loaded.
+    :param infrastructure: built infrastructure
+    :param parser: parsed template
+    :return: changes to apply
+    :raises: TemplateChangeError if routers are added or removed
+    """
+    changes = Changes()
+    network_operations: list[Operation] = []
+    router_operations: list[Operation] = []
+    removed_node_operations: list[Operation] = []
+    node_operations: list[Operation] = []
+
+    subnets: dict[Network, IPNetwork] = {}
+    for network in infrastructure.networks:
+        if network.network_type == constants.NETWORK_TYPE_MANAGEMENT:
+            continue
+        if (plan_network := _match_network(network, parser.networks)) is None:
+            changes.removed_networks.append(network)
+            network_operations.append(Operation(REMOVE, NETWORK, str(network.ipaddress)))
+        else:
+            changes.networks[plan_network.subnet] = network
+            subnets[network] = plan_network.subnet
+    for plan_network in parser.networks:
+        if plan_network.subnet not in changes.networks:
+            changes.added_networks.append(plan_network)
+            network_operations.append(Operation(CREATE, NETWORK, str(plan_network.subnet)))
+
+    routers = {template_name(infrastructure.name, router.name): router for router in infrastructure.routers}
+    plan_routers = {router.name: router for router in parser.routers}
+    if routers.keys() != plan_routers.keys():
+        added, removed = sorted(plan_routers.keys() - routers.keys()), sorted(routers.keys() - plan_routers.keys())
+        raise TemplateChangeError(
+            f"Routers can't be added or removed in a running infrastructure, added: {added}, removed: {removed}"
+        )
+
+    rerouted: set[str] = set()
+    for name, router in routers.items():
+        plan_router = plan_routers[name]
+        connected = {subnets[interface.network] for interface in router.interfaces if interface.network in subnets}
+        plan_connected = {interface.network.subnet: interface.network for interface in plan_router.interfaces}
+        for subnet, plan_network in plan_connected.items():
+            if subnet not in connected:
+                changes.connections.append((router, plan_network))
+                router_operations.append(Operation(UPDATE, ROUTER, name, f"connect to {subnet}"))
+        for subnet in connected - plan_connected.keys():
+            changes.disconnections.append((router, changes.networks[subnet]))
+            router_operations.append(Operation(UPDATE, ROUTER, name, f"disconnect from {subnet}"))
+        if connected != plan_connected.keys() or any(
+            interface.network in changes.removed_networks for interface in router.interfaces
+        ):
+            rerouted.add(name)
+
+        rules = {
+            (subnets.get(rule.src_net), subnets.get(rule.dst_net), rule.service, rule.policy)
+            for rule in router.firewall_rules
+        }
+        plan_rules = {
+            (rule.source.subnet, rule.destination.subnet, rule.service, rule.policy)
+            for rule in plan_router.firewall_rules
+        }
+        if rules != plan_rules:
+            changes.firewalls[router] = plan_router.firewall_rules
+            router_operations.append(Operation(UPDATE, ROUTER, name, "firewall rules"))
+
+    # networks of a router are routed through it by all the other routers
+    for name in routers:
+        if rerouted - {name}:
+            router_operations.append(Operation(UPDATE, ROUTER, name, "routes"))
+
+    nodes = {template_name(infrastructure.name, node.name): node for node in infrastructure.nodes}
+    plan_nodes = {node.name: node for node, _ in parser.expand_replicas()}
+    for name, node in nodes.items():
+        if name not in plan_nodes:
+            changes.removed_nodes.append(node)
+            removed_node_operations.append(Operation(REMOVE, NODE, name))
+    for name, plan_node in plan_nodes.items():
+        if (node := nodes.get(name)) is None:
+            changes.added_nodes.append(name)
+            node_operations.append(Operation(CREATE, NODE, name))
+            continue
+        state, plan_state = _node_state(node), _plan_node_state(plan_node)
+        if differences := [key for key in state if state[key] != plan_state[key]]:
+            changes.removed_nodes.append(node)
+            changes.added_nodes.append(name)
+            node_operations.append(Operation(REPLACE, NODE, name, f"changed {', '.join(differences)}"))
+
+    # a created DNS node is configured with all the records
+    dns_nodes = [name for name, node in plan_nodes.items() if node.type is simple_models.NodeType.DNS]
+    if (removed_node_operations or node_operations) and dns_nodes and dns_nodes[0] not in changes.added_nodes:
+        changes.dns = True
+        node_operations.append(Operation(UPDATE, DNS, dns_nodes[0], "records"))
+
+    changes.operations = [*removed_node_operations, *network_operations, *router_operations, *node_operations]
+    return changes
+
+
+def _free_subnets(infrastructure: Infrastructure) -> Iterator[IPNetwork]:
+    used = [network.ipaddress for network in infrastructure.networks]
+    for subnet in infrastructure.supernet.subnet(used[0].prefixlen):
+        if not any(subnet.first <= network.last and network.first <= subnet.last for network in used):
+            yield subnet
+
+
+def _free_host(network: Network, used: set[IPAddress]) -> IPAddress:
+    for address in network.ipaddress.iter_hosts():
+        if address not in used and str(address) != network.bridge_gateway:
+            used.add(address)
+            return address
+    raise TemplateChangeError(f"No address is left in network {network.name}")
+
+
+def _volumes(container: Node | ServiceContainer) -> list[Volume]:
+    volumes = list(container.volumes)
+    if isinstance(container, Node):
+        volumes += [volume for service in container.service_containers for volume in service.volumes]
+    return volumes
+
+
+async def load_infrastructure(infrastructure_id: int, db_session: AsyncSession) -> Infrastructure:
+    """
+    Load infrastructure with all the models compared and changed by `plan_changes` and `apply_changes`.
+    :param infrastructure_id: infrastructure ID
+    :param db_session: Async database session
+    :return: Infrastructure object
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    return (
+        await db_session.execute(
+            select(Infrastructure)
+            .where(Infrastructure.id == infrastructure_id)
+            .options(
+                joinedload(Infrastructure.instance),
+                joinedload(Infrastructure.docker_host),
+                selectinload(Infrastructure.networks).selectinload(Network.interfaces),
+                selectinload(Infrastructure.routers).options(
+                    selectinload(Router.interfaces).joinedload(Interface.network),
+                    selectinload(Router.firewall_rules).options(
+                        joinedload(FirewallRule.src_net), joinedload(FirewallRule.dst_net)
+                    ),
+                ),
+                selectinload(Infrastructure.nodes).options(
+                    joinedload(Node.image).selectinload(Image.services),
+                    selectinload(Node.volumes),
+                    selectinload(Node.interfaces).joinedload(Interface.network),
+                    selectinload(Node.service_containers).options(
+                        joinedload(ServiceContainer.image).selectinload(Image.services),
+                        selectinload(ServiceContainer.volumes),
+                    ),
+                ),
+            )
+        )
+    ).scalar_one()
+
+
+async def apply_changes(
+    infrastructure: Infrastructure,
+    parser: CYSTParser,
+    changes: Changes,
+    docker_client: docker.DockerClient,
+    deleted: list[Any],
+) -> None:
+    """
+    Apply the changes to the running infrastructure and to its models, which are detached from any DB session.
+    :param infrastructure: infrastructure loaded by `load_infrastructure`
+    :param parser: parsed template the changes were planned with
+    :param changes: planned changes
+    :param docker_client: client of the infrastructure's docker host, set by `docker_hosts.use_host` too
+    :param deleted: removed models are added to it as soon as their docker objects are removed
+    :return:
+    """
+    images = ImageResolver(docker_client, remote=docker_hosts.current_host() is not None)
+    controller = InfrastructureController(infrastructure, images)
+    routes = {router: set(router.routes(infrastructure.routers)) for router in infrastructure.routers}
+
+    # replaced nodes keep their addresses
+    addresses: dict[tuple[str, IPAddress], IPAddress] = {}
+    for node in changes.removed_nodes:
+        name = template_name(infrastructure.name, node.name)
+        if name in changes.added_nodes:
+            addresses.update({(name, interface.original_ip): interface.ipaddress for interface in node.interfaces})
+    for node in changes.removed_nodes:
+        infrastructure.nodes.remove(node)
+    removed_volumes = {volume for node in changes.removed_nodes for volume in _volumes(node)} - infrastructure.volumes
+
+    for router, network in changes.disconnections:
+        await router.disconnect_from_network(network)
+    for network in changes.removed_networks:
+        for router in infrastructure.routers:
+            if any(interface.network is network for interface in router.interfaces):
+                await router.disconnect_from_network(network)
+        infrastructure.networks.remove(network)
+    await teardown.remove_docker_objects(
+        teardown.DockerIds(
+            services=[
+                service.docker_id or service.name
+                for node in changes.removed_nodes
+                for service in node.service_containers
+            ],
+            appliances=[node.docker_id or node.name for node in changes.removed_nodes],
+            networks=[network.docker_id or network.name for network in changes.removed_networks],
+            volumes=[volume.docker_id or volume.name for volume in removed_volumes],
+        ),
+        docker_client=docker_client,
+    )
+    deleted += [*changes.removed_nodes, *changes.removed_networks, *removed_volumes]
+
+    disconnected = {*changes.removed_networks, *(network for _, network in changes.disconnections)}
+    for router in infrastructure.routers:
+        interfaces = [interface for interface in router.interfaces if interface.network in disconnected]
+        for interface in interfaces:
+            router.interfaces.remove(interface)
+        deleted += interfaces
+
+    subnets = _free_subnets(infrastructure)
+    network_names = await util.get_network_names(docker_client)
+    for plan_network in changes.added_networks:
+        if (subnet := next(subnets, None)) is None:
+            raise TemplateChangeError(f"No address space is left for a network in {infrastructure.supernet}")
+        if (name := f"{infrastructure.name}-{plan_network.name}") in network_names:
+            name += "-dr-emu"
+        network = Network(ipaddress=subnet, router_gateway=subnet[1], name=name, network_type=plan_network.type)
+        await network.create()
+        infrastructure.networks.append(network)
+        changes.networks[plan_network.subnet] = network
+
+    appliances = [*infrastructure.routers, *infrastructure.nodes]
+    used = {interface.ipaddress for appliance in appliances for interface in appliance.interfaces}
+    used.update(addresses.values())
+    for router, plan_network in changes.connections:
+        network = changes.networks[plan_network.subnet]
+        interface = Interface(ipaddress=_free_host(network, used), original_ip=plan_network.gateway, network=network)
+        router.interfaces.append(interface)
+        await router.connect_to_network(interface)
+
+    for router in infrastructure.routers:
+        current_routes = set(router.routes(infrastructure.routers))
+        instructions = [f"ip route del {destination}" for destination, _ in routes[router] - current_routes]
+        instructions += [
+            f"ip route add {destination} via {via}" for destination, via in current_routes - routes[router]
+        ]
+        if (rules := changes.firewalls.get(router)) is not None:
+            deleted += router.firewall_rules
+            router.firewall_rules = [
+                FirewallRule(
+                    src_net=changes.networks[rule.source.subnet],
+                    dst_net=changes.networks[rule.destination.subnet],
+                    service=rule.service,
+                    policy=rule.policy,
+                )
+                for rule in rules
+            ]
+            # the FORWARD chain holds only the firewall rules
+            instructions += ["iptables -F FORWARD", *router.firewall_instructions()]
+        if instructions:
+            await router.run_instructions(instructions)
+
+    if changes.added_nodes:
+        await _create_nodes(controller, parser, changes, addresses, used)
+    if changes.dns:
+        await InfrastructureController.configure_dns(infrastructure.nodes, append=False)
+        dns_node = next(node for node in infrastructure.nodes if isinstance(node, Dns))
+        await dns_node.run_instructions(dns_node.config_instructions, privileged=True, user="0")
+
+
+async def _create_nodes(
+    controller: InfrastructureController,
+    parser: CYSTParser,
+    changes: Changes,
+    addresses: dict[tuple[str, IPAddress], IPAddress],
+    used: set[IPAddress],
+) -> None:
+    infrastructure = controller.infrastructure
+    async with sessionmanager.session() as db_session:
+        _, _, baked_nodes, _, _ = await parser.bake_models(db_session, infrastructure.name)
+        nodes = [node for node in baked_nodes if node.name in changes.added_nodes]
+        await InfrastructureController.load_node_files(nodes, db_session)
+
+    volumes = {volume.name: volume for volume in infrastructure.volumes}
+    created_volumes: list[Volume] = []
+    for node in nodes:
+        name = node.name
+        for interface in node.interfaces:
+            # networks of the baked models have the template subnets
+            network = changes.networks[interface.network.ipaddress]
+            interface.ipaddress = addresses.get((name, interface.original_ip)) or _free_host(network, used)
+            interface.network = network
+
+        node.name = f"{infrastructure.name}-{name}"
+        for service in node.service_containers:
+            service.name = f"{infrastructure.name}-{service.name}"
+        for container in [node, *node.service_containers]:
+            container_volumes = []
+            for volume in container.volumes:
+                volume_name = volume.name if volume.local else f"{infrastructure.name}-{volume.name}"
+                if volume_name not in volumes:
+                    volumes[volume_name] = Volume(name=volume_name, bind=volume.bind, local=volume.local)
+                    created_volumes.append(volumes[volume_name])
+                container_volumes.append(volumes[volume_name])
+            container.volumes = container_volumes
+        infrastructure.nodes.append(node)
+
+    name_pairs = {template_name(infrastructure.name, node.name): node.name for node in infrastructure.nodes}
+    await InfrastructureController.update_environment_variables(
+        [*nodes, *(service for node in nodes for service in node.service_containers)], name_pairs
+    )
+    InfrastructureController.configure_attackers(infrastructure.name, nodes)
+    await InfrastructureController.configure_dns(infrastructure.nodes, append=False)
+
+    images = {image.id: image for node in nodes for image in [node.image, *(s.image for s in node.service_containers)]}
+    await asyncio.gather(*(controller.images.ensure(image.id, image.name) for image in images.values()))
+    await asyncio.gather(*(volume.create() for volume in created_volumes))
+    await controller.run_phase(
+        events.CREATE, {controller.track(events.CREATE, node.name, controller.create_node(node)) for node in nodes}
+    )
+    await controller.run_phase(
+        events.START, {controller.track(events.START, node.name, node.start()) for node in nodes}
+    )
+    await controller.run_phase(
+        events.CONFIGURE, {controller.track(events.CONFIGURE, node.name, node.configure()) for node in nodes}
+    )
+
+
+async def apply_template(infrastructure_id: int, template_id: int, dry_run: bool = False) -> list[Operation]:
+    """
+    Change built infrastructure to match the plan of a template, only the difference is applied (see `plan_changes`).
+    The records are saved even if the application fails, so the infrastructure can always be reset or torn down.
+    :param infrastructure_id: infrastructure ID
+    :param template_id: ID of Template to apply
+    :param dry_run: only plan the changes
+    :return: planned (or applied) operations
+    :raises: sqlalchemy.exc.NoResultFound, InfrastructureStateError, TemplateChangeError
+    """
+    async with sessionmanager.session() as db_session:
+        infrastructure = await load_infrastructure(infrastructure_id, db_session)
+        if infrastructure.instance is None and infrastructure.pooled_at is None:
+            raise InfrastructureStateError(f"Infrastructure {infrastructure_id} is not built")
+        if infrastructure.teardown_at is not None:
+            raise InfrastructureStateError(f"Infrastructure {infrastructure_id} is being torn down")
+        template = await template_controller.get_template(template_id, db_session)
+
+    parser = await process_pool.run(parse_template, template.description)
+    changes = plan_changes(infrastructure, parser)
+    logger.info(
+        "Template changes planned",
+        infrastructure_id=infrastructure_id,
+        template_id=template_id,
+        operations=len(changes.operations),
+        dry_run=dry_run,
+    )
+    if dry_run or not changes.operations:
+        return changes.operations
+
+    run_id = infrastructure.instance.run_id if infrastructure.instance is not None else None
+    build_scope = events.build_scope(run_id) if run_id is not None else contextlib.nullcontext()
+    docker_host = infrastructure.docker_host.url if infrastructure.docker_host is not None else None
+    with build_scope, docker_hosts.use_host(docker_host):
+        events.emit(events.APPLY, events.STARTED, infrastructure=infrastructure.name)
+        deleted: list[Any] = []
+        try:
+            await apply_changes(infrastructure, parser, changes, docker_hosts.current_client(), deleted)
+        except Exception as error:
+            events.emit(
+                events.APPLY,
+                events.FAILED,
+                infrastructure=infrastructure.name,
+                detail=f"{type(error).__name__}: {error}",
+            )
+            raise
+        finally:
+            async with sessionmanager.session() as db_session:
+                db_session.add(infrastructure)
+                for model in deleted:
+                    await db_session.delete(model)
+                await db_session.flush()
+                await blob_controller.delete_unreferenced_blobs(db_session)
+                await db_session.commit()
+            async with sessionmanager.session() as db_session:
+                await InfrastructureController.refresh_snapshot(infrastructure_id, db_session)
+        events.emit(events.APPLY, events.FINISHED, infrastructure=infrastructure.name)
+
+    logger.info("Template changes applied", infrastructure_id=infrastructure_id, template_id=template_id)
+    return changes.operations
@@ -0,0 +1,335 @@
+"""
+Registry of docker hosts and placement of infrastructures on them.
+
+Without any registered host, all infrastructures run on the local docker daemon. Once hosts are registered, every new
+infrastructure is placed on one of the enabled hosts (see `place_infrastructures`) and its docker objects are created,
+changed and removed through the client of that host (see `docker_hosts.use_host`). Images are pulled or built by the
+local daemon and copied to the hosts that don't have them.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Sequence
+
+from docker import DockerClient
+from docker.errors import DockerException, ImageNotFound, NotFound
+from netaddr import IPNetwork
+from sqlalchemy import select, func, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dr_emu.lib import docker_hosts, util
+from dr_emu.lib.exceptions import DockerHostStateError, DockerHostUnreachable
+from dr_emu.lib.logger import logger
+from dr_emu.models import DockerHost, Infrastructure
+from dr_emu.settings import settings
+from parser.cyst_parser import CYSTParser
+from parser.lib import containers
+
+
+@dataclass
+class HostLoad:
+    """
+    Infrastructures placed on a docker host.
+    """
+
+    infrastructures: int = 0  # all of them, including the ones being built or torn down
+    building: int = 0  # allocated infrastructures that are not built yet
+
+
+@dataclass
+class HostState:
+    """
+    Docker state of a host, listed once for all infrastructures built together.
+    """
+
+    host: DockerHost | None  # None for the local daemon
+    client: DockerClient
+    networks: set[IPNetwork] = field(default_factory=set)  # subnets of the existing docker networks
+    container_names: set[str] = field(default_factory=set)
+    network_names: set[str] = field(default_factory=set)
+    images: set[str] = field(default_factory=set)  # tags of the images the host has
+
+    @property
+    def url(self) -> str | None:
+        return self.host.url if self.host is not None else None
+
+
+async def create_host(name: str, url: str, capacity: int, db_session: AsyncSession) -> DockerHost:
+    """
+    Register docker host, its daemon has to be reachable.
+    :param name: name of the host
+    :param url: URL of the docker daemon (unix:// socket, tcp:// or ssh:// address)
+    :param capacity: infrastructures the host can run
+    :param db_session: Async database session
+    :return: created DockerHost
+    :raises: DockerHostStateError if the name or URL is already registered, DockerHostUnreachable
+    """
+    logger.debug("Creating docker host", name=name, url=url)
+    if await db_session.scalar(select(DockerHost.id).where((DockerHost.name == name) | (DockerHost.url == url))):
+        raise DockerHostStateError(f"Docker host with name '{name}' or URL '{url}' already exists")
+    try:
+        await asyncio.to_thread(docker_hosts.get_client(url).ping)
+    except DockerException as error:
+        docker_hosts.close_client(url)
+        raise DockerHostUnreachable(f"Docker daemon at '{url}' is unreachable: {error}")
+
+    host = DockerHost(name=name, url=url, capacity=capacity, enabled=True)
+    db_session.add(host)
+    await db_session.commit()
+
+    logger.info("Docker host created", id=host.id, name=host.name, url=host.url)
+    return host
+
+
+async def list_hosts(
+    db_session: AsyncSession, limit: int | None = None, after: int | None = None, enabled: bool | None = None
+) -> Sequence[DockerHost]:
+    """
+    List registered docker hosts ordered by ID.
+    :param db_session: Async database session
+    :param limit: maximum number of hosts
+    :param after: list only hosts with greater ID
+    :param enabled: list only enabled (or disabled) hosts
+    :return: list of DockerHosts
+    """
+    logger.debug("Listing docker hosts", limit=limit, after=after)
+
+    query = select(DockerHost).order_by(DockerHost.id).limit(limit)
+    if after is not None:
+        query = query.where(DockerHost.id > after)
+    if enabled is not None:
+        query = query.where(DockerHost.enabled == enabled)
+
+    return (await db_session.scalars(query)).all()
+
+
+async def get_host(host_id: int, db_session: AsyncSession) -> DockerHost:
+    """
+    Get docker host specified by ID.
+    :param host_id: DockerHost ID
+    :param db_session: Async database session
+    :return: DockerHost
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    return (await db_session.execute(select(DockerHost).where(DockerHost.id == host_id))).scalar_one()
+
+
+async def update_host(
+    host_id: int, db_session: AsyncSession, capacity: int | None = None, enabled: bool | None = None
+) -> DockerHost:
+    """
+    Change capacity of docker host or enable/disable it, infrastructures already placed on it are kept.
+    :param host_id: DockerHost ID
+    :param db_session: Async database session
+    :param capacity: infrastructures the host can run
+    :param enabled: whether new infrastructures can be placed on the host
+    :return: updated DockerHost
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    host = await get_host(host_id, db_session)
+    if capacity is not None:
+        host.capacity = capacity
+    if enabled is not None:
+        host.enabled = enabled
+    await db_session.commit()
+
+    logger.info("Docker host updated", id=host.id, capacity=host.capacity, enabled=host.enabled)
+    return host
+
+
+async def delete_host(host_id: int, db_session: AsyncSession) -> DockerHost:
+    """
+    Unregister docker host, it must not have any infrastructures.
+    :param host_id: DockerHost ID
+    :param db_session: Async database session
+    :return: deleted DockerHost
+    :raises: sqlalchemy.exc.NoResultFound, DockerHostStateError
+    """
+    logger.debug("Deleting docker host", id=host_id)
+
+    host = await get_host(host_id, db_session)
+    if await db_session.scalar(select(exists().where(Infrastructure.docker_host_id == host_id))):
+        raise DockerHostStateError(f"Docker host {host_id} still has infrastructures, disable it and stop them first")
+    await db_session.delete(host)
+    await db_session.commit()
+    docker_hosts.close_client(host.url)
+
+    logger.info("Docker host deleted", id=host.id, name=host.name)
+    return host
+
+
+async def get_load(host_ids: Sequence[int], db_session: AsyncSession) -> dict[int, HostLoad]:
+    """
+    Count infrastructures placed on docker hosts.
+    :param host_ids: IDs of DockerHosts
+    :param db_session: Async database session
+    :return: load of each host
+    """
+    building = (
+        Infrastructure.instance_id.is_(None),
+        Infrastructure.pooled_at.is_(None),
+        Infrastructure.teardown_at.is_(None),
+    )
+    counts = await db_session.execute(
+        select(
+            Infrastructure.docker_host_id,
+            func.count(Infrastructure.id),
+            func.count(Infrastructure.id).filter(*building),
+        )
+        .where(Infrastructure.docker_host_id.in_(host_ids))
+        .group_by(Infrastructure.docker_host_id)
+    )
+    load = {host_id: HostLoad() for host_id in host_ids}
+    for host_id, infrastructures, building_infrastructures in counts:
+        load[host_id] = HostLoad(infrastructures, building_infrastructures)
+
+    return load
+
+
+async def get_capacity(db_session: AsyncSession) -> int:
+    """
+    Get the number of infrastructures that can run, the sum of capacities of the enabled hosts, or
+    `settings.max_infrastructures` of the local daemon if no hosts are registered.
+    :param db_session: Async database session
+    :return: number of infrastructures
+    """
+    if not await db_session.scalar(select(func.count(DockerHost.id))):
+        return settings.max_infrastructures
+    return await db_session.scalar(
+        select(func.coalesce(func.sum(DockerHost.capacity), 0)).where(DockerHost.enabled.is_(True))
+    )
+
+
+async def get_host_state(host: DockerHost | None) -> HostState:
+    """
+    List used networks and names of a docker host and check that it has the management network.
+    :param host: docker host, None for the local daemon
+    :return: docker state of the host, images are listed only for registered hosts (for the placement)
+    :raises: RuntimeError if the management network is missing, docker.errors.DockerException
+    """
+    state = HostState(host, docker_hosts.get_client(host.url if host is not None else None))
+    client = state.client
+    # networks.list doesn't return same objects as networks.get
+    docker_networks = await asyncio.to_thread(client.networks.list)
+    for docker_network in docker_networks:
+        if docker_network.name in ["none", "host"]:
+            continue
+        state.networks.add(IPNetwork(client.networks.get(docker_network.id).attrs["IPAM"]["Config"][0]["Subnet"]))
+
+    # check if management (cryton) network exists
+    if not settings.ignore_management_network:
+        try:
+            client.networks.get(settings.management_network_name)
+        except NotFound:
+            raise RuntimeError(f"Management Network containing Cryton '{settings.management_network_name}' not found")
+
+    state.container_names = await util.get_container_names(client)
+    state.network_names = await util.get_network_names(client)
+    if host is not None:
+        state.images = {tag for image in await asyncio.to_thread(client.images.list) for tag in image.tags}
+
+    return state
+
+
+async def get_host_states(hosts: Sequence[DockerHost]) -> list[HostState]:
+    """
+    List the docker state of the hosts new infrastructures can be placed on, unavailable hosts are left out.
+    :param hosts: enabled docker hosts, the local daemon is used if there are none
+    :return: states of the available hosts
+    :raises: RuntimeError if no host is available
+    """
+    if not hosts:
+        return [await get_host_state(None)]
+
+    states = []
+    for host, state in zip(hosts, await asyncio.gather(*map(get_host_state, hosts), return_exceptions=True)):
+        if isinstance(state, BaseException):
+            if not isinstance(state, Exception):
+                raise state
+            logger.warning("Docker host is unavailable", name=host.name, url=host.url, exception=str(state))
+            continue
+        states.append(state)
+    if not states:
+        raise RuntimeError("No docker host is available")
+
+    return states
+
+
+def template_images(parser: CYSTParser) -> set[str]:
+    """
+    Get names of the images used by the template that docker hosts may already have. Other images are built for the
+    services of their nodes and get their names only when the models are baked.
+    :param parser: parsed template
+    :return: image names
+    """
+    images = [container.image for container in [*parser.routers, *parser.nodes]]
+    images += [service.image for node in parser.nodes for service in node.service_containers]
+    return {image.name for image in images if image.pull or image.name == containers.IMAGE_DEFAULT.name}
+
+
+def score(state: HostState, load: HostLoad, image_names: set[str]) -> float:
+    """
+    Score docker host for a new infrastructure, the higher the better.
+    :param state: docker state of the host
+    :param load: infrastructures placed on the host
+    :param image_names: images of the template (see `template_images`)
+    :return: free share of the capacity, plus the share of cached images and minus the share of the capacity being
+        built, weighted by `settings.placement_image_weight` and `settings.placement_build_weight`
+    """
+    capacity = state.host.capacity
+    cached = len(image_names & state.images) / len(image_names) if image_names else 0
+    return (
+        (capacity - load.infrastructures) / capacity
+        + settings.placement_image_weight * cached
+        - settings.placement_build_weight * load.building / capacity
+    )
+
+
+async def place_infrastructures(
+    count: int, states: Sequence[HostState], image_names: set[str], db_session: AsyncSession
+) -> list[DockerHost | None]:
+    """
+    Choose docker hosts of new infrastructures, one by one on the host with the best score (see `score`).
+    Has to be called under the allocation lock, so concurrent placements see the infrastructures of each other.
+    :param count: number of infrastructures
+    :param states: docker states of the available hosts
+    :param image_names: images of the template (see `template_images`)
+    :param db_session: Async database session
+    :return: host of each infrastructure, None (the local daemon) if no hosts are registered
+    :raises: RuntimeError if the hosts don't have enough free capacity
+    """
+    states = [state for state in states if state.host is not None]
+    if not states:
+        return [None] * count
+
+    load = await get_load([state.host.id for state in states], db_session)
+    placement: list[DockerHost | None] = []
+    for _ in range(count):
+        available = [state for state in states if load[state.host.id].infrastructures < state.host.capacity]
+        if not available:
+            raise RuntimeError(f"Docker hosts have free capacity for {len(placement)} of {count} infrastructures")
+        state = max(available, key=lambda candidate: score(candidate, load[candidate.host.id], image_names))
+        load[state.host.id].infrastructures += 1
+        load[state.host.id].building += 1
+        placement.append(state.host)
+
+    logger.debug("Infrastructures placed", hosts=[host.name for host in placement])
+    return placement
+
+
+async def copy_image(image_name: str, docker_client: DockerClient) -> None:
+    """
+    Copy image from the local daemon, where the images are pulled and built, to a docker host that doesn't have it.
+    :param image_name: name of the image
+    :param docker_client: client of the docker host
+    :return:
+    """
+    try:
+        await asyncio.to_thread(docker_client.images.get, image_name)
+        return
+    except ImageNotFound:
+        pass
+
+    logger.info("Copying image to docker host", image=image_name, url=docker_client.api.base_url)
+    local_client = docker_hosts.get_client()
+    # the image is streamed from one daemon to the other, it's never stored by dr-emu
+    await asyncio.to_thread(docker_client.images.load, local_client.api.get_image(image_name))
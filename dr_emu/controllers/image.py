@@ -5,6 +5,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
+from dr_emu.controllers import blob as blob_controller
 from dr_emu.lib.logger import logger
 from dr_emu.models import Image, ImageState
 
@@ -50,6 +51,8 @@ async def delete_image(image_id: int, db_session: AsyncSession) -> Image:
 
     image = (await db_session.execute(select(Image).where(Image.id == image_id))).scalar_one()
     await db_session.delete(image)
+    await db_session.flush()
+    await blob_controller.delete_unreferenced_blobs(db_session)
     await db_session.commit()
 
     logger.debug("Image deleted", id=image.id, name=image.name)
@@ -74,6 +77,8 @@ async def wait_until_image_is_ready(image: Image, db_session: AsyncSession):
         # Get the current in-memory value of the attribute
         logger.debug(f"Waiting for Image to be ready", id=image.id, current_state=image.state)
         await db_session.refresh(image)
+        # end the transaction, so the connection isn't held while waiting
+        await db_session.commit()
         if image.state == ImageState.ready:
             break
         await asyncio.sleep(5)
@@ -1,21 +1,29 @@
 import asyncio
+import contextlib
 import copy
-from asyncio import TaskGroup
-from typing import Sequence
+from collections import defaultdict
+from typing import Sequence, Any
 from uuid import uuid1
 
 import docker
 import randomname
 from docker import DockerClient
-from docker.errors import ImageNotFound, APIError, NotFound
+from docker.errors import ImageNotFound, APIError
 from netaddr import IPNetwork
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
-
-from dr_emu.controllers import template as template_controller, image as image_controller
+from sqlalchemy.orm import joinedload, selectinload, undefer, load_only, contains_eager
+
+from dr_emu.controllers import (
+    template as template_controller,
+    image as image_controller,
+    blob as blob_controller,
+    docker_host as docker_host_controller,
+    teardown,
+)
 from dr_emu.database_config import sessionmanager
-from dr_emu.lib import util
+from dr_emu.lib import util, process_pool, bulk, events, locks, docker_hosts
+from dr_emu.lib.exceptions import InfrastructureStateError
 from dr_emu.lib.logger import logger
 from dr_emu.models import (
     Infrastructure,
@@ -29,13 +37,43 @@ from dr_emu.models import (
     ServiceAttacker,
     Volume,
     Service,
-    Router, ImageState
+    Router, Image, ImageState, Blob, Job, utc_now, ServiceContainer, DependsOn
 )
 from dr_emu.settings import settings
-from parser.cyst_parser import CYSTParser
+from parser.cyst_parser import CYSTParser, parse_template
 from shared import constants
 
-async_lock = asyncio.Lock()
+
+class ImageResolver:
+    """
+    Makes images available for infrastructures built together, every image is pulled or built only once.
+    Images are pulled and built by the local daemon, registered docker hosts (`remote`) get a copy.
+    """
+
+    def __init__(self, docker_client: DockerClient, remote: bool = False):
+        self.docker_client = docker_client
+        self.remote = remote
+        self.tasks: dict[int, asyncio.Task[None]] = {}
+
+    def ensure(self, image_id: int, image_name: str) -> asyncio.Future[None]:
+        """
+        Get the image ready, infrastructures requesting the same image wait for the first request.
+        :param image_id: ID of Image
+        :param image_name: name of the image
+        :return: future of the image, cancelling it doesn't affect the other infrastructures
+        """
+        if (task := self.tasks.get(image_id)) is None:
+            task = self.tasks[image_id] = asyncio.create_task(
+                events.track(events.IMAGE, image_name, self._ensure(image_id, image_name))
+            )
+        return asyncio.shield(task)
+
+    async def _ensure(self, image_id: int, image_name: str) -> None:
+        if not self.remote:
+            await InfrastructureController.ensure_image_exists(image_id, self.docker_client)
+            return
+        await InfrastructureController.ensure_image_exists(image_id, docker_hosts.get_client())
+        await docker_host_controller.copy_image(image_name, self.docker_client)
 
 
 class InfrastructureController:
@@ -44,7 +82,7 @@ class InfrastructureController:
     """
 
     def __init__(self, infrastructure: Infrastructure):
-        self.client = docker.from_env()
+        self.client = docker_hosts.current_client()
         self.infrastructure = infrastructure
 
     @staticmethod
@@ -63,25 +101,19 @@ class InfrastructureController:
         """
         logger.info("Starting infrastructure", name=self.infrastructure.name)
 
-        create_volumes_tasks = await self.create_volumes()
-        await asyncio.gather(*create_volumes_tasks)
-        logger.debug("Networks created", infrastructure_name=self.infrastructure.name)
+        await self.run_phase(events.VOLUME, await self.create_volumes())
+        logger.debug("Volumes created", infrastructure_name=self.infrastructure.name)
 
-        create_network_tasks = await self.create_networks()
-        await asyncio.gather(*create_network_tasks)
+        await self.run_phase(events.NETWORK, await self.create_networks())
         logger.debug("Networks created", infrastructure_name=self.infrastructure.name)
 
-        create_node_tasks = await self.create_nodes()
-        await asyncio.gather(*create_node_tasks)
+        await self.run_phase(events.CREATE, await self.create_nodes())
         logger.debug("Nodes created", infrastructure_name=self.infrastructure.name)
 
-        start_router_tasks = await self.start_routers()
-        start_node_tasks = await self.start_nodes()
-        await asyncio.gather(*start_node_tasks, *start_router_tasks)
+        await self.run_phase(events.START, (await self.start_routers()) | (await self.start_nodes()))
         logger.debug("Appliances started", infrastructure_name=self.infrastructure.name)
 
-        configure_appliance_tasks: set[asyncio.Task[None]] = await self.configure_appliances()
-        await asyncio.gather(*configure_appliance_tasks)
+        await self.run_phase(events.CONFIGURE, await self.configure_appliances())
         logger.debug("Appliances configured", infrastructure_name=self.infrastructure.name)
 
         logger.info(
@@ -89,13 +121,34 @@ class InfrastructureController:
             name=self.infrastructure.name,
         )
 
+    async def run_phase(self, phase: str, tasks: set[asyncio.Task[None]]) -> None:
+        """
+        Wait for the tasks of a build phase, its start and end are published as build events.
+        :param phase: build phase
+        :param tasks: tasks of the phase
+        :return:
+        """
+        events.emit(phase, events.STARTED, infrastructure=self.infrastructure.name)
+        await asyncio.gather(*tasks)
+        events.emit(phase, events.FINISHED, infrastructure=self.infrastructure.name)
+
+    def track(self, phase: str, name: str, awaitable) -> asyncio.Task[None]:
+        """
+        Create a task publishing a build event once the object is done (or failed).
+        :param phase: build phase
+        :param name: name of the object
+        :param awaitable: creation of the object
+        :return: task of the creation
+        """
+        return asyncio.create_task(events.track(phase, name, awaitable, self.infrastructure.name))
+
     async def create_networks(self) -> set[asyncio.Task[None]]:
         """
         Creates async tasks for creating networks.
         :return: set of tasks for network creation
         """
         logger.debug("Creating networks", infrastructure_name=self.infrastructure.name)
-        return {asyncio.create_task(network.create()) for network in self.infrastructure.networks}
+        return {self.track(events.NETWORK, network.name, network.create()) for network in self.infrastructure.networks}
 
     async def start_routers(self) -> set[asyncio.Task[None]]:
         """
@@ -103,15 +156,38 @@ class InfrastructureController:
         :return: set of tasks to start router containers
         """
         logger.debug("Starting routers", infrastructure_name=self.infrastructure.name)
-        return {asyncio.create_task(router.start()) for router in self.infrastructure.routers}
+        return {self.track(events.START, router.name, router.start()) for router in self.infrastructure.routers}
 
     async def create_nodes(self) -> set[asyncio.Task[None]]:
         """
-        Creates async tasks for creating nodes.
+        Creates async tasks for creating nodes, replicas of a node group are created by a single task.
         :return: set of tasks to create node containers
         """
         logger.debug("Creating nodes", infrastructure_name=self.infrastructure.name)
-        return {asyncio.create_task(node.create()) for node in self.infrastructure.nodes}
+        node_groups: dict[str, list[Node]] = defaultdict(list)
+        node_tasks: set[asyncio.Task[None]] = set()
+        for node in self.infrastructure.nodes:
+            if node.group is None:
+                node_tasks.add(self.track(events.CREATE, node.name, node.create()))
+            else:
+                node_groups[node.group].append(node)
+
+        for group_nodes in node_groups.values():
+            node_tasks.add(asyncio.create_task(self.create_node_group(group_nodes)))
+
+        return node_tasks
+
+    async def create_node_group(self, nodes: list[Node]) -> None:
+        """
+        Create replicas of a node group in chunks, host configuration is created once and shared by all replicas.
+        :param nodes: replicas of the same node definition
+        :return:
+        """
+        logger.debug("Creating node group", group=nodes[0].group, replicas=len(nodes))
+        host_config = await nodes[0]._create_host_config()
+        for chunk_start in range(0, len(nodes), settings.node_create_chunk_size):
+            chunk = nodes[chunk_start : chunk_start + settings.node_create_chunk_size]
+            await asyncio.gather(*(self.track(events.CREATE, node.name, node.create(host_config)) for node in chunk))
 
     async def start_nodes(self) -> set[asyncio.Task[None]]:
         """
@@ -119,7 +195,7 @@ class InfrastructureController:
         :return: set of tasks to start node containers
         """
         logger.debug("Starting nodes", infrastructure_name=self.infrastructure.name)
-        return {asyncio.create_task(node.start()) for node in self.infrastructure.nodes}
+        return {self.track(events.START, node.name, node.start()) for node in self.infrastructure.nodes}
 
     async def create_volumes(self) -> set[asyncio.Task[None]]:
         """
@@ -127,7 +203,7 @@ class InfrastructureController:
         :return: set of tasks to create node containers
         """
         logger.debug("Creating volumes", infrastructure_name=self.infrastructure.name)
-        return {asyncio.create_task(volume.create()) for volume in self.infrastructure.volumes}
+        return {self.track(events.VOLUME, volume.name, volume.create()) for volume in self.infrastructure.volumes}
 
     async def configure_appliances(self) -> set[asyncio.Task[None]]:
         """
@@ -135,12 +211,50 @@ class InfrastructureController:
         :return:
         """
         logger.debug("Configuring appliances", infrastructure_name=self.infrastructure.name)
-        node_configure_tasks = {asyncio.create_task(node.configure()) for node in self.infrastructure.nodes}
-        router_configure_tasks = {asyncio.create_task(router.configure()) for router in self.infrastructure.routers}
+        node_configure_tasks = {
+            self.track(events.CONFIGURE, node.name, node.configure()) for node in self.infrastructure.nodes
+        }
+        router_configure_tasks = {
+            self.track(events.CONFIGURE, router.name, router.configure()) for router in self.infrastructure.routers
+        }
 
         logger.debug("Appliances configured", infrastructure_name=self.infrastructure.name)
         return node_configure_tasks.union(router_configure_tasks)
 
+    async def reset(self) -> None:
+        """
+        Recreate the node and service containers and the volumes from their images and configure the nodes again.
+        Networks, routers, IP addresses and names are kept, so nothing is allocated again. Volumes are recreated empty
+        and docker fills them from the images, the same way as when the infrastructure was built.
+        :return:
+        """
+        logger.info("Resetting infrastructure", name=self.infrastructure.name)
+        nodes = self.infrastructure.nodes
+        services = [service for node in nodes for service in node.service_containers]
+        volumes = self.infrastructure.volumes
+
+        await teardown.remove_docker_objects(
+            teardown.DockerIds(
+                services=[service.docker_id or service.name for service in services],
+                appliances=[node.docker_id or node.name for node in nodes],
+                volumes=[volume.docker_id or volume.name for volume in volumes],
+            ),
+            docker_client=self.client,
+        )
+        # objects that are not created again are referenced by their names
+        for docker_object in [*nodes, *services, *volumes]:
+            docker_object.docker_id = None
+
+        # configuration of the DNS node isn't stored
+        await self.configure_dns(nodes)
+        await self.run_phase(events.VOLUME, await self.create_volumes())
+        await self.run_phase(events.CREATE, await self.create_nodes())
+        await self.run_phase(events.START, await self.start_nodes())
+        await self.run_phase(
+            events.CONFIGURE, {self.track(events.CONFIGURE, node.name, node.configure()) for node in nodes}
+        )
+        logger.info("Infrastructure reset", name=self.infrastructure.name)
+
     async def stop(self, check_id: bool = False):
         """
         Stops and deletes all containers and networks in the infrastructure.
@@ -308,7 +422,7 @@ class InfrastructureController:
                 volume.name = f"{self.infrastructure.name}-{volume.name}"
 
     async def create_management_network(self, management_subnet: IPNetwork):
-        used_network_names = await util.get_network_names(docker.from_env())
+        used_network_names = await util.get_network_names(self.client)
 
         if (management_name := f"{self.infrastructure.name}-management") in used_network_names:
             management_name += str(uuid1())
@@ -333,13 +447,13 @@ class InfrastructureController:
 
         self.infrastructure.networks.append(management_network)
 
-    async def build_infrastructure(self, run: Run, db_session: AsyncSession) -> Instance:
+    async def build_infrastructure(self) -> None:
+        """
+        Create the docker objects of the infrastructure, the models are detached from any DB session meanwhile.
+        :return:
+        """
         try:
             await self.start()
-            return Instance(
-                run=run,
-                infrastructure=self.infrastructure,
-            )
         except (ImageNotFound, APIError, RuntimeError, Exception) as error:
             logger.error(
                 f"Deleting infrastructure due to {type(error).__name__}",
@@ -349,8 +463,6 @@ class InfrastructureController:
             # this is necessary for the specific infra where the exception was thrown, outer exception handling is for
             # other infras
             await self.stop()
-            db_session.expire(self.infrastructure, ["networks", "routers", "nodes"])
-            await db_session.delete(self.infrastructure)
             raise error
 
     @staticmethod
@@ -386,7 +498,13 @@ class InfrastructureController:
         return controller
 
     @staticmethod
-    async def configure_dns(nodes: list[Node]):
+    async def configure_dns(nodes: list[Node], append: bool = True):
+        """
+        Point the nodes to the DNS node and prepare its configuration with the records of the other nodes.
+        :param nodes: Node objects of the infrastructure
+        :param append: append the configuration to the Corefile, otherwise it is replaced (in a running DNS node)
+        :return:
+        """
         hosts = ""
         dns_node: Dns | None = None
 
@@ -402,7 +520,10 @@ class InfrastructureController:
                     node.kwargs["dns"] = [str(dns_node.interfaces[0].ipaddress)]
 
             updated_config = copy.deepcopy(constants.DNS_CONFIG).format(hosts)
-            dns_node.config_instructions = [["sh", "-c", f"printf '{updated_config}' >> /etc/coredns/Corefile"]]
+            redirection = ">>" if append else ">"
+            dns_node.config_instructions = [
+                ["sh", "-c", f"printf '{updated_config}' {redirection} /etc/coredns/Corefile"]
+            ]
 
     @staticmethod
     async def ensure_image_exists(image_id: int, docker_client: DockerClient):
@@ -412,13 +533,27 @@ class InfrastructureController:
             if image.state == ImageState.ready:
                 return
             try:
-                if image.state == ImageState.building:
+                if image.state == ImageState.initialized:
+                    # only one process (of any replica) gets the image, the others wait for it
+                    claimed = await db_session.execute(
+                        update(Image)
+                        .where(Image.id == image.id, Image.state == ImageState.initialized)
+                        .values(state=ImageState.building)
+                    )
+                    await db_session.commit()
+                    if claimed.rowcount:
+                        await util.get_image(docker_client, image, db_session)
+                    else:
+                        await image_controller.wait_until_image_is_ready(image, db_session)
+                elif image.state == ImageState.building:
                     await image_controller.wait_until_image_is_ready(image, db_session)
-                elif image.state == ImageState.initialized:
-                    await util.get_image(docker_client, image, db_session)
                 await db_session.commit()
             except Exception as err:
                 logger.error("Failed to get image, deleting from DB", image_name=image.name, exception=str(err))
+                # the next build starts over instead of waiting for an image that is never going to be ready
+                await db_session.rollback()
+                await db_session.delete(image)
+                await db_session.commit()
                 raise err
 
     @staticmethod
@@ -428,21 +563,19 @@ class InfrastructureController:
             parser: CYSTParser,
             docker_container_names: set[str],
             docker_network_names: set[str],
-            db_session: AsyncSession,
-            docker_client: DockerClient,
+            images: "ImageResolver",
     ):
 
-        async with async_lock:  # TODO: figure out how to make this work without async lock
-            networks, routers, nodes, volumes, images = await parser.bake_models(db_session, infrastructure.name)
-            try:
-                async with TaskGroup() as tg:
-                    for image in images:
-                        tg.create_task(InfrastructureController.ensure_image_exists(image.id, docker_client))
-            except Exception as err:  # TODO: find out what exception can happen here
-                [await db_session.delete(image) for image in images]
+        # concurrent builds (in any process) would save the same new images, bake_models commits the transaction
+        async with sessionmanager.session() as db_session, locks.advisory_lock(db_session, locks.IMAGES):
+            networks, routers, nodes, volumes, baked_images = await parser.bake_models(db_session, infrastructure.name)
+        try:
+            await asyncio.gather(*(images.ensure(image.id, image.name) for image in baked_images))
+        except Exception as err:  # TODO: find out what exception can happen here
+            async with sessionmanager.session() as db_session:
                 await db_session.delete(infrastructure)
                 await db_session.commit()
-                raise err
+            raise err
 
         infrastructure.networks, infrastructure.routers, infrastructure.nodes = networks, routers, nodes
 
@@ -464,98 +597,319 @@ class InfrastructureController:
             infrastructure_name=infrastructure.name,
         )
 
+        InfrastructureController.configure_attackers(infrastructure.name, nodes)
+
+        async with sessionmanager.session() as db_session:
+            db_session.add(infrastructure)
+            if settings.bulk_insert:
+                await bulk.insert_new(db_session)
+            await db_session.commit()
+            await InfrastructureController.load_node_files(nodes, db_session)
+
+        return controller
+
+    @staticmethod
+    def configure_attackers(infrastructure_name: str, nodes: list[Node]) -> None:
+        """
+        Set the environment of the attacker services, which depends on the final names and addresses.
+        :param infrastructure_name: name of the infrastructure
+        :param nodes: Node objects
+        :return:
+        """
         for node in nodes:
             if isinstance(node, Attacker):
                 for service in node.service_containers:
                     if isinstance(service, ServiceAttacker):
-                        service.environment["CRYTON_WORKER_NAME"] = f"attacker_{infrastructure.name}_{service.name}"
+                        service.environment["CRYTON_WORKER_NAME"] = f"attacker_{infrastructure_name}_{service.name}"
                     elif "metasploit" in service.image.name:
                         service.environment["METASPLOIT_LHOST"] = str(node.interfaces[0].ipaddress)
 
-        db_session.add(infrastructure)
-        return controller
-
     @staticmethod
-    async def build_infra(run: Run, db_session: AsyncSession) -> Instance:
+    async def load_node_files(nodes: list[Node], db_session: AsyncSession) -> None:
         """
-        Builds docker infrastructure
-        :param run: Run object
+        Load contents of the files injected into nodes, the nodes are created after the session is closed.
+        :param nodes: Node objects
         :param db_session: Async database session
         :return:
         """
+        blob_ids = {node_file.blob_id for node in nodes for node_file in node.files}
+        if blob_ids:
+            await db_session.execute(select(Blob).where(Blob.id.in_(blob_ids)).options(undefer(Blob.contents)))
 
-        docker_client = docker.from_env()
-        used_docker_networks: set[IPNetwork] = set()
-        # networks.list doesn't return same objects as networks.get
-        docker_networks = await asyncio.to_thread(docker_client.networks.list)
-        for docker_network in docker_networks:
-            if docker_network.name in ["none", "host"]:
-                continue
-            used_docker_networks.add(
-                IPNetwork(docker_client.networks.get(docker_network.id).attrs["IPAM"]["Config"][0]["Subnet"])
+    @staticmethod
+    async def allocate_infrastructures(
+            count: int,
+            used_docker_networks: set[IPNetwork],
+            job_id: int | None = None,
+            pool_template_id: int | None = None,
+            hosts: Sequence[docker_host_controller.HostState] = (),
+            image_names: set[str] = frozenset(),
+    ) -> list[Infrastructure]:
+        """
+        Reserve supernets, unique names and docker hosts for new infrastructures, all of them are saved by a single
+        transaction. The allocations of all processes are serialized by an advisory lock, the rows themselves are the
+        reservations (released by the teardown), and the constraints of the table reject duplicate names and
+        overlapping supernets.
+        :param count: number of infrastructures
+        :param used_docker_networks: subnets of the existing docker networks
+        :param job_id: ID of the Job building the infrastructures
+        :param pool_template_id: ID of Template whose warm pool the infrastructures are built for
+        :param hosts: docker states of the hosts the infrastructures can be placed on
+        :param image_names: images of the template, hosts that have them are preferred
+        :return: saved empty infrastructures
+        :raises: RuntimeError if there is not enough free address space or docker host capacity
+        """
+        async with sessionmanager.session() as db_session, locks.advisory_lock(db_session, locks.ALLOCATION):
+            placement = await docker_host_controller.place_infrastructures(count, hosts, image_names, db_session)
+            # only supernets are loaded, the overlap is resolved by the index of the column
+            used_infrastructure_supernets = set(
+                (
+                    await db_session.scalars(
+                        select(Infrastructure._supernet).where(
+                            Infrastructure._supernet.overlaps(util.INFRASTRUCTURES_SUPERNET)
+                        )
+                    )
+                ).all()
             )
-
-        logger.info("Building infrastructures")
-        # check if management (cryton) network exists
-        if not settings.ignore_management_network:
-            try:
-                docker_client.networks.get(settings.management_network_name)
-            except NotFound:
-                raise RuntimeError(
-                    f"Management Network containing Cryton '{settings.management_network_name}' not found"
+            supernets = await util.get_available_networks_for_infras(
+                used_docker_networks, used_infrastructure_supernets, count
+            )
+            if len(supernets) < count:
+                raise RuntimeError(f"Address space for {count} infrastructures is not available, {len(supernets)} left")
+
+            names: set[str] = set()
+            while len(names) < count:
+                candidates = {
+                    randomname.generate("adj/colors", "n/astronomy") for _ in range(count - len(names))
+                } - names
+                used_names = await db_session.scalars(
+                    select(Infrastructure.name).where(Infrastructure.name.in_(candidates))
                 )
+                names.update(candidates.difference(used_names))
+
+            infrastructures = [
+                Infrastructure(
+                    name=name,
+                    supernet=supernet,
+                    job_id=job_id,
+                    pool_template_id=pool_template_id,
+                    docker_host_id=host.id if host is not None else None,
+                    nodes=[],
+                    networks=[],
+                    routers=[],
+                )
+                for name, supernet, host in zip(sorted(names), supernets, placement)
+            ]
+            db_session.add_all(infrastructures)
+            await db_session.commit()
+
+        return infrastructures
 
-        used_docker_container_names = await util.get_container_names(docker_client)
-        used_docker_network_names = await util.get_network_names(docker_client)
+    @staticmethod
+    async def build_infras(
+            run: Run | None, count: int = 1, job_id: int | None = None, pool_template_id: int | None = None
+    ) -> list[Instance | Infrastructure | Exception]:
+        """
+        Builds docker infrastructures of Run instances. The docker state of the hosts is listed, the template is parsed,
+        images are resolved (per docker host) and the supernets, names and hosts are allocated once for all of them,
+        then they are built in parallel (at most `settings.run_start_concurrency` at the same time). Database sessions
+        are opened only for the database work, so no connection is checked out from the pool while the docker objects
+        are being created.
+        :param run: Run object, None to build idle infrastructures for the warm pool of the Template
+        :param count: number of instances
+        :param job_id: ID of the Job building the infrastructures, the infrastructures are linked to it once created
+        :param pool_template_id: ID of Template whose warm pool is refilled, used only without a Run
+        :return: Instances (pooled infrastructures without a Run) in the order of the infrastructures, or exceptions of
+            the failed ones (the others are kept)
+        """
+        if count < 1:
+            return []
 
-        template = await template_controller.get_template(run.template_id, db_session)
-        parser = CYSTParser(template.description)
-        await parser.parse()
+        logger.info("Building infrastructures", count=count)
+        async with sessionmanager.session() as db_session:
+            template_id = run.template_id if run is not None else pool_template_id
+            template = await template_controller.get_template(template_id, db_session)
+            hosts = await docker_host_controller.list_hosts(db_session, enabled=True)
+
+        states = await docker_host_controller.get_host_states(hosts)
+        # supernets are unique across the hosts, so they avoid the networks of all of them
+        used_docker_networks: set[IPNetwork] = set().union(*(state.networks for state in states))
+        # parsing is CPU-bound, only the DB persistence (bake_models) runs on the event loop
+        parser = await process_pool.run(parse_template, template.description)
+
+        infrastructures = await InfrastructureController.allocate_infrastructures(
+            count,
+            used_docker_networks,
+            job_id,
+            None if run is not None else pool_template_id,
+            states,
+            docker_host_controller.template_images(parser),
+        )
+        host_states = {state.host.id if state.host is not None else None: state for state in states}
+        images = {
+            host_id: ImageResolver(state.client, remote=host_id is not None) for host_id, state in host_states.items()
+        }
+        concurrency = asyncio.Semaphore(settings.run_start_concurrency)
+
+        async def build(infrastructure: Infrastructure) -> Instance | Infrastructure:
+            state = host_states[infrastructure.docker_host_id]
+            async with concurrency:
+                with docker_hosts.use_host(state.url):
+                    return await InfrastructureController.build_instance(
+                        run,
+                        infrastructure,
+                        parser,
+                        used_docker_networks,
+                        state.container_names,
+                        state.network_names,
+                        images[infrastructure.docker_host_id],
+                        job_id,
+                    )
 
-        infrastructure_names: set[str] = set()
+        results = await asyncio.gather(
+            *(build(infrastructure) for infrastructure in infrastructures), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        logger.info(
+            "Infrastructures built",
+            count=count,
+            failed=sum(isinstance(result, Exception) for result in results),
+        )
+        return results
 
-        async with async_lock:
-            existing_infrastructures = (await db_session.scalars(select(Infrastructure))).all()
-            used_infrastructure_supernets = {infra.supernet for infra in existing_infrastructures}
-            used_infrastructure_names = {infra.name for infra in existing_infrastructures}
-            available_infrastructure_supernets = await util.get_available_networks_for_infras(
+    @staticmethod
+    async def build_instance(
+            run: Run | None,
+            infrastructure: Infrastructure,
+            parser: CYSTParser,
+            used_docker_networks: set[IPNetwork],
+            docker_container_names: set[str],
+            docker_network_names: set[str],
+            images: "ImageResolver",
+            job_id: int | None = None,
+    ) -> Instance | Infrastructure:
+        """
+        Build an allocated infrastructure and create the Run Instance for it. The infrastructure is deleted if the build
+        fails.
+        :param run: Run object, None to put the infrastructure into the warm pool of its Template instead
+        :param infrastructure: allocated Infrastructure
+        :param parser: parsed template
+        :param used_docker_networks: subnets of the existing docker networks
+        :param docker_container_names: used docker container names, the new ones are added
+        :param docker_network_names: used docker network names, the new ones are added
+        :param images: resolver of the images shared by the infrastructures of the Run placed on the same docker host
+        :param job_id: ID of the Job building the infrastructure
+        :return: Instance of the Run, or the pooled infrastructure
+        """
+        events.emit(events.BUILD, events.STARTED, infrastructure=infrastructure.name)
+        try:
+            controller = await InfrastructureController.create_controller(
+                infrastructure,
                 used_docker_networks,
-                used_infrastructure_supernets,
+                parser,
+                docker_container_names,
+                docker_network_names,
+                images,
             )
 
-            while (infra_name := randomname.generate("adj/colors", "n/astronomy")) in used_infrastructure_names:
-                continue
-            infrastructure_names.update(infra_name)
-            infrastructure = Infrastructure(name=infra_name,
-                                              supernet=available_infrastructure_supernets,
-                                              nodes=[],
-                                              networks=[],
-                                              routers=[])
-            db_session.add(infrastructure)
-            await db_session.commit()
-
-        controller = await InfrastructureController.create_controller(
-                    infrastructure,
-                    used_docker_networks,
-                    parser,
-                    used_docker_container_names,
-                    used_docker_network_names,
-                    db_session,
-                    docker_client
+            try:
+                await controller.build_infrastructure()
+            except Exception as err:
+                logger.error(
+                    "Deleting instance due to exception in build_infrastructure",
                 )
+                async with sessionmanager.session() as db_session:
+                    # attach the whole infrastructure first, so the deletion cascades to all of its models
+                    db_session.add(infrastructure)
+                    await db_session.delete(infrastructure)
+                    await db_session.flush()
+                    await blob_controller.delete_unreferenced_blobs(db_session)
+                    await db_session.commit()
 
-        try:
-            instance = await controller.build_infrastructure(run, db_session)
+                raise err
         except Exception as err:
-            logger.error(
-                "Deleting instance due to exception in build_infrastructure",
+            detail = f"{type(err).__name__}: {err}"
+            events.emit(events.BUILD, events.FAILED, infrastructure=infrastructure.name, detail=detail)
+            raise
+
+        # saves also docker IDs of the created objects
+        async with sessionmanager.session() as db_session:
+            db_session.add(infrastructure)
+            if run is not None:
+                result = Instance(run=run, infrastructure=infrastructure)
+                db_session.add(result)
+            else:
+                # the Run is assigned when the infrastructure is claimed
+                result, infrastructure.pooled_at = infrastructure, utc_now()
+            infrastructure.snapshot = InfrastructureController.build_snapshot(
+                infrastructure, run.id if run is not None else None
             )
-            await InfrastructureController.stop_infra(infrastructure)
-            await db_session.delete(infrastructure)  # commits in outer function
+            if job_id is not None:
+                await db_session.execute(update(Job).where(Job.id == job_id).values(built=Job.built + 1))
+            await db_session.commit()
+        events.emit(events.BUILD, events.FINISHED, infrastructure=infrastructure.name)
 
-            raise err
+        return result
 
-        return instance
+    @staticmethod
+    async def reset_infra(infrastructure_id: int) -> None:
+        """
+        Reset built infrastructure to its initial state in place (see `reset`), much faster than a new Run instance.
+        The new docker IDs are saved even if the reset fails, so the infrastructure can always be torn down.
+        :param infrastructure_id: infrastructure ID
+        :return:
+        :raises: sqlalchemy.exc.NoResultFound, InfrastructureStateError
+        """
+        async with sessionmanager.session() as db_session:
+            infrastructure = (
+                await db_session.execute(
+                    select(Infrastructure)
+                    .where(Infrastructure.id == infrastructure_id)
+                    .options(
+                        joinedload(Infrastructure.instance),
+                        joinedload(Infrastructure.docker_host),
+                        selectinload(Infrastructure.nodes).options(
+                            joinedload(Node.image),
+                            selectinload(Node.volumes),
+                            selectinload(Node.interfaces).joinedload(Interface.network),
+                            selectinload(Node.service_containers).options(
+                                joinedload(ServiceContainer.image),
+                                joinedload(ServiceContainer.parent_node),
+                                selectinload(ServiceContainer.volumes),
+                                selectinload(ServiceContainer.dependencies).joinedload(DependsOn.dependency),
+                            ),
+                        ),
+                    )
+                )
+            ).scalar_one()
+            if infrastructure.instance is None and infrastructure.pooled_at is None:
+                raise InfrastructureStateError(f"Infrastructure {infrastructure_id} is not built")
+            if infrastructure.teardown_at is not None:
+                raise InfrastructureStateError(f"Infrastructure {infrastructure_id} is being torn down")
+            await InfrastructureController.load_node_files(infrastructure.nodes, db_session)
+
+        run_id = infrastructure.instance.run_id if infrastructure.instance is not None else None
+        build_scope = events.build_scope(run_id) if run_id is not None else contextlib.nullcontext()
+        docker_host = infrastructure.docker_host.url if infrastructure.docker_host is not None else None
+        with build_scope, docker_hosts.use_host(docker_host):
+            events.emit(events.RESET, events.STARTED, infrastructure=infrastructure.name)
+            try:
+                await InfrastructureController(infrastructure).reset()
+            except Exception as error:
+                events.emit(
+                    events.RESET,
+                    events.FAILED,
+                    infrastructure=infrastructure.name,
+                    detail=f"{type(error).__name__}: {error}",
+                )
+                raise
+            finally:
+                async with sessionmanager.session() as db_session:
+                    db_session.add(infrastructure)
+                    await db_session.commit()
+            events.emit(events.RESET, events.FINISHED, infrastructure=infrastructure.name)
 
     @staticmethod
     async def stop_infra(infrastructure: Infrastructure):
@@ -570,37 +924,44 @@ class InfrastructureController:
         await controller.stop()
 
     @staticmethod
-    async def delete_infra(infrastructure: Infrastructure, db_session: AsyncSession):
+    async def list_infrastructures(
+        db_session: AsyncSession,
+        limit: int | None = None,
+        after: int | None = None,
+        name: str | None = None,
+        run_id: int | None = None,
+    ) -> Sequence[Infrastructure]:
         """
-        Delete infrastructure and all models belonging to it (cascade deletion) from db.
-        :param infrastructure: Infrastructure object
+        Return infrastructures of Run instances ordered by ID, only their names and Run IDs are loaded.
+        Infrastructures being torn down are left out.
         :param db_session: Async database session
-        :return:
+        :param limit: maximum number of infrastructures
+        :param after: return only infrastructures with greater ID
+        :param name: return only infrastructure with this name
+        :param run_id: return only infrastructures of this Run
+        :return: list of infrastructures
         """
-        logger.debug(
-            "Deleting infrastructure",
-            name=infrastructure.name,
-            id=infrastructure.id,
-        )
-
-        await db_session.delete(infrastructure.instance)
-        await db_session.commit()
-        logger.debug(
-            "Infrastructure deleted",
-            name=infrastructure.name,
-            id=infrastructure.id,
+        logger.debug("Pulling infrastructures from db", limit=limit, after=after)
+
+        query = (
+            select(Infrastructure)
+            .join(Infrastructure.instance)
+            .options(
+                load_only(Infrastructure.name, Infrastructure.instance_id),
+                contains_eager(Infrastructure.instance).load_only(Instance.run_id),
+            )
+            .where(Infrastructure.teardown_at.is_(None))
+            .order_by(Infrastructure.id)
+            .limit(limit)
         )
+        if after is not None:
+            query = query.where(Infrastructure.id > after)
+        if name is not None:
+            query = query.where(Infrastructure.name == name)
+        if run_id is not None:
+            query = query.where(Instance.run_id == run_id)
 
-    @staticmethod
-    async def list_infrastructures(db_session: AsyncSession) -> Sequence[Infrastructure]:
-        """
-        Return names and Ids of all infrastructures in key:value -> id:name format
-        :param db_session: Async database session
-        :return:
-        """
-        logger.debug("Pulling infrastructures from db")
-
-        return (await db_session.scalars(select(Infrastructure).options(joinedload(Infrastructure.instance)))).all()
+        return (await db_session.scalars(query)).all()
 
     @staticmethod
     async def get_infra_info(infrastructure_id: int, db_session: AsyncSession) -> Infrastructure:
@@ -630,3 +991,77 @@ class InfrastructureController:
         )
 
         return infrastructure
+
+    @staticmethod
+    def build_snapshot(infrastructure: Infrastructure, run_id: int | None) -> dict[str, Any]:
+        """
+        Describe infrastructure in the format served by the infrastructure detail endpoint.
+        Networks with their interfaces and appliances and nodes with their services have to be loaded.
+        :param infrastructure: infrastructure to describe
+        :param run_id: ID of Run the infrastructure is an instance of, None for infrastructures of a warm pool
+        :return: JSON serializable infrastructure description
+        """
+        networks = []
+        for network in infrastructure.networks:
+            appliances = [
+                {
+                    "name": interface.appliance.name,
+                    "ip": str(interface.ipaddress),
+                    "original_ip": str(interface.original_ip),
+                }
+                for interface in network.interfaces
+            ]
+            networks.append({"name": network.name, "ip": str(network.ipaddress), "appliances": appliances})
+
+        attackers = {}
+        for node in infrastructure.nodes:
+            if type(node) is Attacker:
+                for service in node.service_containers:
+                    if type(service) is ServiceAttacker:
+                        attackers[node.name] = service.environment["CRYTON_WORKER_NAME"]
+
+        return {
+            "id": infrastructure.id,
+            "name": infrastructure.name,
+            "run_id": run_id,
+            "networks": networks,
+            "attackers": attackers,
+        }
+
+    @staticmethod
+    async def refresh_snapshot(infrastructure_id: int, db_session: AsyncSession) -> dict[str, Any]:
+        """
+        Rebuild the snapshot of infrastructure from DB, should be called after the infrastructure is changed.
+        :param infrastructure_id: infrastructure ID
+        :param db_session: Async database session
+        :return: infrastructure description
+        :raises: sqlalchemy.exc.NoResultFound
+        """
+        logger.debug("Refreshing infrastructure snapshot", id=infrastructure_id)
+
+        infrastructure = await InfrastructureController.get_infra_info(infrastructure_id, db_session)
+        infrastructure.snapshot = InfrastructureController.build_snapshot(
+            infrastructure, infrastructure.instance.run_id if infrastructure.instance is not None else None
+        )
+        await db_session.commit()
+
+        return infrastructure.snapshot
+
+    @staticmethod
+    async def get_infra_snapshot(infrastructure_id: int, db_session: AsyncSession) -> dict[str, Any]:
+        """
+        Get stored description of infrastructure specified by ID, missing snapshot is built and stored.
+        :param infrastructure_id: infrastructure ID
+        :param db_session: Async database session
+        :return: infrastructure description
+        :raises: sqlalchemy.exc.NoResultFound
+        """
+        logger.debug("Getting infrastructure snapshot", id=infrastructure_id)
+
+        snapshot = (
+            await db_session.execute(select(Infrastructure.snapshot).where(Infrastructure.id == infrastructure_id))
+        ).scalar_one()
+        if snapshot is None:
+            snapshot = await InfrastructureController.refresh_snapshot(infrastructure_id, db_session)
+
+        return snapshot
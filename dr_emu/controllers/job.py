@@ -0,0 +1,268 @@
+from datetime import timedelta
+from typing import Sequence
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dr_emu.controllers import teardown
+from dr_emu.lib.exceptions import JobStateError
+from dr_emu.lib.logger import logger
+from dr_emu.models import Job, JobStatus, Run, Infrastructure, utc_now
+from dr_emu.settings import settings
+
+FINISHED = (JobStatus.succeeded, JobStatus.failed, JobStatus.cancelled)
+
+
+async def create_job(run_id: int, db_session: AsyncSession, count: int = 1, built: int = 0) -> Job:
+    """
+    Queue a build of Run instances, it is executed by a worker process.
+    :param run_id: ID of Run
+    :param db_session: Async database session
+    :param count: number of instances to build
+    :param built: instances already created (claimed from a warm pool), the Job succeeds right away if all are
+    :return: queued Job
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    (await db_session.execute(select(Run.id).where(Run.id == run_id))).scalar_one()
+
+    job = Job(run_id=run_id, count=count, built=built)
+    if built >= count:
+        job.status, job.finished_at = JobStatus.succeeded, utc_now()
+    db_session.add(job)
+    await db_session.commit()
+    logger.info("Job queued", id=job.id, run_id=run_id, count=count, built=built, status=job.status.value)
+
+    return job
+
+
+async def get_job(job_id: int, db_session: AsyncSession) -> Job:
+    """
+    Get Job by ID.
+    :param job_id: ID of Job
+    :param db_session: Async database session
+    :return: Job object
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    return (await db_session.execute(select(Job).where(Job.id == job_id))).scalar_one()
+
+
+async def list_jobs(
+    db_session: AsyncSession,
+    limit: int | None = None,
+    after: int | None = None,
+    status: JobStatus | None = None,
+    run_id: int | None = None,
+) -> Sequence[Job]:
+    """
+    List Jobs ordered by ID.
+    :param db_session: Async database session
+    :param limit: maximum number of Jobs
+    :param after: list only Jobs with greater ID
+    :param status: list only Jobs in this state
+    :param run_id: list only Jobs of this Run
+    :return: list of Jobs
+    """
+    query = select(Job).order_by(Job.id).limit(limit)
+    if after is not None:
+        query = query.where(Job.id > after)
+    if status is not None:
+        query = query.where(Job.status == status)
+    if run_id is not None:
+        query = query.where(Job.run_id == run_id)
+
+    return (await db_session.scalars(query)).all()
+
+
+async def cancel_job(job_id: int, db_session: AsyncSession) -> Job:
+    """
+    Cancel Job. Queued Job is cancelled right away, running one is cancelled by its worker on the next heartbeat.
+    :param job_id: ID of Job
+    :param db_session: Async database session
+    :return: Job object
+    :raises: sqlalchemy.exc.NoResultFound, JobStateError
+    """
+    job = (await db_session.execute(select(Job).where(Job.id == job_id).with_for_update())).scalar_one()
+    if job.status in FINISHED:
+        raise JobStateError(f"Job {job_id} has already finished ({job.status.value})")
+
+    if job.status is JobStatus.queued:
+        job.status, job.finished_at = JobStatus.cancelled, utc_now()
+    else:
+        job.cancel_requested = True
+    await db_session.commit()
+    logger.info("Job cancellation requested", id=job_id, status=job.status.value)
+
+    return job
+
+
+async def retry_job(job_id: int, db_session: AsyncSession) -> Job:
+    """
+    Queue failed or cancelled Job again, only the instances that were not built are built by the new attempt.
+    :param job_id: ID of Job
+    :param db_session: Async database session
+    :return: Job object
+    :raises: sqlalchemy.exc.NoResultFound, JobStateError
+    """
+    job = (await db_session.execute(select(Job).where(Job.id == job_id).with_for_update())).scalar_one()
+    if job.status not in (JobStatus.failed, JobStatus.cancelled):
+        raise JobStateError(f"Only failed or cancelled Job can be retried, Job {job_id} is {job.status.value}")
+    if job.run_id is None and job.template_id is None:
+        raise JobStateError(f"Warm pool of Job {job_id} was deleted")
+
+    job.status, job.error, job.cancel_requested = JobStatus.queued, None, False
+    job.worker = job.started_at = job.finished_at = job.heartbeat_at = None
+    await db_session.commit()
+    logger.info("Job queued again", id=job_id)
+
+    return job
+
+
+async def claim_job(worker: str, db_session: AsyncSession) -> Job | None:
+    """
+    Take the oldest queued Job, concurrent workers skip the Jobs being claimed.
+    :param worker: name of the worker
+    :param db_session: Async database session
+    :return: claimed Job or None if the queue is empty
+    """
+    job = await db_session.scalar(
+        select(Job).where(Job.status == JobStatus.queued).order_by(Job.id).limit(1).with_for_update(skip_locked=True)
+    )
+    if job is None:
+        await db_session.commit()
+        return None
+
+    job.status, job.worker, job.attempts = JobStatus.running, worker, job.attempts + 1
+    job.started_at = job.heartbeat_at = utc_now()
+    await db_session.commit()
+    logger.info("Job claimed", id=job.id, worker=worker, attempt=job.attempts)
+
+    return job
+
+
+async def is_building(db_session: AsyncSession) -> bool:
+    """
+    Check whether any worker is running a Job.
+    :param db_session: Async database session
+    :return: whether a Job is running
+    """
+    running = await db_session.scalar(select(Job.id).where(Job.status == JobStatus.running).limit(1))
+    await db_session.commit()
+
+    return running is not None
+
+
+async def heartbeat(job_id: int, worker: str, db_session: AsyncSession) -> bool | None:
+    """
+    Mark running Job as alive.
+    :param job_id: ID of Job
+    :param worker: name of the worker running the Job
+    :param db_session: Async database session
+    :return: whether cancellation was requested, None if the worker doesn't own the Job anymore
+    """
+    cancel_requested = await db_session.scalar(
+        update(Job)
+        .where(Job.id == job_id, Job.worker == worker, Job.status == JobStatus.running)
+        .values(heartbeat_at=utc_now())
+        .returning(Job.cancel_requested)
+    )
+    await db_session.commit()
+
+    return cancel_requested
+
+
+async def finish_job(
+    job_id: int, worker: str, status: JobStatus, db_session: AsyncSession, error: str | None = None
+) -> None:
+    """
+    Finish Job owned by the worker, or return it to the queue.
+    :param job_id: ID of Job
+    :param worker: name of the worker running the Job
+    :param status: final state, or queued to run the Job again
+    :param db_session: Async database session
+    :param error: reason of the failure
+    :return:
+    """
+    values = {"status": status, "error": error, "heartbeat_at": None}
+    if status is JobStatus.queued:
+        values.update(worker=None)
+    else:
+        values.update(finished_at=utc_now())
+
+    await db_session.execute(
+        update(Job).where(Job.id == job_id, Job.worker == worker, Job.status == JobStatus.running).values(**values)
+    )
+    await db_session.commit()
+    logger.info("Job finished", id=job_id, status=status.value, error=error)
+
+
+async def delete_unfinished_infrastructures(job_id: int, db_session: AsyncSession) -> None:
+    """
+    Tear down the infrastructures of the Job whose build didn't finish (no Instance was created for them and they were
+    not added to a warm pool).
+    :param job_id: ID of Job
+    :param db_session: Async database session
+    :return:
+    """
+    infrastructure_ids = list(
+        await db_session.scalars(
+            select(Infrastructure.id).where(
+                Infrastructure.job_id == job_id,
+                Infrastructure.instance_id.is_(None),
+                Infrastructure.pooled_at.is_(None),
+            )
+        )
+    )
+    if infrastructure_ids:
+        logger.info("Deleting unfinished infrastructures", job_id=job_id, infrastructure_ids=infrastructure_ids)
+        await teardown.teardown_infrastructures(infrastructure_ids, db_session)
+
+
+async def delete_detached_infrastructures(job_id: int, db_session: AsyncSession) -> None:
+    """
+    Tear down the idle infrastructures built by a warm pool Job whose pool was deleted during the build (see
+    `pool_controller.delete_pool`), they don't belong to any Template and can't be claimed.
+    :param job_id: ID of Job
+    :param db_session: Async database session
+    :return:
+    """
+    infrastructure_ids = list(
+        await db_session.scalars(
+            select(Infrastructure.id).where(
+                Infrastructure.job_id == job_id,
+                Infrastructure.pool_template_id.is_(None),
+                Infrastructure.instance_id.is_(None),
+            )
+        )
+    )
+    if infrastructure_ids:
+        logger.info("Deleting detached infrastructures", job_id=job_id, infrastructure_ids=infrastructure_ids)
+        await teardown.teardown_infrastructures(infrastructure_ids, db_session)
+
+
+async def recover_lost_jobs(worker: str, db_session: AsyncSession) -> int:
+    """
+    Take over running Jobs without a heartbeat (their worker was killed), tear down their unfinished infrastructures
+    and queue them again, unless they ran out of attempts.
+    :param worker: name of the recovering worker
+    :param db_session: Async database session
+    :return: number of recovered Jobs
+    """
+    deadline = utc_now() - timedelta(seconds=settings.job_timeout)
+    # the worker name is changed, so the original worker (if still alive) stops the build on its next heartbeat
+    lost_jobs = (
+        await db_session.execute(
+            update(Job)
+            .where(Job.status == JobStatus.running, Job.heartbeat_at < deadline)
+            .values(worker=worker, heartbeat_at=utc_now())
+            .returning(Job.id, Job.attempts)
+        )
+    ).all()
+    await db_session.commit()
+
+    for job_id, attempts in lost_jobs:
+        logger.warning("Recovering lost job", id=job_id, attempts=attempts)
+        await delete_unfinished_infrastructures(job_id, db_session)
+        status = JobStatus.queued if attempts < settings.job_max_attempts else JobStatus.failed
+        await finish_job(job_id, worker, status, db_session, "Worker stopped responding")
+
+    return len(lost_jobs)
@@ -0,0 +1,252 @@
+"""
+Warm pools of idle infrastructures built ahead of time, so starting a Run doesn't wait for the build.
+Pools are refilled by Jobs without a Run queued by the workers, see `refill_pools`.
+"""
+from dataclasses import dataclass
+from typing import Sequence
+
+from sqlalchemy import select, func, update, ColumnElement
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+
+from dr_emu.controllers import teardown, docker_host as docker_host_controller
+from dr_emu.controllers.infrastructure import InfrastructureController
+from dr_emu.lib import metrics
+from dr_emu.lib.logger import logger
+from dr_emu.lib.query_stats import track_queries
+from dr_emu.models import Template, Infrastructure, Instance, Job, JobStatus, utc_now
+from dr_emu.settings import settings
+
+IN_PROGRESS = (JobStatus.queued, JobStatus.running)
+
+
+@dataclass
+class PoolStatus:
+    size: int  # requested number of idle infrastructures
+    ready: int  # idle infrastructures that can be claimed
+    building: int  # infrastructures being built by queued or running Jobs
+
+
+def _ready(template_id: int) -> ColumnElement[bool]:
+    return (
+        (Infrastructure.pool_template_id == template_id)
+        & Infrastructure.pooled_at.is_not(None)
+        & Infrastructure.instance_id.is_(None)
+        & Infrastructure.teardown_at.is_(None)
+    )
+
+
+async def get_pool_status(template_id: int, db_session: AsyncSession) -> PoolStatus:
+    """
+    Get the size and state of the warm pool of Template.
+    :param template_id: ID of Template
+    :param db_session: Async database session
+    :return: pool status
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    size = (await db_session.execute(select(Template.warm_pool_size).where(Template.id == template_id))).scalar_one()
+    ready = await db_session.scalar(select(func.count(Infrastructure.id)).where(_ready(template_id)))
+    building = await db_session.scalar(
+        select(func.coalesce(func.sum(Job.count - Job.built), 0)).where(
+            Job.template_id == template_id, Job.run_id.is_(None), Job.status.in_(IN_PROGRESS)
+        )
+    )
+
+    return PoolStatus(size=size, ready=ready, building=building)
+
+
+async def set_pool_size(template_id: int, size: int, db_session: AsyncSession) -> PoolStatus:
+    """
+    Set the number of idle infrastructures kept for Template, the pool is filled or drained by the workers.
+    :param template_id: ID of Template
+    :param size: number of idle infrastructures, 0 disables the pool
+    :param db_session: Async database session
+    :return: pool status
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    template = (await db_session.execute(select(Template).where(Template.id == template_id))).scalar_one()
+    template.warm_pool_size = size
+    await db_session.commit()
+    logger.info("Warm pool size set", template_id=template_id, size=size)
+
+    return await get_pool_status(template_id, db_session)
+
+
+async def claim_infrastructures(
+    template_id: int, run_id: int, count: int, db_session: AsyncSession
+) -> Sequence[Infrastructure]:
+    """
+    Turn idle infrastructures of the warm pool into Instances of the Run, the oldest ones are taken first.
+    Infrastructures locked by a concurrent claim are skipped, the changes are not committed.
+    :param template_id: ID of Template of the Run
+    :param run_id: ID of Run
+    :param count: number of requested instances
+    :param db_session: Async database session
+    :return: claimed infrastructures, fewer than requested if the pool doesn't have enough of them
+    """
+    infrastructures = (
+        await db_session.scalars(
+            select(Infrastructure)
+            .where(_ready(template_id))
+            .order_by(Infrastructure.pooled_at, Infrastructure.id)
+            .limit(count)
+            .options(undefer(Infrastructure.snapshot))
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+
+    for infrastructure in infrastructures:
+        db_session.add(Instance(run_id=run_id, infrastructure=infrastructure))
+        infrastructure.snapshot = {**infrastructure.snapshot, "run_id": run_id}
+    await db_session.flush()
+
+    metrics.warm_pool_claims.record(hits=len(infrastructures), misses=count - len(infrastructures))
+    logger.info(
+        "Infrastructures claimed from warm pool",
+        template_id=template_id,
+        run_id=run_id,
+        claimed=len(infrastructures),
+        count=count,
+    )
+
+    return infrastructures
+
+
+async def delete_pool(template_id: int, db_session: AsyncSession) -> None:
+    """
+    Remove the warm pool of Template. Its queued Jobs are cancelled and the running ones are asked to cancel, their
+    workers tear down the infrastructures being built (see `Worker.finish`), the other idle infrastructures are torn
+    down by the reapers. Jobs and claimed infrastructures are kept, they are only detached from the Template.
+    :param template_id: ID of Template
+    :param db_session: Async database session
+    :return:
+    """
+    pool_jobs = (Job.template_id == template_id, Job.run_id.is_(None))
+    # the rows of the running Jobs stay locked, so their workers finish only once the pool is detached
+    await db_session.execute(
+        update(Job).where(*pool_jobs, Job.status == JobStatus.running).values(cancel_requested=True)
+    )
+    await db_session.execute(
+        update(Job)
+        .where(*pool_jobs, Job.status == JobStatus.queued)
+        .values(status=JobStatus.cancelled, finished_at=utc_now())
+    )
+    running_job_ids = select(Job.id).where(*pool_jobs, Job.status == JobStatus.running)
+    infrastructure_ids = list(
+        await db_session.scalars(
+            select(Infrastructure.id).where(
+                Infrastructure.pool_template_id == template_id,
+                Infrastructure.instance_id.is_(None),
+                Infrastructure.job_id.is_(None) | Infrastructure.job_id.not_in(running_job_ids),
+            )
+        )
+    )
+    # claimed infrastructures keep running as Run instances
+    await db_session.execute(
+        update(Infrastructure).where(Infrastructure.pool_template_id == template_id).values(pool_template_id=None)
+    )
+    await db_session.execute(update(Job).where(*pool_jobs).values(template_id=None))
+    await db_session.commit()
+    if infrastructure_ids:
+        await teardown.schedule_teardown(infrastructure_ids, db_session)
+
+
+async def _drain(template_id: int, surplus: int, db_session: AsyncSession) -> None:
+    # the rows are taken out of the pool first, so they can't be claimed while the docker objects are removed
+    infrastructure_ids = list(
+        await db_session.scalars(
+            select(Infrastructure.id)
+            .where(_ready(template_id))
+            .order_by(Infrastructure.pooled_at.desc(), Infrastructure.id.desc())
+            .limit(surplus)
+            .with_for_update(skip_locked=True)
+        )
+    )
+    await db_session.execute(
+        update(Infrastructure).where(Infrastructure.id.in_(infrastructure_ids)).values(pooled_at=None)
+    )
+    await db_session.commit()
+    if infrastructure_ids:
+        logger.info("Draining warm pool", template_id=template_id, infrastructure_ids=infrastructure_ids)
+        await teardown.teardown_infrastructures(infrastructure_ids, db_session)
+
+
+async def refill_pools(db_session: AsyncSession) -> list[Job]:
+    """
+    Queue Jobs building the missing infrastructures of warm pools and tear down the surplus ones.
+    A pool has at most one Job in progress building at most `settings.warm_pool_refill_batch` infrastructures, and no
+    Jobs are queued once the infrastructures (existing and queued ones) reach the capacity of the docker hosts (see
+    `docker_host_controller.get_capacity`).
+    :param db_session: Async database session
+    :return: queued Jobs
+    """
+    pooled_template_ids = select(Infrastructure.pool_template_id).where(
+        Infrastructure.pooled_at.is_not(None), Infrastructure.instance_id.is_(None)
+    )
+    # pools with a zero size are included while they have infrastructures to drain
+    sizes = (
+        await db_session.execute(
+            select(Template.id, Template.warm_pool_size)
+            .where((Template.warm_pool_size > 0) | Template.id.in_(pooled_template_ids))
+            .order_by(Template.id)
+        )
+    ).all()
+    queued = await db_session.scalar(
+        select(func.coalesce(func.sum(Job.count - Job.built), 0)).where(Job.status == JobStatus.queued)
+    )
+    limit = await docker_host_controller.get_capacity(db_session)
+    capacity = limit - await db_session.scalar(select(func.count(Infrastructure.id))) - queued
+
+    jobs = []
+    for template_id, size in sizes:
+        # the row lock makes concurrent workers skip the pool instead of changing it twice
+        if (
+            await db_session.scalar(
+                select(Template.id).where(Template.id == template_id).with_for_update(skip_locked=True)
+            )
+            is None
+        ):
+            await db_session.commit()
+            continue
+
+        ready = await db_session.scalar(select(func.count(Infrastructure.id)).where(_ready(template_id)))
+        if ready > size:
+            await _drain(template_id, ready - size, db_session)
+            continue
+
+        in_progress = await db_session.scalar(
+            select(Job.id).where(Job.template_id == template_id, Job.run_id.is_(None), Job.status.in_(IN_PROGRESS))
+        )
+        count = min(size - ready, settings.warm_pool_refill_batch, capacity)
+        if in_progress is not None or count < 1:
+            if in_progress is None and ready < size:
+                logger.warning(
+                    "Warm pool is not refilled, host capacity reached",
+                    template_id=template_id,
+                    ready=ready,
+                    size=size,
+                    limit=limit,
+                )
+            await db_session.commit()
+            continue
+
+        job = Job(template_id=template_id, count=count)
+        db_session.add(job)
+        await db_session.commit()
+        capacity -= count
+        jobs.append(job)
+        logger.info("Warm pool refill queued", template_id=template_id, job_id=job.id, count=count, ready=ready)
+
+    return jobs
+
+
+async def build_pool(template_id: int, count: int, job_id: int | None = None) -> list[Infrastructure | Exception]:
+    """
+    Build idle infrastructures for the warm pool of Template.
+    :param template_id: ID of Template
+    :param count: number of infrastructures
+    :param job_id: ID of the Job executing the build
+    :return: pooled infrastructures, or exceptions of the ones that failed
+    """
+    with track_queries(f"build {count} infrastructures of the warm pool of Template {template_id}"):
+        return await InfrastructureController.build_infras(None, count, job_id, template_id)
@@ -1,18 +1,17 @@
-import asyncio
 from typing import Sequence
 
-from docker.errors import ImageNotFound, APIError
 from sqlalchemy import select
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload, load_only
 
-from fastapi import APIRouter, HTTPException, status
-
-from dr_emu.settings import settings
 from dr_emu.api.helpers import nonexistent_object_msg
+from dr_emu.controllers import teardown, job as job_controller, pool as pool_controller
 from dr_emu.controllers.infrastructure import InfrastructureController
+from dr_emu.database_config import sessionmanager
+from dr_emu.lib import events
 from dr_emu.lib.logger import logger
-from dr_emu.models import Run, Template, Instance, Infrastructure, Node, ServiceContainer
+from dr_emu.lib.query_stats import track_queries
+from dr_emu.models import Run, Template, Instance, Infrastructure, Job
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -40,19 +39,42 @@ async def create_run(name: str, template_id: int, db_session: AsyncSession) -> R
     return run
 
 
-async def list_runs(db_session: AsyncSession) -> Sequence[Run]:
+async def list_runs(
+    db_session: AsyncSession,
+    limit: int | None = None,
+    after: int | None = None,
+    name: str | None = None,
+    template_id: int | None = None,
+) -> Sequence[Run]:
     """
-    List all Runs saved in DB.
+    List Runs saved in DB ordered by ID, only IDs of their infrastructures are loaded.
     :param db_session: Async database session
+    :param limit: maximum number of Runs
+    :param after: list only Runs with greater ID
+    :param name: list only Runs with this name
+    :param template_id: list only Runs of this Template
     :return: list of Runs
     """
-    logger.debug("Listing runs")
-
-    runs = (
-        (await db_session.scalars(select(Run).options(joinedload(Run.instances).joinedload(Instance.infrastructure))))
-        .unique()
-        .all()
+    logger.debug("Listing runs", limit=limit, after=after)
+
+    query = (
+        select(Run)
+        .options(
+            selectinload(Run.instances)
+            .load_only(Instance.run_id)
+            .selectinload(Instance.infrastructure)
+            .load_only(Infrastructure.instance_id)
+        )
+        .order_by(Run.id)
+        .limit(limit)
     )
+    if after is not None:
+        query = query.where(Run.id > after)
+    if name is not None:
+        query = query.where(Run.name == name)
+    if template_id is not None:
+        query = query.where(Run.template_id == template_id)
+    runs = (await db_session.scalars(query)).all()
 
     return runs
 
@@ -97,62 +119,60 @@ async def delete_run(run_id: int, db_session: AsyncSession) -> Run:
     return run
 
 
-async def start_run(run_id: int, db_session: AsyncSession):
+async def start_run(run_id: int, db_session: AsyncSession, count: int = 1) -> Job:
     """
-    Start number of specified Run instances (infrastructure clones)
+    Queue a build of Run instances (infrastructure clones), the build itself takes minutes and runs in a worker.
+    Idle infrastructures of the Template's warm pool are claimed first, only the missing instances are built.
     :param run_id: ID of Run
     :param db_session: Async database session
-    :return:
+    :param count: number of instances
+    :return: queued Job, already succeeded if all instances were claimed
     :raises: sqlalchemy.exc.NoResultFound
     """
+    template_id, warm_pool_size = (
+        await db_session.execute(
+            select(Run.template_id, Template.warm_pool_size).join(Run.template).where(Run.id == run_id)
+        )
+    ).one()
 
-    run = (await db_session.execute(select(Run).where(Run.id == run_id))).scalar_one()
-    try:
-        run_instance = await InfrastructureController.build_infra(run, db_session)
-        db_session.add(run_instance)
-    except (ImageNotFound, RuntimeError, APIError, TypeError, Exception) as ex:
-        if settings.debug:
-            raise ex
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(ex))
-    finally:
-        await db_session.commit()
+    claimed: Sequence[Infrastructure] = []
+    if warm_pool_size > 0:
+        claimed = await pool_controller.claim_infrastructures(template_id, run_id, count, db_session)
+
+    # the claimed infrastructures are committed together with the Job
+    return await job_controller.create_job(run_id, db_session, count, len(claimed))
+
+
+async def build_run(run_id: int, count: int = 1, job_id: int | None = None) -> list[Instance | Exception]:
+    """
+    Build Run instances. The build takes minutes, so it opens short-lived DB sessions only for the database work
+    instead of holding a pooled connection the whole time.
+    :param run_id: ID of Run
+    :param count: number of instances
+    :param job_id: ID of the Job executing the build
+    :return: Instances of the Run, or exceptions of the instances that failed
+    :raises: sqlalchemy.exc.NoResultFound
+    """
+    async with sessionmanager.session() as db_session:
+        run = (await db_session.execute(select(Run).where(Run.id == run_id))).scalar_one()
+
+    with track_queries(f"build {count} infrastructures of Run {run.id}"), events.build_scope(run.id, job_id):
+        return await InfrastructureController.build_infras(run, count, job_id)
 
 
 async def stop_run(run_id: int, db_session: AsyncSession):
     """
-    Stop all instances of this Run
-    :param run_id:
+    Stop all instances of this Run, they are torn down in the background (see `teardown.schedule_teardown`).
+    :param run_id: ID of Run
     :param db_session: Async database session
     :return:
     :raises: sqlalchemy.exc.NoResultFound
     """
-
-    run = (
-        (
-            await db_session.execute(
-                select(Run)
-                .where(Run.id == run_id)
-                .options(
-                    joinedload(Run.instances)
-                    .joinedload(Instance.infrastructure)
-                    .options(
-                        joinedload(Infrastructure.routers),
-                        joinedload(Infrastructure.networks),
-                        joinedload(Infrastructure.nodes).options(
-                            joinedload(Node.service_containers).joinedload(ServiceContainer.volumes),
-                            joinedload(Node.volumes),
-                        ),
-                    )
-                )
-            )
+    (await db_session.execute(select(Run.id).where(Run.id == run_id))).scalar_one()
+    infrastructure_ids = list(
+        await db_session.scalars(
+            select(Infrastructure.id).join(Infrastructure.instance).where(Instance.run_id == run_id)
         )
-        .unique()
-        .scalar_one()
     )
 
-    async with asyncio.TaskGroup() as tg:
-        for instance in run.instances:
-            tg.create_task(InfrastructureController.stop_infra(instance.infrastructure))
-            await db_session.delete(instance)
-
-    await db_session.commit()
+    await teardown.schedule_teardown(infrastructure_ids, db_session)
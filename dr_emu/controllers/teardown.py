@@ -0,0 +1,292 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Sequence, Callable, Any
+
+from docker import DockerClient
+from docker.errors import NotFound, NullResource
+from sqlalchemy import select, delete, update, exists, or_, func, Select, CompoundSelect
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dr_emu.controllers import blob as blob_controller
+from dr_emu.lib import docker_hosts
+from dr_emu.lib.logger import logger
+from dr_emu.lib.rate_limit import RateLimiter
+from dr_emu.models import (
+    Appliance,
+    DependsOn,
+    DockerHost,
+    FirewallRule,
+    Infrastructure,
+    Instance,
+    Interface,
+    Network,
+    NodeFile,
+    ServiceContainer,
+    Volume,
+    appliances_volumes,
+    services_volumes,
+    utc_now,
+)
+from dr_emu.settings import settings
+
+
+@dataclass
+class DockerIds:
+    """
+    Docker objects of infrastructures in the order they have to be removed.
+    """
+
+    services: list[str] = field(default_factory=list)
+    appliances: list[str] = field(default_factory=list)
+    networks: list[str] = field(default_factory=list)
+    volumes: list[str] = field(default_factory=list)
+
+
+def _volume_ids(appliance_ids: Select, service_ids: Select) -> CompoundSelect:
+    return (
+        select(appliances_volumes.c.volume_id)
+        .where(appliances_volumes.c.appliance_id.in_(appliance_ids))
+        .union(select(services_volumes.c.volume_id).where(services_volumes.c.service_container_id.in_(service_ids)))
+    )
+
+
+async def get_docker_ids(infrastructure_ids: Sequence[int], db_session: AsyncSession) -> DockerIds:
+    """
+    Get IDs of docker objects belonging to the infrastructures.
+    Docker IDs are saved only when the build finishes, objects of an interrupted build are referenced by their
+    (infrastructure unique) names instead, the ones that were never created are then ignored by the removal.
+    :param infrastructure_ids: IDs of Infrastructures
+    :param db_session: Async database session
+    :return: docker IDs (or names) of services, appliances, networks and volumes
+    """
+    appliance_ids = select(Appliance.id).where(Appliance.infrastructure_id.in_(infrastructure_ids))
+    service_ids = select(ServiceContainer.id).where(ServiceContainer.parent_node_id.in_(appliance_ids))
+    queries = {
+        "services": select(func.coalesce(ServiceContainer.docker_id, ServiceContainer.name)).where(
+            ServiceContainer.id.in_(service_ids)
+        ),
+        "appliances": select(func.coalesce(Appliance.docker_id, Appliance.name)).where(Appliance.id.in_(appliance_ids)),
+        "networks": select(func.coalesce(Network.docker_id, Network.name)).where(
+            Network.infrastructure_id.in_(infrastructure_ids)
+        ),
+        "volumes": select(func.coalesce(Volume.docker_id, Volume.name)).where(
+            Volume.id.in_(_volume_ids(appliance_ids, service_ids))
+        ),
+    }
+
+    docker_ids = DockerIds()
+    for kind, query in queries.items():
+        getattr(docker_ids, kind).extend(docker_id for docker_id in await db_session.scalars(query) if docker_id)
+
+    return docker_ids
+
+
+async def _remove(remove: Callable[..., Any], docker_id: str, limiter: RateLimiter | None, **kwargs) -> None:
+    if limiter is not None:
+        await limiter.acquire()
+    try:
+        await asyncio.to_thread(remove, docker_id, **kwargs)
+    except (NotFound, NullResource):
+        pass
+
+
+async def remove_docker_objects(
+    docker_ids: DockerIds, limiter: RateLimiter | None = None, docker_client: DockerClient | None = None
+) -> None:
+    """
+    Remove docker objects by their IDs, objects that no longer exist are ignored.
+    :param docker_ids: IDs of docker objects
+    :param limiter: limits the rate of the removals, all objects of a kind are removed at once without it
+    :param docker_client: client of the docker host the objects are on, the local daemon by default
+    :return:
+    """
+    api = (docker_client or docker_hosts.get_client()).api
+
+    # services first, they share the network namespace of their parent node
+    for container_ids in (docker_ids.services, docker_ids.appliances):
+        await asyncio.gather(
+            *(
+                _remove(api.remove_container, container_id, limiter, v=True, force=True)
+                for container_id in container_ids
+            )
+        )
+    logger.debug("Containers removed", services=len(docker_ids.services), appliances=len(docker_ids.appliances))
+
+    await asyncio.gather(*(_remove(api.remove_network, docker_id, limiter) for docker_id in docker_ids.networks))
+    logger.debug("Networks removed", count=len(docker_ids.networks))
+
+    await asyncio.gather(
+        *(_remove(api.remove_volume, docker_id, limiter, force=True) for docker_id in docker_ids.volumes)
+    )
+    logger.debug("Volumes removed", count=len(docker_ids.volumes))
+
+
+async def delete_infrastructures(infrastructure_ids: Sequence[int], db_session: AsyncSession) -> None:
+    """
+    Delete infrastructures, their Instances and all models belonging to them from DB.
+    Every table is cleaned up by a single statement, so the number of queries doesn't depend on the infrastructure size.
+    :param infrastructure_ids: IDs of Infrastructures
+    :param db_session: Async database session
+    :return:
+    """
+    logger.debug("Deleting infrastructures", ids=infrastructure_ids)
+
+    appliance_ids = select(Appliance.id).where(Appliance.infrastructure_id.in_(infrastructure_ids))
+    network_ids = select(Network.id).where(Network.infrastructure_id.in_(infrastructure_ids))
+    service_ids = select(ServiceContainer.id).where(ServiceContainer.parent_node_id.in_(appliance_ids))
+    instance_ids = list(
+        await db_session.scalars(select(Infrastructure.instance_id).where(Infrastructure.id.in_(infrastructure_ids)))
+    )
+    volume_ids = list(await db_session.scalars(_volume_ids(appliance_ids, service_ids)))
+
+    # core table statements, ORM deletes would have to load the rows to cascade and synchronize the session
+    statements = [
+        delete(DependsOn.__table__).where(
+            or_(DependsOn.dependant_service_id.in_(service_ids), DependsOn.dependency_service_id.in_(service_ids))
+        ),
+        delete(services_volumes).where(services_volumes.c.service_container_id.in_(service_ids)),
+        delete(ServiceContainer.__table__).where(ServiceContainer.parent_node_id.in_(appliance_ids)),
+        delete(NodeFile.__table__).where(NodeFile.node_id.in_(appliance_ids)),
+        delete(appliances_volumes).where(appliances_volumes.c.appliance_id.in_(appliance_ids)),
+        delete(FirewallRule.__table__).where(
+            or_(
+                FirewallRule.router_id.in_(appliance_ids),
+                FirewallRule.src_net_id.in_(network_ids),
+                FirewallRule.dst_net_id.in_(network_ids),
+            )
+        ),
+        delete(Interface.__table__).where(
+            or_(Interface.appliance_id.in_(appliance_ids), Interface.network_id.in_(network_ids))
+        ),
+        delete(Appliance.__table__).where(Appliance.infrastructure_id.in_(infrastructure_ids)),
+        delete(Network.__table__).where(Network.infrastructure_id.in_(infrastructure_ids)),
+        # the docker volumes are removed with the infrastructure, unless another appliance or service uses them
+        delete(Volume.__table__).where(
+            Volume.id.in_(volume_ids),
+            ~exists().where(appliances_volumes.c.volume_id == Volume.id),
+            ~exists().where(services_volumes.c.volume_id == Volume.id),
+        ),
+        delete(Infrastructure.__table__).where(Infrastructure.id.in_(infrastructure_ids)),
+        delete(Instance.__table__).where(Instance.id.in_(instance_ids)),
+    ]
+    for statement in statements:
+        await db_session.execute(statement)
+
+    # files injected into the deleted nodes may leave unused blobs
+    await blob_controller.delete_unreferenced_blobs(db_session)
+    await db_session.commit()
+
+    logger.debug("Infrastructures deleted", ids=infrastructure_ids)
+
+
+async def teardown_infrastructures(
+    infrastructure_ids: Sequence[int], db_session: AsyncSession, limiter: RateLimiter | None = None
+) -> None:
+    """
+    Remove docker objects of the infrastructures and delete them from DB.
+    Only docker IDs are loaded, the models themselves are never fetched. The objects are removed from the docker host
+    of each infrastructure.
+    :param infrastructure_ids: IDs of Infrastructures
+    :param db_session: Async database session
+    :param limiter: limits the rate of the docker removals
+    :return:
+    """
+    logger.info("Tearing down infrastructures", ids=infrastructure_ids)
+
+    hosts: defaultdict[str | None, list[int]] = defaultdict(list)
+    for infrastructure_id, url in await db_session.execute(
+        select(Infrastructure.id, DockerHost.url)
+        .outerjoin(Infrastructure.docker_host)
+        .where(Infrastructure.id.in_(infrastructure_ids))
+    ):
+        hosts[url].append(infrastructure_id)
+    docker_ids = {url: await get_docker_ids(ids, db_session) for url, ids in hosts.items()}
+    # release the connection while the docker objects are being removed
+    await db_session.commit()
+    await asyncio.gather(
+        *(
+            remove_docker_objects(ids, limiter, docker_hosts.get_client(url) if url is not None else None)
+            for url, ids in docker_ids.items()
+        )
+    )
+
+    await delete_infrastructures(infrastructure_ids, db_session)
+    logger.info("Infrastructures torn down", ids=infrastructure_ids)
+
+
+async def schedule_teardown(infrastructure_ids: Sequence[int], db_session: AsyncSession) -> None:
+    """
+    Mark infrastructures as terminating, they are torn down in the background by the reapers of the workers
+    (see `reap`). Terminating infrastructures are not listed and can't be claimed, reset or changed anymore.
+    :param infrastructure_ids: IDs of Infrastructures
+    :param db_session: Async database session
+    :return:
+    """
+    await db_session.execute(
+        update(Infrastructure)
+        .where(Infrastructure.id.in_(infrastructure_ids), Infrastructure.teardown_at.is_(None))
+        .values(teardown_at=utc_now())
+    )
+    await db_session.commit()
+    logger.info("Infrastructures scheduled for teardown", ids=infrastructure_ids)
+
+
+async def claim_teardown(db_session: AsyncSession) -> int | None:
+    """
+    Take the infrastructure waiting for its teardown the longest, it is skipped by the other reapers for
+    `settings.reaper_lease` seconds, so a teardown interrupted by a dead worker is taken over afterwards.
+    :param db_session: Async database session
+    :return: ID of the claimed infrastructure or None if there is nothing to tear down
+    """
+    now = utc_now()
+    infrastructure = await db_session.scalar(
+        select(Infrastructure)
+        .where(Infrastructure.teardown_at <= now)
+        .order_by(Infrastructure.teardown_at, Infrastructure.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if infrastructure is None:
+        await db_session.commit()
+        return None
+
+    infrastructure.teardown_at = now + timedelta(seconds=settings.reaper_lease)
+    infrastructure.teardown_attempts += 1
+    infrastructure_id = infrastructure.id
+    await db_session.commit()
+
+    return infrastructure_id
+
+
+async def reap(db_session: AsyncSession, limiter: RateLimiter | None = None) -> bool:
+    """
+    Tear down one infrastructure marked by `schedule_teardown`. If the teardown fails, it is retried after
+    `settings.reaper_retry_delay` seconds multiplied by the number of attempts.
+    :param db_session: Async database session
+    :param limiter: limits the rate of the docker removals
+    :return: whether an infrastructure was claimed
+    """
+    if (infrastructure_id := await claim_teardown(db_session)) is None:
+        return False
+
+    try:
+        await teardown_infrastructures([infrastructure_id], db_session, limiter)
+    except Exception as error:
+        await db_session.rollback()
+        attempts = await db_session.scalar(
+            select(Infrastructure.teardown_attempts).where(Infrastructure.id == infrastructure_id)
+        )
+        await db_session.execute(
+            update(Infrastructure)
+            .where(Infrastructure.id == infrastructure_id)
+            .values(
+                teardown_at=utc_now() + timedelta(seconds=settings.reaper_retry_delay * (attempts or 1)),
+                teardown_error=f"{type(error).__name__}: {error}",
+            )
+        )
+        await db_session.commit()
+        logger.warning("Teardown failed", id=infrastructure_id, attempt=attempts, exception=str(error))
+
+    return True
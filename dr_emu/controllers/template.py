@@ -1,6 +1,7 @@
 from typing import Sequence
 
 from sqlalchemy import select
+from sqlalchemy.orm import undefer
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from dr_emu.lib.logger import logger
@@ -24,15 +25,25 @@ async def create_template(name: str, infra_description: str, db_session: AsyncSe
     return template
 
 
-async def list_templates(db_session: AsyncSession) -> Sequence[Template]:
+async def list_templates(
+    db_session: AsyncSession, limit: int | None = None, after: int | None = None, name: str | None = None
+) -> Sequence[Template]:
     """
-    List all Templates saved in DB.
+    List Templates saved in DB ordered by ID, their descriptions are not loaded.
     :param db_session: Async database session
+    :param limit: maximum number of Templates
+    :param after: list only Templates with greater ID
+    :param name: list only Templates with this name
     :return: list of Templates
     """
-    logger.debug("Listing templates")
+    logger.debug("Listing templates", limit=limit, after=after)
 
-    templates = (await db_session.scalars(select(Template))).all()
+    query = select(Template).order_by(Template.id).limit(limit)
+    if after is not None:
+        query = query.where(Template.id > after)
+    if name is not None:
+        query = query.where(Template.name == name)
+    templates = (await db_session.scalars(query)).all()
 
     return templates
 
@@ -57,14 +68,19 @@ async def delete_template(template_id: int, db_session: AsyncSession) -> Templat
 
 async def get_template(template_id: int, db_session: AsyncSession) -> Template:
     """
-    List all Templates saved in DB.
+    Get Template specified by ID including its description.
     :param db_session: Async database session
     :param template_id: Template ID
-    :return: list of Templates
+    :return: Template
+    :raises: sqlalchemy.exc.NoResultFound
     """
-    logger.debug("Listing templates")
+    logger.debug("Getting template", id=template_id)
 
-    template = (await db_session.execute(select(Template).where(Template.id == template_id))).scalar_one()
+    template = (
+        await db_session.execute(
+            select(Template).where(Template.id == template_id).options(undefer(Template._description))
+        )
+    ).scalar_one()
 
     return template
 
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import contextlib
+import time
 from pathlib import Path
-from typing import AsyncIterator
+from typing import AsyncIterator, Callable
 
-from sqlalchemy import AsyncAdaptedQueuePool
+from sqlalchemy import AsyncAdaptedQueuePool, QueuePool, NullPool
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
@@ -13,6 +15,7 @@ from sqlalchemy.ext.asyncio import (
     AsyncEngine,
 )
 
+from dr_emu.lib import metrics, query_stats
 from dr_emu.settings import settings
 
 BASE_DIR = Path(__file__).parent.parent.parent
@@ -20,6 +23,19 @@ BASE_DIR = Path(__file__).parent.parent.parent
 # Source: https://praciano.com.br/fastapi-and-async-sqlalchemy-20-with-pytest-done-right.html
 
 
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Connection pool measuring how long the checkouts wait for a free connection.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait_seconds.observe(time.perf_counter() - start)
+
+
 class DatabaseSessionManager:
     def __init__(self, engine=None):
         self._engine: AsyncEngine | None = engine
@@ -30,6 +46,7 @@ class DatabaseSessionManager:
     # For testing
     def init(self, config: dict):
         self._engine = create_async_engine(**config)
+        query_stats.instrument(self._engine.sync_engine)
         self._sessionmaker = async_sessionmaker(autocommit=False, bind=self._engine, expire_on_commit=False)
 
     async def close(self):
@@ -39,6 +56,19 @@ class DatabaseSessionManager:
         self._engine = None
         self._sessionmaker = None
 
+    def pool_status(self) -> dict[str, int]:
+        """
+        Get usage of the connection pool.
+        :return: pool size, number of checked out connections and current overflow
+        """
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+
+        pool = self._engine.pool
+        if not isinstance(pool, QueuePool):
+            return {}
+        return {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": max(pool.overflow(), 0)}
+
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
         if self._engine is None:
@@ -51,6 +81,43 @@ class DatabaseSessionManager:
                 await connection.rollback()
                 raise
 
+    async def listen(self, channel: str, callback: Callable[[str], None]) -> None:
+        """
+        Receive PostgreSQL notifications of the channel until cancelled. The connection is opened outside the pool and
+        held meanwhile, so the pool sized for the requests (`settings.db_pool_size`) isn't reduced.
+        :param channel: name of the channel
+        :param callback: called with the payload of every notification
+        :return:
+        :raises: ConnectionError if the connection is lost
+        """
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+
+        listen_engine = create_async_engine(self._engine.url, poolclass=NullPool)
+        try:
+            async with listen_engine.connect() as connection:
+                driver_connection = (await connection.get_raw_connection()).driver_connection
+                lost: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+                def notify(_connection, _pid, _channel, payload: str) -> None:
+                    callback(payload)
+
+                def terminate(_connection) -> None:
+                    if not lost.done():
+                        lost.set_result(None)
+
+                await driver_connection.add_listener(channel, notify)
+                driver_connection.add_termination_listener(terminate)
+                try:
+                    await lost
+                finally:
+                    driver_connection.remove_termination_listener(terminate)
+                    if not driver_connection.is_closed():
+                        await driver_connection.remove_listener(channel, notify)
+                raise ConnectionError(f"Connection listening on {channel} was lost")
+        finally:
+            await listen_engine.dispose()
+
     @contextlib.asynccontextmanager
     async def session(self) -> AsyncIterator[AsyncSession]:
         if self._sessionmaker is None:
@@ -70,11 +137,13 @@ async_engine = create_async_engine(
     url=f"postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@{settings.db_host}/"
     f"{settings.postgres_db}",
     future=True,
-    poolclass=AsyncAdaptedQueuePool,
-    pool_size=5,
-    max_overflow=2,
+    poolclass=TimedQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
     echo=False,
 )
+query_stats.instrument(async_engine.sync_engine)
 
 sessionmanager = DatabaseSessionManager(async_engine)
 
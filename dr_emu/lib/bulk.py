@@ -0,0 +1,217 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import cache
+from typing import Any
+
+from sqlalchemy import insert, Table, Column
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapper, object_mapper, make_transient_to_detached, RelationshipDirection
+from sqlalchemy.orm.attributes import set_committed_value, get_history
+
+from dr_emu.lib.logger import logger
+from dr_emu.models import Base
+
+
+@dataclass(frozen=True)
+class ColumnSource:
+    """
+    Where to take the value of a column from.
+    """
+
+    column: str
+    attribute: str | None  # None for columns not mapped by the class
+    relationship: str | None = None  # many-to-one relationship to the object holding the (foreign key) value
+    remote_attribute: str | None = None
+    default: Any = None
+
+    def value(self, instance: Base) -> Any:
+        value = instance.__dict__.get(self.attribute)
+        if self.relationship is not None and (related := instance.__dict__.get(self.relationship)) is not None:
+            value = getattr(related, self.remote_attribute)
+        return self.default if value is None else value
+
+
+@cache
+def get_table_sources(mapper: Mapper, table: Table) -> tuple[Column | None, tuple[ColumnSource, ...]]:
+    """
+    Get sources of the table columns for objects of the mapper.
+    :param mapper: mapper of the inserted objects
+    :param table: one of the tables the mapper is mapped to
+    :return: generated primary key column (if any) and sources of the remaining columns
+    """
+    foreign_keys: dict[Column, tuple[str, str]] = {}
+    for relationship in mapper.relationships:
+        if relationship.direction is RelationshipDirection.MANYTOONE:
+            for local_column, remote_column in relationship.local_remote_pairs:
+                remote_attribute = relationship.mapper.get_property_by_column(remote_column).key
+                foreign_keys[local_column] = (relationship.key, remote_attribute)
+
+    generated_key = None
+    sources = []
+    for column in table.columns:
+        # primary key of a joined-table subclass references the parent row, so it is not generated
+        if column.primary_key and column.autoincrement is not False and not column.foreign_keys:
+            generated_key = column
+            continue
+        # columns of sibling classes sharing a single table stay empty, all rows of a statement need the same keys
+        if not mapper.c.contains_column(column):
+            sources.append(ColumnSource(column=column.key, attribute=None))
+            continue
+        relationship, remote_attribute = foreign_keys.get(column, (None, None))
+        default = column.default.arg if column.default is not None and column.default.is_scalar else None
+        sources.append(
+            ColumnSource(
+                column=column.key,
+                attribute=mapper.get_property_by_column(column).key,
+                relationship=relationship,
+                remote_attribute=remote_attribute,
+                default=default,
+            )
+        )
+
+    return generated_key, tuple(sources)
+
+
+async def insert_table(table: Table, instances: list[Base], db_session: AsyncSession) -> None:
+    """
+    Insert rows of all objects mapped (also through inheritance) to the table in a single statement.
+    Generated primary keys and resolved foreign keys are set on the objects.
+    :param table: table to insert into
+    :param instances: new ORM objects
+    :param db_session: Async database session
+    :return:
+    """
+    rows: list[dict[str, Any]] = []
+    generated_key: Column | None = None
+    for instance in instances:
+        generated_key, sources = get_table_sources(object_mapper(instance), table)
+        row = {source.column: source.value(instance) for source in sources}
+        for source in sources:
+            if instance.__dict__.get(source.attribute) is not row[source.column]:
+                set_committed_value(instance, source.attribute, row[source.column])
+        rows.append(row)
+
+    if generated_key is None:
+        await db_session.execute(insert(table), rows)
+        return
+
+    result = await db_session.execute(insert(table).returning(generated_key, sort_by_parameter_order=True), rows)
+    for instance, primary_key in zip(instances, result.scalars()):
+        set_committed_value(instance, object_mapper(instance).get_property_by_column(generated_key).key, primary_key)
+
+
+async def insert_associations(instances: list[Base], db_session: AsyncSession) -> None:
+    """
+    Insert rows of many-to-many association tables between the new objects.
+    :param instances: new ORM objects (already inserted)
+    :param db_session: Async database session
+    :return:
+    """
+    associations: dict[Table, set[tuple[tuple[str, Any], ...]]] = defaultdict(set)
+    for instance in instances:
+        mapper = object_mapper(instance)
+        for relationship in mapper.relationships:
+            if relationship.secondary is None or relationship.key not in instance.__dict__:
+                continue
+            for related in instance.__dict__[relationship.key]:
+                row = {
+                    secondary_column.key: getattr(instance, mapper.get_property_by_column(local_column).key)
+                    for local_column, secondary_column in relationship.synchronize_pairs
+                }
+                row.update(
+                    {
+                        secondary_column.key: getattr(
+                            related, relationship.mapper.get_property_by_column(related_column).key
+                        )
+                        for related_column, secondary_column in relationship.secondary_synchronize_pairs
+                    }
+                )
+                # both sides of the relationship hold the same row
+                associations[relationship.secondary].add(tuple(sorted(row.items())))
+
+    for table, rows in associations.items():
+        await db_session.execute(insert(table), [dict(row) for row in rows])
+
+
+def detach(instance: Base) -> None:
+    """
+    Turn an already inserted object into a detached one, so the unit of work doesn't insert it again.
+    :param instance: inserted ORM object
+    :return:
+    """
+    make_transient_to_detached(instance)
+    mapper = object_mapper(instance)
+    # the objects are new, so unloaded relationships are empty, not expired (no lazy loads in async context)
+    for relationship in mapper.relationships:
+        if relationship.key in instance.__dict__:
+            continue
+        if relationship.uselist:
+            set_committed_value(instance, relationship.key, [])
+        elif all(
+            instance.__dict__.get(mapper.get_property_by_column(column).key) is None
+            for column in relationship.local_columns
+        ):
+            set_committed_value(instance, relationship.key, None)
+
+
+def commit_parent_collections(instances: list[Base]) -> None:
+    """
+    Mark collections of already persistent parents (e.g. Infrastructure.networks) as committed, otherwise the next
+    flush would process the whole inserted graph again.
+    :param instances: inserted ORM objects
+    :return:
+    """
+    inserted = {id(instance) for instance in instances}
+    committed: set[tuple[int, str]] = set()
+    for instance in instances:
+        for relationship in object_mapper(instance).relationships:
+            if relationship.direction is not RelationshipDirection.MANYTOONE or not relationship.back_populates:
+                continue
+            parent = instance.__dict__.get(relationship.key)
+            collection = relationship.back_populates
+            if parent is None or id(parent) in inserted or (id(parent), collection) in committed:
+                continue
+            committed.add((id(parent), collection))
+            if collection in parent.__dict__ and not get_history(parent, collection).deleted:
+                set_committed_value(parent, collection, list(parent.__dict__[collection]))
+
+
+async def insert_new(db_session: AsyncSession) -> int:
+    """
+    Insert all new (pending) objects of the session using a single INSERT ... RETURNING statement per table.
+    Tables are processed in the dependency order, so IDs of the inserted rows are available for foreign keys of the
+    following ones. The objects stay in the session as persistent, later changes are flushed as UPDATEs.
+    :param db_session: Async database session
+    :return: number of inserted objects
+    """
+    instances = list(db_session.new)
+    if not instances:
+        return 0
+
+    instances_by_table: dict[Table, list[Base]] = defaultdict(list)
+    for instance in instances:
+        for table in object_mapper(instance).tables:
+            instances_by_table[table].append(instance)
+
+    for instance in instances:
+        # expunge cascades to the related new objects
+        if instance in db_session:
+            db_session.expunge(instance)
+
+    logger.debug("Bulk inserting objects", count=len(instances), tables=len(instances_by_table))
+    with db_session.no_autoflush:
+        for table in Base.metadata.sorted_tables:
+            if table_instances := instances_by_table.get(table):
+                await insert_table(table, table_instances, db_session)
+
+        await insert_associations(instances, db_session)
+
+    # all objects must be detached before adding them, adding cascades to the related objects
+    for instance in instances:
+        detach(instance)
+    commit_parent_collections(instances)
+    for instance in instances:
+        if instance not in db_session:
+            db_session.add(instance)
+
+    return len(instances)
@@ -0,0 +1,65 @@
+"""
+Clients of the docker daemons infrastructures are placed on.
+"""
+import contextlib
+from contextvars import ContextVar
+from typing import Iterator
+
+import docker
+from docker import DockerClient
+
+# URL of the docker host of the infrastructure being built or changed, models use its client (see DockerMixin.client),
+# None is the local daemon configured by the DOCKER_* environment variables
+_current_host: ContextVar[str | None] = ContextVar("docker_host", default=None)
+_clients: dict[str, DockerClient] = {}
+
+
+def get_client(url: str | None = None) -> DockerClient:
+    """
+    Get client of a docker daemon, clients of registered hosts are created once and shared.
+    :param url: URL of the docker host (unix:// socket, tcp:// or ssh:// address), None for the local daemon
+    :return: docker client
+    """
+    if url is None:
+        return docker.from_env()
+    if (client := _clients.get(url)) is None:
+        client = _clients[url] = DockerClient(base_url=url)
+    return client
+
+
+def close_client(url: str) -> None:
+    """
+    Close the shared client of a docker host, e.g. once the host is removed.
+    :param url: URL of the docker host
+    :return:
+    """
+    if (client := _clients.pop(url, None)) is not None:
+        client.close()
+
+
+@contextlib.contextmanager
+def use_host(url: str | None) -> Iterator[None]:
+    """
+    Route docker calls of the models created or loaded in the block (and in the tasks it starts) to the docker host.
+    :param url: URL of the docker host, None for the local daemon
+    :return:
+    """
+    token = _current_host.set(url)
+    try:
+        yield
+    finally:
+        _current_host.reset(token)
+
+
+def current_host() -> str | None:
+    """
+    :return: URL of the docker host set by `use_host`, None for the local daemon
+    """
+    return _current_host.get()
+
+
+def current_client() -> DockerClient:
+    """
+    :return: client of the docker host set by `use_host`
+    """
+    return get_client(_current_host.get())
@@ -0,0 +1,298 @@
+"""
+Progress events of infrastructure builds.
+
+Events are published to the in-process `bus` by InfrastructureController. Builds run in worker processes, so the
+workers forward the events to the API processes through PostgreSQL notifications, where they are streamed to the
+clients (Server-Sent Events).
+"""
+import asyncio
+import contextlib
+import contextvars
+import dataclasses
+import json
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, AsyncIterator, Any
+
+from sqlalchemy import select, func
+
+from dr_emu.lib.logger import logger
+from dr_emu.settings import settings
+
+CHANNEL = "build_events"
+# PostgreSQL limits the payload of a notification to 8000 bytes
+MAX_PAYLOAD_SIZE = 7900
+MAX_DETAIL_LENGTH = 1000
+RECONNECT_INTERVAL = 5
+PROGRESS_INTERVAL = 1  # seconds between progress events of one object
+
+# phases of a build
+BUILD = "build"
+IMAGE = "image"
+VOLUME = "volume"
+NETWORK = "network"
+CREATE = "create"
+START = "start"
+CONFIGURE = "configure"
+JOB = "job"
+RESET = "reset"
+APPLY = "apply"
+
+# states of a phase or of a single object (name of the event)
+STARTED = "started"
+PROGRESS = "progress"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+@dataclasses.dataclass
+class BuildEvent:
+    """
+    Progress of a build phase (no object name) or of a single object (image, network, appliance) in it.
+    """
+
+    run_id: int
+    job_id: int | None
+    phase: str
+    status: str
+    name: str | None = None
+    infrastructure: str | None = None
+    detail: str | None = None
+    time: float = dataclasses.field(default_factory=time.time)
+
+
+class EventBus:
+    """
+    Delivers events of a Run to its subscribers and to sinks receiving all events.
+    Publishing never blocks, events for subscribers that don't keep up are dropped.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue[BuildEvent]]] = defaultdict(set)
+        self._sinks: list[Callable[[BuildEvent], None]] = []
+
+    def publish(self, event: BuildEvent) -> None:
+        for queue in self._subscribers.get(event.run_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.debug("Build event dropped, subscriber is too slow", run_id=event.run_id)
+        for sink in self._sinks:
+            sink(event)
+
+    @contextlib.contextmanager
+    def subscribe(self, run_id: int) -> Iterator[asyncio.Queue[BuildEvent]]:
+        """
+        Receive events of the Run while in the context.
+        :param run_id: ID of Run
+        :return: queue of the events
+        """
+        queue: asyncio.Queue[BuildEvent] = asyncio.Queue(settings.build_events_queue_size)
+        self._subscribers[run_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[run_id].discard(queue)
+            if not self._subscribers[run_id]:
+                del self._subscribers[run_id]
+
+    def add_sink(self, sink: Callable[[BuildEvent], None]) -> None:
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink: Callable[[BuildEvent], None]) -> None:
+        self._sinks.remove(sink)
+
+
+bus = EventBus()
+
+_current_build: ContextVar[tuple[int, int | None] | None] = ContextVar("current_build", default=None)
+
+
+@contextlib.contextmanager
+def build_scope(run_id: int, job_id: int | None = None) -> Iterator[None]:
+    """
+    Attribute events emitted within the block (including tasks created in it) to the build of the Run.
+    :param run_id: ID of the built Run
+    :param job_id: ID of the Job executing the build
+    :return:
+    """
+    token = _current_build.set((run_id, job_id))
+    try:
+        yield
+    finally:
+        _current_build.reset(token)
+
+
+def emit(
+    phase: str, status: str, name: str | None = None, infrastructure: str | None = None, detail: str | None = None
+) -> None:
+    """
+    Publish an event of the current build, nothing is published outside a build scope.
+    :param phase: build phase
+    :param status: STARTED, PROGRESS, FINISHED or FAILED
+    :param name: name of the object the event is about, None for the whole phase
+    :param infrastructure: name of the infrastructure
+    :param detail: error message or other details
+    :return:
+    """
+    if (build := _current_build.get()) is None:
+        return
+    if detail is not None:
+        detail = detail[:MAX_DETAIL_LENGTH]
+    bus.publish(BuildEvent(*build, phase=phase, status=status, name=name, infrastructure=infrastructure, detail=detail))
+
+
+def progress(phase: str, name: str) -> Callable[[str], None]:
+    """
+    Get a function reporting progress of an object from a thread (e.g. reading the output of docker), the PROGRESS
+    events are emitted on the event loop of the caller within its build scope, at most one per `PROGRESS_INTERVAL`.
+    :param phase: build phase
+    :param name: name of the object
+    :return: function called with the details of the progress
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    reported_at = 0.0
+
+    def report(detail: str) -> None:
+        nonlocal reported_at
+        if (now := time.monotonic()) - reported_at < PROGRESS_INTERVAL:
+            return
+        reported_at = now
+        loop.call_soon_threadsafe(emit, phase, PROGRESS, name, None, detail, context=context)
+
+    return report
+
+
+async def track(phase: str, name: str, awaitable: Awaitable[Any], infrastructure: str | None = None) -> Any:
+    """
+    Await creation of an object and emit whether it finished or failed.
+    :param phase: build phase
+    :param name: name of the object
+    :param awaitable: creation of the object
+    :param infrastructure: name of the infrastructure
+    :return: result of the awaitable
+    """
+    try:
+        result = await awaitable
+    except Exception as error:
+        emit(phase, FAILED, name, infrastructure, f"{type(error).__name__}: {error}")
+        raise
+    emit(phase, FINISHED, name, infrastructure)
+    return result
+
+
+def encode(event: BuildEvent) -> str:
+    return json.dumps(dataclasses.asdict(event), separators=(",", ":"))
+
+
+def decode(payload: str) -> list[BuildEvent]:
+    return [BuildEvent(**event) for event in json.loads(payload)]
+
+
+def to_sse(event: BuildEvent) -> str:
+    """
+    Format event as a Server-Sent Event, its name is the status and the data is the whole event in JSON.
+    :param event: build event
+    :return: text of the event
+    """
+    return f"event: {event.status}\ndata: {encode(event)}\n\n"
+
+
+async def stream(run_id: int) -> AsyncIterator[str]:
+    """
+    Stream events of the Run as Server-Sent Events, comments are sent when idle, so proxies keep the connection open.
+    :param run_id: ID of Run
+    :return: texts of the events
+    """
+    with bus.subscribe(run_id) as queue:
+        yield ": connected\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), settings.build_events_keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield to_sse(event)
+
+
+def batch_payloads(events: list[BuildEvent]) -> list[str]:
+    """
+    Pack events into JSON arrays fitting into a notification payload.
+    :param events: events to send
+    :return: payloads
+    """
+    payloads: list[str] = []
+    batch: list[str] = []
+    size = 2
+    for encoded in map(encode, events):
+        if batch and size + len(encoded) + 1 > MAX_PAYLOAD_SIZE:
+            payloads.append(f"[{','.join(batch)}]")
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        payloads.append(f"[{','.join(batch)}]")
+    return payloads
+
+
+class NotificationRelay:
+    """
+    Sink forwarding the events of a worker process to the API processes. Events are sent in batches every
+    `settings.build_events_flush_interval` seconds, so a build with thousands of appliances doesn't send thousands of
+    notifications.
+    """
+
+    def __init__(self, connect: Callable[[], contextlib.AbstractAsyncContextManager]):
+        """
+        :param connect: factory of transactional DB connections (`sessionmanager.connect`)
+        """
+        self.connect = connect
+        self.pending: list[BuildEvent] = []
+
+    def push(self, event: BuildEvent) -> None:
+        self.pending.append(event)
+
+    async def flush(self) -> None:
+        events, self.pending = self.pending, []
+        if not events:
+            return
+        try:
+            # notifications are delivered when the transaction commits
+            async with self.connect() as connection:
+                for payload in batch_payloads(events):
+                    await connection.execute(select(func.pg_notify(CHANNEL, payload)))
+        except Exception as error:
+            logger.warning("Failed to forward build events", count=len(events), exception=str(error))
+
+    async def serve(self) -> None:
+        """
+        Forward the events until cancelled, the remaining events are sent before exiting.
+        :return:
+        """
+        try:
+            while True:
+                await asyncio.sleep(settings.build_events_flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+
+def receive(payload: str) -> None:
+    for event in decode(payload):
+        bus.publish(event)
+
+
+async def forward_notifications(listen: Callable[[str, Callable[[str], None]], Awaitable[None]]) -> None:
+    """
+    Publish events received from the workers to the bus of this process until cancelled, reconnects on failures.
+    :param listen: coroutine function receiving notifications of a channel (`sessionmanager.listen`)
+    :return:
+    """
+    while True:
+        try:
+            await listen(CHANNEL, receive)
+        except Exception as error:
+            logger.warning("Listening for build events failed", exception=str(error))
+        await asyncio.sleep(RECONNECT_INTERVAL)
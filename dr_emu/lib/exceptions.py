@@ -21,3 +21,39 @@ class PackageNotAccessible(Error):
     """
     Cannot find or access python package
     """
+
+
+class UnsupportedConfiguration(Error):
+    """
+    Serialized CYST configuration contains constructs that cannot be decoded without CYST Environment.
+    """
+
+
+class JobStateError(Error):
+    """
+    Requested action is not possible in the current state of the Job.
+    """
+
+
+class InfrastructureStateError(Error):
+    """
+    Requested action is not possible in the current state of the infrastructure.
+    """
+
+
+class TemplateChangeError(Error):
+    """
+    Template change cannot be applied to a running infrastructure, it has to be built again.
+    """
+
+
+class DockerHostStateError(Error):
+    """
+    Requested action is not possible in the current state of the docker host.
+    """
+
+
+class DockerHostUnreachable(Error):
+    """
+    Docker daemon of the host cannot be reached.
+    """
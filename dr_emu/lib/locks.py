@@ -0,0 +1,46 @@
+"""
+Locks shared by all API and worker processes (on any host) using the same database.
+"""
+import asyncio
+import contextlib
+import hashlib
+from collections import defaultdict
+from typing import AsyncIterator
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# names of the locks
+ALLOCATION = "dr-emu.allocation"  # supernets and names of new infrastructures
+IMAGES = "dr-emu.images"  # image and service models created by baking a template
+MIGRATION = "dr-emu.migration"  # alembic upgrade run by every API replica
+
+# databases without advisory locks (SQLite of the tests) are used by a single process
+_local_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def lock_key(name: str) -> int:
+    """
+    Get the 64-bit key of an advisory lock.
+    :param name: name of the lock
+    :return: signed key
+    """
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big", signed=True)
+
+
+@contextlib.asynccontextmanager
+async def advisory_lock(db_session: AsyncSession, name: str) -> AsyncIterator[None]:
+    """
+    Take a transaction level PostgreSQL advisory lock, concurrent holders wait for each other.
+    The lock is released when the transaction of the session ends, so the guarded changes have to be committed (or
+    rolled back) inside the block.
+    :param db_session: Async database session
+    :param name: name of the lock
+    :return:
+    """
+    if db_session.bind.dialect.name == "postgresql":
+        await db_session.execute(select(func.pg_advisory_xact_lock(lock_key(name))))
+        yield
+    else:
+        async with _local_locks[name]:
+            yield
@@ -0,0 +1,76 @@
+import threading
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Summary:
+    """
+    Count, sum and maximum of observed values (e.g. durations in seconds).
+    """
+
+    description: str
+    count: int = 0
+    total: float = 0.0
+    maximum: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def observe(self, value: float) -> None:
+        # observed from the event loop as well as from threads (sync DB pool)
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.maximum = max(self.maximum, value)
+
+    def snapshot(self) -> dict[str, float | int | str]:
+        with self._lock:
+            return {
+                "description": self.description,
+                "count": self.count,
+                "sum": self.total,
+                "max": self.maximum,
+                "mean": self.total / self.count if self.count else 0.0,
+            }
+
+
+@dataclass
+class HitRate:
+    """
+    Hits and misses of a cache (e.g. a pool of prebuilt objects).
+    """
+
+    description: str
+    hits: int = 0
+    misses: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def snapshot(self) -> dict[str, float | int | str]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "description": self.description,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+db_pool_wait_seconds = Summary("Time spent waiting for a database connection from the pool")
+db_queries = Summary("Database queries per HTTP request or infrastructure build")
+warm_pool_claims = HitRate("Run instances taken from warm pools (hits) and queued for a build (misses)")
+
+
+def collect() -> dict[str, dict[str, float | int | str]]:
+    """
+    Get current values of all metrics.
+    :return: metrics indexed by their name
+    """
+    return {
+        "db_pool_wait_seconds": db_pool_wait_seconds.snapshot(),
+        "db_queries": db_queries.snapshot(),
+        "warm_pool_claims": warm_pool_claims.snapshot(),
+    }
@@ -0,0 +1,57 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+
+from dr_emu.lib.logger import logger
+from dr_emu.settings import settings
+
+T = TypeVar("T")
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor() -> ProcessPoolExecutor | None:
+    """
+    Get process pool for CPU-bound work, the pool is created on first use.
+    :return: process pool or None if it is disabled in settings
+    """
+    global _executor
+    if settings.parser_workers < 1:
+        return None
+
+    if _executor is None:
+        logger.debug("Starting process pool", workers=settings.parser_workers)
+        # spawn, so workers do not inherit the event loop, DB connections, and docker clients of the API process
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.parser_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    return _executor
+
+
+async def run(function: Callable[..., T], *args) -> T:
+    """
+    Run CPU-bound function outside the event loop.
+    Function and its arguments and result must be picklable, if the process pool is disabled, thread is used instead.
+    :param function: module level function
+    :param args: function arguments
+    :return: function result
+    """
+    if (executor := get_executor()) is None:
+        return await asyncio.to_thread(function, *args)
+
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args))
+
+
+def shutdown() -> None:
+    """
+    Stop the process pool, running tasks are cancelled.
+    :return:
+    """
+    global _executor
+    if _executor is not None:
+        logger.debug("Stopping process pool")
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
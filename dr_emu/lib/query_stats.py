@@ -0,0 +1,102 @@
+import contextlib
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from dr_emu.lib import metrics
+from dr_emu.lib.logger import logger
+from dr_emu.settings import settings
+
+# lists of bound parameters, their length differs for the same statement shape (e.g. IN (...), VALUES (...))
+PARAMETER_LIST = re.compile(r"\((?:\s*(?:\$\d+|\?|%\(\w+\)s|%s)\s*,)*\s*(?:\$\d+|\?|%\(\w+\)s|%s)\s*\)")
+PARAMETER_LISTS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalize statement, so executions of the same query with different number of parameters match.
+    :param statement: executed SQL statement
+    :return: statement with parameter lists replaced by (...)
+    """
+    return PARAMETER_LISTS.sub("(...)", PARAMETER_LIST.sub("(...)", " ".join(statement.split())))
+
+
+@dataclass
+class QueryStats:
+    """
+    Database queries issued within a tracked block (HTTP request, infrastructure build).
+    """
+
+    name: str
+    count: int = 0
+    duration: float = 0.0
+    statements: Counter[str] = field(default_factory=Counter)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = 2) -> dict[str, int]:
+        """
+        Get statements executed at least `threshold` times, typically lazy loads in a loop (N+1 queries).
+        :param threshold: minimal number of executions
+        :return: number of executions indexed by statement shape
+        """
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+
+_active_stats: ContextVar[tuple[QueryStats, ...]] = ContextVar("active_query_stats", default=())
+
+
+@contextlib.contextmanager
+def track_queries(name: str) -> Iterator[QueryStats]:
+    """
+    Count queries executed in the current context (including tasks started from it) until the block exits.
+    Blocks can be nested, queries are counted in all of them. The totals are logged at the end.
+    :param name: name of the tracked block used in logs
+    :return: statistics filled while the block runs
+    """
+    stats = QueryStats(name)
+    token = _active_stats.set((*_active_stats.get(), stats))
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+        metrics.db_queries.observe(stats.count)
+        repeated = stats.repeated(settings.query_repeat_warning)
+        if repeated:
+            logger.warning(
+                "Repeated database queries", name=name, count=stats.count, duration=stats.duration, repeated=repeated
+            )
+        else:
+            logger.debug("Database queries", name=name, count=stats.count, duration=stats.duration)
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if not (active_stats := _active_stats.get()):
+        return
+
+    duration = time.perf_counter() - context._query_start
+    for stats in active_stats:
+        stats.record(statement, duration)
+
+
+def instrument(engine: Engine) -> None:
+    """
+    Record queries executed by the engine into the tracked blocks.
+    :param engine: engine to instrument (`AsyncEngine.sync_engine` for async engines)
+    """
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket spacing out operations of coroutines to `rate` per second, with bursts of at most `burst` operations.
+    The rate can be changed at any time, zero or less disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Wait until the next operation is allowed.
+        :return:
+        """
+        # waiting coroutines are served in order, the one holding the lock sleeps until its token is available
+        async with self._lock:
+            while self.rate > 0:
+                now = time.monotonic()
+                self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
@@ -0,0 +1,115 @@
+from typing import Any
+
+from netaddr import IPAddress, IPNetwork
+from sqlalchemy import String, Boolean, event, literal
+from sqlalchemy.dialects.postgresql import INET, CIDR
+from sqlalchemy.engine import Engine, Dialect
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+
+class ip_overlaps(FunctionElement):
+    """
+    True if the networks overlap (one of them contains the other).
+    """
+
+    type = Boolean()
+    inherit_cache = True
+
+
+class ip_contained_by(FunctionElement):
+    """
+    True if the address or network is contained in (or equal to) the network.
+    """
+
+    type = Boolean()
+    inherit_cache = True
+
+
+@compiles(ip_overlaps, "postgresql")
+def _compile_ip_overlaps_postgresql(element: ip_overlaps, compiler, **kw) -> str:
+    left, right = element.clauses
+    return f"{compiler.process(left, **kw)} && {compiler.process(right, **kw)}"
+
+
+@compiles(ip_contained_by, "postgresql")
+def _compile_ip_contained_by_postgresql(element: ip_contained_by, compiler, **kw) -> str:
+    left, right = element.clauses
+    return f"{compiler.process(left, **kw)} <<= {compiler.process(right, **kw)}"
+
+
+@compiles(ip_overlaps)
+@compiles(ip_contained_by)
+def _compile_ip_function(element: FunctionElement, compiler, **kw) -> str:
+    # other dialects (SQLite used in tests) call the python functions registered below
+    return f"{type(element).__name__}({compiler.process(element.clauses, **kw)})"
+
+
+def _sqlite_ip_overlaps(left: str | None, right: str | None) -> bool | None:
+    if left is None or right is None:
+        return None
+    left_network, right_network = IPNetwork(left), IPNetwork(right)
+    return left_network in right_network or right_network in left_network
+
+
+def _sqlite_ip_contained_by(left: str | None, right: str | None) -> bool | None:
+    if left is None or right is None:
+        return None
+    return IPNetwork(left) in IPNetwork(right)
+
+
+@event.listens_for(Engine, "connect")
+def _register_ip_functions(dbapi_connection, _):
+    # only sqlite connections can define functions
+    if create_function := getattr(dbapi_connection, "create_function", None):
+        create_function("ip_overlaps", 2, _sqlite_ip_overlaps, deterministic=True)
+        create_function("ip_contained_by", 2, _sqlite_ip_contained_by, deterministic=True)
+
+
+class IPAddressType(TypeDecorator):
+    """
+    IP address stored as native `inet` on PostgreSQL and as string elsewhere, loaded as `netaddr.IPAddress`.
+    """
+
+    impl = String
+    cache_ok = True
+
+    class comparator_factory(TypeDecorator.Comparator):
+        def contained_by(self, network: IPNetwork):
+            return ip_contained_by(self.expr, literal(network, IPNetworkType()))
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine[Any]:
+        return dialect.type_descriptor(INET() if dialect.name == "postgresql" else String())
+
+    def process_bind_param(self, value: IPAddress | str | None, dialect: Dialect) -> str | None:
+        return None if value is None else str(value)
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> IPAddress | None:
+        # inet values may be returned with a prefix (e.g. 10.0.0.1/32)
+        return None if value is None else IPAddress(str(value).partition("/")[0])
+
+
+class IPNetworkType(TypeDecorator):
+    """
+    IP network stored as native `cidr` on PostgreSQL and as string elsewhere, loaded as `netaddr.IPNetwork`.
+    """
+
+    impl = String
+    cache_ok = True
+
+    class comparator_factory(TypeDecorator.Comparator):
+        def overlaps(self, network: IPNetwork):
+            return ip_overlaps(self.expr, literal(network, IPNetworkType()))
+
+        def contained_by(self, network: IPNetwork):
+            return ip_contained_by(self.expr, literal(network, IPNetworkType()))
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine[Any]:
+        return dialect.type_descriptor(CIDR() if dialect.name == "postgresql" else String())
+
+    def process_bind_param(self, value: IPNetwork | str | None, dialect: Dialect) -> str | None:
+        return None if value is None else str(value)
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> IPNetwork | None:
+        return None if value is None else IPNetwork(str(value))
@@ -1,4 +1,6 @@
 import asyncio
+from pathlib import Path
+from typing import Callable
 from uuid import uuid1
 
 import cif
@@ -7,10 +9,13 @@ from docker import DockerClient
 from netaddr import IPNetwork
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from dr_emu.lib import events
 from dr_emu.lib.logger import logger
-from dr_emu.models import Image, ImageState
+from dr_emu.models import Image, ImageState, Blob
 from shared import constants
 
+INFRASTRUCTURES_SUPERNET = IPNetwork("10.0.0.0/8")  # supernets of infrastructures (/16) are allocated from it
+
 
 async def get_container_names(docker_client: DockerClient) -> set[str]:
     """
@@ -44,22 +49,30 @@ async def get_network_names(docker_client: DockerClient) -> set[str]:
 
 
 async def get_available_networks_for_infras(
-        used_networks: set[IPNetwork], used_infra_supernets: set[IPNetwork]
-) -> IPNetwork:
+        used_networks: set[IPNetwork], used_infra_supernets: set[IPNetwork], count: int = 1
+) -> list[IPNetwork]:
     """
     Return available subnets(supernets) for infrastructures.
     :param used_networks: Networks that already exists in docker
     :param used_infra_supernets: Subnets that are already used by other infrastructures
-    :return: list of available Networks, that can be used during infrastructure building.
+    :param count: number of supernets
+    :return: list of available Networks (fewer than `count` if the address space is exhausted), that can be used
+        during infrastructure building.
     """
-    logger.debug("Getting available IP addressed for networks")
+    logger.debug("Getting available IP addressed for networks", count=count)
+    # set lookups compare hashes, the networks are normalized to their CIDR (no host bits)
+    used = {network.cidr for network in (*used_networks, *used_infra_supernets)}
     available_networks: list[IPNetwork] = []
-    infrastructure_subnets = IPNetwork("10.0.0.0/8").subnet(16)
+    if count < 1:
+        return available_networks
 
-    for subnet in infrastructure_subnets:
-        if subnet not in [*used_networks, *available_networks, *used_infra_supernets]:
-            return subnet
+    for subnet in INFRASTRUCTURES_SUPERNET.subnet(16):
+        if subnet not in used:
+            available_networks.append(subnet)
+            if len(available_networks) == count:
+                break
 
+    return available_networks
 
 
 async def generate_infrastructure_subnets(
@@ -76,11 +89,20 @@ async def generate_infrastructure_subnets(
     return infrastructure_subnets
 
 
+def _pull(docker_client: DockerClient, image: str, report: Callable[[str], None]) -> None:
+    # the output is read as the layers are pulled, so the progress can be reported
+    for line in docker_client.api.pull(image, stream=True, decode=True):
+        if "error" in line:
+            raise docker.errors.APIError(line["error"])
+        report(f"{line['id']}: {line.get('status')}" if "id" in line else line.get("status", ""))
+
+
 async def pull_image(docker_client: DockerClient, image: str):
     logger.info(f"pulling image", image=image)
+    report = events.progress(events.IMAGE, image)
     for _ in range(3):
         try:
-            await asyncio.to_thread(docker_client.images.pull, image)
+            await asyncio.to_thread(_pull, docker_client, image, report)
             return
         except docker.errors.DockerException as err:  # TODO: find out what exception is thrown during unreachable image pull source (Server Timeout)
             logger.error(f"Could not pull image {image} due to {err}... retrying")
@@ -104,17 +126,15 @@ async def build_cif_image(image: Image):
 
     logger.info(f"Building image", image=image.name, image_services=image_services)
 
-    file_paths = []
     # list[tuple(host_path, image_path, username, groupname, mode)]
-    image_files: list[tuple[str, str, str | int | None, str | int | None, int | None]] = []
+    image_files: list[tuple[Path, str, str | int | None, str | int | None, int | None]] = []
+    file_paths: dict[str, Path] = {}  # files written for the build by digest, a blob is written once per build
 
     try:
-        for file_desc in image.data:
-            file_name = str(uuid1())
-            file_path = constants.cif_tmp_data_path / file_name
-            file_path.write_text(file_desc.contents)  # Write content to the file
-            image_files.append((file_path, file_desc.image_file_path, None, None, None))
-            file_paths.append(file_path)
+        for image_file in image.files:
+            if (file_path := file_paths.get(image_file.blob.digest)) is None:
+                file_path = file_paths[image_file.blob.digest] = await materialize_blob(image_file.blob)
+            image_files.append((file_path, image_file.path, None, None, None))
 
         await asyncio.to_thread(
             cif.build,
@@ -126,10 +146,23 @@ async def build_cif_image(image: Image):
             packages=image.packages,
             clean_up=True)
     finally:
-        # Delete all created files
-        for file_path in file_paths:
-            if file_path.exists():
-                file_path.unlink()
+        # the contents stay in the blob store, the files are needed only by the build
+        for file_path in file_paths.values():
+            file_path.unlink(missing_ok=True)
+
+
+async def materialize_blob(blob: Blob) -> Path:
+    """
+    Write blob contents into the CIF build context, the caller removes the file once the build is done.
+    :param blob: blob with the file contents
+    :return: path to the file on the host
+    """
+    # contents are deferred, they are loaded only when the file is really needed
+    contents = await blob.awaitable_attrs.contents
+    file_path = constants.cif_tmp_data_path / f"{blob.digest}.{uuid1()}"
+    await asyncio.to_thread(file_path.write_bytes, contents)
+
+    return file_path
 
 
 async def get_image(docker_client: DockerClient, image: Image, db_session: AsyncSession):
@@ -1,8 +1,39 @@
 from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from dr_emu.lib.query_stats import track_queries
+
+
+class QueryStatsMiddleware:
+    """
+    Track database queries of each HTTP request and report them in `X-DB-Query-Count` and `X-DB-Time` headers.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with track_queries(f"{scope['method']} {scope['path']}") as stats:
+
+            async def send_with_stats(message: Message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-db-query-count", str(stats.count).encode()),
+                        (b"x-db-time", f"{stats.duration:.6f}".encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+
 
 middleware = [
+    Middleware(QueryStatsMiddleware),
     Middleware(GZipMiddleware),
     Middleware(CORSMiddleware, allow_origins=["app.example.io"]),
 ]
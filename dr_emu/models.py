@@ -1,6 +1,13 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import io
+import shlex
+import tarfile
+import time
+import zlib
+from datetime import datetime, timezone
 from enum import Enum
 from abc import abstractmethod
 from enum import Enum
@@ -15,7 +22,8 @@ from docker.models.networks import Network as DockerNetwork
 from docker.models.resource import Collection, Model
 from docker.types import IPAMPool, IPAMConfig
 from netaddr import IPAddress, IPNetwork
-from sqlalchemy import ForeignKey, String, JSON, Column, Table
+from sqlalchemy import ForeignKey, String, Column, Table, LargeBinary, Index, DateTime
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import (
@@ -27,7 +35,9 @@ from sqlalchemy.orm import (
 )
 from sqlalchemy_utils import force_instant_defaults, ScalarListType, JSONType
 
+from dr_emu.lib import docker_hosts
 from dr_emu.lib.logger import logger
+from dr_emu.lib.sql_types import IPAddressType, IPNetworkType
 from dr_emu.settings import settings
 from shared import constants
 from shared.classes import FileDescription
@@ -36,6 +46,10 @@ from shared.classes import FileDescription
 force_instant_defaults()
 
 
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class Base(AsyncAttrs, DeclarativeBase):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
@@ -51,10 +65,10 @@ class DockerMixin:
     kwargs: Mapped[Optional[dict[Any, Any]]] = mapped_column(JSONType, nullable=True)
 
     @property
-    def client(self):
-        # testing issue
+    def client(self) -> DockerClient:
+        # the client of the infrastructure's docker host, see docker_hosts.use_host
         if self._client is None:
-            self._client = docker.from_env()
+            self._client = docker_hosts.current_client()
         return self._client
 
     @abstractmethod
@@ -92,7 +106,7 @@ class DockerContainerMixin(DockerMixin):
     healthcheck: Mapped[dict[str, Any]] = mapped_column(JSONType, nullable=True)
     detach: Mapped[bool] = mapped_column(default=True)
     tty: Mapped[bool] = mapped_column(default=True)
-    image_id = mapped_column(ForeignKey("image.id"))
+    image_id = mapped_column(ForeignKey("image.id"), index=True)
 
     @declared_attr
     def image(self) -> Mapped["Image"]:
@@ -133,27 +147,31 @@ class Network(DockerMixin, Base):
     driver: Mapped[str] = mapped_column(default="bridge")
     attachable: Mapped[bool] = mapped_column(default=True)
     interfaces: Mapped[list["Interface"]] = relationship(back_populates="network", cascade="all, delete-orphan")
-    _ipaddress = mapped_column("ipaddress", String)
-    _router_gateway = mapped_column("router_gateway", String)
-    infrastructure_id: Mapped[int] = mapped_column(ForeignKey("infrastructure.id"))
+    _ipaddress = mapped_column("ipaddress", IPNetworkType)
+    _router_gateway = mapped_column("router_gateway", IPAddressType)
+    infrastructure_id: Mapped[int] = mapped_column(ForeignKey("infrastructure.id"), index=True)
     infrastructure: Mapped["Infrastructure"] = relationship(back_populates="networks")
     network_type: Mapped[str] = mapped_column()
 
+    __table_args__ = (
+        Index("ix_network_ipaddress", "ipaddress", postgresql_using="gist", postgresql_ops={"ipaddress": "inet_ops"}),
+    )
+
     @property
-    def ipaddress(self):
-        return IPNetwork(self._ipaddress)
+    def ipaddress(self) -> IPNetwork:
+        return self._ipaddress
 
     @ipaddress.setter
     def ipaddress(self, ipaddress: IPNetwork):
-        self._ipaddress = str(ipaddress)
+        self._ipaddress = IPNetwork(ipaddress)
 
     @property
-    def router_gateway(self):
-        return IPAddress(self._router_gateway)
+    def router_gateway(self) -> IPAddress:
+        return self._router_gateway
 
     @router_gateway.setter
     def router_gateway(self, ipaddress: IPAddress):
-        self._router_gateway = str(ipaddress)
+        self._router_gateway = IPAddress(ipaddress)
 
     @property
     def bridge_gateway(self):
@@ -171,10 +189,10 @@ class Network(DockerMixin, Base):
         Create a docker network.
         :return:
         """
-        ipam_pool = IPAMPool(subnet=self._ipaddress, gateway=self.bridge_gateway)
+        ipam_pool = IPAMPool(subnet=str(self.ipaddress), gateway=self.bridge_gateway)
         ipam_config = IPAMConfig(pool_configs=[ipam_pool])
 
-        logger.debug("Creating network", ip=self._ipaddress, name=self.name)
+        logger.debug("Creating network", ip=str(self.ipaddress), name=self.name)
         try:
             self.docker_id = (  # pyright: ignore [reportAttributeAccessIssue]
                 await asyncio.to_thread(
@@ -186,10 +204,10 @@ class Network(DockerMixin, Base):
                 )
             ).id
         except APIError as err:
-            logger.error(str(err), ip=self._ipaddress, name=self.name)
+            logger.error(str(err), ip=str(self.ipaddress), name=self.name)
             raise err
 
-        logger.debug("Network created", ip=self._ipaddress, name=self.name)
+        logger.debug("Network created", ip=str(self.ipaddress), name=self.name)
 
     async def delete(self):
         """
@@ -209,41 +227,46 @@ class Interface(Base):
 
     __tablename__ = "interface"
 
-    network_id: Mapped[int] = mapped_column(ForeignKey("network.id"))
+    network_id: Mapped[int] = mapped_column(ForeignKey("network.id"), index=True)
     network: Mapped["Network"] = relationship(back_populates="interfaces")
-    _ipaddress = mapped_column("ipaddress", String)
-    _original_ip = mapped_column("original_ip", String, nullable=True)
+    _ipaddress = mapped_column("ipaddress", IPAddressType)
+    _original_ip = mapped_column("original_ip", IPAddressType, nullable=True)
     appliance: Mapped["Appliance"] = relationship(back_populates="interfaces")
-    appliance_id: Mapped[int] = mapped_column(ForeignKey("appliance.id"))
+    appliance_id: Mapped[int] = mapped_column(ForeignKey("appliance.id"), index=True)
+
+    __table_args__ = (
+        Index("ix_interface_ipaddress", "ipaddress", postgresql_using="gist", postgresql_ops={"ipaddress": "inet_ops"}),
+    )
 
     @property
-    def ipaddress(self):
-        return IPAddress(self._ipaddress)
+    def ipaddress(self) -> IPAddress:
+        return self._ipaddress
 
     @ipaddress.setter
     def ipaddress(self, ipaddress: IPAddress):
-        self._ipaddress = str(ipaddress)
+        self._ipaddress = IPAddress(ipaddress)
 
     @property
-    def original_ip(self):
-        return IPAddress(self._original_ip) if self._original_ip else None
+    def original_ip(self) -> IPAddress | None:
+        return self._original_ip
 
     @original_ip.setter
     def original_ip(self, original_ip: IPAddress):
-        self._original_ip = str(original_ip) if original_ip else None
+        self._original_ip = IPAddress(original_ip) if original_ip else None
 
 
 appliances_volumes = Table(
     "appliances_volumes",
     Base.metadata,
     Column("appliance_id", ForeignKey("appliance.id"), primary_key=True),
-    Column("volume_id", ForeignKey("volume.id"), primary_key=True),
+    Column("volume_id", ForeignKey("volume.id"), primary_key=True, index=True),
 )
 
 
 class Appliance(DockerContainerMixin, Base):
     """
     Docker container model, parent model for Node and Router.
+    All appliances share a single table, columns of the subclasses are nullable.
     """
 
     __tablename__ = "appliance"
@@ -252,7 +275,7 @@ class Appliance(DockerContainerMixin, Base):
     interfaces: Mapped[list["Interface"]] = relationship(back_populates="appliance", cascade="all, delete-orphan")
     type: Mapped[str]
     volumes: Mapped[list["Volume"]] = relationship(secondary=appliances_volumes, back_populates="appliances")
-    infrastructure_id: Mapped[int] = mapped_column(ForeignKey("infrastructure.id"))
+    infrastructure_id: Mapped[int] = mapped_column(ForeignKey("infrastructure.id"), index=True)
 
     __mapper_args__ = {
         "polymorphic_on": "type",
@@ -305,13 +328,15 @@ class Appliance(DockerContainerMixin, Base):
         reveal_type(ksd)
         return ksd
 
-    async def create(self):
+    async def create(self, host_config: docker.types.HostConfig | None = None):
         """
         Create a docker container with necessary configurations.
+        :param host_config: already created host configuration shared by more containers
         :return:
         """
         network_config = await self._create_network_config()
-        host_config = await self._create_host_config()
+        if host_config is None:
+            host_config = await self._create_host_config()
 
         self.docker_id = (
             await asyncio.to_thread(
@@ -333,6 +358,22 @@ class Appliance(DockerContainerMixin, Base):
     async def configure(self) -> None:
         pass
 
+    async def run_instructions(self, instructions: list[str] | list[str | list[str]], **kwargs) -> None:
+        """
+        Run configuration commands in the container by a single exec instead of one exec per command.
+        The commands are run by a shell one after another, a failing command doesn't stop the following ones.
+        :param instructions: commands, either shell command lines or argument lists
+        :param kwargs: arguments of the exec
+        :return:
+        """
+        if not instructions:
+            return
+        script = "; ".join(
+            instruction if isinstance(instruction, str) else shlex.join(instruction) for instruction in instructions
+        )
+        container = await self.get()
+        await asyncio.to_thread(container.exec_run, cmd=["sh", "-c", script], **kwargs)  # type: ignore
+
     async def start(self):
         pass
 
@@ -356,20 +397,44 @@ class Infrastructure(Base):
     __tablename__ = "infrastructure"
 
     name: Mapped[str] = mapped_column(unique=True)
-    _supernet = mapped_column("supernet", String, unique=True)
+    _supernet = mapped_column("supernet", IPNetworkType, unique=True)
     networks: Mapped[list["Network"]] = relationship(back_populates="infrastructure", cascade="all, delete-orphan")
     routers: Mapped[list["Router"]] = relationship(back_populates="infrastructure", cascade="all, delete-orphan")
     nodes: Mapped[list["Node"]] = relationship(back_populates="infrastructure", cascade="all, delete-orphan")
-    instance_id: Mapped[int] = mapped_column(ForeignKey("instance.id"), nullable=True)
+    instance_id: Mapped[int] = mapped_column(ForeignKey("instance.id"), nullable=True, index=True)
     instance: Mapped["Instance"] = relationship(back_populates="infrastructure", single_parent=True)
+    # Job building the infrastructure, set in the same transaction as the row, so an interrupted build can always be
+    # cleaned up
+    job_id: Mapped[Optional[int]] = mapped_column(ForeignKey("job.id", ondelete="SET NULL"), nullable=True, index=True)
+    # Template of the warm pool the infrastructure was built for, it is ready to be claimed once pooled_at is set
+    pool_template_id: Mapped[Optional[int]] = mapped_column(ForeignKey("template.id"), nullable=True, index=True)
+    pooled_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # description served by the infrastructure detail endpoint, written when the infrastructure is built
+    snapshot: Mapped[Optional[dict[str, Any]]] = mapped_column(JSONType, nullable=True, deferred=True)
+    # set when the teardown is requested, the reaper of a worker tears the infrastructure down once the time has passed
+    # (a claimed or failed teardown is postponed)
+    teardown_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    teardown_attempts: Mapped[int] = mapped_column(default=0)
+    teardown_error: Mapped[Optional[str]] = mapped_column(nullable=True)
+    # docker host the infrastructure is placed on, chosen when it is allocated, None is the local docker daemon
+    docker_host_id: Mapped[Optional[int]] = mapped_column(ForeignKey("docker_host.id"), nullable=True, index=True)
+    docker_host: Mapped[Optional["DockerHost"]] = relationship(back_populates="infrastructures")
+
+    __table_args__ = (
+        # overlapping supernets are rejected even if the allocations of several processes race, its gist index also
+        # serves the overlap queries of the allocation
+        ExcludeConstraint(
+            ("supernet", "&&"), name="infrastructure_supernet_excl", using="gist", ops={"supernet": "inet_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
 
     @property
-    def supernet(self):
-        return IPNetwork(self._supernet)
+    def supernet(self) -> IPNetwork:
+        return self._supernet
 
     @supernet.setter
     def supernet(self, supernet: IPNetwork):
-        self._supernet = str(supernet)
+        self._supernet = IPNetwork(supernet)
 
     @property
     def volumes(self) -> set["Volume"]:
@@ -388,9 +453,6 @@ class Router(Appliance):
     Router model representing docker container responsible for network routing.
     """
 
-    __tablename__ = "router"
-
-    id: Mapped[int] = mapped_column(ForeignKey("appliance.id"), primary_key=True)
     firewall_rules: Mapped[list["FirewallRule"]] = relationship(back_populates="router", cascade="all, delete-orphan")
     router_type: Mapped[str] = mapped_column(nullable=True)
     infrastructure: Mapped["Infrastructure"] = relationship(back_populates="routers")
@@ -409,10 +471,7 @@ class Router(Appliance):
         await self._setup_default_gateway(config_instructions)
         await self._setup_firewall(config_instructions)
 
-        container = await self.get()
-
-        for instruction in config_instructions:
-            await asyncio.to_thread(container.exec_run, instruction)  # type: ignore
+        await self.run_instructions(config_instructions)
 
     async def _setup_default_gateway(self, config_instructions: list[str]):
         for interface in self.interfaces:
@@ -428,30 +487,46 @@ class Router(Appliance):
                     config_instructions.append(f"ip route add default via {interface.network.router_gateway}")
 
     async def _setup_firewall(self, config_instructions: list[str]):
+        config_instructions += self.firewall_instructions()
+
+    def firewall_instructions(self) -> list[str]:
+        """
+        Create iptables commands of the firewall rules, the rules are appended to the FORWARD chain.
+        :return: commands
+        """
+        instructions: list[str] = []
         for fw_rule in self.firewall_rules:
             if fw_rule.policy == constants.FIREWALL_DENY:
-                config_instructions += [
+                instructions += [
                     f"iptables -A FORWARD -s {fw_rule.src_net.ipaddress} -d {fw_rule.dst_net.ipaddress} -m state "
                     f"--state RELATED,ESTABLISHED -j ACCEPT",
                     f"iptables -A FORWARD -s {fw_rule.src_net.ipaddress} -d {fw_rule.dst_net.ipaddress} -j DROP",
                 ]
+        return instructions
 
     async def _setup_routes(self, routers: list[Router], config_instructions: list[str]):
-        routes_config: list[dict[str, Any]] = []
+        for network_route, via in self.routes(routers):
+            config_instructions.append(f"ip route add {network_route} via {via}")
+
+    def routes(self, routers: list[Router]) -> list[tuple[IPNetwork, IPAddress | str]]:
+        """
+        List routes to the networks of the other routers, they are reached through the management network.
+        :param routers: routers of the infrastructure
+        :return: destination networks and their gateways
+        """
+        routes: list[tuple[IPNetwork, IPAddress | str]] = []
         for router in routers:
             if self == router:
                 continue
-            routes: dict[str, Any] = {"via": "", "to": []}
+            via: IPAddress | str = ""
+            destinations: list[IPNetwork] = []
             for interface in router.interfaces:
                 if interface.network.network_type == constants.NETWORK_TYPE_MANAGEMENT:
-                    routes["via"] = interface.ipaddress
+                    via = interface.ipaddress
                 else:
-                    routes["to"].append(interface.network.ipaddress)
-            routes_config.append(routes)
-
-        for route_config in routes_config:
-            for network_route in route_config["to"]:
-                config_instructions.append(f"ip route add {network_route} via {route_config['via']}")
+                    destinations.append(interface.network.ipaddress)
+            routes += [(destination, via) for destination in destinations]
+        return routes
 
     async def connect_to_networks(self):
         """
@@ -469,8 +544,27 @@ class Router(Appliance):
                 unique_networks.add(interface.network)
 
         for interface in unique_interfaces:
-            logger.debug(f"Connecting router {self.name} to network {interface.network.name}")
-            (await interface.network.get()).connect(self.name, ipv4_address=str(interface.ipaddress))
+            await self.connect_to_network(interface)
+
+    async def connect_to_network(self, interface: Interface) -> None:
+        """
+        Connect the running router to the network of the interface.
+        :param interface: interface of the router
+        :return:
+        """
+        logger.debug(f"Connecting router {self.name} to network {interface.network.name}")
+        await asyncio.to_thread(
+            (await interface.network.get()).connect, self.name, ipv4_address=str(interface.ipaddress)
+        )
+
+    async def disconnect_from_network(self, network: Network) -> None:
+        """
+        Disconnect the running router from the network.
+        :param network: Network object
+        :return:
+        """
+        logger.debug(f"Disconnecting router {self.name} from network {network.name}")
+        await asyncio.to_thread((await network.get()).disconnect, self.name, force=True)
 
     async def start(self):
         """
@@ -499,11 +593,11 @@ class FirewallRule(Base):
     __tablename__ = "firewall_rule"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    src_net_id: Mapped[int] = mapped_column(ForeignKey("network.id"))
-    dst_net_id: Mapped[int] = mapped_column(ForeignKey("network.id"))
+    src_net_id: Mapped[int] = mapped_column(ForeignKey("network.id"), index=True)
+    dst_net_id: Mapped[int] = mapped_column(ForeignKey("network.id"), index=True)
     src_net: Mapped["Network"] = relationship("Network", foreign_keys=[src_net_id])
     dst_net: Mapped["Network"] = relationship("Network", foreign_keys=[dst_net_id])
-    router_id: Mapped[int] = mapped_column(ForeignKey("router.id"))
+    router_id: Mapped[int] = mapped_column(ForeignKey("appliance.id"), index=True)
     router: Mapped["Router"] = relationship(back_populates="firewall_rules")
     service: Mapped[str] = mapped_column()
     policy: Mapped[str] = mapped_column()
@@ -514,14 +608,13 @@ class Node(Appliance):
     Node model representing docker container acting as a physical machine containing services
     """
 
-    __tablename__ = "node"
-
-    id: Mapped[int] = mapped_column(ForeignKey("appliance.id"), primary_key=True)
     service_containers: Mapped[list["ServiceContainer"]] = relationship(back_populates="parent_node",
                                                                         cascade="all, delete-orphan")
     ipc_mode: Mapped[str] = mapped_column(default="shareable", nullable=True)
     infrastructure: Mapped["Infrastructure"] = relationship(back_populates="nodes")
-    depends_on: Mapped[dict[str, str]] = mapped_column(JSONType, default=dict())
+    depends_on: Mapped[dict[str, str]] = mapped_column(JSONType, default=dict(), nullable=True)
+    files: Mapped[list["NodeFile"]] = relationship(back_populates="node", cascade="all, delete-orphan", lazy="selectin")
+    group: Mapped[str] = mapped_column(nullable=True)  # name of the node definition this node is a replica of
     config_instructions: list[str] | list[list[str]] = []
     __mapper_args__ = {
         "polymorphic_identity": "node",
@@ -550,25 +643,46 @@ class Node(Appliance):
         Configure ip tables on a Node.
         :return:
         """
-        container = await self.get()
-
         setup_instructions = [
                                  "ip route del default",
                                  f"ip route add default via {str(self.interfaces[0].network.router_gateway)}",
                              ] + self.config_instructions
 
-        for instruction in setup_instructions:
-            await asyncio.to_thread(container.exec_run, cmd=instruction, privileged=True, user="0")  # type: ignore
+        await self.run_instructions(setup_instructions, privileged=True, user="0")
 
-    async def create(self):
+    async def create(self, host_config: docker.types.HostConfig | None = None):
         """
         Create a docker container representing a Node.
+        :param host_config: already created host configuration shared by replicas of the node
         :return:
         """
-        await super().create()
+        await super().create(host_config)
+        await self.put_files()
         create_service_tasks: set[asyncio.Task[Any]] = await self.create_services()
         await asyncio.gather(*create_service_tasks)
 
+    async def put_files(self) -> None:
+        """
+        Copy data files into the created (not yet started) container, all files are sent in a single tar archive.
+        Relative paths are placed relative to the container root.
+        :return:
+        """
+        if not self.files:
+            return
+
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for node_file in self.files:
+                contents = await node_file.blob.awaitable_attrs.contents
+                file_info = tarfile.TarInfo(node_file.path.lstrip("/"))
+                file_info.size = len(contents)
+                file_info.mode = 0o644
+                file_info.mtime = int(time.time())
+                tar.addfile(file_info, io.BytesIO(contents))
+
+        logger.debug("Copying files to container", container_name=self.name, count=len(self.files))
+        await asyncio.to_thread(self.client.api.put_archive, self.docker_id, "/", archive.getvalue())
+
     async def start(self):
         """
         Start a docker container representing a Node.
@@ -662,7 +776,7 @@ services_volumes = Table(
     "services_volumes",
     Base.metadata,
     Column("service_container_id", ForeignKey("service_container.id"), primary_key=True),  # type: ignore
-    Column("volume_id", ForeignKey("volume.id"), primary_key=True),  # type: ignore
+    Column("volume_id", ForeignKey("volume.id"), primary_key=True, index=True),  # type: ignore
 )
 
 
@@ -673,7 +787,7 @@ class ServiceContainer(DockerContainerMixin, Base):
 
     __tablename__ = "service_container"
 
-    parent_node_id: Mapped[int] = mapped_column(ForeignKey("node.id"))
+    parent_node_id: Mapped[int] = mapped_column(ForeignKey("appliance.id"), index=True)
     parent_node: Mapped["Node"] = relationship(back_populates="service_containers")
     dependencies: Mapped[list["DependsOn"]] = relationship(
         back_populates="dependant",
@@ -813,38 +927,98 @@ class DependsOn(Base):
     """Class for dependency container startup"""
 
     __tablename__ = "depends_on"
-    dependant_service_id: Mapped[int] = mapped_column(ForeignKey("service_container.id"))
-    dependency_service_id: Mapped[int] = mapped_column(ForeignKey("service_container.id"))
+    dependant_service_id: Mapped[int] = mapped_column(ForeignKey("service_container.id"), index=True)
+    dependency_service_id: Mapped[int] = mapped_column(ForeignKey("service_container.id"), index=True)
     dependant: Mapped["ServiceContainer"] = relationship(back_populates="dependencies",
                                                          foreign_keys=[dependant_service_id])
     dependency: Mapped["ServiceContainer"] = relationship(foreign_keys=[dependency_service_id])
     state: Mapped[ContainerState] = mapped_column()
 
 
+class DockerHost(Base):
+    """
+    Docker daemon infrastructures are placed on. Without any registered host, everything runs on the local daemon.
+    """
+
+    __tablename__ = "docker_host"
+    name: Mapped[str] = mapped_column(unique=True)
+    url: Mapped[str] = mapped_column(unique=True)  # unix:// socket, tcp:// or ssh:// address of the docker daemon
+    capacity: Mapped[int] = mapped_column()  # infrastructures the host can run
+    enabled: Mapped[bool] = mapped_column(default=True)  # disabled hosts get no new infrastructures
+    infrastructures: Mapped[list["Infrastructure"]] = relationship(back_populates="docker_host")
+
+
 class Template(Base):
     __tablename__ = "template"
     name: Mapped[str] = mapped_column()
-    description: Mapped[str] = mapped_column(JSON)
+    # serialized CYST configuration, can be large, so it's compressed and loaded only when undeferred
+    _description = mapped_column("description", LargeBinary, deferred=True)
+    digest: Mapped[str] = mapped_column(String(64))  # sha256 of the description
+    size: Mapped[int] = mapped_column()  # size of the uncompressed description
+    warm_pool_size: Mapped[int] = mapped_column(default=0)  # idle built infrastructures kept for new Run instances
     runs: Mapped[list["Run"]] = relationship(back_populates="template")
 
+    @property
+    def description(self) -> str:
+        return zlib.decompress(self._description).decode()
+
+    @description.setter
+    def description(self, description: str):
+        contents = description.encode()
+        self.digest = hashlib.sha256(contents).hexdigest()
+        self.size = len(contents)
+        self._description = zlib.compress(contents, settings.template_compression_level)
+
 
 class Run(Base):
     __tablename__ = "run"
     name: Mapped[str] = mapped_column()
     template: Mapped["Template"] = relationship(back_populates="runs")
-    template_id: Mapped[int] = mapped_column(ForeignKey("template.id"))
+    template_id: Mapped[int] = mapped_column(ForeignKey("template.id"), index=True)
     instances: Mapped[list["Instance"]] = relationship(back_populates="run", cascade="all, delete-orphan")
+    jobs: Mapped[list["Job"]] = relationship(back_populates="run", cascade="all, delete-orphan")
 
 
 class Instance(Base):
     __tablename__ = "instance"
-    run_id: Mapped[int] = mapped_column(ForeignKey("run.id"))
+    run_id: Mapped[int] = mapped_column(ForeignKey("run.id"), index=True)
     run: Mapped["Run"] = relationship(back_populates="instances")
     infrastructure: Mapped["Infrastructure"] = relationship(
         back_populates="instance", uselist=False, cascade="all, delete, delete-orphan"
     )
 
 
+class JobStatus(Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class Job(Base):
+    """
+    Build of Run instances executed by a worker process, the API only queues it.
+    Jobs without a Run build infrastructures for the warm pool of their Template.
+    """
+
+    __tablename__ = "job"
+    run_id: Mapped[Optional[int]] = mapped_column(ForeignKey("run.id"), nullable=True, index=True)
+    run: Mapped[Optional["Run"]] = relationship(back_populates="jobs")
+    template_id: Mapped[Optional[int]] = mapped_column(ForeignKey("template.id"), nullable=True, index=True)
+    status: Mapped[JobStatus] = mapped_column(default=JobStatus.queued, index=True)
+    attempts: Mapped[int] = mapped_column(default=0)
+    error: Mapped[Optional[str]] = mapped_column(nullable=True)
+    cancel_requested: Mapped[bool] = mapped_column(default=False)
+    count: Mapped[int] = mapped_column(default=1)  # number of instances to build
+    built: Mapped[int] = mapped_column(default=0)  # instances built so far, incremented with each Instance
+    worker: Mapped[Optional[str]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utc_now)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
 class Volume(DockerMixin, Base):
     __tablename__ = "volume"
     bind: Mapped[str] = mapped_column()  # Place where the volume will be mounted inside the container
@@ -880,7 +1054,7 @@ images_services = Table(
     "images_services",
     Base.metadata,
     Column("service_id", ForeignKey("service.id"), primary_key=True),  # type: ignore
-    Column("image_id", ForeignKey("image.id"), primary_key=True),  # type: ignore
+    Column("image_id", ForeignKey("image.id"), primary_key=True, index=True),  # type: ignore
 )
 
 
@@ -918,20 +1092,13 @@ class Image(MappedAsDataclass, Base):
     __tablename__ = "image"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, init=False)
     services: Mapped[set["Service"]] = relationship(secondary=images_services, cascade="all, delete",)
-    data: list[FileDescription]
     packages: Mapped[list[str]] = mapped_column(ScalarListType(separator="|"), default_factory=list)
     pull: Mapped[bool] = mapped_column(default=False)
     name: Mapped[str] = mapped_column(unique=True, default=None)
     state: Mapped[ImageState] = mapped_column(default=ImageState.initialized)
-    _data: list[str] = mapped_column("data", ScalarListType(separator="|"), default_factory=list)
-
-    @property
-    def data(self):
-        return [FileDescription(contents=eval(data)[1], image_file_path=eval(data)[0]) for data in self._data]
-
-    @data.setter
-    def data(self, data: list[FileDescription]):
-        self._data = [str((file_decs.image_file_path, file_decs.contents)) for file_decs in data]
+    files: Mapped[list["ImageFile"]] = relationship(
+        back_populates="image", cascade="all, delete-orphan", lazy="selectin", default_factory=list
+    )
 
     def __key(self):
         instance_key = [self.pull]
@@ -939,7 +1106,8 @@ class Image(MappedAsDataclass, Base):
             instance_key += [service.type, service.version, service.cves]
             for key, value in service.variable_override.items():
                 instance_key.append(f"{key}:{value}")
-        [instance_key.append(data_config) for data_config in self.data]
+        for image_file in sorted(self.files, key=lambda f: (f.path, f.blob.digest)):
+            instance_key += [image_file.path, image_file.blob.digest]
         return tuple(instance_key)
 
     def __hash__(self):
@@ -949,3 +1117,48 @@ class Image(MappedAsDataclass, Base):
         if isinstance(other, Image):
             return self.__key() == other.__key()
         return NotImplemented
+
+
+class Blob(Base):
+    """
+    Content-addressed storage for file contents, shared by every image that contains the same file.
+    """
+
+    __tablename__ = "blob"
+
+    digest: Mapped[str] = mapped_column(String(64), unique=True)
+    size: Mapped[int] = mapped_column()
+    contents: Mapped[bytes] = mapped_column(LargeBinary, deferred=True)
+
+    @classmethod
+    def from_file_description(cls, file_description: FileDescription) -> Blob:
+        contents = file_description.contents.encode()
+        return cls(digest=file_description.digest, size=len(contents), contents=contents)
+
+
+class ImageFile(Base):
+    """
+    File placed into an image during its build, the contents are referenced from the blob store.
+    """
+
+    __tablename__ = "image_file"
+
+    image_id: Mapped[int] = mapped_column(ForeignKey("image.id"), index=True)
+    image: Mapped["Image"] = relationship(back_populates="files")
+    blob_id: Mapped[int] = mapped_column(ForeignKey("blob.id"), index=True)
+    blob: Mapped["Blob"] = relationship(lazy="joined")
+    path: Mapped[str] = mapped_column()
+
+
+class NodeFile(Base):
+    """
+    File copied into a node container after it is created, the contents are referenced from the blob store.
+    """
+
+    __tablename__ = "node_file"
+
+    node_id: Mapped[int] = mapped_column(ForeignKey("appliance.id"), index=True)
+    node: Mapped["Node"] = relationship(back_populates="files")
+    blob_id: Mapped[int] = mapped_column(ForeignKey("blob.id"), index=True)
+    blob: Mapped["Blob"] = relationship(lazy="joined")
+    path: Mapped[str] = mapped_column()
@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field
+
+
+class DockerHostSchema(BaseModel):
+    name: str
+    url: str = Field(description="URL of the docker daemon, e.g. unix:///var/run/docker.sock or tcp://10.0.0.2:2375")
+    capacity: int = Field(gt=0, description="Number of infrastructures the host can run")
+
+
+class DockerHostUpdate(BaseModel):
+    capacity: int | None = Field(default=None, gt=0, description="Number of infrastructures the host can run")
+    enabled: bool | None = Field(default=None, description="Whether new infrastructures can be placed on the host")
+
+
+class DockerHostOut(DockerHostSchema):
+    id: int
+    enabled: bool
+
+
+class DockerHostDetail(DockerHostOut):
+    infrastructures: int = Field(description="Infrastructures placed on the host, including the ones being torn down")
+    building: int = Field(description="Infrastructures being built on the host")
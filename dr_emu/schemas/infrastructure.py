@@ -1,5 +1,5 @@
 from sqlalchemy.ext.declarative import declarative_base
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 Base = declarative_base()
 
@@ -25,3 +25,15 @@ class NetworkSchema(BaseModel):
 class InfrastructureInfo(InfrastructureSchema):
     networks: list[NetworkSchema]
     attackers: dict
+
+
+class InfrastructureApply(BaseModel):
+    template_id: int = Field(description="Template whose plan the infrastructure is changed to")
+    dry_run: bool = Field(default=False, description="Only report the planned operations")
+
+
+class OperationOut(BaseModel):
+    action: str
+    kind: str
+    name: str
+    detail: str | None = None
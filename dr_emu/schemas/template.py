@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class TemplateSchema(BaseModel):
@@ -8,3 +8,20 @@ class TemplateSchema(BaseModel):
 
 class TemplateOut(TemplateSchema):
     id: int
+
+
+class TemplateSummary(BaseModel):
+    id: int
+    name: str
+    digest: str
+    size: int
+
+
+class WarmPoolSize(BaseModel):
+    size: int = Field(ge=0, description="Number of idle infrastructures kept built, 0 disables the pool")
+
+
+class WarmPoolOut(BaseModel):
+    size: int
+    ready: int
+    building: int
@@ -10,13 +10,44 @@ class Settings(BaseSettings):
     postgres_password: str
     postgres_db: str
     db_host: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 2
+    db_pool_timeout: float = 30  # seconds to wait for a free connection
     management_network_name: str
     ignore_management_network: bool
     echo_sql: bool = True
+    query_repeat_warning: int = 10  # warn if a request or build repeats a statement this many times (N+1 queries)
     test: bool = False
     project_name: str = "Dr-emu"
     oauth_token_secret: str = "my_dev_secret"
     debug: bool = False
+    bulk_insert: bool = True  # insert baked infrastructure models with one statement per table
+    inject_data_files: bool = False  # copy data files into containers instead of building them into images
+    node_create_chunk_size: int = 16  # replicas of a node group created in parallel
+    parser_workers: int = 2  # processes for template parsing, 0 parses in a thread of the API process
+    template_compression_level: int = 6  # zlib level of stored template descriptions
+    page_size: int = 100  # objects returned by list endpoints when no limit is given
+    max_page_size: int = 1000
+    run_start_concurrency: int = 4  # infrastructures of one run start built at the same time
+    job_workers: int = 2  # worker processes building the queued run starts
+    job_concurrency: int = 2  # builds running at the same time in one worker process
+    job_poll_interval: float = 1  # seconds between checks of an empty queue
+    job_heartbeat_interval: float = 5  # seconds between heartbeats of a running job
+    job_timeout: float = 60  # seconds without a heartbeat after which the job's worker is considered dead
+    job_max_attempts: int = 3  # runs of a job interrupted by dead workers before it fails
+    build_events_flush_interval: float = 0.5  # seconds between batches of build events sent by a worker
+    build_events_queue_size: int = 1000  # events buffered for a streaming client before they are dropped
+    build_events_keepalive: float = 15  # seconds between keepalive comments of an idle event stream
+    warm_pool_refill_interval: float = 30  # seconds between checks of the warm pools by a worker
+    warm_pool_refill_batch: int = 4  # infrastructures built by one warm pool refill job
+    max_infrastructures: int = 64  # infrastructures the local docker daemon can run, no warm pool refills above it
+    placement_image_weight: float = 0.5  # preference of docker hosts that have the template's images
+    placement_build_weight: float = 1  # avoidance of docker hosts building many infrastructures
+    reaper_interval: float = 2  # seconds between checks for infrastructures to tear down
+    reaper_rate: float = 20  # docker objects removed per second by the reaper of one worker process, 0 is unlimited
+    reaper_build_rate: float = 5  # removal rate of the reaper while any Job is building
+    reaper_lease: float = 600  # seconds a teardown claimed by a reaper is skipped by the others
+    reaper_retry_delay: float = 60  # seconds before a failed teardown is retried, multiplied by the attempts
 
 
 BASE_DIR = Path(__file__).parent
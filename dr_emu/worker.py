@@ -0,0 +1,248 @@
+"""
+Worker processes executing the queued Jobs (run starts) and tearing down stopped infrastructures. Start them with:
+    python -m dr_emu.worker
+"""
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from dr_emu.controllers import job as job_controller, run as run_controller, pool as pool_controller, teardown
+from dr_emu.database_config import sessionmanager
+from dr_emu.lib import process_pool, events
+from dr_emu.lib.logger import logger
+from dr_emu.lib.rate_limit import RateLimiter
+from dr_emu.models import Job, JobStatus
+from dr_emu.settings import settings
+
+
+class Worker:
+    """
+    Claims queued Jobs and builds their Run instances, at most `settings.job_concurrency` at the same time.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.jobs: set[asyncio.Task[None]] = set()
+        self.refilled_at: float | None = None
+
+    async def serve(self, stop: asyncio.Event) -> None:
+        """
+        Execute Jobs until the stop event is set. Jobs running at that moment are interrupted, their unfinished
+        infrastructures are torn down, and they are queued again for another worker.
+        :param stop: event stopping the worker
+        :return:
+        """
+        logger.info("Worker started", worker=self.name)
+        try:
+            while not stop.is_set():
+                await self.poll()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), settings.job_poll_interval)
+        finally:
+            jobs = list(self.jobs)
+            for task in jobs:
+                task.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            logger.info("Worker stopped", worker=self.name)
+
+    async def poll(self) -> None:
+        """
+        Recover Jobs of dead workers, queue refills of the warm pools (every `settings.warm_pool_refill_interval`
+        seconds) and start queued Jobs up to the concurrency limit.
+        :return:
+        """
+        async with sessionmanager.session() as db_session:
+            await job_controller.recover_lost_jobs(self.name, db_session)
+            if self.refilled_at is None or time.monotonic() - self.refilled_at >= settings.warm_pool_refill_interval:
+                self.refilled_at = time.monotonic()
+                try:
+                    await pool_controller.refill_pools(db_session)
+                except Exception as error:
+                    logger.warning("Warm pool refill failed", exception=str(error))
+                    await db_session.rollback()
+            while len(self.jobs) < settings.job_concurrency:
+                if (job := await job_controller.claim_job(self.name, db_session)) is None:
+                    break
+                task = asyncio.create_task(self.execute(job))
+                self.jobs.add(task)
+                task.add_done_callback(self.jobs.discard)
+
+    async def execute(self, job: Job) -> None:
+        """
+        Build the Run instances (or warm pool infrastructures) of the Job while sending heartbeats, which also deliver
+        cancellation requests. Instances built by previous attempts of the Job are not built again.
+        :param job: claimed Job
+        :return:
+        """
+        self.publish(job, JobStatus.running)
+        if job.run_id is not None:
+            build = asyncio.create_task(run_controller.build_run(job.run_id, job.count - job.built, job.id))
+        else:
+            build = asyncio.create_task(pool_controller.build_pool(job.template_id, job.count - job.built, job.id))
+        try:
+            while not build.done():
+                await asyncio.wait({build}, timeout=settings.job_heartbeat_interval)
+                if build.done():
+                    break
+                try:
+                    async with sessionmanager.session() as db_session:
+                        cancel_requested = await job_controller.heartbeat(job.id, self.name, db_session)
+                except Exception as error:
+                    # if the database is unavailable for too long, the job is recovered by another worker
+                    logger.warning("Job heartbeat failed", id=job.id, exception=str(error))
+                    continue
+                if cancel_requested is None:
+                    logger.warning("Job was taken over by another worker", id=job.id, worker=self.name)
+                    await self.cancel(build)
+                    return
+                if cancel_requested:
+                    await self.cancel(build)
+                    await self.finish(job, JobStatus.cancelled)
+                    return
+        except asyncio.CancelledError:
+            # the worker is stopping, another one will run the job again
+            await self.cancel(build)
+            await self.finish(job, JobStatus.queued, "Worker stopped")
+            raise
+
+        if (error := build.exception()) is not None:
+            logger.error("Job failed", id=job.id, exception=str(error))
+            await self.finish(job, JobStatus.failed, f"{type(error).__name__}: {error}")
+        elif errors := [result for result in build.result() if isinstance(result, Exception)]:
+            # the built instances are kept, retrying the Job builds only the failed ones
+            count = len(build.result())
+            logger.error("Job failed", id=job.id, failed=len(errors), count=count)
+            messages = "; ".join(f"{type(error).__name__}: {error}" for error in errors)
+            await self.finish(job, JobStatus.failed, f"{len(errors)} of {count} instances failed: {messages}")
+        else:
+            await self.finish(job, JobStatus.succeeded)
+
+    @staticmethod
+    def publish(job: Job, status: JobStatus, error: str | None = None) -> None:
+        if job.run_id is None:
+            return
+        with events.build_scope(job.run_id, job.id):
+            events.emit(events.JOB, status.value, detail=error)
+
+    @staticmethod
+    async def cancel(build: asyncio.Task) -> None:
+        build.cancel()
+        await asyncio.gather(build, return_exceptions=True)
+
+    async def finish(self, job: Job, status: JobStatus, error: str | None = None) -> None:
+        """
+        Tear down the unfinished infrastructures of an unsuccessful build and save the result of the Job.
+        Infrastructures of a warm pool deleted during the build are torn down even if the build succeeded.
+        :param job: executed Job
+        :param status: final state, queued returns the Job to the queue
+        :param error: reason of the failure
+        :return:
+        """
+        async with sessionmanager.session() as db_session:
+            if status is not JobStatus.succeeded:
+                await job_controller.delete_unfinished_infrastructures(job.id, db_session)
+            await job_controller.finish_job(job.id, self.name, status, db_session, error)
+            if status is JobStatus.succeeded and job.run_id is None:
+                # the warm pool may have been deleted during the build
+                await job_controller.delete_detached_infrastructures(job.id, db_session)
+        self.publish(job, status, error)
+
+
+class Reaper:
+    """
+    Tears down the infrastructures of stopped Runs (see `teardown.schedule_teardown`) one at a time. Docker objects are
+    removed at most `settings.reaper_rate` per second, and only `settings.reaper_build_rate` per second while any Job
+    is building, so stopping many Runs at once doesn't slow the builds down.
+    """
+
+    def __init__(self):
+        self.limiter = RateLimiter(settings.reaper_rate)
+
+    async def serve(self, stop: asyncio.Event) -> None:
+        """
+        Reap infrastructures until the stop event is set. An interrupted teardown is taken over by another reaper once
+        its lease expires.
+        :param stop: event stopping the reaper
+        :return:
+        """
+        while not stop.is_set():
+            try:
+                reaped = await self.reap()
+            except Exception as error:
+                logger.warning("Reaper failed", exception=str(error))
+                reaped = False
+            if not reaped:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), settings.reaper_interval)
+
+    async def reap(self) -> bool:
+        """
+        Tear down the next infrastructure, the removal rate is set by the running builds.
+        :return: whether an infrastructure was claimed
+        """
+        async with sessionmanager.session() as db_session:
+            building = await job_controller.is_building(db_session)
+            self.limiter.rate = settings.reaper_build_rate if building else settings.reaper_rate
+            return await teardown.reap(db_session, self.limiter)
+
+
+async def serve() -> None:
+    """
+    Run a worker and its reaper until SIGTERM or SIGINT is received.
+    :return:
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stop.set)
+
+    # build events are sent to the API processes, which stream them to the clients
+    relay = events.NotificationRelay(sessionmanager.connect)
+    events.bus.add_sink(relay.push)
+    relay_task = asyncio.create_task(relay.serve())
+    try:
+        reaper = asyncio.create_task(Reaper().serve(stop))
+        try:
+            await Worker(f"{socket.gethostname()}-{os.getpid()}").serve(stop)
+        finally:
+            reaper.cancel()
+            await asyncio.gather(reaper, return_exceptions=True)
+    finally:
+        relay_task.cancel()
+        await asyncio.gather(relay_task, return_exceptions=True)
+        events.bus.remove_sink(relay.push)
+        process_pool.shutdown()
+        await sessionmanager.close()
+
+
+def run_worker() -> None:
+    asyncio.run(serve())
+
+
+def main() -> None:
+    """
+    Start `settings.job_workers` worker processes and wait for them, SIGTERM and SIGINT are passed to the workers.
+    :return:
+    """
+    # spawn, so workers do not share the DB connections and docker clients of this process
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_worker, name=f"worker-{index}") for index in range(settings.job_workers)]
+    for worker in workers:
+        worker.start()
+
+    def terminate(*_) -> None:
+        for process in workers:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
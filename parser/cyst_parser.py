@@ -1,6 +1,8 @@
+import asyncio
 import copy
+import dataclasses
 from frozendict import frozendict
-from typing import Sequence
+from typing import Sequence, Iterator
 from uuid import uuid1
 
 import cif
@@ -19,8 +21,10 @@ from netaddr import IPNetwork
 from packaging.version import Version
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from dr_emu.controllers import image as image_controller
+from dr_emu.controllers import image as image_controller, blob as blob_controller
+from dr_emu.lib.exceptions import UnsupportedConfiguration
 from dr_emu.lib.logger import logger
+from dr_emu.settings import settings
 from dr_emu.models import (
     Network as DockerNetwork,
     Interface as DockerInterface,
@@ -30,10 +34,14 @@ from dr_emu.models import (
     ServiceAttacker as DockerServiceAttacker,
     Node as DockerNode,
     Image as ImageModel,
+    ImageFile as ImageFileModel,
+    NodeFile as NodeFileModel,
+    Blob as BlobModel,
     Service as ServiceModel,
     Volume,
 )
 from parser.lib import containers
+from parser.lib.cyst_loader import load_configuration
 from parser.lib.simple_models import (
     Network,
     Interface,
@@ -44,6 +52,13 @@ from parser.lib.simple_models import (
     Image,
     Service,
     FileDescription,
+    RouterDescription,
+    NodeDescription,
+    ExploitDescription,
+    PassiveServiceDescription,
+    ActiveServiceDescription,
+    DataDescription,
+    Volume as SimpleVolume,
 )
 from shared import constants
 
@@ -57,12 +72,20 @@ class CYSTParser:
         self.docker_images: set[Image] = {containers.IMAGE_DEFAULT}
 
     @staticmethod
-    def _load_infrastructure_description(description: str) -> list[ConfigItem]:
+    def _load_infrastructure_description(
+        description: str,
+    ) -> list[ConfigItem] | list[RouterDescription | NodeDescription | ExploitDescription]:
         """
         Load CYST configuration from pickled template.
+        Items used by the parser are decoded directly, CYST Environment is created only if that is not possible.
         :param description: CYST infrastructure description
         :return: CYST configuration
         """
+        try:
+            return load_configuration(description)
+        except UnsupportedConfiguration as ex:
+            logger.warning("Cannot decode infrastructure description natively, using CYST Environment", reason=str(ex))
+
         # SECURITY VULNERABILITY, EXECUTES PYTHON CODE FROM USER INPUT
         return Environment.create().configuration.general.load_configuration(description)
 
@@ -71,7 +94,10 @@ class CYSTParser:
         return {network.subnet for network in self.networks}
 
     async def create_image(
-        self, services: list[Service], data_configurations: list[DataConfig], available_cif_services: list[str]
+        self,
+        services: list[Service],
+        data_configurations: list[DataConfig | DataDescription],
+        available_cif_services: list[str],
     ) -> Image:
         packages: set[str] = set()
         actual_services: list[Service] = list()
@@ -108,7 +134,7 @@ class CYSTParser:
 
         raise RuntimeError(f"No network matching {subnet}.")
 
-    async def _parse_networks(self, cyst_routers: list[RouterConfig]):
+    async def _parse_networks(self, cyst_routers: list[RouterConfig | RouterDescription]):
         """
         Create network models from cyst infrastructure prescription.
         :param cyst_routers: router objects from cyst infrastructure
@@ -133,7 +159,9 @@ class CYSTParser:
                     )
                     self.networks.append(Network(network_name, network_type, subnet, interface.ip))
 
-    async def _parse_nodes(self, cyst_nodes: list[NodeConfig], exploits: list[ExploitConfig]):
+    async def _parse_nodes(
+        self, cyst_nodes: list[NodeConfig | NodeDescription], exploits: list[ExploitConfig | ExploitDescription]
+    ):
         """
         Create node models from cyst infrastructure prescription.
         :param cyst_nodes: node objects from cyst infrastructure
@@ -144,10 +172,14 @@ class CYSTParser:
             interfaces = [
                 Interface(interface.ip, await self._find_network(interface.net)) for interface in cyst_node.interfaces
             ]
+            # Node group, CYST has no notion of replicas, so it is an optional extra attribute of the NodeConfig
+            replicas = getattr(cyst_node, "replicas", 1)
+            await self._check_replicas(cyst_node.id, interfaces, replicas)
 
             if cyst_node.id in containers.NODES:
                 node = copy.deepcopy(containers.NODES[cyst_node.id])
                 node.interfaces = interfaces
+                node.replicas = replicas
                 self.nodes.append(node)
                 self.docker_images.add(node.image)
                 for service_container in node.service_containers:
@@ -164,6 +196,15 @@ class CYSTParser:
             if vulnerable_services:
                 services.append(containers.FIREHOLE)
 
+            node_data: set[FileDescription] = set()
+            if settings.inject_data_files:
+                # data files are copied into the container, so nodes differing only in data share the image
+                node_data = {
+                    FileDescription(contents=data_config.description, image_file_path=data_config.id)
+                    for data_config in data_configurations
+                }
+                data_configurations = []
+
             image = await self.create_image(
                 services=services,
                 data_configurations=data_configurations,
@@ -173,14 +214,43 @@ class CYSTParser:
             if len(cyst_node.active_services) > 0:
                 node_type = NodeType.ATTACKER
 
-            logger.debug("Adding node", id=cyst_node.id, services=services, interfaces=interfaces)
-            self.nodes.append(Node(image=image, name=cyst_node.id, interfaces=interfaces, type=node_type))
+            logger.debug("Adding node", id=cyst_node.id, services=services, interfaces=interfaces, replicas=replicas)
+            self.nodes.append(
+                Node(
+                    image=image,
+                    name=cyst_node.id,
+                    interfaces=interfaces,
+                    type=node_type,
+                    data=node_data,
+                    replicas=replicas,
+                )
+            )
+
+    @staticmethod
+    async def _check_replicas(name: str, interfaces: list[Interface], replicas: int):
+        """
+        Check that addresses of all node replicas fit into their networks. Replicas use consecutive addresses starting
+        with the address of the node definition.
+        :param name: node name
+        :param interfaces: interfaces of the node definition
+        :param replicas: number of replicas
+        :return:
+        """
+        if replicas < 1:
+            raise RuntimeError(f"Node {name} must have at least one replica.")
+
+        for interface in interfaces:
+            last_ip = interface.ip + (replicas - 1)
+            if last_ip not in interface.network.subnet or last_ip == interface.network.subnet.broadcast:
+                raise RuntimeError(f"Replicas of node {name} do not fit into network {interface.network.subnet}.")
 
     async def _parse_services(
         self,
-        node_services: list[PassiveServiceConfig | ActiveServiceConfig],
-        data_configs: list[DataConfig],
-        vulnerable_services: list[PassiveServiceConfig],
+        node_services: list[
+            PassiveServiceConfig | ActiveServiceConfig | PassiveServiceDescription | ActiveServiceDescription
+        ],
+        data_configs: list[DataConfig | DataDescription],
+        vulnerable_services: list[PassiveServiceConfig | PassiveServiceDescription],
     ) -> list[Service]:
         """
         Create service models from nodes in cyst infrastructure prescription.
@@ -196,7 +266,7 @@ class CYSTParser:
                     #     raise NotImplementedError(f"ActiveService {node_service.type} is not supported.")
                     # services.append(containers.SERVICES[node_service.type])
 
-                case PassiveServiceConfig():
+                case PassiveServiceConfig() | PassiveServiceDescription():
                     for data_config in node_service.private_data:
                         data_configs.append(data_config)
                     if node_service.name in containers.SERVICES:
@@ -212,7 +282,7 @@ class CYSTParser:
 
         return services
 
-    async def _parse_routers(self, cyst_routers: list[RouterConfig]):
+    async def _parse_routers(self, cyst_routers: list[RouterConfig | RouterDescription]):
         """
         Create router models from nodes in cyst infrastructure prescription.
         :param cyst_routers: router objects from cyst infrastructure
@@ -249,8 +319,11 @@ class CYSTParser:
             )
 
     @staticmethod
-    async def _get_vulnerable_services(exploits: list[ExploitConfig], services: list[PassiveServiceConfig]) -> list[PassiveServiceConfig]:
-        vulnerable_services: list[PassiveServiceConfig] = list()
+    async def _get_vulnerable_services(
+        exploits: list[ExploitConfig | ExploitDescription],
+        services: list[PassiveServiceConfig | PassiveServiceDescription],
+    ) -> list[PassiveServiceConfig | PassiveServiceDescription]:
+        vulnerable_services: list[PassiveServiceConfig | PassiveServiceDescription] = list()
         for exploit in exploits:
             for vuln_service in exploit.services:
                 for service in services:
@@ -296,8 +369,15 @@ class CYSTParser:
         logger.info("Creating infra images", infra_name=infrastructure_name)
 
         db_images = await image_controller.list_images(db_session)
-        await self.bake_router_models(routers, networks, db_images, image_models)
-        await self.bake_node_models(nodes, volumes, networks, db_images, image_models)
+        blobs = await blob_controller.get_blobs(
+            {
+                *(file.digest for image in self.docker_images for file in image.data),
+                *(file.digest for node in self.nodes for file in node.data),
+            },
+            db_session,
+        )
+        await self.bake_router_models(routers, networks, db_images, image_models, blobs)
+        await self.bake_node_models(nodes, volumes, networks, db_images, image_models, blobs)
 
         # Add new images
         for new_image in image_models:
@@ -327,9 +407,9 @@ class CYSTParser:
             [*db_images, *image_models],
         )
 
-    async def bake_router_models(self, routers, networks, db_images, image_models) -> None:
+    async def bake_router_models(self, routers, networks, db_images, image_models, blobs) -> None:
         # Build DB of Docker containers (routers)
-        image_model = await self.bake_image_model(containers.IMAGE_DEFAULT, db_images, image_models)
+        image_model = await self.bake_image_model(containers.IMAGE_DEFAULT, db_images, image_models, blobs)
 
         for router in self.routers:
             interfaces: list[DockerInterface] = list()
@@ -358,9 +438,24 @@ class CYSTParser:
                 firewall_rules=firewall_rules,
             )
 
+    @staticmethod
+    def get_blob(file_description: FileDescription, blobs: dict[str, BlobModel]) -> BlobModel:
+        """
+        Get blob for the file contents, new blob is created only if there is no stored or already created one.
+        :param file_description: file description
+        :param blobs: blobs indexed by their digest, shared by all images and nodes of the infrastructure
+        :return: blob with the file contents
+        """
+        if (blob := blobs.get(file_description.digest)) is None:
+            blob = blobs[file_description.digest] = BlobModel.from_file_description(file_description)
+        return blob
+
     @staticmethod
     async def bake_image_model(
-        simple_image: Image, db_images: Sequence[ImageModel], image_models: list[ImageModel]
+        simple_image: Image,
+        db_images: Sequence[ImageModel],
+        image_models: list[ImageModel],
+        blobs: dict[str, BlobModel],
     ) -> ImageModel:
         service_models = set()
         for service in simple_image.services:
@@ -372,11 +467,16 @@ class CYSTParser:
                     cves=service.cves,
                 )
             )
+        image_files: list[ImageFileModel] = [
+            ImageFileModel(path=file_description.image_file_path, blob=CYSTParser.get_blob(file_description, blobs))
+            for file_description in simple_image.data
+        ]
+
         image = ImageModel(
             services=service_models,
             pull=simple_image.pull,
             name=simple_image.name,
-            data=[data_description for data_description in simple_image.data],
+            files=image_files,
             packages=list(simple_image.packages),
         )
         created_images = [*db_images, *image_models]
@@ -395,7 +495,49 @@ class CYSTParser:
                 container_model.volumes.append(volume)
                 infra_volumes[volume.name] = volume
 
-    async def bake_node_models(self, nodes, volumes, networks, db_images, image_models) -> None:
+    def expand_replicas(self) -> Iterator[tuple[Node, str | None]]:
+        """
+        Expand node groups into separate nodes, replicas get consecutive addresses and are numbered from 1.
+        Replicas are created lazily, so the whole group is never held in memory as simple models.
+        :return: node and the name of its group (None for nodes without replicas)
+        """
+        used_ips = {interface.ip for router in self.routers for interface in router.interfaces}
+        used_ips.update(interface.ip for node in self.nodes if node.replicas == 1 for interface in node.interfaces)
+
+        for node in self.nodes:
+            if node.replicas == 1:
+                yield node, None
+                continue
+
+            for index in range(node.replicas):
+                replica = copy.copy(node)
+                replica.name = f"{node.name}-{index + 1}"
+                replica.replicas = 1
+                replica.volumes = self._replica_volumes(node.volumes, index)
+                replica.service_containers = list()
+                for service_container in node.service_containers:
+                    service_replica = copy.copy(service_container)
+                    service_replica.volumes = self._replica_volumes(service_container.volumes, index)
+                    replica.service_containers.append(service_replica)
+                replica.interfaces = [
+                    Interface(interface.ip + index, interface.network) for interface in node.interfaces
+                ]
+                if used := used_ips.intersection(interface.ip for interface in replica.interfaces):
+                    raise RuntimeError(f"Replica {replica.name} uses already assigned address {used.pop()}.")
+                used_ips.update(interface.ip for interface in replica.interfaces)
+                yield replica, node.name
+
+    @staticmethod
+    def _replica_volumes(volumes: list[SimpleVolume], index: int) -> list[SimpleVolume]:
+        """
+        Copy volumes for a replica, so the replicas of a node group don't share their data.
+        :param volumes: volumes of the node group
+        :param index: index of the replica
+        :return: renamed copies of the volumes
+        """
+        return [dataclasses.replace(volume, name=f"{volume.name}-{index + 1}") for volume in volumes]
+
+    async def bake_node_models(self, nodes, volumes, networks, db_images, image_models, blobs) -> None:
         """
         Create all necessary models for infrastructure based on parsed objects from cyst prescription.
         :return: None
@@ -403,11 +545,13 @@ class CYSTParser:
         # Build DB of Docker containers (nodes and services)
         all_docker_services: list[DockerService] = list()
 
-        for node in self.nodes:
+        for node, group in self.expand_replicas():
             services: list[DockerService] = list()
             interfaces: list[DockerInterface] = list()
             for service_container in node.service_containers:
-                service_image = await self.bake_image_model(service_container.image, db_images, image_models)
+                service_image = await self.bake_image_model(
+                    service_container.image, db_images, image_models, blobs
+                )
                 service_type = DockerServiceAttacker if service_container.is_attacker else DockerService
                 service_container_model = service_type(
                     name=str(uuid1()),
@@ -427,7 +571,7 @@ class CYSTParser:
                         ipaddress=interface.ip, original_ip=interface.ip, network=networks[interface.network.name]
                     )
                 )
-            image_model = await self.bake_image_model(node.image, db_images, image_models)
+            image_model = await self.bake_image_model(node.image, db_images, image_models, blobs)
             node_model = node.type.value(
                 name=node.name,
                 interfaces=interfaces,
@@ -438,6 +582,11 @@ class CYSTParser:
                 healthcheck=node.healthcheck,
                 config_instructions=[],
                 kwargs=copy.deepcopy(node.kwargs),
+                files=[
+                    NodeFileModel(path=file_description.image_file_path, blob=self.get_blob(file_description, blobs))
+                    for file_description in node.data
+                ],
+                group=group,
             )
             await self.bake_volumes(node_model, node.volumes, volumes)
             nodes[node.name] = node_model
@@ -449,20 +598,17 @@ class CYSTParser:
         """
         logger.debug("Parsing cyst infrastructure description")
 
-        cyst_routers: list[RouterConfig] = list()
-        cyst_nodes: list[NodeConfig] = list()
-        exploits: list[ExploitConfig] = list()
+        cyst_routers: list[RouterConfig | RouterDescription] = list()
+        cyst_nodes: list[NodeConfig | NodeDescription] = list()
+        exploits: list[ExploitConfig | ExploitDescription] = list()
 
         for item in self.infrastructure:
             match item:
-                case RouterConfig():
-                    item: RouterConfig
+                case RouterConfig() | RouterDescription():
                     cyst_routers.append(item)
-                case NodeConfig():
-                    item: NodeConfig
+                case NodeConfig() | NodeDescription():
                     cyst_nodes.append(item)
-                case ExploitConfig():
-                    item: ExploitConfig
+                case ExploitConfig() | ExploitDescription():
                     exploits.append(item)
 
         await self._parse_networks(cyst_routers)
@@ -470,3 +616,16 @@ class CYSTParser:
         await self._parse_nodes(cyst_nodes, exploits)
         # await self._resolve_dependencies()
         logger.info("Completed parsing cyst infrastructure description")
+
+
+def parse_template(description: str) -> CYSTParser:
+    """
+    Parse infrastructure description, meant to be run in a worker process (see dr_emu.lib.process_pool).
+    :param description: CYST infrastructure description
+    :return: parser with the infrastructure plan, CYST configuration is dropped to keep the result picklable
+    """
+    parser = CYSTParser(description)
+    asyncio.run(parser.parse())
+    parser.infrastructure = []
+
+    return parser
@@ -0,0 +1,239 @@
+import json
+from typing import Any
+
+from cyst.api.network.firewall import FirewallPolicy
+from netaddr import IPAddress, IPNetwork
+
+from dr_emu.lib.exceptions import UnsupportedConfiguration
+from parser.lib.simple_models import (
+    InterfaceDescription,
+    DataDescription,
+    ActiveServiceDescription,
+    PassiveServiceDescription,
+    NodeDescription,
+    FirewallRuleDescription,
+    FirewallChainDescription,
+    FirewallDescription,
+    RouterDescription,
+    VulnerableServiceDescription,
+    ExploitDescription,
+)
+
+PY_OBJECT = "py/object"
+PY_STATE = "py/state"
+PY_TUPLE = "py/tuple"
+PY_REDUCE = "py/reduce"
+PY_TYPE = "py/type"
+
+# Enums that can be decoded, any other enum in the decoded items makes the configuration unsupported
+ENUMS = {f"{FirewallPolicy.__module__}.{FirewallPolicy.__name__}": FirewallPolicy}
+
+Description = RouterDescription | NodeDescription | ExploitDescription
+
+
+class CYSTLoader:
+    """
+    Decode serialized (jsonpickle) CYST configuration without creating CYST Environment.
+
+    Only items used by the parser (RouterConfig, NodeConfig, ExploitConfig) are decoded and only the attributes
+    the parser reads are kept, everything else is skipped. No Python code from the description is imported or executed.
+    """
+
+    def __init__(self, description: str):
+        try:
+            self._items = json.loads(description)
+        except json.JSONDecodeError as ex:
+            raise UnsupportedConfiguration(f"Configuration is not valid JSON: {ex}") from ex
+
+        if not isinstance(self._items, list):
+            raise UnsupportedConfiguration("Configuration is not a list of configuration items.")
+
+        self._references: dict[str, dict[str, Any]] | None = None
+
+    def load(self) -> list[Description]:
+        """
+        Decode the configuration items used by the parser.
+        :return: Router, Node, and Exploit descriptions
+        """
+        descriptions: list[Description] = []
+        for item in self._items:
+            match self._class_name(item):
+                case "RouterConfig":
+                    descriptions.append(self._router(item))
+                case "NodeConfig":
+                    descriptions.append(self._node(item))
+                case "ExploitConfig":
+                    descriptions.append(self._exploit(item))
+
+        return descriptions
+
+    @staticmethod
+    def _class_name(item: Any) -> str | None:
+        """
+        Get name of the class the item was serialized from, module is ignored as it differs between CYST versions.
+        :param item: serialized item
+        :return: class name
+        """
+        if isinstance(item, dict) and isinstance(py_object := item.get(PY_OBJECT), str):
+            return py_object.rsplit(".", 1)[-1]
+        return None
+
+    def _resolve(self, item: Any) -> dict[str, Any]:
+        """
+        Resolve reference to a configuration item by its id.
+        :param item: serialized item or its id
+        :return: serialized item
+        """
+        if isinstance(item, dict):
+            if "py/id" in item or "py/ref" in item:
+                raise UnsupportedConfiguration("Configuration with jsonpickle references is not supported.")
+            return item
+
+        if isinstance(item, str):
+            if self._references is None:
+                self._references = {}
+                self._index(self._items)
+            if (reference := self._references.get(item)) is not None:
+                return reference
+
+        raise UnsupportedConfiguration(f"Cannot resolve configuration item {item!r}.")
+
+    def _index(self, value: Any) -> None:
+        """
+        Index all serialized configuration items by their id.
+        :param value: serialized value
+        :return:
+        """
+        if isinstance(value, list):
+            for item in value:
+                self._index(item)
+        elif isinstance(value, dict):
+            if PY_OBJECT in value and isinstance(item_id := value.get("id"), str):
+                self._references.setdefault(item_id, value)
+            for item in value.values():
+                self._index(item)
+
+    @staticmethod
+    def _state(item: Any, cls: type[IPAddress] | type[IPNetwork]) -> Any:
+        """
+        Decode netaddr object from its pickled state.
+        :param item: serialized object
+        :param cls: netaddr class
+        :return: netaddr object
+        """
+        try:
+            value = cls.__new__(cls)
+            value.__setstate__(CYSTLoader._tuple(item[PY_STATE]))
+        except (KeyError, TypeError, ValueError) as ex:
+            raise UnsupportedConfiguration(f"Cannot decode {cls.__name__} from {item!r}.") from ex
+        return value
+
+    @staticmethod
+    def _tuple(item: Any) -> Any:
+        """
+        Decode (possibly nested) tuple of plain values.
+        :param item: serialized tuple
+        :return: tuple
+        """
+        if isinstance(item, dict):
+            return tuple(CYSTLoader._tuple(value) for value in item[PY_TUPLE])
+        if isinstance(item, (str, int, float, bool)) or item is None:
+            return item
+        raise UnsupportedConfiguration(f"Cannot decode value {item!r}.")
+
+    @staticmethod
+    def _enum(item: Any) -> Any:
+        """
+        Decode enum member.
+        :param item: serialized enum member
+        :return: enum member
+        """
+        try:
+            enum_type, arguments = item[PY_REDUCE]
+            return ENUMS[enum_type[PY_TYPE]](*CYSTLoader._tuple(arguments))
+        except (KeyError, TypeError, ValueError) as ex:
+            raise UnsupportedConfiguration(f"Cannot decode enum from {item!r}.") from ex
+
+    def _interface(self, item: Any) -> InterfaceDescription:
+        item = self._resolve(item)
+        return InterfaceDescription(
+            ip=self._state(item["ip"], IPAddress),
+            net=self._state(item["net"], IPNetwork),
+        )
+
+    def _data(self, item: Any) -> DataDescription:
+        item = self._resolve(item)
+        return DataDescription(id=item["id"], description=item.get("description", ""))
+
+    def _active_service(self, item: Any) -> ActiveServiceDescription:
+        item = self._resolve(item)
+        return ActiveServiceDescription(type=item["type"], name=item["name"])
+
+    def _passive_service(self, item: Any) -> PassiveServiceDescription:
+        item = self._resolve(item)
+        return PassiveServiceDescription(
+            # older CYST versions call the service name `type`
+            name=item["name"] if "name" in item else item["type"],
+            version=item.get("version", ""),
+            private_data=[self._data(data) for data in item.get("private_data", [])],
+        )
+
+    def _node(self, item: dict[str, Any]) -> NodeDescription:
+        return NodeDescription(
+            id=item["id"],
+            interfaces=[self._interface(interface) for interface in item.get("interfaces", [])],
+            active_services=[self._active_service(service) for service in item.get("active_services", [])],
+            passive_services=[self._passive_service(service) for service in item.get("passive_services", [])],
+            replicas=item.get("replicas", 1),
+        )
+
+    def _firewall_rule(self, item: Any) -> FirewallRuleDescription:
+        item = self._resolve(item)
+        return FirewallRuleDescription(
+            src_net=self._state(item["src_net"], IPNetwork),
+            dst_net=self._state(item["dst_net"], IPNetwork),
+            service=item["service"],
+            policy=self._enum(item["policy"]),
+        )
+
+    def _firewall(self, item: Any) -> FirewallDescription:
+        item = self._resolve(item)
+        chains = [
+            FirewallChainDescription(
+                rules=[self._firewall_rule(rule) for rule in self._resolve(chain).get("rules", [])]
+            )
+            for chain in item.get("chains", [])
+        ]
+        return FirewallDescription(chains=chains)
+
+    def _router(self, item: dict[str, Any]) -> RouterDescription:
+        return RouterDescription(
+            id=item["id"],
+            interfaces=[self._interface(interface) for interface in item.get("interfaces", [])],
+            traffic_processors=[self._firewall(processor) for processor in item.get("traffic_processors", [])],
+        )
+
+    def _vulnerable_service(self, item: Any) -> VulnerableServiceDescription:
+        item = self._resolve(item)
+        return VulnerableServiceDescription(
+            # older CYST versions call the service `name`
+            service=item["service"] if "service" in item else item["name"],
+            min_version=item["min_version"],
+            max_version=item["max_version"],
+        )
+
+    def _exploit(self, item: dict[str, Any]) -> ExploitDescription:
+        return ExploitDescription(services=[self._vulnerable_service(service) for service in item.get("services", [])])
+
+
+def load_configuration(description: str) -> list[Description]:
+    """
+    Decode serialized CYST configuration into descriptions used by the parser.
+    :param description: serialized CYST configuration
+    :raises UnsupportedConfiguration: if the configuration cannot be decoded without CYST Environment
+    :return: Router, Node, and Exploit descriptions
+    """
+    try:
+        return CYSTLoader(description).load()
+    except (KeyError, TypeError, AttributeError) as ex:
+        raise UnsupportedConfiguration(f"Malformed configuration item: {ex!r}") from ex
@@ -1,6 +1,7 @@
 from enum import Enum
 from typing import Any
 
+from cyst.api.network.firewall import FirewallPolicy
 from frozendict import frozendict
 
 from shared.classes import FileDescription
@@ -166,3 +167,120 @@ class Node(Container):
     interfaces: list[Interface] = field(default_factory=list)
     service_containers: list[ServiceContainer] = field(default_factory=list)  # service containers
     type: NodeType = NodeType.DEFAULT
+    data: set[FileDescription] = field(default_factory=set)  # files injected into the container after create
+    replicas: int = 1  # number of identical containers, expanded when the models are baked
+
+
+@dataclass
+class InterfaceDescription:
+    """
+    Lightweight alternative for CYST InterfaceConfig.
+    """
+
+    ip: IPAddress
+    net: IPNetwork
+
+
+@dataclass
+class DataDescription:
+    """
+    Lightweight alternative for CYST DataConfig.
+    """
+
+    id: str
+    description: str
+
+
+@dataclass
+class ActiveServiceDescription:
+    """
+    Lightweight alternative for CYST ActiveServiceConfig.
+    """
+
+    type: str
+    name: str
+
+
+@dataclass
+class PassiveServiceDescription:
+    """
+    Lightweight alternative for CYST PassiveServiceConfig.
+    """
+
+    name: str
+    version: str
+    private_data: list[DataDescription] = field(default_factory=list)
+
+
+@dataclass
+class NodeDescription:
+    """
+    Lightweight alternative for CYST NodeConfig.
+    """
+
+    id: str
+    interfaces: list[InterfaceDescription] = field(default_factory=list)
+    active_services: list[ActiveServiceDescription] = field(default_factory=list)
+    passive_services: list[PassiveServiceDescription] = field(default_factory=list)
+    replicas: int = 1
+
+
+@dataclass
+class FirewallRuleDescription:
+    """
+    Lightweight alternative for CYST FirewallRule.
+    """
+
+    src_net: IPNetwork
+    dst_net: IPNetwork
+    service: str
+    policy: FirewallPolicy
+
+
+@dataclass
+class FirewallChainDescription:
+    """
+    Lightweight alternative for CYST FirewallChainConfig.
+    """
+
+    rules: list[FirewallRuleDescription] = field(default_factory=list)
+
+
+@dataclass
+class FirewallDescription:
+    """
+    Lightweight alternative for CYST FirewallConfig.
+    """
+
+    chains: list[FirewallChainDescription] = field(default_factory=list)
+
+
+@dataclass
+class RouterDescription:
+    """
+    Lightweight alternative for CYST RouterConfig.
+    """
+
+    id: str
+    interfaces: list[InterfaceDescription] = field(default_factory=list)
+    traffic_processors: list[FirewallDescription] = field(default_factory=list)
+
+
+@dataclass
+class VulnerableServiceDescription:
+    """
+    Lightweight alternative for CYST VulnerableServiceConfig.
+    """
+
+    service: str
+    min_version: str
+    max_version: str
+
+
+@dataclass
+class ExploitDescription:
+    """
+    Lightweight alternative for CYST ExploitConfig.
+    """
+
+    services: list[VulnerableServiceDescription] = field(default_factory=list)
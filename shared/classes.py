@@ -1,6 +1,14 @@
+import hashlib
 from dataclasses import dataclass
 
 @dataclass(frozen=True)
 class FileDescription:
     contents: str
-    image_file_path: str
\ No newline at end of file
+    image_file_path: str
+
+    @property
+    def digest(self) -> str:
+        """
+        SHA-256 of the file contents, used as a key in the blob store.
+        """
+        return hashlib.sha256(self.contents.encode()).hexdigest()
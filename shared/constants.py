@@ -9,6 +9,11 @@ TEMPLATE = "Template"
 RUN = "Run"
 INFRASTRUCTURE = "Infrastructure"
 IMAGE = "Image"
+JOB = "Job"
+DOCKER_HOST = "Docker host"
+
+# infrastructures get /16 supernets of 10.0.0.0/8
+MAX_RUN_INSTANCES = 256
 
 # Router types
 ROUTER_TYPE_PERIMETER = "perimeter"
@@ -1,7 +1,9 @@
 class Template:
     list = "/templates/"
+    get = "/templates/get/{}/"
     create = "/templates/create/"
     delete = "/templates/delete/{}/"
+    pool = "/templates/pool/{}/"
 
 
 class Run:
@@ -11,9 +13,31 @@ class Run:
     start = "/runs/start/{}/"
     list = "/runs/"
     get = "/runs/get/{}/"
+    events = "/runs/events/{}/"
 
 
 class Infrastructure:
     get = "/infrastructures/get/{}/"
     delete = "/infrastructures/delete/{}/"
     list = "/infrastructures/"
+    reset = "/infrastructures/reset/{}/"
+    apply = "/infrastructures/apply/{}/"
+
+
+class Job:
+    list = "/jobs/"
+    get = "/jobs/get/{}/"
+    cancel = "/jobs/cancel/{}/"
+    retry = "/jobs/retry/{}/"
+
+
+class Metrics:
+    list = "/metrics/"
+
+
+class DockerHost:
+    list = "/hosts/"
+    get = "/hosts/get/{}/"
+    create = "/hosts/create/"
+    update = "/hosts/update/{}/"
+    delete = "/hosts/delete/{}/"
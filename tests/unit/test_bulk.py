@@ -0,0 +1,121 @@
+import pytest
+from netaddr import IPNetwork, IPAddress
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from dr_emu.lib import bulk
+from dr_emu.models import (
+    Base,
+    Infrastructure,
+    Network,
+    Interface,
+    Router,
+    FirewallRule,
+    Node,
+    Attacker,
+    ServiceContainer,
+    ServiceAttacker,
+    Volume,
+    Blob,
+    NodeFile,
+)
+
+
+@pytest.fixture()
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+
+    await engine.dispose()
+
+
+def interface(network: Network, ipaddress: str) -> Interface:
+    return Interface(ipaddress=IPAddress(ipaddress), original_ip=IPAddress(ipaddress), network=network)
+
+
+@pytest.fixture()
+async def infrastructure(db_session):
+    infrastructure = Infrastructure(name="test", supernet=IPNetwork("10.0.0.0/16"), networks=[], routers=[], nodes=[])
+    db_session.add(infrastructure)
+    await db_session.commit()
+
+    networks = [
+        Network(
+            ipaddress=IPNetwork(f"10.0.{index}.0/24"),
+            router_gateway=IPAddress(f"10.0.{index}.1"),
+            name=f"network_{index}",
+            network_type="internal",
+        )
+        for index in range(2)
+    ]
+    router = Router(
+        name="router",
+        router_type="perimeter",
+        interfaces=[interface(network, str(network.router_gateway)) for network in networks],
+        firewall_rules=[FirewallRule(src_net=networks[0], dst_net=networks[1], service="*", policy="ALLOW")],
+    )
+    volume = Volume(name="volume", bind="/data", local=True)
+    blob = Blob(digest="0" * 64, size=4, contents=b"data")
+    nodes = []
+    for index, (node_type, service_type) in enumerate([(Attacker, ServiceAttacker), (Node, ServiceContainer)]):
+        service = service_type(name=f"service_{index}", environment={}, command=[], healthcheck={}, kwargs={})
+        service.volumes.append(volume)
+        node = node_type(
+            name=f"node_{index}",
+            interfaces=[interface(networks[1], f"10.0.1.{index + 10}")],
+            service_containers=[service],
+            environment={},
+            command=[],
+            healthcheck={},
+            config_instructions=[],
+            kwargs={},
+            files=[NodeFile(path="/data/file", blob=blob)],
+        )
+        node.volumes.append(volume)
+        nodes.append(node)
+
+    infrastructure.networks, infrastructure.routers, infrastructure.nodes = networks, [router], nodes
+    db_session.add(infrastructure)
+    return infrastructure
+
+
+@pytest.mark.asyncio
+class TestInsertNew:
+    async def test_insert_new(self, db_session, infrastructure):
+        assert await bulk.insert_new(db_session) == 16
+        assert not db_session.new
+        await db_session.commit()
+
+        interfaces = (await db_session.scalars(select(Interface))).all()
+        assert {(item.network.name, item.appliance.name, str(item.ipaddress)) for item in interfaces} == {
+            ("network_0", "router", "10.0.0.1"),
+            ("network_1", "router", "10.0.1.1"),
+            ("network_1", "node_0", "10.0.1.10"),
+            ("network_1", "node_1", "10.0.1.11"),
+        }
+        attacker = await db_session.scalar(select(Attacker))
+        assert attacker.name == "node_0"
+        assert isinstance(attacker.service_containers[0], ServiceAttacker)
+        assert [volume.name for volume in attacker.service_containers[0].volumes] == ["volume"]
+        assert [file.blob.digest for file in attacker.files] == ["0" * 64]
+        volume = await db_session.scalar(select(Volume))
+        assert {appliance.name for appliance in await volume.awaitable_attrs.appliances} == {"node_0", "node_1"}
+        rule = await db_session.scalar(select(FirewallRule))
+        assert (rule.router.name, rule.src_net.name, rule.dst_net.name) == ("router", "network_0", "network_1")
+
+    async def test_insert_new_changes_are_updated(self, db_session, infrastructure):
+        await bulk.insert_new(db_session)
+        infrastructure.nodes[0].docker_id = "container_id"
+        infrastructure.networks[0].docker_id = "network_id"
+        await db_session.commit()
+
+        assert await db_session.scalar(select(Node.docker_id).where(Node.name == "node_0")) == "container_id"
+        assert await db_session.scalar(select(Network.docker_id).where(Network.name == "network_0")) == "network_id"
+        assert len((await db_session.scalars(select(Node))).all()) == 2
+
+    async def test_insert_new_nothing_to_insert(self, db_session):
+        assert await bulk.insert_new(db_session) == 0
@@ -0,0 +1,160 @@
+import pytest
+from netaddr import IPNetwork, IPAddress
+
+from dr_emu.controllers import changes as changes_controller
+from dr_emu.controllers.changes import Operation
+from dr_emu.lib.exceptions import TemplateChangeError
+from dr_emu.models import Infrastructure, Network, Interface, Router, FirewallRule, Node, Dns, Image
+from parser.cyst_parser import CYSTParser
+from parser.lib import simple_models
+from shared import constants
+
+SUBNETS = {"public": IPNetwork("10.0.0.0/24"), "server": IPNetwork("10.0.1.0/24"), "app": IPNetwork("10.0.2.0/24")}
+RUNNING_SUBNETS = {"public": IPNetwork("192.168.0.0/24"), "server": IPNetwork("192.168.1.0/24")}
+
+
+def plan_network(name: str) -> simple_models.Network:
+    return simple_models.Network(name, "internal", SUBNETS[name], SUBNETS[name][1])
+
+
+def plan_node(name: str, network: simple_models.Network, host: int, image: str = "node", **kwargs):
+    return simple_models.Node(
+        image=simple_models.Image(image, pull=image != "node"),
+        name=name,
+        interfaces=[simple_models.Interface(network.subnet[host], network)],
+        **kwargs,
+    )
+
+
+def build_parser(routers: dict[str, list[str]], rules: list[tuple[str, str]] = ()) -> CYSTParser:
+    parser = CYSTParser.__new__(CYSTParser)
+    networks = {name: plan_network(name) for router_networks in routers.values() for name in router_networks}
+    parser.networks = list(networks.values())
+    parser.routers = [
+        simple_models.Router(
+            image=simple_models.Image("router"),
+            name=name,
+            interfaces=[simple_models.Interface(networks[network].gateway, networks[network]) for network in names],
+            firewall_rules=[
+                simple_models.FirewallRule(networks[source], networks[destination], "*", "ALLOW")
+                for source, destination in rules
+            ],
+        )
+        for name, names in routers.items()
+    ]
+    parser.nodes = []
+    return parser
+
+
+@pytest.fixture()
+def infrastructure() -> Infrastructure:
+    networks = {
+        name: Network(ipaddress=subnet, router_gateway=subnet[1], name=f"infra-{name}", network_type="internal")
+        for name, subnet in RUNNING_SUBNETS.items()
+    }
+    management = Network(
+        ipaddress=IPNetwork("192.168.2.0/24"),
+        router_gateway=IPAddress("192.168.2.1"),
+        name="infra-management",
+        network_type=constants.NETWORK_TYPE_MANAGEMENT,
+    )
+
+    def interface(network: str, host: int) -> Interface:
+        return Interface(
+            ipaddress=RUNNING_SUBNETS[network][host], original_ip=SUBNETS[network][host], network=networks[network]
+        )
+
+    router = Router(
+        name="infra-router",
+        interfaces=[
+            interface("public", 1),
+            interface("server", 1),
+            Interface(ipaddress=IPAddress("192.168.2.2"), network=management),
+        ],
+        firewall_rules=[
+            FirewallRule(src_net=networks["public"], dst_net=networks["server"], service="*", policy="ALLOW")
+        ],
+    )
+    node_image = Image(services=set(), name="node")
+    nodes = [
+        Node(name="infra-web", image=node_image, interfaces=[interface("public", 10)], service_containers=[], files=[]),
+        Node(name="infra-db", image=node_image, interfaces=[interface("server", 10)], service_containers=[], files=[]),
+        Dns(name="infra-dns", image=node_image, interfaces=[interface("server", 2)], service_containers=[], files=[]),
+    ]
+    return Infrastructure(
+        name="infra",
+        supernet=IPNetwork("192.168.0.0/16"),
+        networks=[*networks.values(), management],
+        routers=[router],
+        nodes=nodes,
+    )
+
+
+def unchanged_nodes(public: simple_models.Network, server: simple_models.Network) -> list[simple_models.Node]:
+    return [
+        plan_node("web", public, 10),
+        plan_node("db", server, 10),
+        plan_node("dns", server, 2, type=simple_models.NodeType.DNS),
+    ]
+
+
+class TestPlanChanges:
+    def test_unchanged(self, infrastructure: Infrastructure):
+        parser = build_parser({"router": ["public", "server"]}, [("public", "server")])
+        parser.nodes = unchanged_nodes(*parser.networks)
+
+        changes = changes_controller.plan_changes(infrastructure, parser)
+
+        assert changes.operations == []
+        assert set(changes.networks) == {SUBNETS["public"], SUBNETS["server"]}
+
+    def test_changes(self, infrastructure: Infrastructure):
+        parser = build_parser({"router": ["public", "server", "app"]}, [("public", "app")])
+        public, server, app = parser.networks
+        parser.nodes = [
+            plan_node("web", public, 10, image="nginx"),
+            plan_node("app", app, 10),
+            plan_node("dns", server, 2, type=simple_models.NodeType.DNS),
+        ]
+
+        changes = changes_controller.plan_changes(infrastructure, parser)
+
+        assert changes.operations == [
+            Operation("remove", "node", "db"),
+            Operation("create", "network", "10.0.2.0/24"),
+            Operation("update", "router", "router", "connect to 10.0.2.0/24"),
+            Operation("update", "router", "router", "firewall rules"),
+            Operation("replace", "node", "web", "changed image"),
+            Operation("create", "node", "app"),
+            Operation("update", "dns", "dns", "records"),
+        ]
+        assert [node.name for node in changes.removed_nodes] == ["infra-db", "infra-web"]
+        assert changes.added_nodes == ["web", "app"]
+        assert changes.added_networks == [app]
+        assert changes.dns
+
+    def test_removed_network(self, infrastructure: Infrastructure):
+        parser = build_parser({"router": ["public"]})
+        parser.nodes = [plan_node("web", parser.networks[0], 10)]
+
+        changes = changes_controller.plan_changes(infrastructure, parser)
+
+        assert changes.operations == [
+            Operation("remove", "node", "db"),
+            Operation("remove", "node", "dns"),
+            # routers are disconnected from the removed networks
+            Operation("remove", "network", "192.168.1.0/24"),
+            Operation("update", "router", "router", "firewall rules"),
+        ]
+        assert [network.name for network in changes.removed_networks] == ["infra-server"]
+
+    def test_added_router(self, infrastructure: Infrastructure):
+        parser = build_parser({"router": ["public", "server"], "edge": ["public"]})
+
+        with pytest.raises(TemplateChangeError, match="added: \\['edge'\\]"):
+            changes_controller.plan_changes(infrastructure, parser)
+
+
+def test_template_name():
+    assert changes_controller.template_name("infra", "infra-web") == "web"
+    assert changes_controller.template_name("infra", "infra-web-dr-emu") == "web"
@@ -5,10 +5,33 @@ from unittest.mock import MagicMock
 import pytest
 from netaddr import IPNetwork, IPAddress
 from pytest_mock import MockerFixture
-
-from dr_emu.controllers.infrastructure import InfrastructureController
-from dr_emu.models import Infrastructure, Network, Interface, ImageState
+from sqlalchemy import inspect, select, func
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from dr_emu.controllers import template as template_controller, teardown
+from dr_emu.controllers.docker_host import HostState
+from dr_emu.controllers.infrastructure import InfrastructureController, ImageResolver
+from dr_emu.lib import docker_hosts
+from dr_emu.lib.exceptions import InfrastructureStateError
+from dr_emu.models import (
+    Base,
+    DockerHost,
+    Infrastructure,
+    Network,
+    Interface,
+    Image,
+    ImageState,
+    Router,
+    Attacker,
+    ServiceAttacker,
+    Node,
+    Run,
+    Template,
+)
+from parser.cyst_parser import parse_template
 from shared import constants
+from tests.unit.test_teardown import build_infrastructure
 
 
 @pytest.mark.asyncio
@@ -37,6 +60,13 @@ class TestInfrastructureController:
         infra.configure_mock(name="test_infra", networks=[network], volumes={AsyncMock()})
         return infra
 
+    @pytest.fixture()
+    def db_session(self, mocker: MockerFixture):
+        db_session = AsyncMock(add=Mock())
+        sessionmanager_mock = mocker.patch(f"{self.file_path}.sessionmanager")
+        sessionmanager_mock.session.return_value.__aenter__.return_value = db_session
+        return db_session
+
     @pytest.fixture(autouse=True)
     def controller(self, mocker: MockerFixture, infrastructure: Mock):
         mocker.patch(f"{self.file_path}.docker.from_env")
@@ -72,6 +102,45 @@ class TestInfrastructureController:
 
         assert asyncio_gather_spy.call_count == 3
 
+    async def test_reset(self, mocker: MockerFixture, infrastructure: Mock):
+        remove_mock = mocker.patch(f"{self.file_path}.teardown.remove_docker_objects")
+        configure_dns_mock = mocker.patch(f"{self.controller_path}.configure_dns")
+        service = AsyncMock(docker_id="service_id")
+        node = AsyncMock(group=None, docker_id="node_id", service_containers=[service])
+        node.name = "node"
+        volume = AsyncMock(docker_id=None)
+        volume.name = "volume"
+        router = AsyncMock()
+        infrastructure.configure_mock(nodes=[node], routers=[router], volumes={volume})
+
+        await self.controller.reset()
+
+        remove_mock.assert_awaited_once_with(
+            teardown.DockerIds(services=["service_id"], appliances=["node_id"], volumes=["volume"]),
+            docker_client=self.controller.client,
+        )
+        configure_dns_mock.assert_awaited_once_with([node])
+        volume.create.assert_awaited_once()
+        node.create.assert_awaited_once()
+        node.start.assert_awaited_once()
+        node.configure.assert_awaited_once()
+        router.start.assert_not_awaited()
+        router.configure.assert_not_awaited()
+        assert (node.docker_id, service.docker_id) == (None, None)
+
+    async def test_create_nodes(self, mocker: MockerFixture, infrastructure: Mock):
+        mocker.patch(f"{self.file_path}.settings.node_create_chunk_size", 2)
+        node = AsyncMock(group=None)
+        replicas = [AsyncMock(group="workstation") for _ in range(3)]
+        infrastructure.nodes = [node, *replicas]
+
+        await asyncio.gather(*await self.controller.create_nodes())
+
+        node.create.assert_awaited_once_with()
+        replicas[0]._create_host_config.assert_awaited_once()
+        for replica in replicas:
+            replica.create.assert_awaited_once_with(replicas[0]._create_host_config.return_value)
+
     async def test_change_ipaddresses(self, infrastructure: Mock, network: Mock):
         network.name = "testing"
         await self.controller.change_ipaddresses([IPNetwork("127.0.1.0/24")])
@@ -129,11 +198,11 @@ class TestInfrastructureController:
         create_management_network_mock.assert_awaited_once_with(IPNetwork("127.0.1.0/24"))
         assert infra_controller == infra_controller_mock
 
-    async def test_create_controller(self, mocker: MockerFixture):
+    async def test_create_controller(self, mocker: MockerFixture, db_session: AsyncMock):
         # Mocks for inputs
         parser_mock = AsyncMock()
-        db_session_mock = AsyncMock()
-        docker_client_mock = Mock()
+        db_session_mock = db_session
+        images_mock = Mock(ensure=AsyncMock())
         infrastructure_mock = Mock(supernet=IPNetwork("127.0.0.0/16"), name="test_infra")
         used_docker_networks = {Mock()}
         docker_container_names = {"container_name"}
@@ -144,15 +213,12 @@ class TestInfrastructureController:
         routers = [Mock()]
         nodes = [Mock(interfaces=[Mock(ipaddress="192.168.1.1")])]
         volumes = [Mock()]
-        images = [Mock(id="image_1"), Mock(id="image_2"), Mock(id="image_3")]
+        images = [Mock(id=f"image_{index}") for index in range(1, 4)]
         parser_mock.bake_models.return_value = (networks, routers, nodes, volumes, images)
 
         # Other mocks
         db_session_mock.delete = AsyncMock()
         db_session_mock.commit = AsyncMock()
-        ensure_image_exists_mock = mocker.patch(
-            f"{self.file_path}.InfrastructureController.ensure_image_exists", return_value=AsyncMock()
-        )
         generate_subnets_mock = mocker.patch(
             f"{self.file_path}.util.generate_infrastructure_subnets", return_value=Mock()
         )
@@ -162,6 +228,8 @@ class TestInfrastructureController:
         configure_dns_mock = mocker.patch.object(InfrastructureController, "configure_dns", return_value=AsyncMock())
         change_names_mock = mocker.patch.object(prepare_controller_mock.return_value, "change_names")
         logger_debug_mock = mocker.patch(f"{self.file_path}.logger.debug")
+        insert_new_mock = mocker.patch(f"{self.file_path}.bulk.insert_new")
+        load_node_files_mock = mocker.patch.object(InfrastructureController, "load_node_files")
 
         # Execute the method
         result = await InfrastructureController.create_controller(
@@ -170,21 +238,13 @@ class TestInfrastructureController:
             parser=parser_mock,
             docker_container_names=docker_container_names,
             docker_network_names=docker_network_names,
-            db_session=db_session_mock,
-            docker_client=docker_client_mock,
+            images=images_mock,
         )
 
         # Assertions
         parser_mock.bake_models.assert_awaited_once_with(db_session_mock, infrastructure_mock.name)
 
-        # TaskGroup validation
-        ensure_image_exists_mock.assert_has_calls(
-            [
-                call("image_1", docker_client_mock),
-                call("image_2", docker_client_mock),
-                call("image_3", docker_client_mock),
-            ]
-        )
+        images_mock.ensure.assert_has_calls([call(image.id, image.name) for image in images])
 
         # Validate deletion and commit upon exception (simulated as no exception occurs here)
         db_session_mock.delete.assert_not_awaited()
@@ -206,6 +266,10 @@ class TestInfrastructureController:
             "Docker names changed",
             infrastructure_name=infrastructure_mock.name,
         )
+        insert_new_mock.assert_awaited_once_with(db_session_mock)
+        db_session_mock.add.assert_called_once_with(infrastructure_mock)
+        db_session_mock.commit.assert_awaited_once()
+        load_node_files_mock.assert_awaited_once_with(nodes, db_session_mock)
 
         # Final result validation
         assert result == prepare_controller_mock.return_value
@@ -217,13 +281,12 @@ class TestInfrastructureController:
         docker_client_mock.networks.get.return_value = Mock(attrs={"IPAM": {"Config": [{"Subnet": "127.1.0.0/16"}]}})
         return docker_client_mock
 
-    async def test_build_infras(self, mocker: MockerFixture, docker_client_mock: Mock):
-        available_infra_supernet = IPNetwork("127.2.0.0/16")
-        db_session = AsyncMock()
+    async def test_build_infras(self, mocker: MockerFixture, docker_client_mock: Mock, db_session: AsyncMock):
         run_mock = AsyncMock()
         used_docker_network_names_mock = Mock()
         used_docker_container_names_mock = Mock()
         get_template_mock = mocker.patch(f"{self.file_path}.template_controller.get_template")
+        mocker.patch(f"{self.file_path}.docker_host_controller.list_hosts", return_value=[])
         mocker.patch(f"{self.file_path}.docker.from_env", return_value=docker_client_mock)
 
         get_container_names_mock = mocker.patch(
@@ -234,60 +297,337 @@ class TestInfrastructureController:
             f"{self.file_path}.util.get_network_names",
             side_effect=AsyncMock(return_value=used_docker_network_names_mock),
         )
-
-        get_available_networks_for_infras_mock = mocker.patch(
-            f"{self.file_path}.util.get_available_networks_for_infras",
-            return_value=available_infra_supernet,
-        )
         used_docker_networks = {
             IPNetwork(docker_client_mock.networks.get.return_value.attrs["IPAM"]["Config"][0]["Subnet"])
         }
-        controller_mock = AsyncMock()
-        infrastructure_mock = Mock(name="test_infra", supernet=available_infra_supernet, spec=Infrastructure)
-        create_controller_mock = mocker.patch(f"{self.controller_path}.create_controller", return_value=controller_mock)
+        infrastructures = [Mock(spec=Infrastructure, docker_host_id=None) for _ in range(3)]
+        allocate_mock = mocker.patch(f"{self.controller_path}.allocate_infrastructures", return_value=infrastructures)
+        instances = [Mock(), RuntimeError("failed"), Mock()]
+        build_instance_mock = mocker.patch(f"{self.controller_path}.build_instance", side_effect=instances)
+        template_images_mock = mocker.patch(f"{self.file_path}.docker_host_controller.template_images")
 
-        cyst_parser_mock = mocker.patch(f"{self.file_path}.CYSTParser", return_value=AsyncMock(networks_ips=["test"]))
-        infra_creation_mock = mocker.patch(f"{self.file_path}.Infrastructure", return_value=infrastructure_mock)
+        parser_mock = Mock(networks_ips=["test"])
+        process_pool_run_mock = mocker.patch(f"{self.file_path}.process_pool.run", return_value=parser_mock)
 
-        mocker.patch.object(cyst_parser_mock, "parse")
-        scalar_mock = MagicMock()
-        mocker.patch.object(db_session, "scalars", return_value=scalar_mock)
-        mocker.patch(f"{self.file_path}.select")
-        mocker.patch.object(scalar_mock, "all", return_value=[])
-        mocker.patch(f"{self.file_path}.randomname.generate", return_value="test_infra")
-
-        await self.controller.build_infra(run_mock, db_session)
+        results = await self.controller.build_infras(run_mock, 3, job_id=7)
 
+        assert results == instances
         get_container_names_mock.assert_awaited_once_with(docker_client_mock)
         get_network_names_mock.assert_awaited_once_with(docker_client_mock)
-        get_available_networks_for_infras_mock.assert_awaited_once_with(used_docker_networks, set())
         get_template_mock.assert_awaited_once_with(run_mock.template_id, db_session)
+        process_pool_run_mock.assert_awaited_once_with(parse_template, get_template_mock.return_value.description)
+        # without registered docker hosts, everything is placed on the local daemon
+        allocate_mock.assert_awaited_once_with(
+            3, used_docker_networks, 7, None, allocate_mock.call_args.args[4], template_images_mock.return_value
+        )
+        assert [state.host for state in allocate_mock.call_args.args[4]] == [None]
+
+        # the parse, docker state and image resolution are shared by all infrastructures
+        assert [call_args.args[1] for call_args in build_instance_mock.call_args_list] == infrastructures
+        images = build_instance_mock.call_args.args[6]
+        for call_args in build_instance_mock.call_args_list:
+            assert call_args.args == (
+                run_mock,
+                call_args.args[1],
+                parser_mock,
+                used_docker_networks,
+                used_docker_container_names_mock,
+                used_docker_network_names_mock,
+                images,
+                7,
+            )
+
+    async def test_build_infras_concurrency(self, mocker: MockerFixture, docker_client_mock: Mock, db_session):
+        mocker.patch(f"{self.file_path}.settings.run_start_concurrency", 2)
+        mocker.patch(f"{self.file_path}.docker.from_env", return_value=docker_client_mock)
+        mocker.patch(f"{self.file_path}.util.get_container_names")
+        mocker.patch(f"{self.file_path}.util.get_network_names")
+        mocker.patch(f"{self.file_path}.template_controller.get_template")
+        mocker.patch(f"{self.file_path}.docker_host_controller.list_hosts", return_value=[])
+        mocker.patch(f"{self.file_path}.docker_host_controller.template_images")
+        mocker.patch(f"{self.file_path}.process_pool.run")
+        infrastructures = [Mock(docker_host_id=None) for _ in range(5)]
+        mocker.patch(f"{self.controller_path}.allocate_infrastructures", return_value=infrastructures)
+        running, max_running = 0, 0
+
+        async def build_instance(*_):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        mocker.patch(f"{self.controller_path}.build_instance", side_effect=build_instance)
+
+        assert len(await self.controller.build_infras(AsyncMock(), 5)) == 5
+        assert max_running == 2
+
+    async def test_build_infras_docker_hosts(self, mocker: MockerFixture, db_session: AsyncMock):
+        hosts = [
+            DockerHost(id=1, name="first", url="tcp://first", capacity=4),
+            DockerHost(id=2, name="second", url="tcp://second", capacity=4),
+        ]
+        states = [
+            HostState(host, Mock(), networks={IPNetwork(f"10.{host.id}.0.0/16")}, container_names={host.name})
+            for host in hosts
+        ]
+        mocker.patch(f"{self.file_path}.docker_host_controller.list_hosts", return_value=hosts)
+        get_host_states_mock = mocker.patch(
+            f"{self.file_path}.docker_host_controller.get_host_states", return_value=states
+        )
+        mocker.patch(f"{self.file_path}.docker_host_controller.template_images")
+        mocker.patch(f"{self.file_path}.template_controller.get_template")
+        mocker.patch(f"{self.file_path}.process_pool.run")
+        allocate_mock = mocker.patch(
+            f"{self.controller_path}.allocate_infrastructures",
+            return_value=[Mock(docker_host_id=2), Mock(docker_host_id=1), Mock(docker_host_id=2)],
+        )
+        builds = []
+
+        async def build_instance(run, infrastructure, parser, networks, container_names, network_names, images, job):
+            builds.append((docker_hosts.current_host(), container_names, images))
+
+        mocker.patch(f"{self.controller_path}.build_instance", side_effect=build_instance)
+
+        await self.controller.build_infras(AsyncMock(), 3)
+
+        get_host_states_mock.assert_awaited_once_with(hosts)
+        assert allocate_mock.call_args.args[1] == {IPNetwork("10.1.0.0/16"), IPNetwork("10.2.0.0/16")}
+        # the infrastructures are built on their hosts, the images are resolved once per host
+        assert [(url, names) for url, names, _ in builds] == [
+            ("tcp://second", {"second"}),
+            ("tcp://first", {"first"}),
+            ("tcp://second", {"second"}),
+        ]
+        assert builds[0][2] is builds[2][2]
+        assert (builds[0][2].docker_client, builds[0][2].remote) == (states[1].client, True)
+
+    async def test_build_instance(self, mocker: MockerFixture, db_session: AsyncMock):
+        run_mock = Mock(id=1)
+        infrastructure_mock = Mock(spec=Infrastructure)
+        controller_mock = AsyncMock()
+        create_controller_mock = mocker.patch(f"{self.controller_path}.create_controller", return_value=controller_mock)
+        instance_creation_mock = mocker.patch(f"{self.file_path}.Instance")
+        build_snapshot_mock = mocker.patch(f"{self.controller_path}.build_snapshot")
+        parser_mock, images_mock = Mock(), Mock()
 
-        infra_creation_mock.assert_called_once_with(
-            routers=[],
-            nodes=[],
-            networks=[],
-            name="test_infra",
-            supernet=available_infra_supernet,
+        instance = await InfrastructureController.build_instance(
+            run_mock, infrastructure_mock, parser_mock, set(), set(), set(), images_mock, job_id=7
         )
-        create_controller_mock.assert_called_once_with(
-            infrastructure_mock,
-            used_docker_networks,
-            cyst_parser_mock.return_value,
-            used_docker_container_names_mock,
-            used_docker_network_names_mock,
-            db_session,
-            docker_client_mock,
+
+        create_controller_mock.assert_awaited_once_with(
+            infrastructure_mock, set(), parser_mock, set(), set(), images_mock
         )
+        controller_mock.build_infrastructure.assert_awaited_once_with()
+        instance_creation_mock.assert_called_once_with(run=run_mock, infrastructure=infrastructure_mock)
+        db_session.add.assert_called_with(instance_creation_mock.return_value)
+        # the Job counts the built instances
+        db_session.execute.assert_awaited_once()
+        build_snapshot_mock.assert_called_once_with(infrastructure_mock, run_mock.id)
+        assert infrastructure_mock.snapshot == build_snapshot_mock.return_value
+        assert instance == instance_creation_mock.return_value
+
+    async def test_build_instance_failure(self, mocker: MockerFixture, db_session: AsyncMock):
+        controller_mock = AsyncMock()
+        controller_mock.build_infrastructure.side_effect = RuntimeError("failed")
+        mocker.patch(f"{self.controller_path}.create_controller", return_value=controller_mock)
+        mocker.patch(f"{self.file_path}.blob_controller.delete_unreferenced_blobs")
+        infrastructure_mock = Mock(spec=Infrastructure)
+
+        with pytest.raises(RuntimeError):
+            await InfrastructureController.build_instance(
+                Mock(), infrastructure_mock, Mock(), set(), set(), set(), Mock()
+            )
+
+        db_session.delete.assert_awaited_once_with(infrastructure_mock)
 
     async def test_build_infrastructure_exception(self, mocker: MockerFixture, infrastructure: Mock):
-        instance_mock = mocker.patch(f"{self.file_path}.Instance")
-        run_mock = Mock()
-        db_session = AsyncMock()
         start_mock = mocker.patch.object(self.controller, "start", side_effect=Exception)
         stop_mock = mocker.patch.object(self.controller, "stop")
 
         with pytest.raises(Exception):
-            await self.controller.build_infrastructure(run_mock, db_session)
+            await self.controller.build_infrastructure()
 
         start_mock.assert_called_once()
+        stop_mock.assert_awaited_once()
+
+    async def test_build_snapshot(self):
+        network = Network(ipaddress=IPNetwork("10.0.0.0/24"), name="network", network_type="internal")
+        router_interface = Interface(
+            ipaddress=IPAddress("10.0.0.1"), original_ip=IPAddress("10.0.0.1"), network=network
+        )
+        attacker_interface = Interface(
+            ipaddress=IPAddress("10.0.0.10"), original_ip=IPAddress("10.1.0.10"), network=network
+        )
+        Router(name="router", interfaces=[router_interface])
+        service = ServiceAttacker(name="worker", environment={"CRYTON_WORKER_NAME": "worker_1"})
+        attacker = Attacker(name="attacker", interfaces=[attacker_interface], service_containers=[service])
+        infrastructure = Infrastructure(id=1, name="test_infra", networks=[network], nodes=[attacker])
+
+        assert InfrastructureController.build_snapshot(infrastructure, 2) == {
+            "id": 1,
+            "name": "test_infra",
+            "run_id": 2,
+            "networks": [
+                {
+                    "name": "network",
+                    "ip": "10.0.0.0/24",
+                    "appliances": [
+                        {"name": "router", "ip": "10.0.0.1", "original_ip": "10.0.0.1"},
+                        {"name": "attacker", "ip": "10.0.0.10", "original_ip": "10.1.0.10"},
+                    ],
+                }
+            ],
+            "attackers": {"attacker": "worker_1"},
+        }
+
+
+@pytest.mark.asyncio
+class TestTemplateController:
+    @pytest.fixture()
+    async def db_session(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+            yield session
+
+        await engine.dispose()
+
+    async def test_template_description(self, db_session):
+        description = '[{"id": "node"}]' * 100
+        template = await template_controller.create_template("test", description, db_session)
+        db_session.expunge_all()
+
+        assert template.size == len(description)
+        assert len(template._description) < template.size
+
+        listed = (await template_controller.list_templates(db_session, name="test"))[0]
+        assert "_description" in inspect(listed).unloaded
+        assert listed.digest == template.digest
+        db_session.expunge_all()
+
+        assert (await template_controller.get_template(template.id, db_session)).description == description
+
+
+@pytest.mark.asyncio
+class TestInfrastructureAllocation:
+    file_path = "dr_emu.controllers.infrastructure"
+
+    @pytest.fixture()
+    async def db_session(self, mocker: MockerFixture):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        mocker.patch(f"{self.file_path}.sessionmanager.session", sessions)
+        async with sessions() as session:
+            yield session
+
+        await engine.dispose()
+
+    async def test_allocate_infrastructures(self, db_session, mocker: MockerFixture):
+        db_session.add(Infrastructure(name="used", supernet=IPNetwork("10.0.0.0/16")))
+        await db_session.commit()
+        # name collisions with existing and with each other are generated again
+        names = iter(["used", "first", "first", "second", "third"])
+        mocker.patch(f"{self.file_path}.randomname.generate", side_effect=lambda *_: next(names))
+
+        infrastructures = await InfrastructureController.allocate_infrastructures(
+            3, {IPNetwork("10.1.0.0/16")}, job_id=None
+        )
+
+        assert {infrastructure.name for infrastructure in infrastructures} == {"first", "second", "third"}
+        assert [infrastructure.supernet for infrastructure in infrastructures] == [
+            IPNetwork("10.2.0.0/16"),
+            IPNetwork("10.3.0.0/16"),
+            IPNetwork("10.4.0.0/16"),
+        ]
+        assert all(infrastructure.id is not None for infrastructure in infrastructures)
+
+    async def test_allocate_too_many_infrastructures(self, db_session):
+        with pytest.raises(RuntimeError):
+            await InfrastructureController.allocate_infrastructures(constants.MAX_RUN_INSTANCES + 1, set())
+
+    async def test_allocate_on_docker_hosts(self, db_session):
+        host = DockerHost(name="host", url="tcp://10.10.0.1:2375", capacity=2)
+        db_session.add(host)
+        await db_session.commit()
+        states = [HostState(host, Mock())]
+
+        infrastructures = await InfrastructureController.allocate_infrastructures(2, set(), hosts=states)
+
+        assert [infrastructure.docker_host_id for infrastructure in infrastructures] == [host.id, host.id]
+        # nothing is allocated once the host is full
+        with pytest.raises(RuntimeError, match="free capacity"):
+            await InfrastructureController.allocate_infrastructures(1, set(), hosts=states)
+        assert await db_session.scalar(select(func.count(Infrastructure.id))) == 2
+
+    async def test_reset_infra(self, db_session, mocker: MockerFixture):
+        run = Run(name="run", template=Template(name="template", description=""))
+        infrastructure = build_infrastructure("first", 1, run, 2)
+        db_session.add(infrastructure)
+        await db_session.commit()
+
+        async def reset(controller: InfrastructureController):
+            for node in controller.infrastructure.nodes:
+                assert node.files[0].blob.contents == b""
+                assert node.service_containers[0].parent_node is node
+                assert node.interfaces[0].network.name == "first_network"
+                assert [volume.name for volume in controller.infrastructure.volumes] == ["first_volume"]
+                assert node.service_containers[0].dependencies[0].dependency is node.service_containers[1]
+                node.docker_id = f"{node.name}_new_id"
+
+        mocker.patch(f"{self.file_path}.docker.from_env")
+        mocker.patch(f"{self.file_path}.InfrastructureController.reset", reset)
+
+        await InfrastructureController.reset_infra(infrastructure.id)
+
+        docker_ids = await db_session.scalars(select(Node.docker_id).order_by(Node.id))
+        assert list(docker_ids) == ["first_node_0_new_id", "first_node_1_new_id"]
+
+    async def test_reset_unfinished_infra(self, db_session):
+        infrastructure = Infrastructure(name="unfinished")
+        db_session.add(infrastructure)
+        await db_session.commit()
+
+        with pytest.raises(InfrastructureStateError):
+            await InfrastructureController.reset_infra(infrastructure.id)
+        with pytest.raises(NoResultFound):
+            await InfrastructureController.reset_infra(infrastructure.id + 1)
+
+    async def test_ensure_image_exists(self, db_session, mocker: MockerFixture):
+        get_mock = mocker.patch(f"{self.file_path}.util.get_image")
+        wait_mock = mocker.patch(f"{self.file_path}.image_controller.wait_until_image_is_ready")
+        image = Image(services=set(), name="image")
+        db_session.add(image)
+        await db_session.commit()
+
+        # builds of other processes would see the same state
+        await asyncio.gather(*(InfrastructureController.ensure_image_exists(image.id, Mock()) for _ in range(2)))
+
+        assert (get_mock.await_count, wait_mock.await_count) == (1, 1)
+        await db_session.refresh(image)
+        assert image.state is ImageState.building
+
+    async def test_image_resolver(self, mocker: MockerFixture):
+        ensure_mock = mocker.patch(f"{self.file_path}.InfrastructureController.ensure_image_exists")
+        images = ImageResolver(Mock())
+
+        await asyncio.gather(images.ensure(1, "image"), images.ensure(1, "image"), images.ensure(2, "other"))
+
+        assert ensure_mock.await_count == 2
+
+    async def test_image_resolver_remote(self, mocker: MockerFixture):
+        ensure_mock = mocker.patch(f"{self.file_path}.InfrastructureController.ensure_image_exists")
+        copy_mock = mocker.patch(f"{self.file_path}.docker_host_controller.copy_image")
+        local_client_mock = mocker.patch(f"{self.file_path}.docker_hosts.get_client")
+        docker_client = Mock()
+
+        await ImageResolver(docker_client, remote=True).ensure(1, "image")
+
+        # the image is pulled or built by the local daemon and copied to the host
+        ensure_mock.assert_awaited_once_with(1, local_client_mock.return_value)
+        copy_mock.assert_awaited_once_with("image", docker_client)
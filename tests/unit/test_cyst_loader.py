@@ -0,0 +1,181 @@
+import json
+
+import pytest
+from cyst.api.network.firewall import FirewallPolicy
+from netaddr import IPAddress, IPNetwork
+from pytest_mock import MockerFixture
+
+from dr_emu.lib.exceptions import UnsupportedConfiguration
+from parser.cyst_parser import CYSTParser
+from parser.lib.cyst_loader import load_configuration
+from parser.lib.simple_models import (
+    RouterDescription,
+    NodeDescription,
+    ExploitDescription,
+    InterfaceDescription,
+    PassiveServiceDescription,
+    DataDescription,
+)
+
+
+def ip_address(ip: str) -> dict:
+    return {"py/object": "netaddr.ip.IPAddress", "py/state": {"py/tuple": [int(IPAddress(ip)), 4]}}
+
+
+def ip_network(net: str) -> dict:
+    network = IPNetwork(net)
+    return {
+        "py/object": "netaddr.ip.IPNetwork",
+        "py/state": {"py/tuple": [int(network.ip), network.prefixlen, 4]},
+    }
+
+
+def interface(ip: str, net: str) -> dict:
+    return {
+        "py/object": "cyst.api.configuration.network.elements.InterfaceConfig",
+        "ip": ip_address(ip),
+        "net": ip_network(net),
+        "index": -1,
+        "id": f"interface_{ip}",
+    }
+
+
+@pytest.fixture()
+def router() -> dict:
+    return {
+        "py/object": "cyst.api.configuration.network.router.RouterConfig",
+        "interfaces": [interface("127.0.0.1", "127.0.0.0/24")],
+        "traffic_processors": [
+            {
+                "py/object": "cyst.api.configuration.network.firewall.FirewallConfig",
+                "chains": [
+                    {
+                        "py/object": "cyst.api.configuration.network.firewall.FirewallChainConfig",
+                        "rules": [
+                            {
+                                "py/object": "cyst.api.network.firewall.FirewallRule",
+                                "src_net": ip_network("127.0.0.0/24"),
+                                "dst_net": ip_network("127.0.1.0/24"),
+                                "service": "*",
+                                "policy": {
+                                    "py/reduce": [
+                                        {"py/type": "cyst.api.network.firewall.FirewallPolicy"},
+                                        {"py/tuple": [{"py/tuple": [0]}]},
+                                    ]
+                                },
+                            }
+                        ],
+                    }
+                ],
+            }
+        ],
+        "routing_table": [],
+        "id": "perimeter_router",
+    }
+
+
+@pytest.fixture()
+def node() -> dict:
+    return {
+        "py/object": "cyst.api.configuration.network.node.NodeConfig",
+        "active_services": [],
+        "passive_services": [
+            {
+                "py/object": "cyst.api.configuration.host.service.PassiveServiceConfig",
+                "name": "mysql",
+                "version": "8.0.31",
+                "private_data": [
+                    {"py/object": "cyst.api.configuration.logic.data.DataConfig", "id": "/tmp/a", "description": "a"}
+                ],
+                "id": "mysql_service",
+            }
+        ],
+        "interfaces": [interface("127.0.0.2", "127.0.0.0/24")],
+        "id": "database_node",
+    }
+
+
+@pytest.fixture()
+def exploit() -> dict:
+    return {
+        "py/object": "cyst.api.configuration.logic.exploit.ExploitConfig",
+        "services": [
+            {
+                "py/object": "cyst.api.configuration.logic.exploit.VulnerableServiceConfig",
+                "service": "mysql",
+                "min_version": "8.0.0",
+                "max_version": "8.0.31",
+            }
+        ],
+        "id": "mysql_exploit",
+    }
+
+
+class TestCYSTLoader:
+    def test_load_configuration(self, router: dict, node: dict, exploit: dict):
+        connection = {"py/object": "cyst.api.configuration.network.elements.ConnectionConfig", "id": "connection"}
+
+        router_description, node_description, exploit_description = load_configuration(
+            json.dumps([router, node, connection, exploit])
+        )
+
+        assert isinstance(router_description, RouterDescription)
+        assert router_description.id == "perimeter_router"
+        assert router_description.interfaces == [
+            InterfaceDescription(IPAddress("127.0.0.1"), IPNetwork("127.0.0.0/24"))
+        ]
+        rule = router_description.traffic_processors[0].chains[0].rules[0]
+        assert (rule.src_net, rule.dst_net, rule.service) == (
+            IPNetwork("127.0.0.0/24"),
+            IPNetwork("127.0.1.0/24"),
+            "*",
+        )
+        assert rule.policy is FirewallPolicy.ALLOW
+
+        assert isinstance(node_description, NodeDescription)
+        assert node_description.passive_services == [
+            PassiveServiceDescription("mysql", "8.0.31", [DataDescription("/tmp/a", "a")])
+        ]
+
+        assert isinstance(exploit_description, ExploitDescription)
+        assert exploit_description.services[0].service == "mysql"
+
+    def test_load_configuration_references(self, node: dict):
+        service = node["passive_services"][0]
+        node["passive_services"] = [service["id"]]
+
+        node_description = load_configuration(json.dumps([node, service]))[0]
+
+        assert node_description.passive_services[0].name == "mysql"
+
+    @pytest.mark.parametrize(
+        "description",
+        [
+            "not json",
+            json.dumps({"py/object": "cyst.api.configuration.network.node.NodeConfig"}),
+            json.dumps(
+                [{"py/object": "cyst.api.configuration.network.node.NodeConfig", "id": "node", "interfaces": ["x"]}]
+            ),
+            json.dumps([{"py/object": "cyst.api.configuration.network.node.NodeConfig", "passive_services": []}]),
+        ],
+    )
+    def test_load_configuration_unsupported(self, description: str):
+        with pytest.raises(UnsupportedConfiguration):
+            load_configuration(description)
+
+    def test_load_configuration_enum_not_allowed(self, router: dict):
+        rule = router["traffic_processors"][0]["chains"][0]["rules"][0]
+        rule["policy"]["py/reduce"][0]["py/type"] = "os.system"
+
+        with pytest.raises(UnsupportedConfiguration):
+            load_configuration(json.dumps([router]))
+
+    def test_load_infrastructure_description_fallback(self, mocker: MockerFixture):
+        mocker.patch("parser.cyst_parser.load_configuration", side_effect=UnsupportedConfiguration)
+        environment_mock = mocker.patch("parser.cyst_parser.Environment")
+
+        result = CYSTParser._load_infrastructure_description("description")
+
+        load_mock = environment_mock.create.return_value.configuration.general.load_configuration
+        load_mock.assert_called_once_with("description")
+        assert result == load_mock.return_value
@@ -6,11 +6,13 @@ from unittest.mock import AsyncMock, Mock, call, MagicMock
 
 from shared import constants
 from parser.cyst_parser import CYSTParser
-from parser.lib.simple_models import Network, Node, Service, ServiceContainer, NodeType
+from parser.lib.simple_models import Network, Node, Service, ServiceContainer, NodeType, Interface, NodeDescription, \
+    InterfaceDescription, Volume
 from cyst.api.configuration import NodeConfig, RouterConfig, PassiveServiceConfig, ExploitConfig, \
     VulnerableServiceConfig, ActiveServiceConfig, InterfaceConfig
 from netaddr import IPAddress, IPNetwork
 from parser.lib import containers
+from shared.classes import FileDescription
 
 
 @pytest.fixture()
@@ -115,7 +117,10 @@ class TestCYSTParser:
 
     async def test_parse_nodes(self, mocker: MockerFixture):
         # Create parser mock and setup attributes
-        self.parser._find_network = AsyncMock(return_value=Mock())
+        network = Network(
+            "network", constants.NETWORK_TYPE_INTERNAL, IPNetwork("192.168.1.0/24"), IPAddress("192.168.1.254")
+        )
+        self.parser._find_network = AsyncMock(return_value=network)
         services_mock = [Mock(spec=Service), Mock(spec=Service)]
         self.parser._parse_services = AsyncMock(return_value=services_mock)
         self.parser.create_image = AsyncMock(return_value="image_id")
@@ -169,6 +174,121 @@ class TestCYSTParser:
         assert self.parser.nodes[1].name == "node2"
         assert self.parser.nodes[1].image == "image_id"
         assert self.parser.nodes[1].type == NodeType.DEFAULT
+        assert self.parser.nodes[1].interfaces == [Interface(IPAddress("192.168.1.2"), network)]
+        assert self.parser.nodes[1].replicas == 1
+
+    async def test_parse_nodes_inject_data_files(self, mocker: MockerFixture):
+        mocker.patch(f"{self.path}.settings.inject_data_files", True)
+        mocker.patch(f"{self.path}.cif.available_services", return_value=[])
+        self.parser._find_network = AsyncMock(return_value=Mock())
+        self.parser._get_vulnerable_services = AsyncMock(return_value=[])
+        data_config = Mock(id="/tmp/data", description="contents")
+
+        async def parse_services(node_services, data_configs, vulnerable_services):
+            data_configs.append(data_config)
+            return []
+
+        self.parser._parse_services = parse_services
+        self.parser.create_image = AsyncMock(return_value="image_id")
+        cyst_node = Mock(spec=NodeConfig, id="node", interfaces=[], active_services=[], passive_services=[])
+
+        await self.parser._parse_nodes([cyst_node], [])
+
+        self.parser.create_image.assert_awaited_once_with(
+            services=[], data_configurations=[], available_cif_services=[]
+        )
+        assert self.parser.nodes[0].data == {FileDescription(contents="contents", image_file_path="/tmp/data")}
+
+    @pytest.fixture()
+    def parse_replicas(self, mocker: MockerFixture):
+        mocker.patch(f"{self.path}.cif.available_services", return_value=[])
+        network = Network(
+            "network", constants.NETWORK_TYPE_INTERNAL, IPNetwork("192.168.1.0/24"), IPAddress("192.168.1.1")
+        )
+        self.parser.networks = [network]
+        self.parser._get_vulnerable_services = AsyncMock(return_value=[])
+        self.parser._parse_services = AsyncMock(return_value=[])
+        self.parser.create_image = AsyncMock(return_value="image_id")
+
+        async def parse(ip: str, replicas: int):
+            node = NodeDescription(
+                id="workstation",
+                interfaces=[InterfaceDescription(IPAddress(ip), IPNetwork("192.168.1.0/24"))],
+                replicas=replicas,
+            )
+            await self.parser._parse_nodes([node], [])
+
+        return parse
+
+    async def test_parse_nodes_replicas(self, parse_replicas):
+        await parse_replicas("192.168.1.250", 5)
+
+        assert self.parser.nodes[0].replicas == 5
+        assert self.parser.nodes[0].interfaces[0].ip == IPAddress("192.168.1.250")
+
+    @pytest.mark.parametrize(
+        "ip, replicas",
+        [
+            ("192.168.1.250", 6),  # the last replica gets the broadcast address
+            ("192.168.1.250", 10),  # the replicas spill past the subnet
+            ("192.168.1.10", 0),
+            ("192.168.1.10", -1),
+        ],
+    )
+    async def test_parse_nodes_invalid_replicas(self, parse_replicas, ip: str, replicas: int):
+        with pytest.raises(RuntimeError):
+            await parse_replicas(ip, replicas)
+
+        assert self.parser.nodes == []
+
+    async def test_expand_replicas(self, network: Mock):
+        node = Node(image=Mock(), name="workstation", interfaces=[Interface(IPAddress("127.0.0.10"), network)])
+        node.replicas = 3
+        server = Node(image=Mock(), name="server", interfaces=[Interface(IPAddress("127.0.0.5"), network)])
+        self.parser.nodes = [server, node]
+
+        expanded = [(replica.name, replica.interfaces[0].ip, group) for replica, group in self.parser.expand_replicas()]
+
+        assert expanded == [
+            ("server", IPAddress("127.0.0.5"), None),
+            ("workstation-1", IPAddress("127.0.0.10"), "workstation"),
+            ("workstation-2", IPAddress("127.0.0.11"), "workstation"),
+            ("workstation-3", IPAddress("127.0.0.12"), "workstation"),
+        ]
+
+    async def test_expand_replicas_volumes(self, network: Mock):
+        volume = Volume(name="data", bind="/data")
+        service = ServiceContainer(image=Mock(), volumes=[volume])
+        node = Node(
+            image=Mock(),
+            name="workstation",
+            interfaces=[Interface(IPAddress("127.0.0.10"), network)],
+            volumes=[volume],
+            service_containers=[service],
+        )
+        node.replicas = 2
+        self.parser.nodes = [node]
+
+        replicas = [replica for replica, _ in self.parser.expand_replicas()]
+
+        assert [replica.volumes for replica in replicas] == [
+            [Volume(name="data-1", bind="/data")],
+            [Volume(name="data-2", bind="/data")],
+        ]
+        assert replicas[0].volumes[0] is not replicas[1].volumes[0]
+        assert [replica.service_containers[0].volumes for replica in replicas] == [
+            replica.volumes for replica in replicas
+        ]
+        assert node.volumes == [volume] and service.volumes == [volume]
+
+    async def test_expand_replicas_address_collision(self, network: Mock):
+        node = Node(image=Mock(), name="workstation", interfaces=[Interface(IPAddress("127.0.0.4"), network)])
+        node.replicas = 3
+        server = Node(image=Mock(), name="server", interfaces=[Interface(IPAddress("127.0.0.5"), network)])
+        self.parser.nodes = [server, node]
+
+        with pytest.raises(RuntimeError):
+            list(self.parser.expand_replicas())
 
     async def test_parse_services(self, mocker: MockerFixture):
         exploits = [PassiveServiceConfig("test_type", "test_type", "1.2.3", False, Mock())]
@@ -0,0 +1,236 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+from docker.errors import DockerException, ImageNotFound
+from pytest_mock import MockerFixture
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from dr_emu.controllers import docker_host as docker_host_controller
+from dr_emu.controllers.docker_host import HostState
+from dr_emu.lib import docker_hosts
+from dr_emu.lib.exceptions import DockerHostStateError, DockerHostUnreachable
+from dr_emu.models import Base, DockerHost, Infrastructure, Network, utc_now
+from parser.lib import simple_models, containers
+
+
+@pytest.fixture()
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+
+    await engine.dispose()
+
+
+@pytest.fixture()
+def clients(mocker: MockerFixture) -> dict[str | None, Mock]:
+    """
+    Fake docker daemons, one client per URL.
+    """
+    fakes: dict[str | None, Mock] = {}
+    mocker.patch(f"{docker_hosts.__name__}.get_client", side_effect=lambda url=None: fakes.setdefault(url, Mock()))
+    return fakes
+
+
+async def add_hosts(db_session: AsyncSession, *capacities: int) -> list[DockerHost]:
+    hosts = [
+        DockerHost(name=f"host_{index}", url=f"tcp://10.10.0.{index}:2375", capacity=capacity)
+        for index, capacity in enumerate(capacities)
+    ]
+    db_session.add_all(hosts)
+    await db_session.commit()
+    return hosts
+
+
+def add_infrastructures(db_session: AsyncSession, host: DockerHost, count: int, built: bool = True) -> None:
+    db_session.add_all(
+        Infrastructure(
+            name=f"{host.name}_{'built' if built else 'building'}_{index}",
+            docker_host_id=host.id,
+            pooled_at=utc_now() if built else None,
+        )
+        for index in range(count)
+    )
+
+
+def test_use_host(mocker: MockerFixture):
+    client_mock = mocker.patch(f"{docker_hosts.__name__}.DockerClient")
+    from_env_mock = mocker.patch(f"{docker_hosts.__name__}.docker.from_env")
+
+    assert docker_hosts.current_client() == from_env_mock.return_value
+    with docker_hosts.use_host("tcp://10.10.0.1:2375"):
+        assert docker_hosts.current_host() == "tcp://10.10.0.1:2375"
+        # models created in the block use the client of the host
+        assert Network(name="network").client == client_mock.return_value
+        assert docker_hosts.get_client("tcp://10.10.0.1:2375") is docker_hosts.current_client()
+    assert docker_hosts.current_host() is None
+
+    client_mock.assert_called_once_with(base_url="tcp://10.10.0.1:2375")
+    docker_hosts.close_client("tcp://10.10.0.1:2375")
+    client_mock.return_value.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_use_host_tasks():
+    async def current() -> str | None:
+        await asyncio.sleep(0)
+        return docker_hosts.current_host()
+
+    async def build(url: str) -> str | None:
+        with docker_hosts.use_host(url):
+            return await asyncio.create_task(current())
+
+    # concurrent builds on different hosts don't see each other's host
+    assert await asyncio.gather(build("tcp://first"), build("tcp://second"), current()) == [
+        "tcp://first",
+        "tcp://second",
+        None,
+    ]
+
+
+@pytest.mark.asyncio
+class TestDockerHostController:
+    async def test_create_host(self, db_session: AsyncSession, clients):
+        host = await docker_host_controller.create_host("first", "tcp://10.10.0.1:2375", 8, db_session)
+
+        clients["tcp://10.10.0.1:2375"].ping.assert_called_once_with()
+        assert (host.id, host.enabled) == (1, True)
+        with pytest.raises(DockerHostStateError):
+            await docker_host_controller.create_host("second", "tcp://10.10.0.1:2375", 8, db_session)
+
+    async def test_create_unreachable_host(self, db_session: AsyncSession, clients, mocker: MockerFixture):
+        clients["tcp://10.10.0.1:2375"] = Mock(ping=Mock(side_effect=DockerException("connection refused")))
+        mocker.patch(f"{docker_hosts.__name__}.close_client")
+
+        with pytest.raises(DockerHostUnreachable):
+            await docker_host_controller.create_host("first", "tcp://10.10.0.1:2375", 8, db_session)
+
+        assert await docker_host_controller.list_hosts(db_session) == []
+
+    async def test_delete_host(self, db_session: AsyncSession, mocker: MockerFixture):
+        close_mock = mocker.patch(f"{docker_hosts.__name__}.close_client")
+        used, unused = await add_hosts(db_session, 4, 4)
+        add_infrastructures(db_session, used, 1)
+        await db_session.commit()
+
+        with pytest.raises(DockerHostStateError):
+            await docker_host_controller.delete_host(used.id, db_session)
+        await docker_host_controller.delete_host(unused.id, db_session)
+
+        assert await docker_host_controller.list_hosts(db_session) == [used]
+        close_mock.assert_called_once_with(unused.url)
+
+    async def test_get_load(self, db_session: AsyncSession):
+        first, second = await add_hosts(db_session, 4, 4)
+        add_infrastructures(db_session, first, 2)
+        add_infrastructures(db_session, first, 1, built=False)
+        await db_session.commit()
+
+        load = await docker_host_controller.get_load([first.id, second.id], db_session)
+
+        assert load == {
+            first.id: docker_host_controller.HostLoad(infrastructures=3, building=1),
+            second.id: docker_host_controller.HostLoad(),
+        }
+
+    async def test_get_capacity(self, db_session: AsyncSession, mocker: MockerFixture):
+        mocker.patch(f"{docker_host_controller.__name__}.settings.max_infrastructures", 10)
+        assert await docker_host_controller.get_capacity(db_session) == 10
+
+        _, disabled = await add_hosts(db_session, 4, 8)
+        disabled.enabled = False
+        await db_session.commit()
+
+        assert await docker_host_controller.get_capacity(db_session) == 4
+
+    async def test_get_host_states(self, clients, mocker: MockerFixture):
+        mocker.patch(f"{docker_host_controller.__name__}.settings.ignore_management_network", True)
+        first = DockerHost(name="first", url="tcp://first", capacity=4)
+        second = DockerHost(name="second", url="tcp://second", capacity=4)
+        clients["tcp://first"] = Mock(
+            networks=Mock(list=Mock(return_value=[])),
+            containers=Mock(list=Mock(return_value=[])),
+            images=Mock(list=Mock(return_value=[Mock(tags=["nginx:latest", "cif_base:latest"])])),
+        )
+        clients["tcp://second"] = Mock(networks=Mock(list=Mock(side_effect=DockerException("unreachable"))))
+
+        states = await docker_host_controller.get_host_states([first, second])
+
+        # the unreachable host is left out
+        assert [state.host for state in states] == [first]
+        assert states[0].images == {"nginx:latest", "cif_base:latest"}
+        with pytest.raises(RuntimeError, match="No docker host"):
+            await docker_host_controller.get_host_states([second])
+
+
+@pytest.mark.asyncio
+class TestPlacement:
+    async def test_without_hosts(self, db_session: AsyncSession):
+        placement = await docker_host_controller.place_infrastructures(2, [HostState(None, Mock())], set(), db_session)
+
+        assert placement == [None, None]
+
+    async def test_free_capacity(self, db_session: AsyncSession, mocker: MockerFixture):
+        mocker.patch(f"{docker_host_controller.__name__}.settings.placement_build_weight", 0)
+        full, free = await add_hosts(db_session, 10, 10)
+        add_infrastructures(db_session, full, 8)
+        await db_session.commit()
+        states = [HostState(full, Mock()), HostState(free, Mock())]
+
+        placement = await docker_host_controller.place_infrastructures(10, states, set(), db_session)
+
+        # the free host gets infrastructures until it has the same free share as the other one
+        assert placement.count(free) == 9
+        assert placement.count(full) == 1
+        with pytest.raises(RuntimeError, match="free capacity for 12 of 13"):
+            await docker_host_controller.place_infrastructures(13, states, set(), db_session)
+
+    async def test_cached_images(self, db_session: AsyncSession):
+        first, second = await add_hosts(db_session, 10, 10)
+        states = [HostState(first, Mock()), HostState(second, Mock(), images={"nginx:latest"})]
+
+        placement = await docker_host_controller.place_infrastructures(2, states, {"nginx:latest"}, db_session)
+
+        assert placement == [second, second]
+
+    async def test_build_load(self, db_session: AsyncSession):
+        building, built = await add_hosts(db_session, 10, 10)
+        add_infrastructures(db_session, building, 3, built=False)
+        add_infrastructures(db_session, built, 3)
+        await db_session.commit()
+        states = [HostState(building, Mock()), HostState(built, Mock())]
+
+        placement = await docker_host_controller.place_infrastructures(1, states, set(), db_session)
+
+        assert placement == [built]
+
+
+def test_template_images():
+    parser = Mock(
+        routers=[simple_models.Router(image=containers.IMAGE_DEFAULT, name="router")],
+        nodes=[
+            simple_models.Node(
+                image=simple_models.Image("dr_emu_generated"),
+                name="node",
+                service_containers=[simple_models.ServiceContainer(image=simple_models.Image("nginx", pull=True))],
+            )
+        ],
+    )
+
+    assert docker_host_controller.template_images(parser) == {containers.IMAGE_DEFAULT.name, "nginx"}
+
+
+@pytest.mark.asyncio
+async def test_copy_image(clients):
+    target = Mock()
+    target.images.get.side_effect = [ImageNotFound("missing"), Mock()]
+
+    await docker_host_controller.copy_image("nginx", target)
+    await docker_host_controller.copy_image("nginx", target)
+
+    target.images.load.assert_called_once_with(clients[None].api.get_image.return_value)
+    clients[None].api.get_image.assert_called_once_with("nginx")
@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from dr_emu.lib import events
+from dr_emu.lib.events import BuildEvent, EventBus
+
+
+@pytest.fixture()
+def bus(mocker: MockerFixture) -> EventBus:
+    return mocker.patch(f"{events.__name__}.bus", EventBus())
+
+
+def test_batch_payloads(mocker: MockerFixture):
+    mocker.patch(f"{events.__name__}.MAX_PAYLOAD_SIZE", 400)
+    build_events = [BuildEvent(1, 2, events.CREATE, events.FINISHED, f"node_{index}", "infra") for index in range(10)]
+
+    payloads = events.batch_payloads(build_events)
+
+    assert len(payloads) > 1
+    assert all(len(payload) <= 400 for payload in payloads)
+    assert [event for payload in payloads for event in events.decode(payload)] == build_events
+
+
+@pytest.mark.asyncio
+class TestEvents:
+    async def test_emit(self, bus: EventBus):
+        with bus.subscribe(1) as queue, bus.subscribe(2) as other_queue:
+            events.emit(events.BUILD, events.STARTED)
+            with events.build_scope(1, 3):
+                events.emit(events.NETWORK, events.FAILED, "network", "infra", "x" * 2000)
+
+        event = queue.get_nowait()
+        assert (event.run_id, event.job_id, event.phase, event.status) == (1, 3, events.NETWORK, events.FAILED)
+        assert event.name == "network"
+        assert len(event.detail) == events.MAX_DETAIL_LENGTH
+        assert queue.empty() and other_queue.empty()
+
+    async def test_full_queue(self, bus: EventBus, mocker: MockerFixture):
+        mocker.patch(f"{events.__name__}.settings.build_events_queue_size", 1)
+        with bus.subscribe(1) as queue, events.build_scope(1):
+            events.emit(events.BUILD, events.STARTED)
+            events.emit(events.BUILD, events.FINISHED)
+
+            assert queue.qsize() == 1
+
+    async def test_track(self, bus: EventBus):
+        with bus.subscribe(1) as queue, events.build_scope(1):
+            assert await events.track(events.START, "node", asyncio.sleep(0, "result"), "infra") == "result"
+            with pytest.raises(RuntimeError):
+                await events.track(events.START, "router", AsyncMock(side_effect=RuntimeError("failed"))(), "infra")
+
+        assert [(event.name, event.status) for event in (queue.get_nowait(), queue.get_nowait())] == [
+            ("node", events.FINISHED),
+            ("router", events.FAILED),
+        ]
+
+    async def test_stream(self, bus: EventBus, mocker: MockerFixture):
+        mocker.patch(f"{events.__name__}.settings.build_events_keepalive", 0.01)
+        stream = events.stream(1)
+
+        assert await anext(stream) == ": connected\n\n"
+        assert await anext(stream) == ": keepalive\n\n"
+        with events.build_scope(1):
+            events.emit(events.BUILD, events.FINISHED, infrastructure="infra")
+        event, data = (await anext(stream)).splitlines()[:2]
+        assert event == "event: finished"
+        assert json.loads(data.removeprefix("data: "))["infrastructure"] == "infra"
+
+        await stream.aclose()
+        assert not bus._subscribers
+
+    async def test_progress(self, bus: EventBus):
+        with bus.subscribe(1) as queue:
+            with events.build_scope(1):
+                report = events.progress(events.IMAGE, "image")
+            # reported from a thread outside the build scope, the second report is throttled
+            await asyncio.to_thread(lambda: [report("layer: Downloading"), report("layer: Extracting")])
+            await asyncio.sleep(0)
+
+            event = queue.get_nowait()
+            assert (event.phase, event.status, event.name, event.detail) == (
+                events.IMAGE,
+                events.PROGRESS,
+                "image",
+                "layer: Downloading",
+            )
+            assert queue.empty()
+
+    async def test_relay(self, bus: EventBus):
+        connection = AsyncMock()
+
+        @contextlib.asynccontextmanager
+        async def connect():
+            yield connection
+
+        relay = events.NotificationRelay(connect)
+        bus.add_sink(relay.push)
+        with events.build_scope(1):
+            events.emit(events.BUILD, events.STARTED)
+        bus.remove_sink(relay.push)
+
+        await relay.flush()
+        await relay.flush()
+
+        connection.execute.assert_awaited_once()
+        assert not relay.pending
+
+    async def test_receive(self, bus: EventBus):
+        event = BuildEvent(1, None, events.IMAGE, events.FINISHED, "image")
+        with bus.subscribe(1) as queue:
+            events.receive(events.batch_payloads([event])[0])
+
+        assert queue.get_nowait() == event
+
+    async def test_forward_notifications(self, mocker: MockerFixture):
+        mocker.patch(f"{events.__name__}.RECONNECT_INTERVAL", 0)
+        listen = AsyncMock(side_effect=[ConnectionError, asyncio.CancelledError])
+
+        with pytest.raises(asyncio.CancelledError):
+            await events.forward_notifications(listen)
+
+        assert listen.await_count == 2
@@ -0,0 +1,347 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from unittest.mock import Mock
+
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy import select, text
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from dr_emu import worker as worker_module
+from dr_emu.controllers import job as job_controller
+from dr_emu.lib import events
+from dr_emu.lib.exceptions import JobStateError
+from dr_emu.models import Base, Template, Run, Instance, Infrastructure, Job, JobStatus, utc_now
+from dr_emu.worker import Worker, Reaper
+from tests.unit.test_teardown import build_infrastructure
+
+
+@pytest.fixture()
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        await session.execute(text("PRAGMA foreign_keys = ON"))
+        yield session
+
+    await engine.dispose()
+
+
+@pytest.fixture()
+async def run(db_session: AsyncSession) -> Run:
+    run = Run(name="run", template=Template(name="template", description="{}"))
+    db_session.add(run)
+    await db_session.commit()
+    return run
+
+
+@pytest.mark.asyncio
+class TestJobController:
+    async def test_create_job(self, db_session: AsyncSession, run: Run):
+        job = await job_controller.create_job(run.id, db_session, 3)
+
+        assert (job.status, job.count, job.built) == (JobStatus.queued, 3, 0)
+        assert (await job_controller.get_job(job.id, db_session)).run_id == run.id
+
+    async def test_create_job_nonexistent_run(self, db_session: AsyncSession):
+        with pytest.raises(NoResultFound):
+            await job_controller.create_job(1, db_session)
+
+    async def test_list_jobs(self, db_session: AsyncSession, run: Run):
+        jobs = [await job_controller.create_job(run.id, db_session) for _ in range(3)]
+        await job_controller.claim_job("worker", db_session)
+
+        after_first = await job_controller.list_jobs(db_session, 10, jobs[0].id)
+        assert [job.id for job in after_first] == [jobs[1].id, jobs[2].id]
+        queued = await job_controller.list_jobs(db_session, status=JobStatus.queued, run_id=run.id)
+        assert [job.id for job in queued] == [jobs[1].id, jobs[2].id]
+
+    async def test_claim_job(self, db_session: AsyncSession, run: Run):
+        first = await job_controller.create_job(run.id, db_session)
+        second = await job_controller.create_job(run.id, db_session)
+
+        claimed = [await job_controller.claim_job("worker", db_session) for _ in range(3)]
+
+        assert [job.id for job in claimed[:2]] == [first.id, second.id]
+        assert claimed[2] is None
+        assert all(job.status is JobStatus.running and job.attempts == 1 for job in claimed[:2])
+
+    async def test_heartbeat(self, db_session: AsyncSession, run: Run):
+        job = await job_controller.create_job(run.id, db_session)
+        await job_controller.claim_job("worker", db_session)
+
+        assert await job_controller.heartbeat(job.id, "worker", db_session) is False
+        await job_controller.cancel_job(job.id, db_session)
+        assert await job_controller.heartbeat(job.id, "worker", db_session) is True
+        assert await job_controller.heartbeat(job.id, "other_worker", db_session) is None
+
+    async def test_cancel_queued_job(self, db_session: AsyncSession, run: Run):
+        job = await job_controller.create_job(run.id, db_session)
+
+        assert (await job_controller.cancel_job(job.id, db_session)).status is JobStatus.cancelled
+        assert await job_controller.claim_job("worker", db_session) is None
+        with pytest.raises(JobStateError):
+            await job_controller.cancel_job(job.id, db_session)
+
+    async def test_cancel_running_job(self, db_session: AsyncSession, run: Run):
+        job = await job_controller.create_job(run.id, db_session)
+        await job_controller.claim_job("worker", db_session)
+
+        job = await job_controller.cancel_job(job.id, db_session)
+        assert job.status is JobStatus.running
+        assert job.cancel_requested
+
+    async def test_retry_job(self, db_session: AsyncSession, run: Run):
+        job = await job_controller.create_job(run.id, db_session)
+        with pytest.raises(JobStateError):
+            await job_controller.retry_job(job.id, db_session)
+
+        await job_controller.claim_job("worker", db_session)
+        await job_controller.finish_job(job.id, "worker", JobStatus.failed, db_session, "error")
+        job = await job_controller.retry_job(job.id, db_session)
+
+        assert (job.status, job.error, job.worker) == (JobStatus.queued, None, None)
+        assert (await job_controller.claim_job("worker", db_session)).attempts == 2
+
+    async def test_finish_job_of_other_worker(self, db_session: AsyncSession, run: Run):
+        job = await job_controller.create_job(run.id, db_session)
+        await job_controller.claim_job("worker", db_session)
+
+        await job_controller.finish_job(job.id, "other_worker", JobStatus.succeeded, db_session)
+
+        await db_session.refresh(job)
+        assert job.status is JobStatus.running
+
+    async def test_delete_unfinished_infrastructures(self, db_session: AsyncSession, run: Run, mocker: MockerFixture):
+        teardown_mock = mocker.patch("dr_emu.controllers.teardown.teardown_infrastructures")
+        job, other_job = Job(run=run), Job(run=run)
+        db_session.add_all([job, other_job])
+        await db_session.flush()
+        unfinished = [Infrastructure(name=f"unfinished_{index}", job_id=job.id) for index in range(2)]
+        finished = build_infrastructure("finished", 1, run, 0)
+        finished.job_id = job.id
+        db_session.add_all([*unfinished, finished, Infrastructure(name="other", job_id=other_job.id)])
+        await db_session.commit()
+
+        await job_controller.delete_unfinished_infrastructures(job.id, db_session)
+
+        teardown_mock.assert_awaited_once_with([infrastructure.id for infrastructure in unfinished], db_session)
+
+    async def test_delete_unfinished_pool_infrastructures(self, db_session: AsyncSession, mocker: MockerFixture):
+        teardown_mock = mocker.patch("dr_emu.controllers.teardown.teardown_infrastructures")
+        template = Template(name="template", description="{}", warm_pool_size=2)
+        job = Job()
+        db_session.add_all([template, job])
+        await db_session.flush()
+        pooled = Infrastructure(name="pooled", job_id=job.id, pool_template_id=template.id, pooled_at=utc_now())
+        unfinished = Infrastructure(name="unfinished", job_id=job.id, pool_template_id=template.id)
+        db_session.add_all([pooled, unfinished])
+        await db_session.commit()
+
+        await job_controller.delete_unfinished_infrastructures(job.id, db_session)
+
+        teardown_mock.assert_awaited_once_with([unfinished.id], db_session)
+
+    async def test_delete_detached_infrastructures(self, db_session: AsyncSession, mocker: MockerFixture):
+        teardown_mock = mocker.patch("dr_emu.controllers.teardown.teardown_infrastructures")
+        template = Template(name="template", description="{}", warm_pool_size=2)
+        job = Job()
+        db_session.add_all([template, job])
+        await db_session.flush()
+        detached = Infrastructure(name="detached", job_id=job.id, pooled_at=utc_now())
+        pooled = Infrastructure(name="pooled", job_id=job.id, pool_template_id=template.id, pooled_at=utc_now())
+        db_session.add_all([detached, pooled])
+        await db_session.commit()
+
+        await job_controller.delete_detached_infrastructures(job.id, db_session)
+
+        teardown_mock.assert_awaited_once_with([detached.id], db_session)
+
+    async def test_retry_detached_job(self, db_session: AsyncSession):
+        job = Job(status=JobStatus.cancelled)
+        db_session.add(job)
+        await db_session.commit()
+
+        with pytest.raises(JobStateError, match="Warm pool"):
+            await job_controller.retry_job(job.id, db_session)
+
+    @pytest.mark.parametrize("attempts, status", [(1, JobStatus.queued), (3, JobStatus.failed)])
+    async def test_recover_lost_jobs(
+        self, db_session: AsyncSession, run: Run, mocker: MockerFixture, attempts: int, status: JobStatus
+    ):
+        mocker.patch(f"{job_controller.__name__}.settings.job_max_attempts", 3)
+        delete_mock = mocker.patch(f"{job_controller.__name__}.delete_unfinished_infrastructures")
+        stale = utc_now() - timedelta(hours=1)
+        lost_job = Job(run=run, status=JobStatus.running, worker="dead", attempts=attempts, heartbeat_at=stale)
+        alive_job = Job(run=run, status=JobStatus.running, worker="alive", attempts=1, heartbeat_at=utc_now())
+        db_session.add_all([lost_job, alive_job])
+        await db_session.commit()
+
+        assert await job_controller.recover_lost_jobs("worker", db_session) == 1
+
+        delete_mock.assert_awaited_once_with(lost_job.id, db_session)
+        statuses = dict((await db_session.execute(select(Job.id, Job.status))).all())
+        assert statuses == {lost_job.id: status, alive_job.id: JobStatus.running}
+
+
+@pytest.mark.asyncio
+class TestWorker:
+    @pytest.fixture()
+    def session_mock(self, mocker: MockerFixture, db_session: AsyncSession):
+        @asynccontextmanager
+        async def session():
+            yield db_session
+
+        mocker.patch(f"{worker_module.__name__}.sessionmanager.session", session)
+        mocker.patch(f"{worker_module.__name__}.settings.job_heartbeat_interval", 0.01)
+
+    @pytest.fixture()
+    async def job(self, db_session: AsyncSession, run: Run, session_mock) -> Job:
+        await job_controller.create_job(run.id, db_session)
+        return await job_controller.claim_job("worker", db_session)
+
+    @pytest.fixture()
+    def delete_mock(self, mocker: MockerFixture):
+        return mocker.patch(f"{job_controller.__name__}.delete_unfinished_infrastructures")
+
+    async def test_execute(self, db_session: AsyncSession, job: Job, mocker: MockerFixture, delete_mock):
+        published_events = []
+        mocker.patch(f"{events.__name__}.bus", Mock(publish=published_events.append))
+        build_mock = mocker.patch("dr_emu.controllers.run.build_run", return_value=[Instance()])
+
+        await Worker("worker").execute(job)
+
+        build_mock.assert_awaited_once_with(job.run_id, 1, job.id)
+        delete_mock.assert_not_awaited()
+        await db_session.refresh(job)
+        assert job.status is JobStatus.succeeded
+        assert job.finished_at is not None
+        published = [(event.phase, event.status) for event in published_events]
+        assert published == [(events.JOB, "running"), (events.JOB, "succeeded")]
+
+    async def test_execute_pool_refill(
+        self, db_session: AsyncSession, session_mock, mocker: MockerFixture, delete_mock
+    ):
+        published_events = []
+        mocker.patch(f"{events.__name__}.bus", Mock(publish=published_events.append))
+        build_mock = mocker.patch(
+            "dr_emu.controllers.pool.build_pool", return_value=[Infrastructure(), Infrastructure()]
+        )
+        template = Template(name="template", description="{}", warm_pool_size=2)
+        db_session.add(template)
+        await db_session.flush()
+        db_session.add(Job(template_id=template.id, count=2))
+        await db_session.commit()
+        job = await job_controller.claim_job("worker", db_session)
+
+        await Worker("worker").execute(job)
+
+        build_mock.assert_awaited_once_with(template.id, 2, job.id)
+        await db_session.refresh(job)
+        assert job.status is JobStatus.succeeded
+        assert published_events == []
+
+    async def test_execute_deleted_pool(
+        self, db_session: AsyncSession, session_mock, mocker: MockerFixture, delete_mock
+    ):
+        detached_mock = mocker.patch(f"{job_controller.__name__}.delete_detached_infrastructures")
+        mocker.patch("dr_emu.controllers.pool.build_pool", return_value=[Infrastructure()])
+        db_session.add(Job(count=1))
+        await db_session.commit()
+        job = await job_controller.claim_job("worker", db_session)
+
+        await Worker("worker").execute(job)
+
+        # the build succeeded, but its infrastructures don't belong to any pool anymore
+        delete_mock.assert_not_awaited()
+        detached_mock.assert_awaited_once_with(job.id, db_session)
+
+    async def test_execute_failure(self, db_session: AsyncSession, job: Job, mocker: MockerFixture, delete_mock):
+        mocker.patch("dr_emu.controllers.run.build_run", side_effect=RuntimeError("no docker"))
+
+        await Worker("worker").execute(job)
+
+        delete_mock.assert_awaited_once_with(job.id, db_session)
+        await db_session.refresh(job)
+        assert job.status is JobStatus.failed
+        assert job.error == "RuntimeError: no docker"
+
+    async def test_execute_partial_failure(
+        self, db_session: AsyncSession, job: Job, mocker: MockerFixture, delete_mock
+    ):
+        mocker.patch("dr_emu.controllers.run.build_run", return_value=[Instance(), RuntimeError("no image")])
+
+        await Worker("worker").execute(job)
+
+        delete_mock.assert_awaited_once_with(job.id, db_session)
+        await db_session.refresh(job)
+        assert job.status is JobStatus.failed
+        assert job.error == "1 of 2 instances failed: RuntimeError: no image"
+
+    async def test_execute_remaining_instances(
+        self, db_session: AsyncSession, job: Job, mocker: MockerFixture, delete_mock
+    ):
+        job.count, job.built = 5, 3
+        build_mock = mocker.patch("dr_emu.controllers.run.build_run", return_value=[Instance(), Instance()])
+
+        await Worker("worker").execute(job)
+
+        build_mock.assert_awaited_once_with(job.run_id, 2, job.id)
+
+    async def test_execute_cancelled(self, db_session: AsyncSession, job: Job, mocker: MockerFixture, delete_mock):
+        build_started = asyncio.Event()
+
+        async def build(*_):
+            build_started.set()
+            await asyncio.sleep(10)
+
+        mocker.patch("dr_emu.controllers.run.build_run", side_effect=build)
+        execution = asyncio.create_task(Worker("worker").execute(job))
+        await build_started.wait()
+        await job_controller.cancel_job(job.id, db_session)
+        await asyncio.wait_for(execution, 5)
+
+        delete_mock.assert_awaited_once()
+        await db_session.refresh(job)
+        assert job.status is JobStatus.cancelled
+
+    async def test_stop_worker_requeues_job(
+        self, db_session: AsyncSession, job: Job, mocker: MockerFixture, delete_mock
+    ):
+        build_started = asyncio.Event()
+
+        async def build(*_):
+            build_started.set()
+            await asyncio.sleep(10)
+
+        mocker.patch("dr_emu.controllers.run.build_run", side_effect=build)
+        execution = asyncio.create_task(Worker("worker").execute(job))
+        await build_started.wait()
+        execution.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await execution
+
+        delete_mock.assert_awaited_once()
+        await db_session.refresh(job)
+        assert (job.status, job.worker) == (JobStatus.queued, None)
+
+    @pytest.mark.parametrize("building, rate", [(False, 20), (True, 5)])
+    async def test_reaper_rate(
+        self, db_session: AsyncSession, run: Run, session_mock, mocker: MockerFixture, building: bool, rate: float
+    ):
+        mocker.patch(f"{worker_module.__name__}.settings.reaper_rate", 20)
+        mocker.patch(f"{worker_module.__name__}.settings.reaper_build_rate", 5)
+        reap_mock = mocker.patch("dr_emu.controllers.teardown.reap", return_value=True)
+        await job_controller.create_job(run.id, db_session)
+        if building:
+            await job_controller.claim_job("worker", db_session)
+        reaper = Reaper()
+
+        assert await reaper.reap() is True
+
+        assert reaper.limiter.rate == rate
+        reap_mock.assert_awaited_once_with(db_session, reaper.limiter)
@@ -0,0 +1,45 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from dr_emu.lib import locks
+
+
+def test_lock_key():
+    keys = {locks.lock_key(name) for name in (locks.ALLOCATION, locks.IMAGES, locks.MIGRATION)}
+
+    assert len(keys) == 3
+    assert all(-(2**63) <= key < 2**63 for key in keys)
+    assert locks.lock_key(locks.ALLOCATION) == locks.lock_key("dr-emu.allocation")
+
+
+@pytest.mark.asyncio
+class TestAdvisoryLock:
+    async def test_postgresql(self):
+        db_session = Mock(execute=AsyncMock())
+        db_session.bind.dialect.name = "postgresql"
+
+        async with locks.advisory_lock(db_session, locks.ALLOCATION):
+            pass
+
+        statement = db_session.execute.call_args.args[0].compile(dialect=postgresql.dialect())
+        assert "pg_advisory_xact_lock" in str(statement)
+        assert list(statement.params.values()) == [locks.lock_key(locks.ALLOCATION)]
+
+    async def test_local(self):
+        db_session = Mock(execute=AsyncMock())
+        db_session.bind.dialect.name = "sqlite"
+        order = []
+
+        async def allocate(name: str):
+            async with locks.advisory_lock(db_session, locks.ALLOCATION):
+                order.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                order.append(f"{name} end")
+
+        await asyncio.gather(allocate("first"), allocate("second"))
+
+        assert order == ["first start", "first end", "second start", "second end"]
+        db_session.execute.assert_not_awaited()
@@ -0,0 +1,172 @@
+from datetime import timedelta
+
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy import select, func
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from dr_emu.controllers import pool as pool_controller, run as run_controller
+from dr_emu.lib import metrics
+from dr_emu.models import Base, Template, Run, Instance, Infrastructure, Job, JobStatus, utc_now
+
+
+@pytest.fixture()
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+
+    await engine.dispose()
+
+
+@pytest.fixture()
+async def template(db_session: AsyncSession) -> Template:
+    template = Template(name="template", description="{}", warm_pool_size=3)
+    db_session.add(template)
+    await db_session.commit()
+    return template
+
+
+@pytest.fixture()
+def hit_rate(mocker: MockerFixture) -> metrics.HitRate:
+    return mocker.patch(f"{metrics.__name__}.warm_pool_claims", metrics.HitRate("claims"))
+
+
+def pooled(template: Template, count: int, prefix: str = "pooled") -> list[Infrastructure]:
+    start = utc_now()
+    return [
+        Infrastructure(
+            name=f"{prefix}_{index}",
+            pool_template_id=template.id,
+            pooled_at=start + timedelta(seconds=index),
+            snapshot={"name": f"{prefix}_{index}", "run_id": None},
+        )
+        for index in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+class TestPoolController:
+    async def test_claim_infrastructures(self, db_session: AsyncSession, template: Template, hit_rate):
+        run = Run(name="run", template=template)
+        building = Infrastructure(name="building", pool_template_id=template.id)
+        infrastructures = pooled(template, 3)
+        db_session.add_all([run, building, *infrastructures])
+        await db_session.commit()
+
+        claimed = await pool_controller.claim_infrastructures(template.id, run.id, 2, db_session)
+        await db_session.commit()
+
+        assert [infrastructure.id for infrastructure in claimed] == [infrastructures[0].id, infrastructures[1].id]
+        run_ids = await db_session.scalars(
+            select(Instance.run_id).join(Infrastructure.instance).order_by(Infrastructure.id)
+        )
+        assert list(run_ids) == [run.id, run.id]
+        assert claimed[0].snapshot == {"name": "pooled_0", "run_id": run.id}
+        assert (await pool_controller.get_pool_status(template.id, db_session)).ready == 1
+        assert (hit_rate.hits, hit_rate.misses) == (2, 0)
+
+    async def test_start_run_from_pool(self, db_session: AsyncSession, template: Template, hit_rate):
+        run = Run(name="run", template=template)
+        db_session.add_all([run, *pooled(template, 2)])
+        await db_session.commit()
+
+        complete = await run_controller.start_run(run.id, db_session, 2)
+        partial = await run_controller.start_run(run.id, db_session, 3)
+
+        assert (complete.status, complete.count, complete.built) == (JobStatus.succeeded, 2, 2)
+        assert (partial.status, partial.count, partial.built) == (JobStatus.queued, 3, 0)
+        assert (hit_rate.hits, hit_rate.misses) == (2, 3)
+        assert hit_rate.snapshot()["hit_rate"] == 0.4
+
+    async def test_start_run_without_pool(self, db_session: AsyncSession, template: Template, hit_rate):
+        template.warm_pool_size = 0
+        run = Run(name="run", template=template)
+        db_session.add(run)
+        await db_session.commit()
+
+        job = await run_controller.start_run(run.id, db_session)
+
+        assert (job.status, job.built) == (JobStatus.queued, 0)
+        assert (hit_rate.hits, hit_rate.misses) == (0, 0)
+
+    async def test_set_pool_size(self, db_session: AsyncSession, template: Template):
+        db_session.add_all([*pooled(template, 1), Job(template_id=template.id, count=2)])
+        await db_session.commit()
+
+        status = await pool_controller.set_pool_size(template.id, 5, db_session)
+
+        assert status == pool_controller.PoolStatus(size=5, ready=1, building=2)
+        with pytest.raises(NoResultFound):
+            await pool_controller.set_pool_size(template.id + 1, 5, db_session)
+
+    async def test_refill_pools(self, db_session: AsyncSession, template: Template, mocker: MockerFixture):
+        mocker.patch(f"{pool_controller.__name__}.settings.warm_pool_refill_batch", 2)
+        mocker.patch(f"{pool_controller.__name__}.settings.max_infrastructures", 10)
+        full = Template(name="full", description="{}", warm_pool_size=1)
+        db_session.add(full)
+        await db_session.flush()
+        db_session.add_all(pooled(full, 1, "full"))
+        await db_session.commit()
+
+        jobs = await pool_controller.refill_pools(db_session)
+        assert [(job.template_id, job.run_id, job.count) for job in jobs] == [(template.id, None, 2)]
+
+        # a refill is already in progress
+        assert await pool_controller.refill_pools(db_session) == []
+
+    async def test_refill_pools_capacity(self, db_session: AsyncSession, template: Template, mocker: MockerFixture):
+        mocker.patch(f"{pool_controller.__name__}.settings.max_infrastructures", 3)
+        run = Run(name="run", template=template)
+        db_session.add_all([run, Infrastructure(name="running")])
+        await db_session.flush()
+        db_session.add(Job(run_id=run.id, count=1))
+        await db_session.commit()
+
+        jobs = await pool_controller.refill_pools(db_session)
+
+        assert [job.count for job in jobs] == [1]
+
+    async def test_refill_pools_drains_surplus(
+        self, db_session: AsyncSession, template: Template, mocker: MockerFixture
+    ):
+        teardown_mock = mocker.patch("dr_emu.controllers.teardown.teardown_infrastructures")
+        template.warm_pool_size = 1
+        infrastructures = pooled(template, 3)
+        db_session.add_all(infrastructures)
+        await db_session.commit()
+
+        assert await pool_controller.refill_pools(db_session) == []
+
+        # the newest infrastructures are removed and can't be claimed anymore
+        teardown_mock.assert_awaited_once_with([infrastructures[2].id, infrastructures[1].id], db_session)
+        assert (await pool_controller.get_pool_status(template.id, db_session)).ready == 1
+
+    async def test_delete_pool(self, db_session: AsyncSession, template: Template, mocker: MockerFixture):
+        schedule_mock = mocker.patch("dr_emu.controllers.teardown.schedule_teardown")
+        run = Run(name="run", template=template)
+        queued_job = Job(template_id=template.id)
+        running_job = Job(template_id=template.id, status=JobStatus.running, worker="worker")
+        db_session.add_all([run, queued_job, running_job])
+        await db_session.flush()
+        idle, claimed = pooled(template, 2)
+        claimed.instance = Instance(run=run)
+        # the running Job tears down its infrastructures itself once it is cancelled
+        building = Infrastructure(name="building", pool_template_id=template.id, job_id=running_job.id)
+        db_session.add_all([idle, claimed, building])
+        await db_session.commit()
+
+        await pool_controller.delete_pool(template.id, db_session)
+
+        schedule_mock.assert_awaited_once_with([idle.id], db_session)
+        await db_session.refresh(queued_job)
+        await db_session.refresh(running_job)
+        assert (queued_job.status, queued_job.template_id) == (JobStatus.cancelled, None)
+        assert (running_job.status, running_job.cancel_requested) == (JobStatus.running, True)
+        assert running_job.template_id is None
+        await db_session.refresh(claimed)
+        assert claimed.pool_template_id is None
@@ -0,0 +1,16 @@
+import pytest
+from pytest_mock import MockerFixture
+
+from dr_emu.lib import process_pool
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [0, 1])
+async def test_process_pool_run(mocker: MockerFixture, workers: int):
+    mocker.patch("dr_emu.lib.process_pool.settings.parser_workers", workers)
+
+    try:
+        assert await process_pool.run(pow, 2, 10) == 1024
+        assert (process_pool.get_executor() is None) == (workers == 0)
+    finally:
+        process_pool.shutdown()
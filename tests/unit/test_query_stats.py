@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from dr_emu.lib import query_stats
+from dr_emu.lib.query_stats import track_queries, statement_shape
+from dr_emu.models import Base, Template
+
+
+@pytest.fixture()
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    query_stats.instrument(engine.sync_engine)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+
+    await engine.dispose()
+
+
+@pytest.mark.parametrize(
+    "statement, shape",
+    [
+        ("SELECT a FROM t WHERE id IN ($1, $2, $3)", "SELECT a FROM t WHERE id IN (...)"),
+        ("SELECT a FROM t WHERE id IN (?)", "SELECT a FROM t WHERE id IN (...)"),
+        ("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)", "INSERT INTO t (a, b) VALUES (...)"),
+        ("SELECT a\nFROM t\nWHERE id = %(id_1)s", "SELECT a FROM t WHERE id = %(id_1)s"),
+    ],
+)
+def test_statement_shape(statement: str, shape: str):
+    assert statement_shape(statement) == shape
+
+
+@pytest.mark.asyncio
+class TestTrackQueries:
+    async def test_track_queries(self, db_session):
+        db_session.add_all(Template(name=f"template_{i}", description="") for i in range(3))
+        await db_session.commit()
+        templates = (await db_session.scalars(select(Template))).all()
+
+        with track_queries("outer") as outer:
+            await db_session.execute(text("SELECT 1"))
+            with track_queries("inner") as inner:
+                for template in templates:
+                    await db_session.execute(select(Template.name).where(Template.id == template.id))
+
+        assert (outer.count, inner.count) == (4, 3)
+        assert inner.duration <= outer.duration
+        assert list(inner.repeated(3).values()) == [3]
+        assert inner.repeated(4) == {}
+
+    async def test_track_queries_tasks(self, db_session):
+        async def query():
+            await db_session.execute(text("SELECT 1"))
+
+        with track_queries("tasks") as stats:
+            await asyncio.create_task(query())
+
+        await query()
+        assert stats.count == 1
+
+    async def test_track_queries_repeated_warning(self, db_session, mocker):
+        mocker.patch("dr_emu.lib.query_stats.settings.query_repeat_warning", 2)
+        logger_mock = mocker.patch("dr_emu.lib.query_stats.logger")
+
+        with track_queries("repeated"):
+            for _ in range(2):
+                await db_session.execute(text("SELECT 1"))
+
+        logger_mock.warning.assert_called_once()
+        assert logger_mock.warning.call_args.kwargs["repeated"] == {"SELECT 1": 2}
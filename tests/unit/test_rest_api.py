@@ -1,16 +1,31 @@
+from datetime import datetime, timezone
 from typing import Any
 
 import pytest
 from unittest.mock import AsyncMock, Mock
 
+from netaddr import IPNetwork
 from pytest_mock import MockerFixture
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from fastapi.testclient import TestClient
 
-from dr_emu.models import Run, Template, Infrastructure, Instance
+from dr_emu.database_config import get_db_session
+from dr_emu.lib import query_stats
+from dr_emu.lib.exceptions import (
+    JobStateError,
+    InfrastructureStateError,
+    TemplateChangeError,
+    DockerHostStateError,
+    DockerHostUnreachable,
+)
+from dr_emu.models import Base, Run, Template, Infrastructure, Instance, Job, JobStatus, DockerHost
 
 from dr_emu.app import app as app
-from shared import endpoints
+from dr_emu.controllers.changes import Operation
+from dr_emu.controllers.docker_host import HostLoad
+from dr_emu.controllers.pool import PoolStatus
+from shared import endpoints, constants
 
 
 @pytest.fixture()
@@ -26,6 +41,17 @@ async def test_main(test_app: TestClient):
     assert response.json() == {"message": "Dr-Emu will see you now"}
 
 
+async def test_metrics(test_app: TestClient, mocker: MockerFixture):
+    pool_status = {"size": 5, "checked_out": 1, "overflow": 0}
+    mocker.patch("dr_emu.api.endpoints.metrics.sessionmanager.pool_status", return_value=pool_status)
+
+    response = test_app.get(endpoints.Metrics.list)
+
+    assert response.status_code == 200
+    assert response.json()["db_pool"] == pool_status
+    assert set(response.json()["db_pool_wait_seconds"]) == {"description", "count", "sum", "max", "mean"}
+
+
 controllers_path = "dr_emu.controllers"
 
 
@@ -92,17 +118,34 @@ class TestRun:
         assert response.status_code == 404
 
     async def test_start_run(self, test_app: TestClient, run: Mock, mocker: MockerFixture):
-        mocker.patch(f"{self.run_controller}.start_run")
-        response = test_app.post(endpoints.Run.start.format(run.id), json={"instances": 1})
+        job = Job(id=5, run_id=run.id, created_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        start_run_mock = mocker.patch(f"{self.run_controller}.start_run", side_effect=AsyncMock(return_value=job))
+        response = test_app.post(endpoints.Run.start.format(run.id), params={"count": 3})
 
-        assert response.status_code == 200
-        assert response.json() == {"message": "Run instance started"}
+        assert response.status_code == 202
+        assert response.headers["location"] == endpoints.Job.get.format(job.id)
+        assert response.json()["id"] == job.id
+        assert response.json()["status"] == JobStatus.queued.value
+        assert start_run_mock.call_args.args[2] == 3
+
+    @pytest.mark.parametrize("count", [0, constants.MAX_RUN_INSTANCES + 1])
+    async def test_start_run_invalid_count(self, test_app: TestClient, run: Mock, mocker: MockerFixture, count: int):
+        start_run_mock = mocker.patch(f"{self.run_controller}.start_run")
+        response = test_app.post(endpoints.Run.start.format(run.id), params={"count": count})
+
+        assert response.status_code == 422
+        start_run_mock.assert_not_called()
 
     async def test_start_nonexistent_run(self, test_app: TestClient, run: Mock, mocker: MockerFixture):
         mocker.patch(f"{self.run_controller}.start_run", side_effect=NoResultFound)
-        response = test_app.post(
-            f"/runs/start/{run.id}", json={"instances": 1, "supernet": "10.0.0.0/8", "subnets_mask": 24}
-        )
+        response = test_app.post(endpoints.Run.start.format(run.id))
+
+        assert response.status_code == 404
+
+    async def test_stream_nonexistent_run_events(self, test_app: TestClient, run: Mock, mocker: MockerFixture):
+        mocker.patch("dr_emu.api.endpoints.run.sessionmanager")
+        mocker.patch(f"{self.run_controller}.get_run", side_effect=NoResultFound)
+        response = test_app.get(endpoints.Run.events.format(run.id))
 
         assert response.status_code == 404
 
@@ -113,7 +156,7 @@ class TestRun:
         )
 
         assert response.status_code == 200
-        assert response.json() == {"message": f"All instances of Run {run.id} has been stopped"}
+        assert response.json() == {"message": f"All instances of Run {run.id} are being stopped"}
 
     async def test_stop_nonexistent_run(self, test_app: TestClient, run: Mock, mocker: MockerFixture):
         mocker.patch(f"{self.run_controller}.stop_run", side_effect=NoResultFound)
@@ -134,6 +177,8 @@ class TestTemplate:
             id=1,
             name="test_template",
             description="test_description",
+            digest="0" * 64,
+            size=16,
         )
         return template_mock
 
@@ -147,9 +192,43 @@ class TestTemplate:
         mock_list_templates = AsyncMock(return_value=[template])
         mocker.patch(f"{self.template_controller}.list_templates", side_effect=mock_list_templates)
 
-        response = test_app.get(endpoints.Template.list)
+        response = test_app.get(endpoints.Template.list, params={"limit": 1, "name": template.name})
+        assert response.status_code == 200
+        assert response.json() == [
+            {"id": template.id, "name": template.name, "digest": template.digest, "size": template.size}
+        ]
+        mock_list_templates.assert_awaited_once_with(mocker.ANY, 1, None, template.name)
+        assert response.headers["link"] == f'<http://testserver{endpoints.Template.list}?limit=1&name={template.name}' \
+                                           f'&after={template.id}>; rel="next"'
+
+    async def test_list_templates_not_modified(self, template: Mock, test_app: TestClient, mocker: MockerFixture):
+        mocker.patch(f"{self.template_controller}.list_templates", side_effect=AsyncMock(return_value=[template]))
+
+        etag = test_app.get(endpoints.Template.list).headers["etag"]
+        response = test_app.get(endpoints.Template.list, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert "link" not in response.headers
+
+        template.name = "changed"
+        response = test_app.get(endpoints.Template.list, headers={"If-None-Match": etag})
         assert response.status_code == 200
-        assert response.json() == [template_schema]
+        assert response.headers["etag"] != etag
+
+    async def test_get_template(
+        self, template: Mock, test_app: TestClient, mocker: MockerFixture, template_schema: dict[str, Any]
+    ):
+        mocker.patch(f"{self.template_controller}.get_template", side_effect=AsyncMock(return_value=template))
+
+        response = test_app.get(endpoints.Template.get.format(template.id))
+        assert response.status_code == 200
+        assert response.json() == template_schema
+
+    async def test_get_nonexistent_template(self, template: Mock, test_app: TestClient, mocker: MockerFixture):
+        mocker.patch(f"{self.template_controller}.get_template", side_effect=NoResultFound)
+
+        response = test_app.get(endpoints.Template.get.format(template.id))
+        assert response.status_code == 404
 
     async def test_create_template(
         self, test_app: TestClient, template: Mock, mocker: MockerFixture, template_schema: dict[str, Any]
@@ -166,18 +245,45 @@ class TestTemplate:
         assert response.json() == template_schema
 
     async def test_delete_template(self, test_app: TestClient, template: Mock, mocker: MockerFixture):
+        mock_delete_pool = mocker.patch(f"{controllers_path}.pool.delete_pool")
         mock_delete_template = mocker.patch(f"{self.template_controller}.delete_template")
         response = test_app.delete(endpoints.Template.delete.format(template.id))
 
+        mock_delete_pool.assert_called_once()
         mock_delete_template.assert_called_once()
         assert response.status_code == 204
 
     async def test_delete_nonexistent_template(self, test_app: TestClient, template: Mock, mocker: MockerFixture):
+        mocker.patch(f"{controllers_path}.pool.delete_pool")
         mocker.patch(f"{self.template_controller}.delete_template", side_effect=NoResultFound)
         response = test_app.delete(endpoints.Template.delete.format(template.id))
 
         assert response.status_code == 404
 
+    async def test_set_warm_pool(self, test_app: TestClient, template: Mock, mocker: MockerFixture):
+        set_pool_size_mock = mocker.patch(
+            f"{controllers_path}.pool.set_pool_size",
+            side_effect=AsyncMock(return_value=PoolStatus(size=3, ready=1, building=2)),
+        )
+        response = test_app.put(endpoints.Template.pool.format(template.id), json={"size": 3})
+
+        assert response.status_code == 200
+        assert response.json() == {"size": 3, "ready": 1, "building": 2}
+        assert set_pool_size_mock.call_args.args[:2] == (template.id, 3)
+
+    async def test_set_invalid_warm_pool(self, test_app: TestClient, template: Mock, mocker: MockerFixture):
+        set_pool_size_mock = mocker.patch(f"{controllers_path}.pool.set_pool_size")
+        response = test_app.put(endpoints.Template.pool.format(template.id), json={"size": -1})
+
+        assert response.status_code == 422
+        set_pool_size_mock.assert_not_called()
+
+    async def test_get_nonexistent_warm_pool(self, test_app: TestClient, template: Mock, mocker: MockerFixture):
+        mocker.patch(f"{controllers_path}.pool.get_pool_status", side_effect=NoResultFound)
+        response = test_app.get(endpoints.Template.pool.format(template.id))
+
+        assert response.status_code == 404
+
 
 @pytest.mark.asyncio
 class TestInfrastructure:
@@ -197,17 +303,45 @@ class TestInfrastructure:
         response = test_app.get(endpoints.Infrastructure.list)
         assert response.status_code == 200
         assert response.json() == [{"id": infrastructure.id, "name": infrastructure.name, "run_id": 1}]
+        assert "link" not in response.headers
+
+    async def test_get_infrastructure(self, test_app: TestClient, mocker: MockerFixture, infrastructure: Mock):
+        snapshot = {
+            "id": infrastructure.id,
+            "name": infrastructure.name,
+            "run_id": 1,
+            "networks": [
+                {
+                    "name": "network",
+                    "ip": "10.0.0.0/24",
+                    "appliances": [{"name": "router", "ip": "10.0.0.1", "original_ip": "10.0.0.1"}],
+                }
+            ],
+            "attackers": {},
+        }
+        get_snapshot_mock = mocker.patch(
+            f"{self.infra_controller}.get_infra_snapshot", side_effect=AsyncMock(return_value=snapshot)
+        )
+
+        response = test_app.get(endpoints.Infrastructure.get.format(infrastructure.id))
+        assert response.status_code == 200
+        assert response.json() == snapshot
+        get_snapshot_mock.assert_awaited_once()
+
+    async def test_get_nonexistent_infrastructure(self, test_app: TestClient, mocker: MockerFixture):
+        mocker.patch(f"{self.infra_controller}.get_infra_snapshot", side_effect=NoResultFound)
+        response = test_app.get(endpoints.Infrastructure.get.format(1))
+
+        assert response.status_code == 404
 
     async def test_destroy_infrastructure(self, test_app: TestClient, mocker: MockerFixture):
-        infra_mock = Mock()
-        mock_stop_infra = mocker.patch(f"{self.infra_controller}.stop_infra")
-        mock_delete_infra = mocker.patch(f"{self.infra_controller}.delete_infra")
-        mocker.patch(f"{self.infra_controller}.get_infra", side_effect=AsyncMock(return_value=infra_mock))
+        mock_teardown = mocker.patch("dr_emu.controllers.teardown.schedule_teardown")
+        mocker.patch(f"{self.infra_controller}.get_infra", side_effect=AsyncMock(return_value=Mock()))
 
         response = test_app.delete(endpoints.Infrastructure.delete.format(1))
 
-        mock_stop_infra.assert_called_once_with(infra_mock)
-        mock_delete_infra.assert_called_once()
+        mock_teardown.assert_awaited_once()
+        assert mock_teardown.call_args.args[0] == [1]
 
         assert response.status_code == 204
 
@@ -216,3 +350,244 @@ class TestInfrastructure:
         response = test_app.delete(endpoints.Infrastructure.delete.format(1))
 
         assert response.status_code == 404
+
+    @pytest.mark.parametrize(
+        "error, status_code", [(None, 204), (NoResultFound(), 404), (InfrastructureStateError("not built"), 409)]
+    )
+    async def test_reset_infrastructure(
+        self, test_app: TestClient, mocker: MockerFixture, error: Exception | None, status_code: int
+    ):
+        reset_mock = mocker.patch(f"{self.infra_controller}.reset_infra", side_effect=error)
+        response = test_app.post(endpoints.Infrastructure.reset.format(1))
+
+        assert response.status_code == status_code
+        reset_mock.assert_awaited_once_with(1)
+
+    @pytest.mark.parametrize(
+        "error, status_code",
+        [(None, 200), (NoResultFound(), 404), (TemplateChangeError("router added"), 409)],
+    )
+    async def test_apply_template(
+        self, test_app: TestClient, mocker: MockerFixture, error: Exception | None, status_code: int
+    ):
+        operations = [Operation("create", "node", "node_web"), Operation("update", "router", "router", "routes")]
+        apply_mock = mocker.patch(
+            "dr_emu.controllers.changes.apply_template", side_effect=error, return_value=operations
+        )
+        response = test_app.post(endpoints.Infrastructure.apply.format(1), json={"template_id": 2, "dry_run": True})
+
+        assert response.status_code == status_code
+        apply_mock.assert_awaited_once_with(1, 2, True)
+        if error is None:
+            assert response.json() == [
+                {"action": "create", "kind": "node", "name": "node_web", "detail": None},
+                {"action": "update", "kind": "router", "name": "router", "detail": "routes"},
+            ]
+
+
+@pytest.mark.asyncio
+class TestJob:
+    job_controller = f"{controllers_path}.job"
+
+    @pytest.fixture()
+    def job(self) -> Job:
+        return Job(id=1, run_id=2, created_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+    async def test_list_jobs(self, test_app: TestClient, mocker: MockerFixture, job: Job):
+        list_jobs_mock = mocker.patch(f"{self.job_controller}.list_jobs", side_effect=AsyncMock(return_value=[job]))
+
+        response = test_app.get(endpoints.Job.list, params={"status": "queued", "run_id": 2})
+        assert response.status_code == 200
+        assert [item["id"] for item in response.json()] == [job.id]
+        assert list_jobs_mock.call_args.args[3:] == (JobStatus.queued, 2)
+
+    async def test_get_job(self, test_app: TestClient, mocker: MockerFixture, job: Job):
+        mocker.patch(f"{self.job_controller}.get_job", side_effect=AsyncMock(return_value=job))
+
+        response = test_app.get(endpoints.Job.get.format(job.id))
+        assert response.status_code == 200
+        assert response.json() == {
+            "id": 1,
+            "run_id": 2,
+            "template_id": None,
+            "status": "queued",
+            "count": 1,
+            "built": 0,
+            "attempts": 0,
+            "error": None,
+            "created_at": "2024-01-01T00:00:00Z",
+            "started_at": None,
+            "finished_at": None,
+        }
+
+    async def test_get_nonexistent_job(self, test_app: TestClient, mocker: MockerFixture):
+        mocker.patch(f"{self.job_controller}.get_job", side_effect=NoResultFound)
+        response = test_app.get(endpoints.Job.get.format(1))
+
+        assert response.status_code == 404
+
+    @pytest.mark.parametrize("action", ["cancel", "retry"])
+    async def test_change_job(self, test_app: TestClient, mocker: MockerFixture, job: Job, action: str):
+        mocker.patch(f"{self.job_controller}.{action}_job", side_effect=AsyncMock(return_value=job))
+        response = test_app.post(getattr(endpoints.Job, action).format(job.id))
+
+        assert response.status_code == 202
+        assert response.json()["id"] == job.id
+
+    @pytest.mark.parametrize("action", ["cancel", "retry"])
+    @pytest.mark.parametrize("error, status_code", [(NoResultFound, 404), (JobStateError("finished"), 409)])
+    async def test_change_job_error(
+        self, test_app: TestClient, mocker: MockerFixture, action: str, error: Exception, status_code: int
+    ):
+        mocker.patch(f"{self.job_controller}.{action}_job", side_effect=error)
+        response = test_app.post(getattr(endpoints.Job, action).format(1))
+
+        assert response.status_code == status_code
+
+
+@pytest.mark.asyncio
+class TestDockerHost:
+    host_controller = f"{controllers_path}.docker_host"
+
+    @pytest.fixture()
+    def host(self) -> DockerHost:
+        return DockerHost(id=1, name="first", url="tcp://10.10.0.1:2375", capacity=8, enabled=True)
+
+    @pytest.fixture()
+    def host_schema(self, host: DockerHost) -> dict[str, Any]:
+        return {"id": host.id, "name": host.name, "url": host.url, "capacity": host.capacity, "enabled": host.enabled}
+
+    async def test_list_hosts(
+        self, test_app: TestClient, mocker: MockerFixture, host: DockerHost, host_schema: dict[str, Any]
+    ):
+        list_hosts_mock = mocker.patch(f"{self.host_controller}.list_hosts", side_effect=AsyncMock(return_value=[host]))
+
+        response = test_app.get(endpoints.DockerHost.list, params={"enabled": True})
+        assert response.status_code == 200
+        assert response.json() == [host_schema]
+        assert list_hosts_mock.call_args.args[3] is True
+
+    async def test_get_host(
+        self, test_app: TestClient, mocker: MockerFixture, host: DockerHost, host_schema: dict[str, Any]
+    ):
+        mocker.patch(f"{self.host_controller}.get_host", side_effect=AsyncMock(return_value=host))
+        mocker.patch(
+            f"{self.host_controller}.get_load", side_effect=AsyncMock(return_value={host.id: HostLoad(3, 1)})
+        )
+
+        response = test_app.get(endpoints.DockerHost.get.format(host.id))
+        assert response.status_code == 200
+        assert response.json() == {**host_schema, "infrastructures": 3, "building": 1}
+
+    async def test_get_nonexistent_host(self, test_app: TestClient, mocker: MockerFixture):
+        mocker.patch(f"{self.host_controller}.get_host", side_effect=NoResultFound)
+        response = test_app.get(endpoints.DockerHost.get.format(1))
+
+        assert response.status_code == 404
+
+    async def test_create_host(
+        self, test_app: TestClient, mocker: MockerFixture, host: DockerHost, host_schema: dict[str, Any]
+    ):
+        create_host_mock = mocker.patch(
+            f"{self.host_controller}.create_host", side_effect=AsyncMock(return_value=host)
+        )
+        response = test_app.post(
+            endpoints.DockerHost.create, json={"name": host.name, "url": host.url, "capacity": host.capacity}
+        )
+
+        assert response.status_code == 201
+        assert response.json() == host_schema
+        assert create_host_mock.call_args.args[:3] == (host.name, host.url, host.capacity)
+
+    @pytest.mark.parametrize(
+        "error, status_code", [(DockerHostUnreachable("refused"), 400), (DockerHostStateError("exists"), 409)]
+    )
+    async def test_create_host_error(
+        self, test_app: TestClient, mocker: MockerFixture, error: Exception, status_code: int
+    ):
+        mocker.patch(f"{self.host_controller}.create_host", side_effect=error)
+        response = test_app.post(
+            endpoints.DockerHost.create, json={"name": "first", "url": "tcp://10.10.0.1:2375", "capacity": 8}
+        )
+
+        assert response.status_code == status_code
+
+    async def test_create_invalid_host(self, test_app: TestClient, mocker: MockerFixture):
+        create_host_mock = mocker.patch(f"{self.host_controller}.create_host")
+        response = test_app.post(
+            endpoints.DockerHost.create, json={"name": "first", "url": "tcp://10.10.0.1:2375", "capacity": 0}
+        )
+
+        assert response.status_code == 422
+        create_host_mock.assert_not_called()
+
+    async def test_update_host(self, test_app: TestClient, mocker: MockerFixture, host: DockerHost):
+        update_host_mock = mocker.patch(
+            f"{self.host_controller}.update_host", side_effect=AsyncMock(return_value=host)
+        )
+        response = test_app.put(endpoints.DockerHost.update.format(host.id), json={"enabled": False})
+
+        assert response.status_code == 200
+        assert update_host_mock.call_args.args[2:] == (None, False)
+
+    @pytest.mark.parametrize(
+        "error, status_code", [(None, 204), (NoResultFound, 404), (DockerHostStateError("used"), 409)]
+    )
+    async def test_delete_host(self, test_app: TestClient, mocker: MockerFixture, error: Exception, status_code: int):
+        mocker.patch(f"{self.host_controller}.delete_host", side_effect=error)
+        response = test_app.delete(endpoints.DockerHost.delete.format(1))
+
+        assert response.status_code == status_code
+
+
+@pytest.mark.asyncio
+class TestQueryBudgets:
+    @pytest.fixture()
+    async def db_app(self, test_app: TestClient):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        query_stats.instrument(engine.sync_engine)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with session_maker() as session:
+            for index in range(5):
+                run = Run(name=f"run_{index}", template=Template(name=f"template_{index}", description="{}"))
+                infrastructure = Infrastructure(
+                    name=f"infrastructure_{index}",
+                    supernet=IPNetwork(f"10.{index}.0.0/16"),
+                    snapshot={
+                        "id": index + 1,
+                        "name": f"infrastructure_{index}",
+                        "run_id": index + 1,
+                        "networks": [],
+                        "attackers": {},
+                    },
+                )
+                session.add(Instance(run=run, infrastructure=infrastructure))
+            await session.commit()
+
+        async def db_session():
+            async with session_maker() as session:
+                yield session
+
+        app.dependency_overrides[get_db_session] = db_session
+        yield test_app
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+    @pytest.mark.parametrize(
+        "endpoint, budget",
+        [
+            (endpoints.Template.list, 1),
+            (endpoints.Run.list, 3),
+            (endpoints.Run.get.format(1), 1),
+            (endpoints.Infrastructure.list, 1),
+            (endpoints.Infrastructure.get.format(1), 1),
+        ],
+    )
+    async def test_query_budget(self, db_app: TestClient, endpoint: str, budget: int):
+        response = db_app.get(endpoint)
+
+        assert response.status_code == 200
+        assert 0 < int(response.headers["x-db-query-count"]) <= budget
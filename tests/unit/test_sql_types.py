@@ -0,0 +1,63 @@
+import pytest
+from netaddr import IPNetwork
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from dr_emu.models import Base, Infrastructure
+
+
+@pytest.fixture()
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine)() as session:
+        yield session
+
+    await engine.dispose()
+
+
+@pytest.fixture()
+async def infrastructures(db_session):
+    db_session.add_all(
+        [
+            Infrastructure(name="first", supernet=IPNetwork("10.0.0.0/16")),
+            Infrastructure(name="second", supernet=IPNetwork("10.1.0.0/16")),
+            Infrastructure(name="other", supernet=IPNetwork("192.168.0.0/16")),
+        ]
+    )
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+class TestIPTypes:
+    async def test_loaded_types(self, db_session, infrastructures):
+        db_session.expunge_all()
+        infrastructure = await db_session.scalar(select(Infrastructure).where(Infrastructure.name == "first"))
+
+        assert infrastructure.supernet == IPNetwork("10.0.0.0/16")
+        assert isinstance(infrastructure.supernet, IPNetwork)
+
+    @pytest.mark.parametrize(
+        "network, names",
+        [
+            (IPNetwork("10.0.0.0/8"), {"first", "second"}),
+            (IPNetwork("10.1.2.0/24"), {"second"}),
+            (IPNetwork("172.16.0.0/12"), set()),
+        ],
+    )
+    async def test_overlaps(self, db_session, infrastructures, network, names):
+        query = select(Infrastructure.name).where(Infrastructure._supernet.overlaps(network))
+
+        assert set((await db_session.scalars(query)).all()) == names
+
+    async def test_contained_by(self, db_session, infrastructures):
+        query = select(Infrastructure.name).where(Infrastructure._supernet.contained_by(IPNetwork("10.0.0.0/8")))
+
+        assert set((await db_session.scalars(query)).all()) == {"first", "second"}
+
+    async def test_equality(self, db_session, infrastructures):
+        query = select(Infrastructure.name).where(Infrastructure._supernet == IPNetwork("10.1.0.0/16"))
+
+        assert await db_session.scalar(query) == "second"
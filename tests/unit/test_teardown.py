@@ -0,0 +1,237 @@
+import time
+from datetime import timedelta
+
+import pytest
+from docker.errors import NotFound
+from netaddr import IPNetwork, IPAddress
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from dr_emu.controllers import teardown
+from dr_emu.lib import query_stats
+from dr_emu.lib.query_stats import track_queries
+from dr_emu.lib.rate_limit import RateLimiter
+from dr_emu.models import (
+    Base,
+    DockerHost,
+    Template,
+    Run,
+    Instance,
+    Infrastructure,
+    Network,
+    Interface,
+    Router,
+    FirewallRule,
+    Node,
+    ServiceContainer,
+    DependsOn,
+    ContainerState,
+    Volume,
+    Blob,
+    NodeFile,
+    utc_now,
+)
+
+
+@pytest.fixture()
+async def db_session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    query_stats.instrument(engine.sync_engine)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        await session.execute(text("PRAGMA foreign_keys = ON"))
+        yield session
+
+    await engine.dispose()
+
+
+def build_infrastructure(name: str, index: int, run: Run, nodes: int) -> Infrastructure:
+    network = Network(
+        ipaddress=IPNetwork(f"10.{index}.0.0/24"),
+        router_gateway=IPAddress(f"10.{index}.0.1"),
+        name=f"{name}_network",
+        network_type="internal",
+        docker_id=f"{name}_network_id",
+    )
+    router = Router(
+        name=f"{name}_router",
+        router_type="perimeter",
+        docker_id=f"{name}_router_id",
+        interfaces=[Interface(ipaddress=network.router_gateway, network=network)],
+        firewall_rules=[FirewallRule(src_net=network, dst_net=network, service="*", policy="ALLOW")],
+    )
+    volume = Volume(name=f"{name}_volume", bind="/data", local=True, docker_id=f"{name}_volume")
+    infrastructure = Infrastructure(
+        name=name, supernet=IPNetwork(f"10.{index}.0.0/16"), networks=[network], routers=[router], nodes=[]
+    )
+    for node_index in range(nodes):
+        blob = Blob(digest=f"{name}_{node_index}_".ljust(64, "0"), size=0, contents=b"")
+        services = [
+            ServiceContainer(name=f"{name}_service_{node_index}_{service_index}", docker_id=None, volumes=[volume])
+            for service_index in range(2)
+        ]
+        services[0].dependencies.append(DependsOn(dependency=services[1], state=ContainerState.service_started))
+        infrastructure.nodes.append(
+            Node(
+                name=f"{name}_node_{node_index}",
+                docker_id=f"{name}_node_{node_index}_id",
+                interfaces=[Interface(ipaddress=IPAddress(f"10.{index}.0.{node_index + 10}"), network=network)],
+                service_containers=services,
+                volumes=[volume],
+                files=[NodeFile(path="/file", blob=blob)],
+            )
+        )
+    Instance(run=run, infrastructure=infrastructure)
+    return infrastructure
+
+
+@pytest.fixture()
+async def infrastructures(db_session):
+    run = Run(name="run", template=Template(name="template", description=""))
+    infrastructures = [build_infrastructure(name, index, run, 3) for index, name in enumerate(["first", "second"])]
+    db_session.add_all(infrastructures)
+    await db_session.commit()
+    return infrastructures
+
+
+async def count_rows(db_session) -> dict[str, int]:
+    return {
+        table.name: await db_session.scalar(select(func.count()).select_from(table))
+        for table in Base.metadata.sorted_tables
+    }
+
+
+@pytest.mark.asyncio
+class TestTeardown:
+    async def test_get_docker_ids(self, db_session, infrastructures):
+        docker_ids = await teardown.get_docker_ids([infrastructures[0].id], db_session)
+
+        # docker IDs of the services were not saved, names are used instead
+        services = [f"first_service_{node}_{service}" for node in range(3) for service in range(2)]
+        assert sorted(docker_ids.services) == services
+        assert sorted(docker_ids.appliances) == [f"first_node_{index}_id" for index in range(3)] + ["first_router_id"]
+        assert docker_ids.networks == ["first_network_id"]
+        assert docker_ids.volumes == ["first_volume"]
+
+    async def test_remove_docker_objects(self, mocker):
+        api_mock = mocker.patch("dr_emu.controllers.teardown.docker_hosts.get_client").return_value.api
+        api_mock.remove_network.side_effect = NotFound("network")
+
+        await teardown.remove_docker_objects(
+            teardown.DockerIds(services=["service"], appliances=["node"], networks=["network"], volumes=["volume"])
+        )
+
+        assert [call.args for call in api_mock.remove_container.call_args_list] == [("service",), ("node",)]
+        api_mock.remove_network.assert_called_once_with("network")
+        api_mock.remove_volume.assert_called_once_with("volume", force=True)
+
+    async def test_delete_infrastructures(self, db_session, infrastructures):
+        first, second = infrastructures
+        kept = await count_rows(db_session)
+        db_session.expunge_all()
+
+        await teardown.delete_infrastructures([first.id], db_session)
+
+        remaining = await count_rows(db_session)
+        assert remaining.pop("infrastructure") == 1
+        assert remaining.pop("instance") == 1
+        assert (remaining.pop("template"), remaining.pop("run")) == (kept.pop("template"), kept.pop("run"))
+        # the other infrastructure is left untouched
+        del kept["infrastructure"], kept["instance"]
+        assert remaining == {table: count // 2 for table, count in kept.items()}
+        assert await db_session.scalar(select(Infrastructure.name)) == second.name
+
+    async def test_delete_infrastructures_query_count(self, db_session):
+        run = Run(name="run", template=Template(name="template", description=""))
+        small, large = build_infrastructure("small", 0, run, 1), build_infrastructure("large", 1, run, 20)
+        db_session.add_all([small, large])
+        await db_session.commit()
+
+        counts = []
+        for infrastructure in [small, large]:
+            with track_queries("teardown") as stats:
+                await teardown.delete_infrastructures([infrastructure.id], db_session)
+            counts.append(stats.count)
+
+        assert counts[0] == counts[1]
+
+    async def test_teardown_infrastructures(self, db_session, infrastructures, mocker):
+        remove_mock = mocker.patch("dr_emu.controllers.teardown.remove_docker_objects")
+
+        await teardown.teardown_infrastructures([infrastructure.id for infrastructure in infrastructures], db_session)
+
+        assert len(remove_mock.call_args.args[0].appliances) == 8
+        assert set((await count_rows(db_session)).values()) == {0, 1}
+
+    async def test_teardown_infrastructures_on_docker_hosts(self, db_session, infrastructures, mocker):
+        remove_mock = mocker.patch("dr_emu.controllers.teardown.remove_docker_objects")
+        get_client_mock = mocker.patch("dr_emu.controllers.teardown.docker_hosts.get_client")
+        first, second = infrastructures
+        host = DockerHost(name="host", url="tcp://10.10.0.1:2375", capacity=4)
+        db_session.add(host)
+        await db_session.commit()
+        first.docker_host_id = host.id
+        await db_session.commit()
+
+        await teardown.teardown_infrastructures([first.id, second.id], db_session)
+
+        # the objects are removed from the host of each infrastructure, the local daemon by default
+        get_client_mock.assert_called_once_with(host.url)
+        assert {call_args.args[2] for call_args in remove_mock.call_args_list} == {get_client_mock.return_value, None}
+        assert [len(call_args.args[0].appliances) for call_args in remove_mock.call_args_list] == [4, 4]
+
+    async def test_remove_docker_objects_rate_limit(self, mocker):
+        mocker.patch("dr_emu.controllers.teardown.docker_hosts.get_client")
+        limiter = RateLimiter(rate=100)
+
+        start = time.monotonic()
+        docker_ids = teardown.DockerIds(appliances=[f"node_{index}" for index in range(11)])
+        await teardown.remove_docker_objects(docker_ids, limiter)
+
+        # the first removal uses the initial token
+        assert time.monotonic() - start >= 0.1
+
+    async def test_schedule_teardown(self, db_session, infrastructures):
+        first, second = infrastructures
+
+        await teardown.schedule_teardown([first.id], db_session)
+        await db_session.refresh(first)
+        teardown_at = first.teardown_at
+        # a repeated request doesn't postpone the teardown
+        await teardown.schedule_teardown([first.id], db_session)
+
+        await db_session.refresh(first)
+        await db_session.refresh(second)
+        assert teardown_at is not None
+        assert first.teardown_at == teardown_at
+        assert second.teardown_at is None
+
+    async def test_reap(self, db_session, infrastructures, mocker):
+        remove_mock = mocker.patch("dr_emu.controllers.teardown.remove_docker_objects")
+        first, second = infrastructures
+        second.teardown_at = utc_now() + timedelta(hours=1)
+        await db_session.commit()
+        await teardown.schedule_teardown([first.id], db_session)
+
+        assert await teardown.reap(db_session) is True
+        # the other infrastructure is not due yet
+        assert await teardown.reap(db_session) is False
+
+        remove_mock.assert_awaited_once()
+        assert list(await db_session.scalars(select(Infrastructure.name))) == [second.name]
+
+    async def test_reap_failure(self, db_session, infrastructures, mocker):
+        mocker.patch("dr_emu.controllers.teardown.remove_docker_objects", side_effect=RuntimeError("docker is down"))
+        first, _ = infrastructures
+        await teardown.schedule_teardown([first.id], db_session)
+
+        assert await teardown.reap(db_session) is True
+
+        db_session.expunge_all()
+        infrastructure = await db_session.get(Infrastructure, first.id)
+        assert (infrastructure.teardown_attempts, infrastructure.teardown_error) == (1, "RuntimeError: docker is down")
+        # the teardown is retried later
+        assert infrastructure.teardown_at.replace(tzinfo=None) > utc_now().replace(tzinfo=None)
+        assert await teardown.reap(db_session) is False
@@ -4,9 +4,12 @@ import pytest
 from unittest.mock import AsyncMock, patch, Mock, MagicMock
 import docker.errors
 from pytest_mock import MockerFixture
-from dr_emu.lib.util import pull_image, get_image, build_cif_image  # Adjust the import based on your module structure
+from dr_emu.lib.util import pull_image, get_image, build_cif_image, materialize_blob
+from dr_emu.database_config import TimedQueuePool, DatabaseSessionManager
 from dr_emu.models import ImageState
 from docker.errors import ImageNotFound
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
 
 
 # Mock logger to avoid unnecessary logging during tests
@@ -15,11 +18,12 @@ logger = AsyncMock()
 @pytest.mark.asyncio
 async def test_pull_image():
     docker_client = Mock()
+    docker_client.api.pull.return_value = [{"status": "Pulling from library/image1"}, {"id": "a1", "status": "Done"}]
 
     with patch("asyncio.to_thread", new=AsyncMock(side_effect=lambda func, *args: func(*args))):
         await pull_image(docker_client, "image1")
 
-    docker_client.images.pull.assert_called_with("image1")
+    docker_client.api.pull.assert_called_with("image1", stream=True, decode=True)
 
 
 
@@ -27,13 +31,13 @@ async def test_pull_image():
 async def test_pull_images_server_timeout(mocker: MockerFixture):
     mocker.patch("asyncio.sleep")
     docker_client = Mock()
-    docker_client.images.pull.side_effect = docker.errors.DockerException("Server timeout")
+    docker_client.api.pull.return_value = [{"error": "Server timeout"}]
 
     with pytest.raises(docker.errors.ImageNotFound):
         with patch("asyncio.to_thread", new=AsyncMock(side_effect=lambda func, *args: func(*args))):
             await pull_image(docker_client, "image1")
 
-    assert docker_client.images.pull.call_count == 3
+    assert docker_client.api.pull.call_count == 3
 
 
 @pytest.fixture()
@@ -42,7 +46,7 @@ def image():
         Mock(type="service1", variable_override={"key1": "value1"}),
         Mock(type="service2", variable_override={"key2": "value2"}),
     ]
-    image = Mock(state=ImageState.initialized, pull=False, services=services, data=[], packages=[])
+    image = Mock(state=ImageState.initialized, pull=False, services=services, files=[], packages=[])
     image.name = "test-image"
     return image
 
@@ -109,38 +113,61 @@ async def test_build_cif_image_not_found_and_built(mocker, image):
 
 
 @pytest.mark.asyncio
-async def test_build_cif_image(mocker, image):
+async def test_build_cif_image(mocker, image, tmp_path: Path):
     mock_build = mocker.patch("dr_emu.lib.util.cif.build")
-    mock_new_path = MagicMock()
-    mocker.patch("dr_emu.lib.util.uuid1", return_value="test_uuid")
     mocker.patch("dr_emu.lib.util.cif.helpers.check_for_forbidden_services", return_value=[])
-    mocker.patch.object(mock_new_path, "exists", return_value=True)
-    data_path_mock =mocker.patch("dr_emu.lib.util.constants.cif_tmp_data_path")
-    data_path_mock.__truediv__.return_value = mock_new_path
-
-
-    image.data = [
-        Mock(contents="file_contents_1", image_file_path="path/to/file1"),
+    blob_path = tmp_path / "digest"
+    blob_path.write_bytes(b"file_contents")
+    materialize_blob_mock = mocker.patch("dr_emu.lib.util.materialize_blob", AsyncMock(return_value=blob_path))
+
+    blob = Mock(digest="digest")
+    image.files = [
+        Mock(path="path/to/file1", blob=blob),
+        Mock(path="path/to/file2", blob=blob),
     ]
 
     # Act
     await build_cif_image(image)
 
+    materialize_blob_mock.assert_awaited_once_with(blob)
     # Check if cif.build was called with correct arguments
     mock_build.assert_called_once_with(
         services=["service1", "service2"],
         variables={"key1": "value1", "key2": "value2"},
         actions=[('create-user', {})],
         final_tag="test-image",
-        files=[(mock_new_path, 'path/to/file1', None, None, None)],  # Can assert specific file details if needed
+        files=[(blob_path, 'path/to/file1', None, None, None), (blob_path, 'path/to/file2', None, None, None)],
         packages=[],
         clean_up=True
         )
+    # the file is removed once the image is built
+    assert not blob_path.exists()
+
 
-    # Check that file.write_text was called for each file
-    mock_new_path.write_text.assert_called_once_with("file_contents_1")
+@pytest.mark.asyncio
+async def test_materialize_blob(mocker, tmp_path: Path):
+    mocker.patch("dr_emu.lib.util.constants.cif_tmp_data_path", tmp_path)
+    blob = Mock(digest="digest", awaitable_attrs=Mock(contents=AsyncMock(return_value=b"file_contents")()))
+
+    file_path = await materialize_blob(blob)
 
-    # Ensure file unlinking happens
-    assert mock_new_path.unlink.call_count == 1  # There are two files being processed
+    assert file_path.parent == tmp_path
+    assert file_path.name.startswith("digest.")
+    assert file_path.read_bytes() == b"file_contents"
 
 
+@pytest.mark.asyncio
+async def test_timed_queue_pool(mocker, tmp_path: Path):
+    pool_wait_mock = mocker.patch("dr_emu.database_config.metrics.db_pool_wait_seconds")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=TimedQueuePool)
+    manager = DatabaseSessionManager(engine)
+
+    try:
+        async with manager.session() as db_session:
+            await db_session.execute(text("SELECT 1"))
+            assert manager.pool_status()["checked_out"] == 1
+
+        pool_wait_mock.observe.assert_called_once()
+        assert manager.pool_status()["checked_out"] == 0
+    finally:
+        await engine.dispose()